@@ -15,7 +15,6 @@ import action_venv  # noqa: F401
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
 from subprocess import check_output, CalledProcessError
 
 from charmhelpers.core.hookenv import (
@@ -25,32 +24,60 @@ from charmhelpers.core.hookenv import (
     function_set
 )
 
+from charms_ceph.paging import dumps, parse_fields, results, select
+from charms_ceph.utils import get_pool_ls_detail
 
-def get_list_pools(output_format="text"):
+
+def get_list_pools(output_format="text", offset=0, limit=0, pattern=None,
+                   fields=None):
     """Get list of Ceph pools.
 
+    The pools come from ``osd pool ls detail`` rather than a full osd dump.
+    Only the pools whose name matches pattern are listed, limit of them
+    from offset on.
+
     :param output_format: specify output format
     :type output_format: str
-    :returns: joined list of string <pool_id> <pool_name> or
-              dump list of pools with details
-    :rtype: str
+    :param offset: number of matching pools to skip
+    :type offset: int
+    :param limit: maximum number of pools to list, 0 for all
+    :type limit: int
+    :param pattern: glob the pool names have to match
+    :type pattern: Optional[str]
+    :param fields: comma separated pool fields to show, all by default
+    :type fields: Optional[str]
+    :returns: action results, with the joined list of string
+              <pool_id> <pool_name> or dump list of pools with details
+              under 'message'
+    :rtype: Dict[str, Any]
     """
-    if output_format == "text":
-        return check_output(["ceph", "--id", "admin", "osd",
-                             "lspools"]).decode("UTF-8")
+    if output_format == "text" and not (offset or limit or pattern):
+        out = check_output(["ceph", "--id", "admin", "osd",
+                            "lspools"]).decode("UTF-8")
+        return {"message": out}
 
-    ceph_osd_dump = check_output(["ceph", "--id", "admin", "osd", "dump",
-                                  "--format=json"]).decode("UTF-8")
-    pools = json.loads(ceph_osd_dump).get("pools", [])
-    return json.dumps(pools,
-                      indent=2 if output_format == "text-full" else None)
+    if output_format == "text":
+        fields = None
+    page = select(get_pool_ls_detail(), offset=offset, limit=limit,
+                  pattern=pattern, key=lambda pool: pool["pool_name"],
+                  fields=parse_fields(fields))
+    if output_format == "text":
+        message = "\n".join("{} {}".format(pool["pool"], pool["pool_name"])
+                            for pool in page.items)
+    else:
+        message = dumps(page.items, pretty=output_format == "text-full")
+    return results(page, message)
 
 
 def main():
     try:
-        list_pools = get_list_pools(function_get("format"))
-        function_set({"message": list_pools})
-    except CalledProcessError as e:
+        list_pools = get_list_pools(function_get("format"),
+                                    offset=function_get("offset"),
+                                    limit=function_get("limit"),
+                                    pattern=function_get("filter"),
+                                    fields=function_get("fields"))
+        function_set(list_pools)
+    except (CalledProcessError, ValueError) as e:
         log(e)
         function_fail("List pools failed with error: {}".format(str(e)))
 
@@ -15,17 +15,72 @@ import action_venv  # noqa: F401
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import concurrent.futures
 import json
+import time
 from subprocess import check_output, CalledProcessError
 
 
 from charmhelpers.core.hookenv import (
     log,
     function_fail,
+    function_get,
     function_set,
 )
 from charms_ceph.utils import list_pools
 
+# Number of pools and placement groups scanned at the same time.
+SCAN_WORKERS = 16
+# Repairs allowed at the same time on any OSD of a placement group's acting
+# set; a repair is a deep scrub and OSDs allow one scrub by default.
+MAX_REPAIRS_PER_OSD = 1
+# Seconds between checks on the repairs in progress.
+POLL_INTERVAL = 5
+# Seconds after which a repair that has not cleared the inconsistency no
+# longer counts against its OSDs.
+REPAIR_TIMEOUT = 600
+# Minimum seconds between two progress reports.
+PROGRESS_INTERVAL = 10
+
+
+class Progress(object):
+    """Report the progress of a phase of the action through function_set."""
+
+    def __init__(self, phase, total):
+        self.phase = phase
+        self.total = total
+        self.done = 0
+        self.start = time.monotonic()
+        self.last_report = None
+
+    def advance(self, count=1):
+        self.done += count
+        now = time.monotonic()
+        if (self.done < self.total and self.last_report is not None and
+                now - self.last_report < PROGRESS_INTERVAL):
+            return
+        self.last_report = now
+        elapsed = now - self.start
+        eta = 0
+        if self.done:
+            eta = elapsed / self.done * (self.total - self.done)
+        function_set({
+            "progress": "{}: {} of {} done, ETA {:.0f}s".format(
+                self.phase, self.done, self.total, eta)
+        })
+
+
+def _map_concurrently(func, items):
+    """Call func on every item with up to SCAN_WORKERS threads.
+
+    :returns: the results, in the order of the items
+    :rtype: Iterator
+    """
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=SCAN_WORKERS) as executor:
+        yield from executor.map(func, items)
+
 
 def get_rados_inconsistent_objs(pg):
     """Get all inconsistent objects for a given placement group.
@@ -37,7 +92,7 @@ def get_rados_inconsistent_objs(pg):
     """
     return json.loads(
         check_output(
-            ["rados", "list-inconsistent-obj", pg, "--format=json-pretty"]
+            ["rados", "list-inconsistent-obj", pg, "--format=json"]
         ).decode("UTF-8")
     )
 
@@ -64,8 +119,10 @@ def get_inconsistent_pgs(ceph_pools):
     :rtype: set[str]
     """
     inconsistent_pgs = set()
-    for pool in ceph_pools:
-        inconsistent_pgs.update(get_rados_inconsistent_pgs(pool))
+    progress = Progress("Scanning pools", len(ceph_pools))
+    for pgs in _map_concurrently(get_rados_inconsistent_pgs, ceph_pools):
+        inconsistent_pgs.update(pgs)
+        progress.advance()
     return inconsistent_pgs
 
 
@@ -77,7 +134,15 @@ def get_safe_pg_repairs(inconsistent_pgs):
     :returns: list of safely repairable placement groups as a set
     :rtype: set[str]
     """
-    return {pg for pg in inconsistent_pgs if is_pg_safe_to_repair(pg)}
+    inconsistent_pgs = list(inconsistent_pgs)
+    progress = Progress("Checking placement groups", len(inconsistent_pgs))
+    safe_pgs = set()
+    for pg, safe in zip(inconsistent_pgs, _map_concurrently(
+            is_pg_safe_to_repair, inconsistent_pgs)):
+        if safe:
+            safe_pgs.add(pg)
+        progress.advance()
+    return safe_pgs
 
 
 def is_pg_safe_to_repair(pg):
@@ -118,17 +183,82 @@ def has_read_error_only(pg):
     return read_error_found
 
 
-def perform_pg_repairs(pgs):
+def get_pg_states():
+    """Get the acting OSDs and state of every placement group.
+
+    :returns: placement group ID -> (acting OSD IDs, state)
+    :rtype: dict[str, tuple[list[int], str]]
+    """
+    pg_stats = json.loads(
+        check_output(
+            ["ceph", "pg", "dump", "pgs_brief", "--format=json"]
+        ).decode("UTF-8")
+    )
+    if isinstance(pg_stats, dict):
+        pg_stats = pg_stats.get("pg_stats", [])
+    return {
+        pg["pgid"]: (pg.get("acting", []), pg.get("state", ""))
+        for pg in pg_stats
+    }
+
+
+def is_repair_finished(state):
+    """Whether a placement group state shows no inconsistency or scrub.
+
+    :param state: Placement group state, e.g. "active+clean+inconsistent"
+    :type state: str
+    :rtype: bool
+    """
+    flags = set(state.split("+"))
+    return not flags & {"inconsistent", "repair", "scrubbing"}
+
+
+def perform_pg_repairs(pgs, max_per_osd=MAX_REPAIRS_PER_OSD):
     """Runs `ceph pg repair` on a group of placement groups.
     All placement groups provided should be confirmed as safe prior to using
     this method.
 
+    Repairs are throttled so that no OSD takes part in more than max_per_osd
+    of them at the same time. A repair counts until its placement group is
+    no longer inconsistent or scrubbing, or until REPAIR_TIMEOUT expires.
+
     :param pgs: List of safe-to-repair placement groups
     :type pg: list[str]
+    :param max_per_osd: Concurrent repairs allowed per OSD
+    :type max_per_osd: int
     """
-    for pg in pgs:
-        log("Repairing ceph placement group {}".format(pg))
-        check_output(["ceph", "pg", "repair", pg])
+    pending = sorted(pgs)
+    in_flight = {}
+    osd_repairs = collections.Counter()
+    progress = Progress("Repairing placement groups", len(pending))
+    states = get_pg_states()
+    while pending or in_flight:
+        waiting = []
+        for pg in pending:
+            osds = states.get(pg, ([], ""))[0]
+            if any(osd_repairs[osd] >= max_per_osd for osd in osds):
+                waiting.append(pg)
+                continue
+            log("Repairing ceph placement group {}".format(pg))
+            check_output(["ceph", "pg", "repair", pg])
+            in_flight[pg] = (osds, time.monotonic())
+            osd_repairs.update(osds)
+        pending = waiting
+
+        time.sleep(POLL_INTERVAL)
+        states = get_pg_states()
+        now = time.monotonic()
+        for pg, (osds, submitted) in list(in_flight.items()):
+            if is_repair_finished(states.get(pg, ([], ""))[1]):
+                log("Placement group {} repaired".format(pg))
+            elif now - submitted > REPAIR_TIMEOUT:
+                log("Placement group {} still not repaired after {}s".format(
+                    pg, REPAIR_TIMEOUT))
+            else:
+                continue
+            del in_flight[pg]
+            osd_repairs.subtract(osds)
+            progress.advance()
 
 
 def pg_repair():
@@ -161,7 +291,10 @@ def pg_repair():
         )
     if safe_pg_repairs:
         log("Safe placement group repairs found: {}".format(safe_pg_repairs))
-        perform_pg_repairs(safe_pg_repairs)
+        perform_pg_repairs(
+            safe_pg_repairs,
+            max_per_osd=function_get("max-repairs-per-osd") or
+            MAX_REPAIRS_PER_OSD)
         function_set(
             {
                 "message": "placement groups repaired: {}".format(
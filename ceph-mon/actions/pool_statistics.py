@@ -15,14 +15,50 @@ import action_venv  # noqa: F401
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 from subprocess import check_output, CalledProcessError
-from charmhelpers.core.hookenv import log, action_set, action_fail
+from charmhelpers.core.hookenv import log, action_get, action_set, action_fail
+
+from charms_ceph.paging import dumps, parse_fields, results, select
+
+
+def get_pool_statistics(fmt="plain", offset=0, limit=0, pattern=None,
+                        fields=None):
+    """Get the utilization statistics of the pools.
+
+    With the json format only the pools whose name matches pattern are
+    returned, limit of them from offset on, with the given fields, along
+    with the statistics of the whole cluster.
+
+    :param fmt: plain or json
+    :type fmt: str
+    :returns: action results
+    :rtype: Dict[str, Any]
+    :raises: ValueError if pools are selected with the plain format.
+    """
+    if fmt != 'json':
+        if offset or limit or pattern or fields:
+            raise ValueError("offset, limit, filter and fields need the json "
+                             "format")
+        return {'message': check_output(['ceph', '--id', 'admin',
+                                         'df']).decode('UTF-8')}
+
+    df = json.loads(check_output(['ceph', '--id', 'admin', 'df', '-f',
+                                  'json']).decode('UTF-8'))
+    page = select(df.get('pools', []), offset=offset, limit=limit,
+                  pattern=pattern, key=lambda pool: pool['name'],
+                  fields=parse_fields(fields))
+    df['pools'] = page.items
+    return results(page, dumps(df))
+
 
 if __name__ == '__main__':
     try:
-        out = check_output(['ceph', '--id', 'admin',
-                            'df']).decode('UTF-8')
-        action_set({'message': out})
-    except CalledProcessError as e:
+        action_set(get_pool_statistics(action_get("format") or "plain",
+                                       offset=action_get("offset"),
+                                       limit=action_get("limit"),
+                                       pattern=action_get("filter"),
+                                       fields=action_get("fields")))
+    except (CalledProcessError, ValueError) as e:
         log(e)
         action_fail("ceph df failed with message: {}".format(str(e)))
@@ -15,17 +15,52 @@ import action_venv  # noqa: F401
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 from subprocess import check_output, CalledProcessError
 from charmhelpers.core.hookenv import log, action_get, action_set, action_fail
 
+from charms_ceph.paging import dumps, parse_fields, results, select
+
+
+def get_disk_free(fmt="plain", offset=0, limit=0, pattern=None, fields=None):
+    """Get the disk utilization by host and OSD.
+
+    With a json format only the nodes of the tree whose name matches
+    pattern are returned, limit of them from offset on, with the given
+    fields. The other formats are passed on from ceph unchanged.
+
+    :param fmt: one of json, json-pretty, xml, xml-pretty or plain
+    :type fmt: str
+    :returns: action results
+    :rtype: Dict[str, Any]
+    :raises: ValueError if nodes are selected with a format other than json.
+    """
+    if not fmt.startswith('json'):
+        if offset or limit or pattern or fields:
+            raise ValueError("offset, limit, filter and fields need the json "
+                             "or json-pretty format")
+        return {'message': check_output(['ceph', '--id', 'admin',
+                                         'osd', 'df', 'tree', '-f',
+                                         fmt]).decode('UTF-8')}
+
+    tree = json.loads(check_output(['ceph', '--id', 'admin', 'osd', 'df',
+                                    'tree', '-f', 'json']).decode('UTF-8'))
+    page = select(tree.get('nodes', []), offset=offset, limit=limit,
+                  pattern=pattern, key=lambda node: node['name'],
+                  fields=parse_fields(fields))
+    tree['nodes'] = page.items
+    return results(page, dumps(tree, pretty=fmt == 'json-pretty'))
+
+
 if __name__ == '__main__':
     # constrained to enum: json,json-pretty,xml,xml-pretty,plain
-    fmt = action_get("format")
     try:
-        out = check_output(['ceph', '--id', 'admin',
-                            'osd', 'df', 'tree', '-f', fmt]).decode('UTF-8')
-        action_set({'message': out})
-    except CalledProcessError as e:
+        action_set(get_disk_free(action_get("format"),
+                                 offset=action_get("offset"),
+                                 limit=action_get("limit"),
+                                 pattern=action_get("filter"),
+                                 fields=action_get("fields")))
+    except (CalledProcessError, ValueError) as e:
         log(e)
         action_fail(
             "ceph osd df tree failed with message: {}".format(str(e)))
@@ -26,7 +26,7 @@ EXIT_CRIT = 2
 EXIT_UNKNOWN = 3
 EXIT_CODE_TEXT = ["OK", "WARN", "CRITICAL", "UNKNOWN"]
 
-CURRENT_OSD_COUNT_FILE = "/var/lib/nagios/current-ceph-osd-count.json"
+SNAPSHOT_FILE = "/var/lib/nagios/ceph-status-snapshot.json"
 
 
 class CriticalError(Exception):
@@ -61,12 +61,12 @@ def check_file_freshness(filename, newer_than=3600):
                             % (filename, time.ctime(mtime)))
 
 
-def check_ceph_osd_count(host_osd_count_report):
+def check_ceph_osd_count(host_osd_count_report, snapshot_file=SNAPSHOT_FILE):
 
     with open(host_osd_count_report, "r") as f:
         expected_osd_map = json.load(f)
 
-    current_osd_map = get_osd_tree()
+    current_osd_map = get_osd_tree(snapshot_file)
 
     exit_code = EXIT_OK
     err_msgs = []
@@ -89,15 +89,21 @@ def check_ceph_osd_count(host_osd_count_report):
     return (exit_code, err_msgs)
 
 
-def get_osd_tree():
-    """Read CURRENT_OSD_COUNT_FILE to get the host osd map.
+def get_osd_tree(snapshot_file=SNAPSHOT_FILE):
+    """Read the osd tree from the snapshot to get the host osd map.
 
+    :param snapshot_file: Snapshot written by collect_ceph_status.py
+    :type snapshot_file: str
     :return: The map of node and osd ids.
     :rtype: Dict[str: List[str]]
+    :raises CriticalError: If the snapshot is stale or lacks the osd tree
     """
-    check_file_freshness(CURRENT_OSD_COUNT_FILE)
-    with open(CURRENT_OSD_COUNT_FILE, "r") as f:
-        current_osd_counts = json.load(f)
+    check_file_freshness(snapshot_file)
+    with open(snapshot_file, "r") as f:
+        current_osd_counts = json.load(f).get("osd_tree")
+    if current_osd_counts is None:
+        raise CriticalError("{}: osd tree was not collected."
+                            .format(snapshot_file))
 
     host_osd_map = {}
     for node in current_osd_counts["nodes"]:
@@ -111,11 +117,16 @@ def get_osd_tree():
 
 if __name__ == "__main__":
     host_osd_report = sys.argv[1]
+    snapshot_file = sys.argv[2] if len(sys.argv) > 2 else SNAPSHOT_FILE
     if not os.path.isfile(host_osd_report):
         print("UNKNOWN: report file missing: {}".format(host_osd_report))
         sys.exit(EXIT_UNKNOWN)
 
-    (exit_code, err_msgs) = check_ceph_osd_count(host_osd_report)
+    try:
+        (exit_code, err_msgs) = check_ceph_osd_count(host_osd_report,
+                                                     snapshot_file)
+    except CriticalError as e:
+        (exit_code, err_msgs) = (EXIT_CRIT, [str(e)])
     print("{} {}".format(EXIT_CODE_TEXT[exit_code],
                          ", ".join(err_msgs)))
     sys.exit(exit_code)
@@ -68,31 +68,60 @@ def check_file_freshness(filename, newer_than=3600):
                             % (filename, time.ctime(mtime)))
 
 
-def get_ceph_version():
+def load_snapshot(filename, section):
+    """
+    Read one section of the snapshot written by collect_ceph_status.py.
+
+    :param filename: Path to the snapshot
+    :type filename: str
+    :param section: Name of the section, e.g. 'status'
+    :type section: str
+    :returns: The section's content
+    :raises: CriticalError if the snapshot is stale, UnknownError if the
+             section could not be collected
+    """
+    check_file_freshness(filename)
+    with open(filename) as f:
+        snapshot = json.load(f)
+    data = snapshot.get(section)
+    if data is None:
+        raise UnknownError(
+            "UNKNOWN: {} was not collected: {}".format(
+                section, snapshot.get('errors', {}).get(section, 'missing')))
+    return data
+
+
+def get_ceph_version(out_string=None):
     """
     Uses CLI to get the ceph version, because the status output changes from
     Luminous onwards (12.2.0 or higher)
 
+    :param out_string: Output of 'ceph --version' if already known
+    :type out_string: Optional[str]
     :returns: list of integers, just the actual version number
     :raises: UnknownError
     """
-    try:
-        out_string = subprocess.check_output(['ceph',
-                                              '--version']).decode('UTF-8')
-    except subprocess.CalledProcessError as e:
-        raise UnknownError(
-            "UNKNOWN: could not determine Ceph version, error: {}".format(e))
+    if out_string is None:
+        try:
+            out_string = subprocess.check_output(
+                ['ceph', '--version']).decode('UTF-8')
+        except subprocess.CalledProcessError as e:
+            raise UnknownError(
+                "UNKNOWN: could not determine Ceph version, error: {}"
+                .format(e))
     out_version = [int(x) for x in out_string.split(" ")[2].split(".")]
     return out_version
 
 
-def get_status_and_messages(status_data):
+def get_status_and_messages(status_data, version_string=None):
     """
     Used to get general status of a Ceph cluster as well as a list of
     error/warning messages.
 
     :param status_data: JSON formatted output from ceph health
     :type status_data: str
+    :param version_string: Output of 'ceph --version' if already known
+    :type version_string: Optional[str]
     :returns:
         - string representing overall status of the cluster
         - list of error or warning messages
@@ -101,7 +130,7 @@ def get_status_and_messages(status_data):
     """
 
     try:
-        ceph_version = get_ceph_version()
+        ceph_version = get_ceph_version(version_string)
     except UnknownError as e:
         raise UnknownError(e)
     if ceph_version[0] >= 12 and ceph_version[1] >= 2:
@@ -135,7 +164,11 @@ def check_ceph_status(args):
     """
 
     status_critical = False
-    if args.status_file:
+    version_string = None
+    if args.snapshot_file:
+        status_data = load_snapshot(args.snapshot_file, 'status')
+        version_string = load_snapshot(args.snapshot_file, 'version')
+    elif args.status_file:
         check_file_freshness(args.status_file)
         with open(args.status_file) as f:
             tree = f.read()
@@ -156,7 +189,8 @@ def check_ceph_status(args):
         raise UnknownError('UNKNOWN: status data is incomplete')
 
     try:
-        overall_status, status_messages = get_status_and_messages(status_data)
+        overall_status, status_messages = get_status_and_messages(
+            status_data, version_string)
     except UnknownError as e:
         raise UnknownError(e)
 
@@ -254,6 +288,11 @@ def parse_args(args):
                              'Generally useful for testing, and if the Nagios '
                              'user account does not have rights for the Ceph '
                              'config files.')
+    parser.add_argument('-s', '--snapshot', dest='snapshot_file',
+                        default=False,
+                        help='Snapshot written by collect_ceph_status.py. '
+                             'Takes precedence over --file and avoids '
+                             'running any ceph command.')
     parser.add_argument('--degraded_thresh', dest='degraded_thresh',
                         default=1.0, type=float,
                         help="Threshold for degraded ratio (0.1 = 10%)")
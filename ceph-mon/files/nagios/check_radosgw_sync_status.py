@@ -20,6 +20,7 @@
 
 import re
 import argparse
+import json
 import os
 import subprocess
 import sys
@@ -61,6 +62,29 @@ def check_file_freshness(filename, newer_than=3600):
                             % (filename, time.ctime(mtime)))
 
 
+def load_snapshot(filename, section):
+    """
+    Read one section of the snapshot written by collect_ceph_status.py.
+
+    :param filename: Path to the snapshot
+    :type filename: str
+    :param section: Name of the section, e.g. 'radosgw_sync_status'
+    :type section: str
+    :returns: The section's content
+    :raises: CriticalError if the snapshot is stale, UnknownError if the
+             section could not be collected
+    """
+    check_file_freshness(filename)
+    with open(filename) as f:
+        snapshot = json.load(f)
+    data = snapshot.get(section)
+    if data is None:
+        raise UnknownError(
+            "UNKNOWN: {} was not collected: {}".format(
+                section, snapshot.get('errors', {}).get(section, 'missing')))
+    return data
+
+
 def check_radosgw_status(args):
     """
     Used to check the status of multizone RadosGW Ceph. Uses the output of
@@ -78,7 +102,10 @@ def check_radosgw_status(args):
     :raises: UnknownError, CriticalError
     """
 
-    if args.status_file:
+    if args.snapshot_file:
+        status_data = load_snapshot(args.snapshot_file,
+                                    'radosgw_sync_status')
+    elif args.status_file:
         check_file_freshness(args.status_file)
         with open(args.status_file) as f:
             status_data = f.read()
@@ -147,6 +174,11 @@ def parse_args(args):
                              'Generally useful for testing, and if the Nagios '
                              'user account does not have rights for the Ceph '
                              'config files.')
+    parser.add_argument('-s', '--snapshot', dest='snapshot_file',
+                        default=False,
+                        help='Snapshot written by collect_ceph_status.py. '
+                             'Takes precedence over --file and avoids '
+                             'running radosgw-admin.')
     parser.add_argument('--zones', dest='zones',
                         default=None,
                         help="Check if the given zones, as a comma-separated "
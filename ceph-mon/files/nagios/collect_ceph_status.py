@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014, 2026 Canonical
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Collect the state of the cluster for the nagios checks.
+
+Every command the checks need is run once here, from cron, and the results
+are written to a single JSON snapshot.  The snapshot is replaced atomically
+so a check never reads a partially written file.  A section whose command
+failed is stored as null and the error is recorded under ``errors``.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+LOCK_FILE = "/var/lock/ceph-status.lock"
+DATA_DIR = "/var/lib/nagios"
+SNAPSHOT_FILE = os.path.join(DATA_DIR, "ceph-status-snapshot.json")
+COMMAND_TIMEOUT = 60
+
+# Section name, command and whether the command prints JSON.
+# Note: radosgw-admin sync status doesn't support outputting in json at time
+# of writing, so the raw text is kept.
+SECTIONS = (
+    ("status", ["ceph", "status", "--format", "json"], True),
+    ("version", ["ceph", "--version"], False),
+    ("osd_tree", ["ceph", "osd", "tree", "--format", "json"], True),
+    ("df", ["ceph", "df", "--format", "json"], True),
+    ("radosgw_sync_status", ["radosgw-admin", "sync", "status"], False),
+)
+
+
+def collect():
+    """Run every command once.
+
+    :returns: The snapshot.
+    :rtype: Dict[str, Any]
+    """
+    snapshot = {"collected_at": time.time(), "errors": {}}
+    for name, cmd, is_json in SECTIONS:
+        try:
+            # stderr is kept apart so warnings can't corrupt the JSON.
+            out = subprocess.check_output(
+                cmd, stderr=subprocess.PIPE,
+                timeout=COMMAND_TIMEOUT).decode("UTF-8")
+            snapshot[name] = json.loads(out) if is_json else out.strip()
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            snapshot[name] = None
+            error = str(e)
+            stderr = getattr(e, "stderr", None)
+            if stderr:
+                error = "{}: {}".format(
+                    error, stderr.decode("UTF-8", "replace").strip())
+            snapshot["errors"][name] = error
+    return snapshot
+
+
+def write_snapshot(snapshot, filename=SNAPSHOT_FILE):
+    """Atomically replace filename with snapshot, readable by nagios."""
+    dirname = os.path.dirname(filename)
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix=".ceph-status-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f)
+        try:
+            shutil.chown(tmp, "root", "nagios")
+        except (LookupError, PermissionError):
+            pass
+        os.chmod(tmp, 0o640)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def main():
+    with open(LOCK_FILE, "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # A previous run is still collecting.
+            return 1
+        write_snapshot(collect())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
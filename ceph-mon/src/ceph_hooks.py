@@ -15,10 +15,13 @@
 # limitations under the License.
 
 import ast
+import collections
+import hashlib
 import json
 import os
 import subprocess
 import sys
+import time
 import uuid
 import pathlib
 
@@ -29,6 +32,8 @@ import charms_ceph.utils as ceph
 from charms_ceph.broker import (
     process_requests
 )
+from charms_ceph.crush_utils import Crushmap
+from charms_ceph.utils import cached_cmp_pkgrevno as cmp_pkgrevno
 
 from charmhelpers.core import hookenv
 from charmhelpers.core.hookenv import (
@@ -56,8 +61,7 @@ from charmhelpers.core.host import (
     service_pause,
     mkdir,
     write_file,
-    rsync,
-    cmp_pkgrevno)
+    rsync)
 from charmhelpers.fetch import (
     apt_install,
     filter_installed_packages,
@@ -108,9 +112,7 @@ hooks = Hooks()
 NAGIOS_PLUGINS = '/usr/local/lib/nagios/plugins'
 NAGIOS_FILE_FOLDER = '/var/lib/nagios'
 SCRIPTS_DIR = '/usr/local/bin'
-STATUS_FILE = '{}/cat-ceph-status.txt'.format(NAGIOS_FILE_FOLDER)
-RADOSGW_STATUS_FILE = ('{}/current-radosgw-admin-sync-status.raw'
-                       .format(NAGIOS_FILE_FOLDER))
+SNAPSHOT_FILE = '{}/ceph-status-snapshot.json'.format(NAGIOS_FILE_FOLDER)
 STATUS_CRONFILE = '/etc/cron.d/cat-ceph-health'
 HOST_OSD_COUNT_REPORT = '{}/host-osd-report.json'.format(NAGIOS_FILE_FOLDER)
 
@@ -624,25 +626,7 @@ def attempt_mon_cluster_bootstrap():
     if is_leader() and config('customize-failure-domain'):
         # But only if the environment supports it
         if os.environ.get('JUJU_AVAILABILITY_ZONE'):
-            cmds = [
-                "ceph osd getcrushmap -o /tmp/crush.map",
-                "crushtool -d /tmp/crush.map| "
-                "sed 's/step chooseleaf firstn 0 type host/step "
-                "chooseleaf firstn 0 type rack/' > "
-                "/tmp/crush.decompiled",
-                "crushtool -c /tmp/crush.decompiled -o /tmp/crush.map",
-                "crushtool -i /tmp/crush.map --test "
-                "--num-rep 3 --show-statistics",
-                "ceph osd setcrushmap -i /tmp/crush.map"
-            ]
-            for cmd in cmds:
-                try:
-                    subprocess.check_call(cmd, shell=True)
-                except subprocess.CalledProcessError as e:
-                    log("Failed to modify crush map:", level='error')
-                    log("Cmd: {}".format(cmd), level='error')
-                    log("Error: {}".format(e.output), level='error')
-                    break
+            customize_failure_domain()
         else:
             log(
                 "Your Juju environment doesn't"
@@ -651,6 +635,23 @@ def attempt_mon_cluster_bootstrap():
     return True
 
 
+def customize_failure_domain():
+    """Replicate across racks rather than hosts.
+
+    The rules are only rewritten if they still choose hosts, and all the
+    changes are set in one map, so this creates at most one osdmap epoch.
+    """
+    try:
+        crushmap = Crushmap()
+        crushmap.set_failure_domain('host', 'rack')
+        epochs = crushmap.save()
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        log("Failed to modify crush map: {}".format(e), level='error')
+        return
+    log("Set the CRUSH failure domain to rack in {} osdmap "
+        "epochs".format(epochs))
+
+
 def notify_relations(reprocess_broker_requests=False):
     notify_osds(reprocess_broker_requests=reprocess_broker_requests)
     notify_radosgws(reprocess_broker_requests=reprocess_broker_requests)
@@ -670,29 +671,117 @@ def notify_prometheus():
                                 module_enabled=module_enabled)
 
 
+# Prefix of the relation data keys holding a digest of the settings this
+# unit last published for each remote unit, see publish_relation_settings().
+SETTINGS_FINGERPRINT_PREFIX = 'settings-fingerprint-'
+
+# Relation ID -> 'published' and 'unchanged' counts for the notify pass.
+_notify_stats = collections.defaultdict(collections.Counter)
+
+# Relation ID -> local relation data, read at most once per notify pass.
+_notify_published = {}
+
+
+def settings_fingerprint(settings):
+    """Return a stable digest of relation settings.
+
+    :param settings: Relation settings as passed to relation_set.
+    :type settings: dict
+    :returns: Hex encoded SHA-256 digest.
+    :rtype: str
+    """
+    return hashlib.sha256(
+        json.dumps(settings, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+
+def settings_fingerprint_key(unit):
+    """Return the relation data key of the fingerprint for a remote unit."""
+    return SETTINGS_FINGERPRINT_PREFIX + unit.replace('/', '-')
+
+
+def publish_relation_settings(relid, unit, settings):
+    """Set relation settings unless identical settings are already published.
+
+    The settings carry keys specific to the remote unit, such as its key or
+    its broker response, so the fingerprint of the settings is published
+    along with them under a key per remote unit.
+
+    :param relid: Relation ID, None for the current relation.
+    :type relid: Optional[str]
+    :param unit: Remote unit the settings are for, None for the remote unit.
+    :type unit: Optional[str]
+    :param settings: Relation settings.
+    :type settings: dict
+    :returns: Whether relation_set was called.
+    :rtype: bool
+    """
+    key = settings_fingerprint_key(unit or remote_unit())
+    fingerprint = settings_fingerprint(settings)
+    published = _notify_published.get(relid)
+    if published is None:
+        published = relation_get(rid=relid, unit=local_unit()) or {}
+        if relid in _notify_published:
+            _notify_published[relid] = published
+    if published.get(key) == fingerprint:
+        _notify_stats[relid]['unchanged'] += 1
+        return False
+    settings = dict(settings)
+    settings[key] = fingerprint
+    relation_set(relation_id=relid, relation_settings=settings)
+    if relid in _notify_published:
+        _notify_published[relid][key] = fingerprint
+    _notify_stats[relid]['published'] += 1
+    return True
+
+
+def _notify_units(endpoint, notify_unit):
+    """Call notify_unit(relid, unit) for each unit related on endpoint.
+
+    The local relation data is read once per relation rather than once
+    per unit. Logs, per relation, how long the units took and how many of
+    them already had up to date settings.
+    """
+    for relid in relation_ids(endpoint):
+        _notify_stats.pop(relid, None)
+        start = time.monotonic()
+        units = related_units(relid)
+        _notify_published[relid] = None
+        try:
+            for unit in units:
+                notify_unit(relid, unit)
+        finally:
+            _notify_published.pop(relid, None)
+        stats = _notify_stats.pop(relid, collections.Counter())
+        log('Notified {} units on {} in {:.3f}s ({} published, {} unchanged)'
+            .format(len(units), relid, time.monotonic() - start,
+                    stats['published'], stats['unchanged']),
+            level=DEBUG)
+
+
 def notify_osds(reprocess_broker_requests=False):
-    for relid in relation_ids('osd'):
-        for unit in related_units(relid):
-            osd_relation(
-                relid=relid, unit=unit,
-                reprocess_broker_requests=reprocess_broker_requests)
+    _notify_units(
+        'osd',
+        lambda relid, unit: osd_relation(
+            relid=relid, unit=unit,
+            reprocess_broker_requests=reprocess_broker_requests))
 
 
 def notify_radosgws(reprocess_broker_requests=False):
-    for relid in relation_ids('radosgw'):
-        for unit in related_units(relid):
-            radosgw_relation(
-                relid=relid, unit=unit,
-                reprocess_broker_requests=reprocess_broker_requests)
+    _notify_units(
+        'radosgw',
+        lambda relid, unit: radosgw_relation(
+            relid=relid, unit=unit,
+            reprocess_broker_requests=reprocess_broker_requests))
 
 
 def notify_rbd_mirrors(reprocess_broker_requests=False):
-    for relid in relation_ids('rbd-mirror'):
-        for unit in related_units(relid):
-            rbd_mirror_relation(
-                relid=relid, unit=unit,
-                recurse=False,
-                reprocess_broker_requests=reprocess_broker_requests)
+    _notify_units(
+        'rbd-mirror',
+        lambda relid, unit: rbd_mirror_relation(
+            relid=relid, unit=unit,
+            recurse=False,
+            reprocess_broker_requests=reprocess_broker_requests))
 
 
 def req_already_treated(request_id, relid, req_unit):
@@ -884,48 +973,58 @@ def handle_broker_request(relid, unit, add_legacy_response=False,
     return response
 
 
+@ceph.hook_cached()
+def osd_relation_settings():
+    """Return the fsid, keys and addresses provided to every OSD unit.
+
+    The keys are fetched with one ``ceph auth`` call each, so the settings
+    are built once per hook rather than once per related unit.
+
+    :rtype: dict
+    """
+    public_addr = get_public_addr()
+    return {
+        'pending_key': '',
+        'fsid': leader_get('fsid'),
+        'osd_bootstrap_key': ceph.get_osd_bootstrap_key(),
+        'auth': 'cephx',
+        'ceph-public-address': public_addr,
+        'osd_upgrade_key': ceph.get_named_key('osd-upgrade',
+                                              caps=ceph.osd_upgrade_caps),
+        'osd_disk_removal_key': ceph.get_named_key(
+            'osd-removal',
+            caps={
+                'mgr': ['allow *'],
+                'mon': [
+                    'allow r',
+                    'allow command "osd crush reweight"',
+                    'allow command "osd purge"',
+                    'allow command "osd destroy"',
+                ]
+            }
+        ),
+        # Provide a key to the osd for use by the crash module:
+        # https://docs.ceph.com/en/latest/mgr/crash/
+        'client_crash_key': ceph.create_named_keyring(
+            'client',
+            'crash',
+            caps={
+                'mon': ['profile crash'],
+                'mgr': ['profile crash'],
+            }
+        )
+    }
+
+
 @hooks.hook('osd-relation-joined')
 @hooks.hook('osd-relation-changed')
 def osd_relation(relid=None, unit=None, reprocess_broker_requests=False):
     if ceph.is_quorum():
         log('mon cluster in quorum - providing fsid & keys')
-        public_addr = get_public_addr()
-        data = {
-            'pending_key': '',
-            'fsid': leader_get('fsid'),
-            'osd_bootstrap_key': ceph.get_osd_bootstrap_key(),
-            'auth': 'cephx',
-            'ceph-public-address': public_addr,
-            'osd_upgrade_key': ceph.get_named_key('osd-upgrade',
-                                                  caps=ceph.osd_upgrade_caps),
-            'osd_disk_removal_key': ceph.get_named_key(
-                'osd-removal',
-                caps={
-                    'mgr': ['allow *'],
-                    'mon': [
-                        'allow r',
-                        'allow command "osd crush reweight"',
-                        'allow command "osd purge"',
-                        'allow command "osd destroy"',
-                    ]
-                }
-            ),
-            # Provide a key to the osd for use by the crash module:
-            # https://docs.ceph.com/en/latest/mgr/crash/
-            'client_crash_key': ceph.create_named_keyring(
-                'client',
-                'crash',
-                caps={
-                    'mon': ['profile crash'],
-                    'mgr': ['profile crash'],
-                }
-            )
-        }
-
+        data = osd_relation_settings()
         data.update(handle_broker_request(
             relid, unit, force=reprocess_broker_requests))
-        relation_set(relation_id=relid,
-                     relation_settings=data)
+        publish_relation_settings(relid, unit, data)
 
         if is_leader():
             ceph_osd_releases = get_ceph_osd_releases()
@@ -1034,6 +1133,14 @@ def dashboard_relation(relid=None):
     relation_set(relation_id=relid, relation_settings={'mon-ready': True})
 
 
+@ceph.hook_cached()
+def get_radosgw_key(name=None):
+    """Return the radosgw key, fetched at most once per hook."""
+    if name:
+        return ceph.get_radosgw_key(name=name)
+    return ceph.get_radosgw_key()
+
+
 @hooks.hook('radosgw-relation-changed')
 @hooks.hook('radosgw-relation-joined')
 def radosgw_relation(relid=None, unit=None, reprocess_broker_requests=False):
@@ -1058,16 +1165,50 @@ def radosgw_relation(relid=None, unit=None, reprocess_broker_requests=False):
         key_name = relation_get('key_name', unit=unit, rid=relid)
         if key_name:
             # New style, per unit keys
-            data['{}_key'.format(key_name)] = (
-                ceph.get_radosgw_key(name=key_name)
-            )
+            data['{}_key'.format(key_name)] = get_radosgw_key(name=key_name)
         else:
             # Old style global radosgw key
-            data['radosgw_key'] = ceph.get_radosgw_key()
+            data['radosgw_key'] = get_radosgw_key()
 
         data.update(handle_broker_request(
             relid, unit, force=reprocess_broker_requests))
-        relation_set(relation_id=relid, relation_settings=data)
+        publish_relation_settings(relid, unit, data)
+
+
+@ceph.hook_cached()
+def get_rbd_mirror_key(name):
+    """Return the rbd-mirror key for name, fetched at most once per hook."""
+    return ceph.get_rbd_mirror_key(name)
+
+
+@ceph.hook_cached(ceph.POOLS)
+def rbd_mirror_relation_settings():
+    """Return the pools and addresses provided to every rbd-mirror unit.
+
+    Listing the pools takes several ``ceph`` calls per pool, so the settings
+    are built once per hook, and again after a broker request changed the
+    pools.
+
+    :rtype: dict
+    """
+    # Add some tenacity in getting pool details
+    @tenacity.retry(wait=tenacity.wait_exponential(max=20),
+                    reraise=True)
+    def get_pool_details():
+        return ceph.list_pools_detail()
+
+    data = {
+        'auth': 'cephx',
+        'ceph-public-address': get_public_addr(),
+        'pools': json.dumps(get_pool_details(), sort_keys=True),
+        'broker_requests': json.dumps(
+            [rq.request for rq in retrieve_client_broker_requests()],
+            sort_keys=True),
+    }
+    cluster_addr = get_cluster_addr()
+    if cluster_addr:
+        data['ceph-cluster-address'] = cluster_addr
+    return data
 
 
 @hooks.hook('rbd-mirror-relation-joined')
@@ -1093,26 +1234,10 @@ def rbd_mirror_relation(
         if is_unsupported_cmr(unit):
             return
 
-        # Add some tenacity in getting pool details
-        @tenacity.retry(wait=tenacity.wait_exponential(max=20),
-                        reraise=True)
-        def get_pool_details():
-            return ceph.list_pools_detail()
-
         # handle broker requests first to get a updated pool map
         data = (handle_broker_request(
             relid, unit, recurse=recurse, force=reprocess_broker_requests))
-        data.update({
-            'auth': 'cephx',
-            'ceph-public-address': get_public_addr(),
-            'pools': json.dumps(get_pool_details(), sort_keys=True),
-            'broker_requests': json.dumps(
-                [rq.request for rq in retrieve_client_broker_requests()],
-                sort_keys=True),
-        })
-        cluster_addr = get_cluster_addr()
-        if cluster_addr:
-            data['ceph-cluster-address'] = cluster_addr
+        data.update(rbd_mirror_relation_settings())
         # handle both classic and reactive Endpoint peers
         try:
             unique_id = json.loads(
@@ -1120,10 +1245,10 @@ def rbd_mirror_relation(
         except (TypeError, json.decoder.JSONDecodeError):
             unique_id = relation_get('unique_id', unit=unit, rid=relid)
         if unique_id:
-            data['{}_key'.format(unique_id)] = ceph.get_rbd_mirror_key(
+            data['{}_key'.format(unique_id)] = get_rbd_mirror_key(
                 'rbd-mirror.{}'.format(unique_id))
 
-        relation_set(relation_id=relid, relation_settings=data)
+        publish_relation_settings(relid, unit, data)
 
         # make sure clients are updated with the appropriate RBD features
         # bitmap.
@@ -1212,7 +1337,6 @@ def upgrade_charm():
 @hooks.hook('nrpe-external-master-relation-joined')
 @hooks.hook('nrpe-external-master-relation-changed')
 def update_nrpe_config():
-    apt_install('lockfile-progs', fatal=True)
     log('Refreshing nagios checks')
     if os.path.isdir(NAGIOS_PLUGINS):
         rsync(os.path.join(os.getenv('CHARM_DIR'), 'files', 'nagios',
@@ -1227,9 +1351,11 @@ def update_nrpe_config():
                            'check_radosgw_sync_status.py'),
               os.path.join(NAGIOS_PLUGINS, 'check_radosgw_sync_status.py'))
 
-    script = os.path.join(SCRIPTS_DIR, 'collect_ceph_status.sh')
+    # A single collector runs the ceph commands for all checks below, which
+    # only read the snapshot it writes.
+    script = os.path.join(SCRIPTS_DIR, 'collect_ceph_status.py')
     rsync(os.path.join(os.getenv('CHARM_DIR'), 'files',
-                       'nagios', 'collect_ceph_status.sh'),
+                       'nagios', 'collect_ceph_status.py'),
           script)
     cronjob = "{} root {}\n".format('*/5 * * * *', script)
     write_file(STATUS_CRONFILE, cronjob)
@@ -1238,9 +1364,9 @@ def update_nrpe_config():
     hostname = nrpe.get_nagios_hostname()
     current_unit = nrpe.get_nagios_unit_name()
     nrpe_setup = nrpe.NRPE(hostname=hostname)
-    check_cmd = 'check_ceph_status.py -f {} --degraded_thresh {}' \
+    check_cmd = 'check_ceph_status.py -s {} --degraded_thresh {}' \
         ' --misplaced_thresh {}' \
-        ' --recovery_rate {}'.format(STATUS_FILE,
+        ' --recovery_rate {}'.format(SNAPSHOT_FILE,
                                      config('nagios_degraded_thresh'),
                                      config('nagios_misplaced_thresh'),
                                      config('nagios_recovery_rate'))
@@ -1252,8 +1378,8 @@ def update_nrpe_config():
         check_cmd=check_cmd
     )
 
-    check_cmd = 'check_ceph_osd_count.py {} '.format(
-        HOST_OSD_COUNT_REPORT)
+    check_cmd = 'check_ceph_osd_count.py {} {}'.format(
+        HOST_OSD_COUNT_REPORT, SNAPSHOT_FILE)
     nrpe_setup.add_check(
         shortname='ceph_osd_count',
         description='Check if osd count matches expected count',
@@ -1267,9 +1393,9 @@ def update_nrpe_config():
         for key, value in x.items():
             name = "ceph-{}".format(key.replace(" ", ""))
             log("Adding check {}".format(name))
-            check_cmd = 'check_ceph_status.py -f {}' \
+            check_cmd = 'check_ceph_status.py -s {}' \
                 ' --additional_check \"{}\"' \
-                ' {}'.format(STATUS_FILE, value,
+                ' {}'.format(SNAPSHOT_FILE, value,
                              "--additional_check_critical"
                              if additional_critical is True else "")
             nrpe_setup.add_check(
@@ -1279,16 +1405,16 @@ def update_nrpe_config():
                 check_cmd=check_cmd
             )
     if config('nagios_check_num_osds'):
-        check_cmd = 'check_ceph_status.py -f {} --check_num_osds'.format(
-            STATUS_FILE)
+        check_cmd = 'check_ceph_status.py -s {} --check_num_osds'.format(
+            SNAPSHOT_FILE)
         nrpe_setup.add_check(
             shortname='ceph_num_osds',
             description='Check whether all OSDs are up and in',
             check_cmd=check_cmd
         )
 
-    check_cmd = ('check_radosgw_sync_status.py -f {}'
-                 .format(RADOSGW_STATUS_FILE))
+    check_cmd = ('check_radosgw_sync_status.py -s {}'
+                 .format(SNAPSHOT_FILE))
     if config('nagios_rgw_zones'):
         check_cmd += ' --zones "{}"'.format(config('nagios_rgw_zones'))
     if config('nagios_rgw_additional_checks'):
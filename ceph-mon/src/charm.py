@@ -72,6 +72,7 @@ class CephMonCharm(ops_openstack.core.OSBaseCharm):
     def on_install(self, event):
         self._initialise_config()
         self.install_pkgs()
+        ceph.invalidate_hook_cache(ceph.INSTALLED_PACKAGES)
         rm_packages = ceph.determine_packages_to_remove()
         if rm_packages:
             apt.remove_package(package_names=rm_packages)
@@ -322,4 +323,7 @@ class CephMonCharm(ops_openstack.core.OSBaseCharm):
 
 
 if __name__ == '__main__':
+    # Memoize read-only Ceph queries, such as the mon status and the OSD
+    # tree, that the notify_* loops repeat for every related unit.
+    ceph.enable_hook_cache()
     main(CephMonCharm)
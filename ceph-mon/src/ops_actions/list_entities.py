@@ -16,38 +16,43 @@
 
 """Retrieve a list of entities recognized by the Ceph cluster."""
 
-import json
 import logging
 import subprocess
 import yaml
 
+from charms_ceph.paging import dumps, results, select
+
 
 logger = logging.getLogger(__name__)
 
 
+def get_entities():
+    """Return the names of the entities known to the cluster."""
+    # NOTE(lmlg): Don't bother passing --format=json or the likes,
+    # since it sometimes contain escaped strings that are incompatible
+    # with python's json module. This method of fetching entities is
+    # simple enough and portable across Ceph versions.
+    out = subprocess.check_output(['sudo', 'ceph', 'auth', 'ls'])
+    return [line for line in out.decode('utf-8').split('\n')
+            if line and not (line.startswith(' ') or line.startswith('\t'))]
+
+
 def list_entities(event):
     try:
-        # NOTE(lmlg): Don't bother passing --format=json or the likes,
-        # since it sometimes contain escaped strings that are incompatible
-        # with python's json module. This method of fetching entities is
-        # simple enough and portable across Ceph versions.
-        out = subprocess.check_output(['sudo', 'ceph', 'auth', 'ls'])
-        ret = []
-
-        for line in out.decode('utf-8').split('\n'):
-            if line and not (line.startswith(' ') or line.startswith('\t') or
-                             line.startswith('\n')):
-                ret.append(line)
+        page = select(get_entities(),
+                      offset=event.params.get('offset', 0),
+                      limit=event.params.get('limit', 0),
+                      pattern=event.params.get('filter'))
 
         fmt = event.params.get('format', 'text')
         if fmt == 'json':
-            msg = json.dumps(str(ret))
+            msg = dumps(page.items)
         elif fmt == 'yaml':
-            msg = yaml.safe_dump(str(ret))
+            msg = yaml.safe_dump(page.items)
         else:
-            msg = '\n'.join(ret)
+            msg = '\n'.join(page.items)
 
-        event.set_results({'message': msg})
+        event.set_results(results(page, msg))
     except Exception as e:
         logger.warning(e)
         event.fail('failed to list entities: {}'.format(str(e)))
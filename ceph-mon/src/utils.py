@@ -265,6 +265,7 @@ def add_rbd_mirror_features(rbd_features):
     return rbd_features | RBD_FEATURE_EXCLUSIVE_LOCK | RBD_FEATURE_JOURNALING
 
 
+@ceph_utils.hook_cached()
 def get_rbd_features():
     """Determine if we should set, and what the rbd default features should be.
 
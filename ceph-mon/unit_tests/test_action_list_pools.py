@@ -92,18 +92,21 @@ class ListPoolsTestCase(CharmTestCase):
     def setUp(self):
         super(ListPoolsTestCase, self).setUp(
             list_pools, ["check_output", "function_fail", "function_get",
-                         "function_set"])
-        self.function_get.return_value = "json"  # format=json
-        self.check_output.return_value = self.ceph_osd_dump
+                         "function_set", "get_pool_ls_detail"])
+        self.params = {"format": "json"}
+        self.function_get.side_effect = self.params.get
+        self.get_pool_ls_detail.return_value = json.loads(
+            self.ceph_osd_dump)["pools"]
 
     def test_getting_list_pools_without_details(self):
         """Test getting list of pools without details."""
-        self.function_get.return_value = "text"
+        self.params["format"] = "text"
         self.check_output.return_value = b"1 test,2 test2"
         list_pools.main()
-        self.function_get.assert_called_once_with("format")
+        self.function_get.assert_any_call("format")
         self.function_set.assert_called_once_with(
             {"message": "1 test,2 test2"})
+        self.get_pool_ls_detail.assert_not_called()
 
     def test_getting_list_pools_with_details(self):
         """Test getting list of pools with details."""
@@ -113,7 +116,33 @@ class ListPoolsTestCase(CharmTestCase):
             self.pools = json.loads(message['message'])
         self.function_set.side_effect = _function_set
         list_pools.main()
-        self.function_get.assert_called_once_with("format")
+        self.function_get.assert_any_call("format")
         self.assertEqual(self.pools[0]["pool"], 1)
         self.assertEqual(self.pools[0]["size"], 3)
         self.assertEqual(self.pools[0]["min_size"], 2)
+        self.check_output.assert_not_called()
+
+    def test_getting_list_pools_paged(self):
+        """Test getting a filtered page of pools with some fields."""
+        self.params.update({"limit": 1, "filter": "test*",
+                            "fields": "pool_name,hit_set_params.type"})
+        list_pools.main()
+        self.function_set.assert_called_once_with({
+            "message": '[{"pool_name":"test",'
+                       '"hit_set_params":{"type":"none"}}]',
+            "total": 2,
+            "next-offset": 1})
+
+        self.function_set.reset_mock()
+        self.params.update({"format": "text", "offset": 1})
+        list_pools.main()
+        self.function_set.assert_called_once_with(
+            {"message": "2 test2", "total": 2})
+        self.check_output.assert_not_called()
+
+    def test_getting_list_pools_invalid_offset(self):
+        self.params["offset"] = -1
+        list_pools.main()
+        self.function_fail.assert_called_once_with(
+            "List pools failed with error: "
+            "offset and limit must not be negative")
@@ -28,16 +28,22 @@ class PlacementGroupRepairTestCase(CharmTestCase):
             action,
             [
                 "function_fail",
+                "function_get",
                 "function_set",
                 "get_rados_inconsistent_objs",
                 "get_rados_inconsistent_pgs",
             ],
         )
+        self.function_get.return_value = None
 
     @mock.patch("actions.pg_repair.get_rados_inconsistent_pgs")
     def test_get_inconsistent_pgs(self, _rados_inc_pgs):
         """Test collection of all inconsistent placement groups."""
-        _rados_inc_pgs.side_effect = (["1.a", "2.b"], ["2.b", "3.c"], [])
+        _rados_inc_pgs.side_effect = {
+            "testPool0": ["1.a", "2.b"],
+            "testPool1": ["2.b", "3.c"],
+            "testPool2": [],
+        }.get
         ceph_pools = ["testPool0", "testPool1", "testPool2"]
         result = action.get_inconsistent_pgs(ceph_pools)
         self.assertEqual(result, {"1.a", "2.b", "3.c"})
@@ -67,11 +73,12 @@ class PlacementGroupRepairTestCase(CharmTestCase):
 
     @mock.patch("actions.pg_repair.get_rados_inconsistent_objs")
     def test_get_safe_pg_repair(self, _rados_inc_objs):
-        _rados_inc_objs.side_effect = (
-            rados_inc_obj_output_safe(),
-            rados_inc_obj_output_extra_errors(),
-            rados_inc_obj_output_multiple_read_errors(),
-        )
+        outputs = {
+            "3.1f2": rados_inc_obj_output_safe(),
+            "12.ab3": rados_inc_obj_output_extra_errors(),
+            "16.222": rados_inc_obj_output_multiple_read_errors(),
+        }
+        _rados_inc_objs.side_effect = outputs.get
         inconsistent_pgs = ("3.1f2", "12.ab3", "16.222")
         result = action.get_safe_pg_repairs(inconsistent_pgs)
         self.assertEqual(result, {"3.1f2"})
@@ -93,23 +100,64 @@ class PlacementGroupRepairTestCase(CharmTestCase):
         msg = "No inconsistent placement groups found."
         self.function_set.assert_called_once_with(msg)
 
+    @mock.patch("actions.pg_repair.time.sleep")
+    @mock.patch("actions.pg_repair.get_pg_states")
     @mock.patch("actions.pg_repair.check_output")
     @mock.patch("actions.pg_repair.get_rados_inconsistent_objs")
     @mock.patch("actions.pg_repair.get_rados_inconsistent_pgs")
     @mock.patch("actions.pg_repair.list_pools")
     def test_pg_repair_safe_case(
-        self, _list_pools, _rados_inc_pgs, _rados_inc_objs, _check_output
+        self, _list_pools, _rados_inc_pgs, _rados_inc_objs, _check_output,
+        _get_pg_states, _sleep
     ):
         """Test action succeeds with one read error."""
         _list_pools.return_value = ["testPool"]
         _rados_inc_pgs.return_value = {"16.abf", "12.bd4"}
         _rados_inc_objs.return_value = rados_inc_obj_output_safe()
         _check_output.return_value = b""
+        _get_pg_states.return_value = {}
         action.pg_repair()
-        self.function_set.assert_called_once_with(
+        self.function_set.assert_called_with(
             {"message": "placement groups repaired: ['12.bd4', '16.abf']"}
         )
 
+    @mock.patch("actions.pg_repair.time.sleep")
+    @mock.patch("actions.pg_repair.get_pg_states")
+    @mock.patch("actions.pg_repair.check_output")
+    def test_perform_pg_repairs_throttled(
+        self, _check_output, _get_pg_states, _sleep
+    ):
+        """Test repairs sharing an OSD wait for each other."""
+        states = [
+            # 1.a and 1.b share osd.1; 1.c is on other OSDs.
+            {"1.a": ([0, 1], "active+clean+inconsistent"),
+             "1.b": ([1, 2], "active+clean+inconsistent"),
+             "1.c": ([3, 4], "active+clean+inconsistent")},
+            {"1.a": ([0, 1], "active+clean+scrubbing+deep+repair"),
+             "1.b": ([1, 2], "active+clean+inconsistent"),
+             "1.c": ([3, 4], "active+clean")},
+            {"1.a": ([0, 1], "active+clean"),
+             "1.b": ([1, 2], "active+clean+inconsistent"),
+             "1.c": ([3, 4], "active+clean")},
+            {"1.a": ([0, 1], "active+clean"),
+             "1.b": ([1, 2], "active+clean"),
+             "1.c": ([3, 4], "active+clean")},
+        ]
+        _get_pg_states.side_effect = states
+        action.perform_pg_repairs({"1.a", "1.b", "1.c"})
+        repairs = [c[0][0][-1] for c in _check_output.call_args_list]
+        self.assertEqual(repairs, ["1.a", "1.c", "1.b"])
+        self.assertEqual(_get_pg_states.call_count, 4)
+        self.function_set.assert_called_with({
+            "progress": "Repairing placement groups: 3 of 3 done, ETA 0s"})
+
+    def test_is_repair_finished(self):
+        self.assertTrue(action.is_repair_finished("active+clean"))
+        self.assertFalse(
+            action.is_repair_finished("active+clean+inconsistent"))
+        self.assertFalse(action.is_repair_finished(
+            "active+clean+scrubbing+deep+inconsistent+repair"))
+
     @mock.patch("actions.pg_repair.get_rados_inconsistent_objs")
     @mock.patch("actions.pg_repair.get_rados_inconsistent_pgs")
     @mock.patch("actions.pg_repair.list_pools")
@@ -121,7 +169,8 @@ class PlacementGroupRepairTestCase(CharmTestCase):
         _rados_inc_pgs.return_value = {"16.abf", "12.bd4"}
         _rados_inc_objs.return_value = rados_inc_obj_output_extra_errors()
         action.pg_repair()
-        self.function_set.assert_called_once()
+        self.function_set.assert_called_with(
+            "No safe placement group repairs found.")
 
     @mock.patch("actions.pg_repair.get_rados_inconsistent_objs")
     @mock.patch("actions.pg_repair.get_rados_inconsistent_pgs")
@@ -136,7 +185,8 @@ class PlacementGroupRepairTestCase(CharmTestCase):
             rados_inc_obj_output_multiple_read_errors()
         )
         action.pg_repair()
-        self.function_set.assert_called_once()
+        self.function_set.assert_called_with(
+            "No safe placement group repairs found.")
 
 
 def rados_inc_obj_output_safe():
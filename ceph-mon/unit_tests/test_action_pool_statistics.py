@@ -0,0 +1,53 @@
+# Copyright 2016 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+
+from actions import pool_statistics
+from test_utils import CharmTestCase
+
+
+CEPH_DF = b"""
+{"stats": {"total_bytes": 1000, "total_used_bytes": 10},
+ "pools": [
+  {"name": "rbd", "id": 1, "stats": {"stored": 5, "objects": 1}},
+  {"name": "glance", "id": 2, "stats": {"stored": 3, "objects": 2}},
+  {"name": "cinder-ceph", "id": 3, "stats": {"stored": 2, "objects": 3}}]}
+"""
+
+
+class PoolStatisticsTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(PoolStatisticsTestCase, self).setUp(
+            pool_statistics, ["check_output"])
+        self.check_output.return_value = CEPH_DF
+
+    def test_plain(self):
+        self.check_output.return_value = b"--- RAW STORAGE ---"
+        self.assertEqual(pool_statistics.get_pool_statistics(),
+                         {"message": "--- RAW STORAGE ---"})
+        self.check_output.assert_called_once_with(
+            ["ceph", "--id", "admin", "df"])
+        self.assertRaises(ValueError, pool_statistics.get_pool_statistics,
+                          "plain", pattern="rbd")
+
+    def test_json_paged(self):
+        rv = pool_statistics.get_pool_statistics(
+            "json", limit=1, pattern="*c*", fields="name,stats.stored")
+        self.assertEqual(rv["total"], 2)
+        self.assertEqual(rv["next-offset"], 1)
+        self.assertEqual(json.loads(rv["message"]), {
+            "stats": {"total_bytes": 1000, "total_used_bytes": 10},
+            "pools": [{"name": "glance", "stats": {"stored": 3}}]})
+        self.check_output.assert_called_once_with(
+            ["ceph", "--id", "admin", "df", "-f", "json"])
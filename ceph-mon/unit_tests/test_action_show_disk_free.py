@@ -0,0 +1,61 @@
+# Copyright 2016 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+
+from actions import show_disk_free
+from test_utils import CharmTestCase
+
+
+OSD_DF_TREE = b"""
+{"nodes": [
+  {"id": -1, "name": "default", "type": "root", "utilization": 1.5,
+   "children": [-3, -2]},
+  {"id": -2, "name": "host-1", "type": "host", "utilization": 1.5,
+   "children": [0]},
+  {"id": 0, "name": "osd.0", "type": "osd", "utilization": 1.5},
+  {"id": -3, "name": "host-2", "type": "host", "utilization": 1.5,
+   "children": [1]},
+  {"id": 1, "name": "osd.1", "type": "osd", "utilization": 1.5}],
+ "stray": [],
+ "summary": {"total_kb": 100, "average_utilization": 1.5}}
+"""
+
+
+class ShowDiskFreeTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(ShowDiskFreeTestCase, self).setUp(
+            show_disk_free, ["check_output"])
+        self.check_output.return_value = OSD_DF_TREE
+
+    def test_plain(self):
+        self.check_output.return_value = b"ID CLASS WEIGHT"
+        self.assertEqual(show_disk_free.get_disk_free("plain"),
+                         {"message": "ID CLASS WEIGHT"})
+        self.check_output.assert_called_once_with(
+            ["ceph", "--id", "admin", "osd", "df", "tree", "-f", "plain"])
+        self.assertRaises(ValueError, show_disk_free.get_disk_free,
+                          "xml", limit=10)
+
+    def test_json_paged(self):
+        rv = show_disk_free.get_disk_free("json", offset=1, limit=1,
+                                          pattern="osd.*",
+                                          fields="name,utilization")
+        self.assertEqual(rv["total"], 2)
+        self.assertNotIn("next-offset", rv)
+        self.assertEqual(json.loads(rv["message"]), {
+            "nodes": [{"name": "osd.1", "utilization": 1.5}],
+            "stray": [],
+            "summary": {"total_kb": 100, "average_utilization": 1.5}})
+        self.check_output.assert_called_once_with(
+            ["ceph", "--id", "admin", "osd", "df", "tree", "-f", "json"])
@@ -306,7 +306,24 @@ mgr.0
         event = test_utils.MockActionEvent({})
         self.harness.charm.on_list_entities_action(event)
         event.set_results.assert_called_once_with(
-            {"message": "client.admin\nmgr.0"}
+            {"message": "client.admin\nmgr.0", "total": 2}
+        )
+
+    @mock.patch.object(list_entities.subprocess, 'check_output')
+    def test_list_entities_paged(self, check_output):
+        check_output.return_value = b"""
+client.admin
+  key: AQAOwwFmTR3TNxAAIsdYgastd0uKntPtEnoWug==
+client.glance
+  key: AQAOwwFmTR3TNxAAIsdYgastd0uKntPtEnoWug==
+mgr.0
+  key: AQAVwwFm/CmaJhAAdacns6DdFe4xZE1iwj8izg==
+"""
+        event = test_utils.MockActionEvent({'format': 'json', 'limit': 1,
+                                            'filter': 'client.*'})
+        self.harness.charm.on_list_entities_action(event)
+        event.set_results.assert_called_once_with(
+            {"message": '["client.admin"]', "total": 2, "next-offset": 1}
         )
 
 
@@ -3,7 +3,7 @@ import json
 import unittest
 import sys
 
-from unittest.mock import patch, MagicMock, DEFAULT, call
+from unittest.mock import patch, MagicMock, ANY, DEFAULT, call
 
 # python-apt is not installed as part of test-requirements but is imported by
 # some charmhelpers modules so create a fake import.
@@ -12,6 +12,7 @@ sys.modules['apt'] = mock_apt
 mock_apt.apt_pkg = MagicMock()
 
 import charmhelpers.contrib.storage.linux.ceph as ceph
+import charms_ceph.cache as hook_cache
 import test_utils
 
 with patch('charmhelpers.contrib.hardening.harden.harden') as mock_dec:
@@ -242,19 +243,39 @@ class CephHooksTestCase(test_utils.CharmTestCase):
                     'ms_bind_ipv6': True}
         self.assertEqual(ctxt, expected)
 
+    @patch.object(ceph_hooks, 'log')
+    @patch.object(ceph_hooks, 'Crushmap')
+    def test_customize_failure_domain(self, mock_crushmap, mock_log):
+        crushmap = mock_crushmap.return_value
+        crushmap.save.return_value = 1
+        ceph_hooks.customize_failure_domain()
+        crushmap.set_failure_domain.assert_called_once_with('host', 'rack')
+        crushmap.save.assert_called_once_with()
+        crushmap.save.side_effect = ceph_hooks.subprocess.CalledProcessError(
+            1, 'setcrushmap')
+        ceph_hooks.customize_failure_domain()
+        mock_log.assert_called_with(ANY, level='error')
+
     @patch.object(ceph_hooks, 'config')
-    def test_nrpe_dependency_installed(self, mock_config):
+    def test_nrpe_collector_installed(self, mock_config):
         config = copy.deepcopy(CHARM_CONFIG)
         mock_config.side_effect = lambda key: config[key]
         with patch.multiple(ceph_hooks,
-                            apt_install=DEFAULT,
                             rsync=DEFAULT,
                             log=DEFAULT,
                             write_file=DEFAULT,
                             nrpe=DEFAULT) as mocks:
             ceph_hooks.update_nrpe_config()
-        mocks["apt_install"].assert_called_with(
-            "lockfile-progs", fatal=True)
+        mocks["rsync"].assert_any_call(
+            ANY, '/usr/local/bin/collect_ceph_status.py')
+        mocks["write_file"].assert_called_once_with(
+            ceph_hooks.STATUS_CRONFILE,
+            '*/5 * * * * root /usr/local/bin/collect_ceph_status.py\n')
+        check_cmds = [c[1]['check_cmd'] for c in
+                      mocks["nrpe"].NRPE.return_value.add_check.call_args_list]
+        self.assertTrue(check_cmds)
+        for check_cmd in check_cmds:
+            self.assertIn(ceph_hooks.SNAPSHOT_FILE, check_cmd)
 
     @patch.object(ceph_hooks, 'notify_prometheus')
     @patch.object(ceph_hooks, 'notify_rbd_mirrors')
@@ -262,7 +283,7 @@ class CephHooksTestCase(test_utils.CharmTestCase):
     @patch.object(ceph_hooks, 'notify_radosgws')
     @patch.object(ceph_hooks, 'ceph')
     @patch.object(ceph_hooks, 'config')
-    def test_upgrade_charm_with_nrpe_relation_installs_dependencies(
+    def test_upgrade_charm_with_nrpe_relation_installs_collector(
             self,
             mock_config,
             mock_ceph,
@@ -285,8 +306,8 @@ class CephHooksTestCase(test_utils.CharmTestCase):
                     "charmhelpers.contrib.hardening.harden.config"):
             mocks["is_relation_made"].return_value = True
             ceph_hooks.upgrade_charm()
-        mocks["apt_install"].assert_called_with(
-            "lockfile-progs", fatal=True)
+        mocks["write_file"].assert_called_with(
+            ceph_hooks.STATUS_CRONFILE, ANY)
         mock_notify_radosgws.assert_called_once_with(
             reprocess_broker_requests=True)
         mock_ceph.update_monfs.assert_called_once_with()
@@ -879,6 +900,7 @@ class RGWRelationTestCase(test_utils.CharmTestCase):
         'process_requests',
         'log',
         'relation_set',
+        'local_unit',
         'config',
     ]
 
@@ -909,6 +931,7 @@ class RGWRelationTestCase(test_utils.CharmTestCase):
                 'auth': self.test_config.get('auth-supported'),
                 'ceph-public-address': '10.10.10.2',
                 'radosgw_key': self.test_key,
+                'settings-fingerprint-ceph-radosgw-0': ANY,
             }
         )
         self.ceph.get_radosgw_key.assert_called_once_with()
@@ -925,10 +948,140 @@ class RGWRelationTestCase(test_utils.CharmTestCase):
                 'auth': self.test_config.get('auth-supported'),
                 'ceph-public-address': '10.10.10.2',
                 'testhostname_key': self.test_key,
+                'settings-fingerprint-ceph-radosgw-0': ANY,
             }
         )
         self.ceph.get_radosgw_key.assert_called_once_with(name='testhostname')
 
+    @patch.object(ceph_hooks, 'related_units')
+    @patch.object(ceph_hooks, 'relation_ids')
+    def test_notify_per_unit_radosgw_keys(self, mock_relation_ids,
+                                          mock_related_units):
+        published = {}
+        key_names = {'ceph-radosgw/0': 'host0', 'ceph-radosgw/1': 'host1'}
+
+        def _relation_get(attribute=None, unit=None, rid=None):
+            if unit == 'ceph-mon/0':
+                return dict(published)
+            return key_names[unit]
+
+        self.relation_get.side_effect = _relation_get
+        self.relation_set.side_effect = (
+            lambda relation_id, relation_settings:
+            published.update(relation_settings))
+        self.local_unit.return_value = 'ceph-mon/0'
+        self.ceph.get_radosgw_key.side_effect = (
+            lambda name: 'key-' + name)
+        self.process_requests.return_value = {}
+        mock_relation_ids.side_effect = (
+            lambda endpoint: ['radosgw:1'] if endpoint == 'radosgw' else [])
+        mock_related_units.return_value = sorted(key_names)
+
+        ceph_hooks.notify_radosgws()
+        self.assertEqual(self.relation_set.call_count, 2)
+        self.assertEqual(published['host0_key'], 'key-host0')
+        self.assertEqual(published['host1_key'], 'key-host1')
+        self.assertIn('settings-fingerprint-ceph-radosgw-0', published)
+        self.assertIn('settings-fingerprint-ceph-radosgw-1', published)
+        self.assertIn('(2 published, 0 unchanged)',
+                      self.log.call_args_list[-1][0][0])
+
+        self.relation_set.reset_mock()
+        self.relation_get.reset_mock()
+        ceph_hooks.notify_radosgws()
+        self.relation_set.assert_not_called()
+        # The local relation data is read once for both units.
+        self.assertEqual(
+            [c for c in self.relation_get.call_args_list
+             if c[1].get('unit') == 'ceph-mon/0'],
+            [call(rid='radosgw:1', unit='ceph-mon/0')])
+        self.assertIn('(0 published, 2 unchanged)',
+                      self.log.call_args_list[-1][0][0])
+
+
+class NotifyOSDsTestCase(test_utils.CharmTestCase):
+
+    TO_PATCH = [
+        'ceph',
+        'config',
+        'dashboard_relation',
+        'get_public_addr',
+        'handle_broker_request',
+        'is_leader',
+        'leader_get',
+        'local_unit',
+        'log',
+        'notify_radosgws',
+        'notify_rbd_mirrors',
+        'ready_for_service',
+        'related_units',
+        'relation_get',
+        'relation_ids',
+        'relation_set',
+        'send_osd_settings',
+    ]
+
+    def setUp(self):
+        super(NotifyOSDsTestCase, self).setUp(ceph_hooks, self.TO_PATCH)
+        self.addCleanup(hook_cache.disable_hook_cache)
+        self.published = {}
+        self.relation_get.side_effect = (
+            lambda attribute=None, rid=None, unit=None:
+            self.published.get(rid, {}))
+        self.relation_set.side_effect = (
+            lambda relation_id, relation_settings:
+            self.published.setdefault(relation_id, {}).update(
+                relation_settings))
+        self.relation_ids.side_effect = (
+            lambda endpoint: ['osd:0', 'osd:1'] if endpoint == 'osd' else [])
+        self.related_units.side_effect = (
+            lambda relid: ['ceph-osd/{}'.format(i) for i in range(3)])
+        self.local_unit.return_value = 'ceph-mon/0'
+        self.ceph.is_quorum.return_value = True
+        self.ceph.get_osd_bootstrap_key.return_value = 'bootstrap-key'
+        self.ceph.get_named_key.return_value = 'named-key'
+        self.ceph.create_named_keyring.return_value = 'crash-key'
+        self.leader_get.return_value = 'fsid'
+        self.get_public_addr.return_value = '10.0.0.1'
+        self.handle_broker_request.return_value = {}
+        self.is_leader.return_value = False
+        self.ready_for_service.return_value = False
+
+    def test_settings_built_once_per_hook(self):
+        hook_cache.enable_hook_cache()
+        ceph_hooks.notify_osds()
+        self.ceph.get_osd_bootstrap_key.assert_called_once_with()
+        self.assertEqual(self.ceph.get_named_key.call_count, 2)
+        self.ceph.create_named_keyring.assert_called_once()
+        self.assertEqual(self.relation_set.call_count, 6)
+        self.assertEqual(
+            self.published['osd:0']['settings-fingerprint-ceph-osd-0'],
+            ceph_hooks.settings_fingerprint({
+                'pending_key': '',
+                'fsid': 'fsid',
+                'osd_bootstrap_key': 'bootstrap-key',
+                'auth': 'cephx',
+                'ceph-public-address': '10.0.0.1',
+                'osd_upgrade_key': 'named-key',
+                'osd_disk_removal_key': 'named-key',
+                'client_crash_key': 'crash-key',
+            }))
+        self.assertIn(
+            '(3 published, 0 unchanged)', self.log.call_args_list[-1][0][0])
+
+    def test_publish_skipped_when_fingerprint_matches(self):
+        ceph_hooks.notify_osds()
+        self.relation_set.reset_mock()
+        ceph_hooks.notify_osds()
+        self.relation_set.assert_not_called()
+        self.handle_broker_request.return_value = {
+            'broker-rsp-ceph-osd-0': '{"exit-code": 0}'}
+        ceph_hooks.notify_osds()
+        self.assertEqual(self.relation_set.call_count, 6)
+        self.assertEqual(
+            self.published['osd:1']['broker-rsp-ceph-osd-0'],
+            '{"exit-code": 0}')
+
 
 class RBDMirrorRelationTestCase(test_utils.CharmTestCase):
 
@@ -947,6 +1100,7 @@ class RBDMirrorRelationTestCase(test_utils.CharmTestCase):
         'process_requests',
         'log',
         'relation_set',
+        'local_unit',
         'config',
         'handle_broker_request',
     ]
@@ -984,6 +1138,7 @@ class RBDMirrorRelationTestCase(test_utils.CharmTestCase):
             'ceph-cluster-address': '192.0.2.10',
             'pools': json.dumps({'pool': {}}),
             'broker_requests': '["fakejsonstr0", "fakejsonstr1"]',
+            'settings-fingerprint-ceph-rbd-mirror-0': ANY,
         }
         _retrieve_client_broker_requests.return_value = [
             self.FakeCephBrokerRq(raw_request_data={
@@ -1028,6 +1183,29 @@ class RBDMirrorRelationTestCase(test_utils.CharmTestCase):
             relation_id='rbd-mirror:42',
             relation_settings=key_relation_settings)
 
+    @patch.object(ceph_hooks, 'retrieve_client_broker_requests')
+    def test_notify_rbd_mirrors_lists_pools_once(
+            self, _retrieve_client_broker_requests):
+        self.addCleanup(hook_cache.disable_hook_cache)
+        hook_cache.enable_hook_cache()
+        self.handle_broker_request.return_value = {}
+        self.relation_ids.side_effect = (
+            lambda endpoint: ['rbd-mirror:51']
+            if endpoint == 'rbd-mirror' else [])
+        self.related_units.return_value = ['ceph-rbd-mirror/0',
+                                           'ceph-rbd-mirror/1']
+        self.local_unit.return_value = 'ceph-mon/0'
+        _retrieve_client_broker_requests.return_value = []
+        ceph_hooks.notify_rbd_mirrors()
+        self.assertEqual(self.relation_set.call_count, 2)
+        self.ceph.list_pools_detail.assert_called_once_with()
+        _retrieve_client_broker_requests.assert_called_once_with()
+
+        # A broker request changing the pools lists them again.
+        hook_cache.invalidate_hook_cache(hook_cache.POOLS)
+        ceph_hooks.notify_rbd_mirrors()
+        self.assertEqual(self.ceph.list_pools_detail.call_count, 2)
+
     @patch.object(ceph_hooks, 'CephBrokerRq')
     def test_retrieve_client_broker_requests(self, _CephBrokerRq):
         self.maxDiff = None
@@ -67,14 +67,14 @@ class TestCephOps(unittest.TestCase):
         self.assertEqual(json.loads(rc), {'exit-code': 0})
 
     @patch('charmhelpers.contrib.storage.linux.ceph.cmp_pkgrevno')
-    @patch.object(broker, 'pool_exists')
+    @patch.object(broker, 'get_pool_ls_detail')
     @patch.object(broker.ReplicatedPool, 'create')
     @patch.object(broker, 'log', lambda *args, **kwargs: None)
     def test_process_requests_create_replicated_pool(self,
                                                      mock_replicated_pool,
-                                                     mock_pool_exists,
+                                                     mock_pool_ls_detail,
                                                      mock_cmp_pkgrevno):
-        mock_pool_exists.return_value = False
+        mock_pool_ls_detail.return_value = []
         mock_cmp_pkgrevno.return_value = 1
         reqs = json.dumps({'api-version': 1,
                            'ops': [{
@@ -83,20 +83,20 @@ class TestCephOps(unittest.TestCase):
                                'replicas': 3
                            }]})
         rc = broker.process_requests(reqs)
-        mock_pool_exists.assert_called_with(service='admin', name='foo')
+        mock_pool_ls_detail.assert_called_once_with(client='admin')
         mock_replicated_pool.assert_called_with()
         self.assertEqual(json.loads(rc), {'exit-code': 0})
 
     @patch('charmhelpers.contrib.storage.linux.ceph.cmp_pkgrevno')
-    @patch.object(broker, 'pool_exists')
+    @patch.object(broker, 'get_pool_ls_detail')
     @patch.object(broker.ErasurePool, 'create')
     @patch.object(broker, 'erasure_profile_exists')
     @patch.object(broker, 'log', lambda *args, **kwargs: None)
     def test_process_requests_create_erasure_pool(self, mock_profile_exists,
                                                   mock_erasure_pool,
-                                                  mock_pool_exists,
+                                                  mock_pool_ls_detail,
                                                   mock_cmp_pkgrevno):
-        mock_pool_exists.return_value = False
+        mock_pool_ls_detail.return_value = []
         mock_cmp_pkgrevno.return_value = 1
         reqs = json.dumps({'api-version': 1,
                            'ops': [{
@@ -107,7 +107,7 @@ class TestCephOps(unittest.TestCase):
                            }]})
         rc = broker.process_requests(reqs)
         mock_profile_exists.assert_called_with(service='admin', name='default')
-        mock_pool_exists.assert_called_with(service='admin', name='foo')
+        mock_pool_ls_detail.assert_called_once_with(client='admin')
         mock_erasure_pool.assert_called_with()
         self.assertEqual(json.loads(rc), {'exit-code': 0})
 
@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import os
 import sys
+import tempfile
 import unittest
 
 from unittest.mock import patch, mock_open
@@ -109,6 +111,25 @@ class CheckCephOsdCountTestCase(unittest.TestCase):
             (exit_code, _) = check_ceph_osd_count.check_ceph_osd_count(file)
         self.assertEqual(exit_code, check_ceph_osd_count.EXIT_OK)
 
+    def test_get_osd_tree_from_snapshot(self):
+        """Check that the host osd map is read from the snapshot."""
+        osd_tree = {"nodes": [
+            {"id": -1, "name": "default", "type": "root", "children": [-2]},
+            {"id": -2, "name": "host1", "type": "host", "children": [1, 0]},
+            {"id": 0, "name": "osd.0", "type": "osd"},
+            {"id": 1, "name": "osd.1", "type": "osd"}]}
+        with tempfile.TemporaryDirectory() as wdir:
+            snapshot = os.path.join(wdir, "snapshot.json")
+            with open(snapshot, "w") as f:
+                json.dump({"osd_tree": osd_tree}, f)
+            self.assertEqual(check_ceph_osd_count.get_osd_tree(snapshot),
+                             {"host1": [1, 0]})
+
+            with open(snapshot, "w") as f:
+                json.dump({"osd_tree": None}, f)
+            self.assertRaises(check_ceph_osd_count.CriticalError,
+                              check_ceph_osd_count.get_osd_tree, snapshot)
+
     @patch("json.dumps")
     @patch("src.ceph_hooks.write_file")
     @patch("src.ceph_hooks.pathlib")
@@ -12,9 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import unittest
 import os
 import sys
+import tempfile
 
 from unittest.mock import patch
 
@@ -364,3 +366,35 @@ class NagiosTestCase(unittest.TestCase):
         args = check_ceph_status.parse_args(['--check_num_osds'])
         self.assertRaises(check_ceph_status.CriticalError,
                           lambda: check_ceph_status.check_ceph_status(args))
+
+    def _write_snapshot(self, wdir, **sections):
+        snapshot = os.path.join(wdir, 'snapshot.json')
+        with open(snapshot, 'w') as f:
+            json.dump(dict(sections, errors={'df': 'timed out'}), f)
+        return snapshot
+
+    # Status and version read from the collector's snapshot
+    def test_snapshot(self, mock_subprocess):
+        with open('unit_tests/ceph_ok_luminous.json') as f:
+            status = json.load(f)
+        with tempfile.TemporaryDirectory() as wdir:
+            snapshot = self._write_snapshot(
+                wdir, status=status,
+                version='ceph version 12.2.0 (abc) luminous (stable)')
+            args = check_ceph_status.parse_args(['-s', snapshot])
+            check_output = check_ceph_status.check_ceph_status(args)
+        self.assertRegex(check_output, r"^All OK$")
+        mock_subprocess.assert_not_called()
+
+    def test_snapshot_missing_section(self, mock_subprocess):
+        with tempfile.TemporaryDirectory() as wdir:
+            snapshot = self._write_snapshot(wdir, status=None)
+            args = check_ceph_status.parse_args(['--snapshot', snapshot])
+            self.assertRaises(
+                check_ceph_status.UnknownError,
+                lambda: check_ceph_status.check_ceph_status(args))
+            os.utime(snapshot, (0, 0))
+            self.assertRaises(
+                check_ceph_status.CriticalError,
+                lambda: check_ceph_status.check_ceph_status(args))
+        mock_subprocess.assert_not_called()
@@ -0,0 +1,66 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+os.sys.path.insert(1, os.path.join(sys.path[0], 'files/nagios'))
+import collect_ceph_status
+
+
+def fake_check_output(cmd, **kwargs):
+    if cmd[0] == 'radosgw-admin':
+        raise subprocess.CalledProcessError(
+            1, cmd, stderr=b'failed to init sync status\n')
+    if cmd[1] == '--version':
+        return b'ceph version 17.2.6 (abc) quincy (stable)\n'
+    return json.dumps({'cmd': cmd[1]}).encode('UTF-8')
+
+
+class CollectCephStatusTestCase(unittest.TestCase):
+
+    @patch.object(collect_ceph_status.subprocess, 'check_output')
+    def test_collect(self, mock_check_output):
+        mock_check_output.side_effect = fake_check_output
+        snapshot = collect_ceph_status.collect()
+        self.assertEqual(mock_check_output.call_count,
+                         len(collect_ceph_status.SECTIONS))
+        self.assertEqual(snapshot['status'], {'cmd': 'status'})
+        self.assertEqual(snapshot['osd_tree'], {'cmd': 'osd'})
+        self.assertEqual(snapshot['df'], {'cmd': 'df'})
+        self.assertEqual(snapshot['version'],
+                         'ceph version 17.2.6 (abc) quincy (stable)')
+        self.assertIsNone(snapshot['radosgw_sync_status'])
+        self.assertEqual(list(snapshot['errors']), ['radosgw_sync_status'])
+        self.assertTrue(snapshot['errors']['radosgw_sync_status'].endswith(
+            ': failed to init sync status'))
+        for call in mock_check_output.call_args_list:
+            self.assertEqual(call[1]['stderr'], subprocess.PIPE)
+
+    def test_write_snapshot(self):
+        with tempfile.TemporaryDirectory() as wdir:
+            filename = os.path.join(wdir, 'snapshot.json')
+            collect_ceph_status.write_snapshot({'status': {}}, filename)
+            collect_ceph_status.write_snapshot({'status': {'a': 1}},
+                                               filename)
+            self.assertEqual(os.listdir(wdir), ['snapshot.json'])
+            self.assertEqual(os.stat(filename).st_mode & 0o777, 0o640)
+            with open(filename) as f:
+                self.assertEqual(json.load(f), {'status': {'a': 1}})
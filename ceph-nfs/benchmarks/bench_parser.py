@@ -0,0 +1,199 @@
+#! /usr/bin/env python3
+#
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure Ganesha config parsing over many export blocks.
+
+Each export is parsed on its own, as list_shares does, and then all of
+them at once as a single config, with both the current parser and the
+previous one that went through JSON. Run from the charm directory:
+
+    python3 benchmarks/bench_parser.py --exports 10000
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import manager  # noqa: E402
+
+
+# The parser manager.py used to carry, taken from Manila.
+def legacy_conf2json(conf):
+    """Convert Ganesha config to JSON, one character at a time."""
+
+    # tokenize config string
+    token_list = [io.StringIO()]
+    state = {
+        'in_quote': False,
+        'in_comment': False,
+        'escape': False,
+    }
+
+    cbk = []
+    for char in conf:
+        if state['in_quote']:
+            if not state['escape']:
+                if char == '"':
+                    state['in_quote'] = False
+                    cbk.append(lambda: token_list.append(io.StringIO()))
+                elif char == '\\':
+                    cbk.append(lambda: state.update({'escape': True}))
+        else:
+            if char == "#":
+                state['in_comment'] = True
+            if state['in_comment']:
+                if char == "\n":
+                    state['in_comment'] = False
+            else:
+                if char == '"':
+                    token_list.append(io.StringIO())
+                    state['in_quote'] = True
+        state['escape'] = False
+        if not state['in_comment']:
+            token_list[-1].write(char)
+        while cbk:
+            cbk.pop(0)()
+
+    if state['in_quote']:
+        raise RuntimeError("Unterminated quoted string")
+
+    # jsonify tokens
+    js_token_list = ["{"]
+    for tok in token_list:
+        tok = tok.getvalue()
+
+        if tok[0] == '"':
+            js_token_list.append(tok)
+            continue
+
+        for pat, s in [
+                # add omitted "=" signs to block openings
+                (r'([^=\s])\s*{', '\\1={'),
+                # delete trailing semicolons in blocks
+                (r';\s*}', '}'),
+                # add omitted semicolons after blocks
+                (r'}\s*([^}\s])', '};\\1'),
+                # separate syntactically significant characters
+                (r'([;{}=])', ' \\1 ')]:
+            tok = re.sub(pat, s, tok)
+
+        # map tokens to JSON equivalents
+        for word in tok.split():
+            if word == "=":
+                word = ":"
+            elif word == ";":
+                word = ','
+            elif word in ['{', '}'] or  \
+                    re.search(r'\A-?[1-9]\d*(\.\d+)?\Z', word):
+                pass
+            else:
+                word = json.dumps(word)
+            js_token_list.append(word)
+    js_token_list.append("}")
+
+    # group quoted strings
+    token_grp_list = []
+    for tok in js_token_list:
+        if tok[0] == '"':
+            if not (token_grp_list and isinstance(token_grp_list[-1], list)):
+                token_grp_list.append([])
+            token_grp_list[-1].append(tok)
+        else:
+            token_grp_list.append(tok)
+
+    # process quoted string groups by joining them
+    js_token_list2 = []
+    for x in token_grp_list:
+        if isinstance(x, list):
+            x = ''.join(['"'] + [tok[1:-1] for tok in x] + ['"'])
+        js_token_list2.append(x)
+
+    return ''.join(js_token_list2)
+
+
+def legacy_parseconf(conf):
+    def list_to_dict(src_list):
+        # Convert a list of key-value pairs stored as tuples to a dict.
+        # For tuples with identical keys, preserve all the values in a
+        # list. e.g., argument [('k', 'v1'), ('k', 'v2')] to function
+        # returns {'k': ['v1', 'v2']}.
+        dst_dict = {}
+        for i in src_list:
+            if isinstance(i, tuple):
+                k, v = i
+                if isinstance(v, list):
+                    v = list_to_dict(v)
+                if k in dst_dict:
+                    dst_dict[k] = [dst_dict[k]]
+                    dst_dict[k].append(v)
+                else:
+                    dst_dict[k] = v
+        return dst_dict
+
+    li = json.loads(legacy_conf2json(conf), object_pairs_hook=lambda x: x)
+    return list_to_dict(li)
+
+
+def export_block(i):
+    return manager.mkconf({'EXPORT': {
+        'Export_Id': 1000 + i,
+        'Path': '/volumes/_nogroup/share-%d/%08x' % (i, i),
+        'FSAL': {'Name': 'Ceph', 'User_Id': 'ganesha-share-%d' % i,
+                 'Secret_Access_Key': 'AQCT9+9h4cwJOxAAue2fFvvGTWziUiR9k=='},
+        'Pseudo': '/volumes/_nogroup/share-%d/%08x' % (i, i),
+        'Squash': 'None',
+        'SecType': 'sys',
+        'CLIENT': [{'Access_Type': 'rw',
+                    'Clients': '10.%d.0.0/16, 192.168.0.1' % (i % 256)}],
+    }})
+
+
+def timed(fn, *args):
+    start = time.monotonic()
+    fn(*args)
+    return time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--exports', type=int, default=10000)
+    args = parser.parse_args()
+
+    blocks = [export_block(i) for i in range(args.exports)]
+    conf = '\n'.join(blocks)
+    parsed = manager.parseconf(blocks[-1])
+    assert manager.parseconf(manager.mkconf(parsed)) == parsed
+
+    print('{} exports, {:.1f} KiB of config'.format(
+        args.exports, len(conf) / 1024))
+    for name, parse in (('current', manager.parseconf),
+                        ('legacy', legacy_parseconf)):
+        each = timed(lambda: [parse(block) for block in blocks])
+        whole = timed(parse, conf)
+        print('{:<8} {:8.3f}s one by one {:8.3f}s as one config '
+              '{:8.1f} us/export'.format(
+                  name, each, whole, each / args.exports * 1e6))
+
+
+if __name__ == '__main__':
+    main()
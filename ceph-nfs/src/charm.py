@@ -172,7 +172,8 @@ class CephNFSCharm(
         ops_openstack.plugins.classes.BaseCephClientCharm):
     """Ceph NFS Base Charm."""
 
-    PACKAGES = ['nfs-ganesha-ceph', 'nfs-ganesha-rados-grace', 'ceph-common']
+    PACKAGES = ['nfs-ganesha-ceph', 'nfs-ganesha-rados-grace', 'ceph-common',
+                'python3-rados', 'python3-dbus']
 
     CEPH_CAPABILITIES = [
         "mgr", "allow rw",
@@ -216,6 +217,7 @@ class CephNFSCharm(
             is_started=False,
             is_cluster_setup=False
         )
+        self._ganesha_client = None
         self.ceph_client = ceph_client.CephClientRequires(
             self,
             'ceph-client')
@@ -306,7 +308,10 @@ class CephNFSCharm(
 
     @property
     def ganesha_client(self):
-        return GaneshaNFS(self.client_name, self.pool_name)
+        # Keep one client, and so one librados connection, per hook.
+        if self._ganesha_client is None:
+            self._ganesha_client = GaneshaNFS(self.client_name, self.pool_name)
+        return self._ganesha_client
 
     def request_ceph_pool(self, event):
         """Request pools from Ceph cluster."""
@@ -2,20 +2,113 @@
 # Copyright 2021 OpenStack Charmers
 # See LICENSE file for licensing details.
 
+import concurrent.futures
+import copy
+import importlib
 import json
 import logging
 import manager
 import subprocess
-from typing import Dict, List, Optional
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
 import tempfile
 import uuid
 
+# Loaded on first use by _librados, once python3-rados is installed.
+rados = None
+
+# Loaded on first use by _dbus, once python3-dbus is installed.
+dbus = None
+
 logger = logging.getLogger(__name__)
 
+CEPH_CONF = '/etc/ceph/ceph.conf'
+# The librados and dbus bindings are only packaged for the system Python
+# (python3-rados, python3-dbus). The charm's virtualenv uses the same
+# interpreter but does not see its dist-packages.
+SYSTEM_DIST_PACKAGES = '/usr/lib/python3/dist-packages'
+# Attempts at a compare-and-swap update of a RADOS object before giving up.
+MAX_CAS_ATTEMPTS = 50
+OMAP_PAGE = 1000
+# Number of export objects fetched at the same time by list_shares.
+EXPORT_FETCH_WORKERS = 16
+
+GANESHA_BUS_NAME = 'org.ganesha.nfsd'
+EXPORTMGR_INTERFACE = 'org.ganesha.nfsd.exportmgr'
+
 
 # TODO: Add ACL with kerberos
 
 
+def import_system_module(name: str):
+    """Import a module, falling back to the system dist-packages.
+
+    The system path is appended, so packages of the charm's virtualenv
+    still take precedence.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        if SYSTEM_DIST_PACKAGES not in sys.path:
+            sys.path.append(SYSTEM_DIST_PACKAGES)
+        return importlib.import_module(name)
+
+
+def _librados():
+    """Return the rados module.
+
+    There is no fallback to the rados CLI: it cannot update the export
+    counter and index atomically, so concurrent share changes would hand
+    out the same export ID or lose index entries.
+
+    :raises: RuntimeError if python3-rados is not installed.
+    """
+    global rados
+    if rados is None:
+        try:
+            rados = import_system_module('rados')
+        except ImportError as e:
+            raise RuntimeError(
+                "The librados Python bindings are not available, is "
+                "python3-rados installed? {}".format(e))
+    return rados
+
+
+def _dbus():
+    """Return the dbus module.
+
+    :raises: RuntimeError if python3-dbus is not installed.
+    """
+    global dbus
+    if dbus is None:
+        try:
+            dbus = import_system_module('dbus')
+        except ImportError as e:
+            raise RuntimeError(
+                "The dbus Python bindings are not available, is "
+                "python3-dbus installed? {}".format(e))
+    return dbus
+
+
+def _dbus_errors() -> tuple:
+    """Errors reported by a single Ganesha DBus call, whichever way it
+    was made."""
+    if dbus is None:
+        return (subprocess.CalledProcessError,)
+    return (subprocess.CalledProcessError, dbus.exceptions.DBusException)
+
+
+def _dbus_arg(arg: str):
+    """Convert a dbus-send style argument into a dbus-python value."""
+    kind, _, value = arg.partition(':')
+    if kind == 'uint16':
+        value = int(value)
+        return dbus.UInt16(value) if dbus is not None else value
+    return value
+
+
 class Export(object):
     """Object that encodes and decodes Ganesha export blocks"""
 
@@ -107,6 +200,56 @@ class GaneshaNFS(object):
     def __init__(self, client_name, ceph_pool):
         self.client_name = client_name
         self.ceph_pool = ceph_pool
+        self._cluster = None
+        self._ioctx = None
+        self._index_migrated = False
+        self._local = threading.local()
+        # Export object name -> (object version, Export)
+        self._export_cache = {}
+        # Share name -> export object name
+        self._share_objects = {}
+        self._bus = None
+        self._use_dbus = True
+        # Object path section -> DBus proxy object
+        self._dbus_objects = {}
+
+    @property
+    def ioctx(self):
+        """A librados I/O context on the pool, kept for the object's lifetime.
+
+        :raises: RuntimeError if librados is not available, rados.Error if
+                 the cluster cannot be reached.
+        """
+        if self._ioctx is None:
+            librados = _librados()
+            cluster = librados.Rados(conffile=CEPH_CONF,
+                                     rados_id=self.client_name)
+            cluster.connect()
+            try:
+                self._ioctx = cluster.open_ioctx(self.ceph_pool)
+            except Exception:
+                cluster.shutdown()
+                raise
+            self._cluster = cluster
+        return self._ioctx
+
+    @property
+    def bus(self):
+        """A system bus connection, kept for the object's lifetime.
+
+        :returns: The connection, or None if the system bus cannot be
+                  reached, in which case dbus-send is used instead.
+        :raises: RuntimeError if the dbus bindings are not available.
+        """
+        if self._bus is None and self._use_dbus:
+            bindings = _dbus()
+            try:
+                self._bus = bindings.SystemBus()
+            except bindings.exceptions.DBusException as e:
+                logging.warning("Unable to connect to the system bus, "
+                                "falling back to dbus-send: {}".format(e))
+                self._use_dbus = False
+        return self._bus
 
     def create_share(self, name: str = None, size: int = None,
                      access_ips: List[str] = None,
@@ -121,11 +264,9 @@ class GaneshaNFS(object):
         if name is None:
             name = str(uuid.uuid4())
         else:
-            existing_shares = [
-                share for share in self.list_shares() if share.name == name
-            ]
-            if existing_shares:
-                return existing_shares[0].path
+            existing_share = self.get_share(name)
+            if existing_share is not None:
+                return existing_share.path
         if size is not None:
             size_in_bytes = size * 1024 * 1024 * 1024
         if access_ips is None:
@@ -166,42 +307,80 @@ class GaneshaNFS(object):
         logging.debug("Export template::\n{}".format(export_template))
         tmp_file = self._tmpfile(export_template)
         self._rados_put('ganesha-export-{}'.format(export_id), tmp_file.name)
-        self._ganesha_add_export(self.export_path, tmp_file.name)
+        self._apply_export_change(add=[export])
         self._add_share_to_index(export_id)
         return self.export_path
 
     def list_shares(self) -> List[Export]:
-        share_urls = [
-            url.replace('%url rados://{}/'.format(self.ceph_pool), '')
-            for url
-            in self._rados_get('ganesha-export-index').splitlines()]
-        exports_raw = [
-            self._rados_get(url)
-            for url in share_urls
-            if url.strip()
-        ]
+        """List the exports in the index.
+
+        The export objects are fetched in parallel. Exports whose object
+        version hasn't changed since they were last fetched are not read or
+        parsed again.
+        """
+        self._migrate_index()
+        share_urls = [url for url in sorted(self._index_entries()[0])
+                      if url.strip()]
+        load = self._load_export
+
         exports = []
-        for export_raw in exports_raw:
-            try:
-                exports.append(Export.from_export(export_raw))
-            except RuntimeError:
-                logging.warning("Encountered an independently created export")
+        self._share_objects = {}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=EXPORT_FETCH_WORKERS) as executor:
+            for url, export in zip(share_urls, executor.map(load,
+                                                            share_urls)):
+                if export is None:
+                    continue
+                self._share_objects[export.name] = url
+                exports.append(copy.deepcopy(export))
         return exports
 
+    def _thread_ioctx(self):
+        # Object versions are tracked per I/O context, so each thread
+        # gets its own.
+        ioctx = getattr(self._local, 'ioctx', None)
+        if ioctx is None:
+            ioctx = self._local.ioctx = self._cluster.open_ioctx(
+                self.ceph_pool)
+        return ioctx
+
+    def _load_export(self, name: str) -> Optional[Export]:
+        """Fetch and parse an export object, unless the cached copy is current.
+        """
+        ioctx = self._thread_ioctx()
+        cached = self._export_cache.get(name)
+        try:
+            size, _ = ioctx.stat(name)
+            version = ioctx.get_last_version()
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            data = ioctx.read(name, length=size)
+            version = ioctx.get_last_version()
+        except rados.ObjectNotFound:
+            logging.warning("Export object {} is missing".format(name))
+            self._export_cache.pop(name, None)
+            return None
+
+        try:
+            export = Export.from_export(data.decode('utf-8'))
+        except RuntimeError:
+            logging.warning("Encountered an independently created export")
+            export = None
+        self._export_cache[name] = (version, export)
+        return export
+
     def resize_share(self, name: str, size: int):
         size_in_bytes = size * 1024 * 1024 * 1024
         self._ceph_subvolume_command('resize', 'ceph-fs', name,
                                      str(size_in_bytes), '--no_shrink')
 
     def delete_share(self, name: str, purge=False):
-        share = [share for share in self.list_shares() if share.name == name]
-        if share:
-            share = share[0]
-        else:
+        share = self.get_share(name)
+        if share is None:
             return
         logging.info("About to remove export {} ({})"
                      .format(share.name, share.export_id))
-        self._ganesha_remove_export(share.export_id)
+        self._apply_export_change(remove=[share.export_id])
         logging.debug("Removing export from index")
         self._remove_share_from_index(share.export_id)
         logging.debug("Removing export file from RADOS")
@@ -219,7 +398,7 @@ class GaneshaNFS(object):
         tmp_file = self._tmpfile(export_template)
         self._rados_put('ganesha-export-{}'.format(share.export_id),
                         tmp_file.name)
-        self._ganesha_update_export(share.export_id, tmp_file.name)
+        self._apply_export_change(update=[share])
 
     def revoke_access(self, name: str, client: str):
         share = self.get_share(name)
@@ -231,9 +410,15 @@ class GaneshaNFS(object):
         tmp_file = self._tmpfile(export_template)
         self._rados_put('ganesha-export-{}'.format(share.export_id),
                         tmp_file.name)
-        self._ganesha_update_export(share.export_id, tmp_file.name)
+        self._apply_export_change(update=[share])
 
     def get_share(self, name: str) -> Optional[Export]:
+        url = self._share_objects.get(name)
+        if url is not None:
+            # Known share; only its own object needs checking.
+            export = self._load_export(url)
+            if export is not None and export.name == name:
+                return copy.deepcopy(export)
         share = [share for share in self.list_shares() if share.name == name]
         if share:
             return share[0]
@@ -241,34 +426,92 @@ class GaneshaNFS(object):
     def update_share(self, id):
         pass
 
-    def _ganesha_add_export(self, export_path: str, tmp_path: str):
-        """Add a configured NFS export to Ganesha"""
-        self._dbus_send(
-            'ExportMgr', 'AddExport',
-            'string:{}'.format(tmp_path),
-            'string:EXPORT(Path={})'.format(export_path))
-
-    def _ganesha_remove_export(self, share_id: int):
-        """Remove a configured NFS export from Ganesha"""
-        self._dbus_send(
-            'ExportMgr',
-            'RemoveExport',
-            "uint16:{}".format(share_id))
-
-    def _ganesha_update_export(self, share_id: int, tmp_path: str):
-        """Update a configured NFS export in Ganesha"""
-        self._dbus_send(
-            'ExportMgr', 'UpdateExport',
-            'string:{}'.format(tmp_path),
-            'string:EXPORT(Export_Id={})'.format(share_id))
+    def apply_export_changes(
+            self, add: Iterable[Export] = (), update: Iterable[Export] = (),
+            remove: Iterable[int] = ()
+    ) -> Dict[int, Tuple[str, float, Optional[str]]]:
+        """Apply many export changes to the running Ganesha in one pass.
+
+        The exports to add or update are written to a single config file
+        and every change is sent over the same DBus connection. A change
+        that fails does not stop the others.
+
+        :param add: Exports to add to Ganesha
+        :param update: Exports to update in Ganesha
+        :param remove: IDs of the exports to remove from Ganesha
+
+        :returns: Export ID -> (DBus method, seconds taken, error or None)
+        """
+        add, update = list(add), list(update)
+        with tempfile.NamedTemporaryFile(mode='w') as tmp_file:
+            tmp_file.write('\n'.join(
+                export.to_export() for export in add + update))
+            tmp_file.flush()
+            calls = []
+            for action, exports in (('AddExport', add),
+                                    ('UpdateExport', update)):
+                calls.extend(
+                    (export.export_id, action,
+                     'string:{}'.format(tmp_file.name),
+                     'string:EXPORT(Export_Id={})'.format(export.export_id))
+                    for export in exports)
+            calls.extend((export_id, 'RemoveExport', 'uint16:{}'.format(
+                export_id)) for export_id in remove)
+
+            results = {}
+            start = time.monotonic()
+            for export_id, action, *args in calls:
+                call_start = time.monotonic()
+                error = None
+                try:
+                    self._dbus_send('ExportMgr', action, *args)
+                except _dbus_errors() as e:
+                    logging.error("{} of export {} failed: {}".format(
+                        action, export_id, e))
+                    error = str(e)
+                results[export_id] = (action, time.monotonic() - call_start,
+                                      error)
+        logging.info("Applied {} export changes ({} failed) in {:.3f}s".format(
+            len(results), sum(1 for r in results.values() if r[2]),
+            time.monotonic() - start))
+        return results
+
+    def _apply_export_change(self, **changes):
+        """Apply export changes to Ganesha, failing if any of them failed.
+
+        :raises: RuntimeError naming the first change that failed.
+        """
+        results = self.apply_export_changes(**changes)
+        for export_id, (action, _, error) in results.items():
+            if error is not None:
+                raise RuntimeError("{} of export {} failed: {}".format(
+                    action, export_id, error))
 
     def _dbus_send(self, section: str, action: str, *args):
-        """Send a command to Ganesha via Dbus"""
+        """Send a command to Ganesha via Dbus
+
+        Arguments take the dbus-send form, e.g. 'uint16:1'. The call goes
+        over the persistent system bus connection when there is one.
+        """
+        bus = self.bus
+        if bus is None:
+            return self._dbus_send_cli(section, action, *args)
+        obj = self._dbus_objects.get(section)
+        if obj is None:
+            obj = bus.get_object(GANESHA_BUS_NAME,
+                                 '/org/ganesha/nfsd/{}'.format(section))
+            self._dbus_objects[section] = obj
+        logging.debug("About to call: {}.{}{}".format(section, action, args))
+        return getattr(obj, action)(*[_dbus_arg(arg) for arg in args],
+                                    dbus_interface=EXPORTMGR_INTERFACE)
+
+    def _dbus_send_cli(self, section: str, action: str, *args):
+        """Send a command to Ganesha with dbus-send"""
         cmd = [
             'dbus-send', '--print-reply', '--system',
-            '--dest=org.ganesha.nfsd',
+            '--dest={}'.format(GANESHA_BUS_NAME),
             '/org/ganesha/nfsd/{}'.format(section),
-            'org.ganesha.nfsd.exportmgr.{}'.format(action)] + [*args]
+            '{}.{}'.format(EXPORTMGR_INTERFACE, action)] + [*args]
         logging.debug("About to call: {}".format(cmd))
         return subprocess.check_output(cmd)
 
@@ -347,13 +590,35 @@ class GaneshaNFS(object):
     def _get_next_export_id(self) -> int:
         """Retrieve the next available export ID, and update the rados key
 
+        The counter is updated with a compare-and-swap, so concurrent share
+        creations never get the same ID.
+
         :returns: The export ID
         :rtype: str
         """
-        next_id = int(self._rados_get(self.export_counter))
-        file = self._tmpfile(next_id + 1)
-        self._rados_put(self.export_counter, file.name)
-        return next_id
+        ioctx = self.ioctx
+
+        for _ in range(MAX_CAS_ATTEMPTS):
+            data, version = self._read_versioned(self.export_counter)
+            next_id = int(data)
+            write_op = ioctx.create_write_op()
+            try:
+                write_op.assert_version(version)
+                write_op.write_full(str(next_id + 1).encode('utf-8'))
+                ioctx.operate_write_op(write_op, self.export_counter)
+                return next_id
+            except rados.OSError:
+                logging.debug("Export counter changed, retrying")
+            finally:
+                write_op.release()
+        raise RuntimeError("Unable to allocate an export ID")
+
+    def _read_versioned(self, name: str) -> Tuple[bytes, int]:
+        """Read a whole RADOS object along with its version."""
+        ioctx = self.ioctx
+        size, _ = ioctx.stat(name)
+        data = ioctx.read(name, length=size) if size else b''
+        return data, ioctx.get_last_version()
 
     def _tmpfile(self, value: str) -> tempfile._TemporaryFileWrapper:
         file = tempfile.NamedTemporaryFile(mode='w+')
@@ -361,22 +626,6 @@ class GaneshaNFS(object):
         file.seek(0)
         return file
 
-    def _rados_get(self, name: str) -> str:
-        """Retrieve the content of the RADOS object with a given name
-
-        :param name: Name of the RADOS object to retrieve
-
-        :returns: Contents of the RADOS object
-        :rtype: str
-        """
-        cmd = [
-            'rados', '-p', self.ceph_pool, '--id', self.client_name,
-            'get', name, '/dev/stdout'
-        ]
-        logging.debug("About to call: {}".format(cmd))
-        output = subprocess.check_output(cmd)
-        return output.decode('utf-8')
-
     def _rados_put(self, name: str, source: str):
         """Store the contents of the source file in a named RADOS object.
 
@@ -385,12 +634,8 @@ class GaneshaNFS(object):
 
         :returns: None
         """
-        cmd = [
-            'rados', '-p', self.ceph_pool, '--id', self.client_name,
-            'put', name, source
-        ]
-        logging.debug("About to call: {}".format(cmd))
-        subprocess.check_call(cmd)
+        with open(source, 'rb') as f:
+            self.ioctx.write_full(name, f.read())
 
     def _rados_rm(self, name: str):
         """Remove a named RADOS object.
@@ -400,38 +645,126 @@ class GaneshaNFS(object):
 
         :returns: None
         """
-        cmd = [
-            'rados', '-p', self.ceph_pool, '--id', self.client_name,
-            'rm', name
-        ]
-        logging.debug("About to call: {}".format(cmd))
-        subprocess.check_call(cmd)
+        self.ioctx.remove_object(name)
+
+    def _export_url(self, export_id: int) -> str:
+        return '%url rados://{}/ganesha-export-{}'.format(
+            self.ceph_pool, export_id)
+
+    def _index_entries(self) -> Tuple[Dict[str, str], int]:
+        """Read the export index omap along with the index version.
+
+        :returns: Export object name to URL, and the index object version.
+        """
+        ioctx = self.ioctx
+        for _ in range(MAX_CAS_ATTEMPTS):
+            entries = {}
+            versions = set()
+            start_after = ''
+            while True:
+                read_op = ioctx.create_read_op()
+                try:
+                    it, _ = ioctx.get_omap_vals(read_op, start_after, '',
+                                                OMAP_PAGE)
+                    ioctx.operate_read_op(read_op, self.export_index)
+                    page = [(k, v.decode('utf-8')) for k, v in it]
+                finally:
+                    read_op.release()
+                versions.add(ioctx.get_last_version())
+                entries.update(page)
+                if len(page) < OMAP_PAGE:
+                    break
+                start_after = page[-1][0]
+            if len(versions) == 1:
+                return entries, versions.pop()
+        raise RuntimeError("Unable to read a consistent export index")
+
+    def _migrate_index(self):
+        """Copy the URLs of an index predating its omap into the omap."""
+        if self._index_migrated:
+            return
+        ioctx = self.ioctx
+        for _ in range(MAX_CAS_ATTEMPTS):
+            entries, _ = self._index_entries()
+            data, version = self._read_versioned(self.export_index)
+            urls = [url.strip() for url in data.decode('utf-8').split('\n')
+                    if url.strip()]
+            if entries or not urls:
+                self._index_migrated = True
+                return
+            logging.info("Moving {} exports to the index omap"
+                         .format(len(urls)))
+            write_op = ioctx.create_write_op()
+            try:
+                write_op.assert_version(version)
+                ioctx.set_omap(write_op,
+                               tuple(url.split('/')[-1] for url in urls),
+                               tuple(url.encode('utf-8') for url in urls))
+                ioctx.operate_write_op(write_op, self.export_index)
+                self._index_migrated = True
+                return
+            except rados.OSError:
+                logging.debug("Export index changed, retrying")
+            finally:
+                write_op.release()
+        raise RuntimeError("Unable to migrate the export index")
 
     def _add_share_to_index(self, export_id: int):
-        """Add an export RADOS object's URL to the RADOS URL index."""
-        index_data = self._rados_get(self.export_index)
-        url = '%url rados://{}/ganesha-export-{}'.format(
-            self.ceph_pool, export_id
-        )
-        rados_urls = index_data.split('\n')
-        if url not in rados_urls:
-            rados_urls.append(url)
-            tmpfile = self._tmpfile('\n'.join(rados_urls))
-            self._rados_put(self.export_index, tmpfile.name)
+        """Add an export RADOS object's URL to the RADOS URL index.
+
+        The index is kept both as omap entries, keyed by export object, and
+        as the list of URLs Ganesha includes. Adding an export only
+        appends to the latter.
+        """
+        ioctx = self.ioctx
+        self._migrate_index()
+        key = 'ganesha-export-{}'.format(export_id)
+        url = self._export_url(export_id)
+        for _ in range(MAX_CAS_ATTEMPTS):
+            read_op = ioctx.create_read_op()
+            try:
+                it, _ = ioctx.get_omap_vals_by_keys(read_op, (key,))
+                ioctx.operate_read_op(read_op, self.export_index)
+                present = any(True for _ in it)
+            finally:
+                read_op.release()
+            if present:
+                return
+            version = ioctx.get_last_version()
+            write_op = ioctx.create_write_op()
+            try:
+                write_op.assert_version(version)
+                ioctx.set_omap(write_op, (key,), (url.encode('utf-8'),))
+                write_op.append('\n{}'.format(url).encode('utf-8'))
+                ioctx.operate_write_op(write_op, self.export_index)
+                return
+            except rados.OSError:
+                logging.debug("Export index changed, retrying")
+            finally:
+                write_op.release()
+        raise RuntimeError("Unable to add export {} to the index"
+                           .format(export_id))
 
     def _remove_share_from_index(self, export_id: int):
         """Remove an export RADOS object's URL from the RADOS URL index."""
-        index_data = self._rados_get(self.export_index)
-        if not index_data:
-            return
-
-        unwanted_url = "%url rados://{0}/{1}".format(
-            self.ceph_pool,
-            'ganesha-export-{}'.format(export_id))
-        logging.debug("Looking for '{}' in index".format(unwanted_url))
-        rados_urls = index_data.split('\n')
-        logging.debug("Index URLs: {}".format(rados_urls))
-        index = [url.strip() for url in rados_urls if url != unwanted_url]
-        logging.debug("Index URLs without unwanted: {}".format(index))
-        tmpfile = self._tmpfile('\n'.join(index))
-        self._rados_put(self.export_index, tmpfile.name)
+        ioctx = self.ioctx
+        self._migrate_index()
+        key = 'ganesha-export-{}'.format(export_id)
+        for _ in range(MAX_CAS_ATTEMPTS):
+            entries, version = self._index_entries()
+            if entries.pop(key, None) is None:
+                return
+            write_op = ioctx.create_write_op()
+            try:
+                write_op.assert_version(version)
+                ioctx.remove_omap_keys(write_op, (key,))
+                write_op.write_full('\n'.join(
+                    entries[k] for k in sorted(entries)).encode('utf-8'))
+                ioctx.operate_write_op(write_op, self.export_index)
+                return
+            except rados.OSError:
+                logging.debug("Export index changed, retrying")
+            finally:
+                write_op.release()
+        raise RuntimeError("Unable to remove export {} from the index"
+                           .format(export_id))
@@ -16,8 +16,9 @@
 # The contents of this file were copied, almost straight, from
 # https://github.com/openstack/manila/blob/a3aaea91494665a25bdccebf69d9e85e8475983d/manila/share/drivers/ganesha/manager.py#L205
 #
-# The key differences is the lack of other Ganesha control code
-# and the removal of oslo's JSON helpers.
+# The key differences is the lack of other Ganesha control code,
+# the removal of oslo's JSON helpers and a parser that builds the
+# dictionary directly instead of converting the config to JSON.
 
 
 import io
@@ -29,97 +30,144 @@ import sys
 IWIDTH = 4
 
 
-def _conf2json(conf):
-    """Convert Ganesha config to JSON."""
-
-    # tokenize config string
-    token_list = [io.StringIO()]
-    state = {
-        'in_quote': False,
-        'in_comment': False,
-        'escape': False,
-    }
-
-    cbk = []
-    for char in conf:
-        if state['in_quote']:
-            if not state['escape']:
-                if char == '"':
-                    state['in_quote'] = False
-                    cbk.append(lambda: token_list.append(io.StringIO()))
-                elif char == '\\':
-                    cbk.append(lambda: state.update({'escape': True}))
-        else:
-            if char == "#":
-                state['in_comment'] = True
-            if state['in_comment']:
-                if char == "\n":
-                    state['in_comment'] = False
+# One token per match, after any whitespace and comments: a quoted string,
+# one of the syntactically significant characters, a bare word or the end
+# of the config. A lone double quote starts a string that never ends.
+# Whitespace and comments can only be split one way, so the scan is linear.
+_TOKEN_RE = re.compile(r'''
+    (?:\s|\#[^\n]*(?:\n|\Z))*
+    (?:
+        ("(?:[^"\\]|\\.)*")
+      | ([{}=;])
+      | ([^\s"#{}=;]+)
+      | (")
+      | \Z
+    )
+''', re.VERBOSE | re.DOTALL)
+# Bare words that are read as JSON numbers; anything else is a string.
+_NUMBER_RE = re.compile(r'-?(?:0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?\Z')
+_BOOLEANS = {'true': True, 'false': False}
+_DECODER = json.JSONDecoder(strict=False)
+_EOF = (None, None)
+
+
+def _tokenize(conf):
+    """Split Ganesha config into (kind, text) tokens.
+
+    The kind is 'string', 'word' or the punctuation character itself.
+    """
+    tokens = []
+    for string, punct, word, unterminated in _TOKEN_RE.findall(conf):
+        if string:
+            tokens.append(('string', string))
+        elif punct:
+            tokens.append((punct, punct))
+        elif word:
+            tokens.append(('word', word))
+        elif unterminated:
+            raise RuntimeError("Unterminated quoted string")
+    tokens.append(_EOF)
+    return tokens
+
+
+def _scalar(kind, text):
+    if kind == 'string':
+        if '\\' in text:
+            return _DECODER.decode(text)
+        return text[1:-1]
+    number = _NUMBER_RE.match(text)
+    if number:
+        if number.lastindex:
+            return float(text)
+        return int(text)
+    return _BOOLEANS.get(text, text)
+
+
+class _Parser(object):
+    """Recursive-descent parser turning Ganesha config tokens into a dict.
+
+    A key that appears more than once, e.g. several CLIENT blocks, maps
+    to the list of its values in order.
+    """
+
+    def __init__(self, conf):
+        self.tokens = _tokenize(conf)
+        self.pos = 0
+
+    def _error(self, message):
+        kind, text = self.tokens[self.pos]
+        raise ValueError("{} at token {} ({!r})".format(
+            message, self.pos, text if kind else 'end of config'))
+
+    def parse(self):
+        confdict = self._block()
+        if self.tokens[self.pos] is not _EOF:
+            self._error("Unexpected '}'")
+        return confdict
+
+    def _block(self):
+        confdict = {}
+        repeated = set()
+        while True:
+            kind, text = self.tokens[self.pos]
+            if kind is None or kind == '}':
+                return confdict
+            self.pos += 1
+            if kind == ';':
+                continue
+            if kind != 'word':
+                self.pos -= 1
+                self._error("Expected a key")
+            key = text
+            kind = self.tokens[self.pos][0]
+            assign = kind == '='
+            if assign:
+                self.pos += 1
+                kind = self.tokens[self.pos][0]
+            if kind == '{':
+                self.pos += 1
+                value = self._block()
+                if self.tokens[self.pos][0] != '}':
+                    self._error("Unterminated block {}".format(key))
+                self.pos += 1
+            elif assign:
+                value = self._value()
             else:
-                if char == '"':
-                    token_list.append(io.StringIO())
-                    state['in_quote'] = True
-        state['escape'] = False
-        if not state['in_comment']:
-            token_list[-1].write(char)
-        while cbk:
-            cbk.pop(0)()
-
-    if state['in_quote']:
-        raise RuntimeError("Unterminated quoted string")
-
-    # jsonify tokens
-    js_token_list = ["{"]
-    for tok in token_list:
-        tok = tok.getvalue()
-
-        if tok[0] == '"':
-            js_token_list.append(tok)
-            continue
-
-        for pat, s in [
-                # add omitted "=" signs to block openings
-                (r'([^=\s])\s*{', '\\1={'),
-                # delete trailing semicolons in blocks
-                (r';\s*}', '}'),
-                # add omitted semicolons after blocks
-                (r'}\s*([^}\s])', '};\\1'),
-                # separate syntactically significant characters
-                (r'([;{}=])', ' \\1 ')]:
-            tok = re.sub(pat, s, tok)
-
-        # map tokens to JSON equivalents
-        for word in tok.split():
-            if word == "=":
-                word = ":"
-            elif word == ";":
-                word = ','
-            elif word in ['{', '}'] or  \
-                    re.search(r'\A-?[1-9]\d*(\.\d+)?\Z', word):
-                pass
+                self._error("Expected '=' or '{{' after {}".format(key))
+
+            if key in repeated:
+                confdict[key].append(value)
+            elif key in confdict:
+                confdict[key] = [confdict[key], value]
+                repeated.add(key)
             else:
-                word = json.dumps(word)
-            js_token_list.append(word)
-    js_token_list.append("}")
-
-    # group quoted strings
-    token_grp_list = []
-    for tok in js_token_list:
-        if tok[0] == '"':
-            if not (token_grp_list and isinstance(token_grp_list[-1], list)):
-                token_grp_list.append([])
-            token_grp_list[-1].append(tok)
-        else:
-            token_grp_list.append(tok)
-
-    # process quoted string groups by joining them
-    js_token_list2 = []
-    for x in token_grp_list:
-        if isinstance(x, list):
-            x = ''.join(['"'] + [tok[1:-1] for tok in x] + ['"'])
-        js_token_list2.append(x)
-
-    return ''.join(js_token_list2)
+                confdict[key] = value
+
+    def _value(self):
+        parts = []
+        while True:
+            kind, text = self.tokens[self.pos]
+            if kind not in ('word', 'string'):
+                break
+            parts.append((kind, text))
+            self.pos += 1
+        if not parts:
+            self._error("Expected a value")
+        if kind == ';':
+            self.pos += 1
+        elif kind is not None and kind != '}':
+            self._error("Unexpected {!r}".format(kind))
+        if len(parts) == 1:
+            return _scalar(*parts[0])
+        # Adjacent quoted strings are concatenated, bare words keep the
+        # space between them, e.g. "Clients = 10.0.0.1, 10.0.0.2;".
+        value = _scalar('string', parts[0][1]) \
+            if parts[0][0] == 'string' else parts[0][1]
+        for (prev, _), (kind, text) in zip(parts, parts[1:]):
+            if kind == 'word' or prev == 'word':
+                value += ' '
+            value += _scalar('string', text) if kind == 'string' else text
+        return value
 
 
 def _dump_to_conf(confdict, out=sys.stdout, indent=0):
@@ -160,37 +208,12 @@ def parseconf(conf):
     Both native format and JSON are supported.
     Convert config to a (nested) dictionary.
     """
-    def list_to_dict(src_list):
-        # Convert a list of key-value pairs stored as tuples to a dict.
-        # For tuples with identical keys, preserve all the values in a
-        # list. e.g., argument [('k', 'v1'), ('k', 'v2')] to function
-        # returns {'k': ['v1', 'v2']}.
-        dst_dict = {}
-        for i in src_list:
-            if isinstance(i, tuple):
-                k, v = i
-                if isinstance(v, list):
-                    v = list_to_dict(v)
-                if k in dst_dict:
-                    dst_dict[k] = [dst_dict[k]]
-                    dst_dict[k].append(v)
-                else:
-                    dst_dict[k] = v
-        return dst_dict
-
     try:
         # allow config to be specified in JSON --
         # for sake of people who might feel Ganesha config foreign.
-        d = json.loads(conf)
+        return json.loads(conf)
     except ValueError:
-        # Customize JSON decoder to convert Ganesha config to a list
-        # of key-value pairs stored as tuples. This allows multiple
-        # occurrences of a config block to be later converted to a
-        # dict key-value pair, with block name being the key and a
-        # list of block contents being the value.
-        li = json.loads(_conf2json(conf), object_pairs_hook=lambda x: x)
-        d = list_to_dict(li)
-    return d
+        return _Parser(conf).parse()
 
 
 def mkconf(confdict):
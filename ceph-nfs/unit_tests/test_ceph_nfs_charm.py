@@ -65,3 +65,9 @@ class TestCephNFSCharmBase(CharmTestCase):
     def test_init(self):
         self.harness.begin()
         self.assertFalse(self.harness.charm._stored.is_started)
+
+    def test_packages(self):
+        # The share actions need the librados and dbus bindings, see
+        # ganesha.import_system_module.
+        self.assertIn('python3-rados', CephNFSCharm.PACKAGES)
+        self.assertIn('python3-dbus', CephNFSCharm.PACKAGES)
@@ -1,4 +1,12 @@
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+import unittest.mock
+
 import ganesha
 
 
@@ -33,6 +41,167 @@ EXPORT {
 """
 
 
+class FakeRados:
+    class Error(Exception):
+        pass
+
+    class OSError(Error):
+        pass
+
+    class ObjectNotFound(OSError):
+        pass
+
+
+class FakeOp:
+    def __init__(self):
+        self.version = None
+        self.data = None
+        self.appended = b''
+        self.omap_set = {}
+        self.omap_rm = ()
+        self.query = None
+        self.result = []
+
+    def assert_version(self, version):
+        self.version = version
+
+    def write_full(self, data):
+        self.data = data
+
+    def append(self, data):
+        self.appended += data
+
+    def release(self):
+        pass
+
+
+class FakeIoctx:
+    """An in-memory pool; objects have data, an omap and a version."""
+
+    def __init__(self, objects, lock):
+        self.objects = objects
+        self.lock = lock
+        self.last_version = 0
+
+    def _get(self, name):
+        if name not in self.objects:
+            raise FakeRados.ObjectNotFound(name)
+        return self.objects[name]
+
+    def stat(self, name):
+        with self.lock:
+            obj = self._get(name)
+            self.last_version = obj['version']
+            return len(obj['data']), 0
+
+    def read(self, name, length=8192, offset=0):
+        with self.lock:
+            obj = self._get(name)
+            self.last_version = obj['version']
+            return obj['data'][offset:offset + length]
+
+    def get_last_version(self):
+        return self.last_version
+
+    def write_full(self, name, data):
+        op = FakeOp()
+        op.write_full(data)
+        self.operate_write_op(op, name)
+
+    def remove_object(self, name):
+        with self.lock:
+            self._get(name)
+            del self.objects[name]
+
+    create_write_op = create_read_op = FakeOp
+
+    def set_omap(self, op, keys, values):
+        op.omap_set.update(zip(keys, values))
+
+    def remove_omap_keys(self, op, keys):
+        op.omap_rm = keys
+
+    def get_omap_vals(self, op, start_after, filter_prefix, max_return):
+        op.query = lambda omap: sorted(
+            (k, v) for k, v in omap.items()
+            if k > start_after and k.startswith(filter_prefix)
+        )[:max_return]
+        return op.result, 0
+
+    def get_omap_vals_by_keys(self, op, keys):
+        op.query = lambda omap: [(k, omap[k]) for k in keys if k in omap]
+        return op.result, 0
+
+    def operate_read_op(self, op, name):
+        with self.lock:
+            obj = self._get(name)
+            self.last_version = obj['version']
+            op.result.extend(op.query(obj['omap']))
+
+    def operate_write_op(self, op, name):
+        with self.lock:
+            obj = self.objects.setdefault(
+                name, {'data': b'', 'omap': {}, 'version': 0})
+            if op.version is not None and op.version != obj['version']:
+                raise FakeRados.OSError('version mismatch')
+            if op.data is not None:
+                obj['data'] = op.data
+            obj['data'] += op.appended
+            obj['omap'].update(op.omap_set)
+            for key in op.omap_rm:
+                obj['omap'].pop(key, None)
+            obj['version'] += 1
+            self.last_version = obj['version']
+
+
+class MockExportMgr:
+    """Ganesha's ExportMgr DBus object, keeping its exports in memory."""
+
+    def __init__(self, exports=()):
+        self.exports = {export_id: None for export_id in exports}
+        self.calls = []
+
+    def _load(self, path, expr):
+        export_id = int(re.search(r'Export_Id=(\d+)', expr).group(1))
+        with open(path) as file:
+            conf = file.read()
+        for text in re.split(r'(?m)^(?=EXPORT)', conf)[1:]:
+            block = ganesha.manager.parseconf(text)['EXPORT']
+            if block['Export_Id'] == export_id:
+                return export_id, block
+        raise subprocess.CalledProcessError(1, 'no export matches ' + expr)
+
+    def AddExport(self, path, expr, dbus_interface=None):
+        self.calls.append(('AddExport', dbus_interface))
+        export_id, block = self._load(path, expr)
+        if export_id in self.exports:
+            raise subprocess.CalledProcessError(1, 'export exists')
+        self.exports[export_id] = block
+
+    def UpdateExport(self, path, expr, dbus_interface=None):
+        self.calls.append(('UpdateExport', dbus_interface))
+        export_id, block = self._load(path, expr)
+        if export_id not in self.exports:
+            raise subprocess.CalledProcessError(1, 'no such export')
+        self.exports[export_id] = block
+
+    def RemoveExport(self, export_id, dbus_interface=None):
+        self.calls.append(('RemoveExport', dbus_interface))
+        if self.exports.pop(export_id, False) is False:
+            raise subprocess.CalledProcessError(1, 'no such export')
+
+
+class MockSystemBus:
+
+    def __init__(self, export_mgr):
+        self.export_mgr = export_mgr
+        self.objects = []
+
+    def get_object(self, bus_name, path):
+        self.objects.append((bus_name, path))
+        return self.export_mgr
+
+
 class ExportTest(unittest.TestCase):
 
     def test_parser(self):
@@ -85,20 +254,20 @@ class ExportTest(unittest.TestCase):
 class TestGaneshaNFS(unittest.TestCase):
 
     @unittest.mock.patch.object(ganesha.GaneshaNFS, '_ceph_subvolume_command')
-    @unittest.mock.patch.object(ganesha.GaneshaNFS, '_ganesha_add_export')
+    @unittest.mock.patch.object(ganesha.GaneshaNFS, '_add_share_to_index')
+    @unittest.mock.patch.object(ganesha.GaneshaNFS, '_apply_export_change')
     @unittest.mock.patch.object(ganesha.GaneshaNFS, '_get_next_export_id')
     @unittest.mock.patch.object(ganesha.GaneshaNFS, 'list_shares')
     @unittest.mock.patch.object(ganesha.GaneshaNFS, '_ceph_auth_key')
-    @unittest.mock.patch.object(ganesha.GaneshaNFS, '_rados_get')
     @unittest.mock.patch.object(ganesha.GaneshaNFS, '_rados_put')
     @unittest.mock.patch.object(ganesha.Export, 'to_export')
     def test_create_share(self, mock_export,
                           mock_rados_put,
-                          mock_rados_get,
                           mock_auth_key,
                           mock_list_shares,
                           mock_export_id,
-                          mock_add_export,
+                          mock_apply_change,
+                          mock_add_to_index,
                           mock_subvolume_command):
         mock_subvolume_command.return_value = b'mock-volume'
         mock_list_shares.return_value = []
@@ -111,6 +280,9 @@ class TestGaneshaNFS(unittest.TestCase):
         mock_subvolume_command.assert_any_call('create', 'ceph-fs',
                                                'test-create-share',
                                                str(3 * 1024 * 1024 * 1024))
+        export, = mock_apply_change.call_args[1]['add']
+        self.assertEqual(export.export_id, 1)
+        mock_add_to_index.assert_called_once_with(1)
 
     @unittest.mock.patch.object(ganesha.GaneshaNFS, '_ceph_subvolume_command')
     def test_resize_share(self, mock_subvolume_command):
@@ -121,15 +293,284 @@ class TestGaneshaNFS(unittest.TestCase):
                                                str(5 * 1024 * 1024 * 1024),
                                                '--no_shrink')
 
-    @unittest.mock.patch.object(ganesha.GaneshaNFS, '_rados_get')
-    def test_list_shares(self, mock_rados_get):
-        mock_rados_get.side_effect = ['%url rados://mypool/test_ganesha_share',
-                                      EXAMPLE_EXPORT]
+
+class TestSystemModules(unittest.TestCase):
+
+    def test_import_system_module(self):
+        saved_path = list(sys.path)
+        self.addCleanup(setattr, sys, 'path', saved_path)
+        with tempfile.TemporaryDirectory() as dist_packages:
+            with open(os.path.join(dist_packages,
+                                   'fake_system_rados.py'), 'w') as f:
+                f.write('LIBRADOS = True\n')
+            with unittest.mock.patch.object(ganesha, 'SYSTEM_DIST_PACKAGES',
+                                            dist_packages):
+                module = ganesha.import_system_module('fake_system_rados')
+                self.addCleanup(sys.modules.pop, 'fake_system_rados')
+                self.assertTrue(module.LIBRADOS)
+                # Appended, so the virtualenv's packages come first.
+                self.assertEqual(sys.path[-1], dist_packages)
+                self.assertEqual(sys.path.count(dist_packages), 1)
+                with self.assertRaises(ImportError):
+                    ganesha.import_system_module('no_such_system_module')
+                self.assertEqual(sys.path.count(dist_packages), 1)
+
+    @unittest.mock.patch.object(ganesha, 'import_system_module')
+    def test_librados_loaded_once(self, mock_import):
+        mock_import.return_value = FakeRados
+        with unittest.mock.patch.object(ganesha, 'rados', None):
+            self.assertIs(ganesha._librados(), FakeRados)
+            self.assertIs(ganesha._librados(), FakeRados)
+            self.assertIs(ganesha.rados, FakeRados)
+        mock_import.assert_called_once_with('rados')
+
+    @unittest.mock.patch.object(ganesha, 'import_system_module')
+    def test_no_dbus(self, mock_import):
+        mock_import.side_effect = ImportError('No module named dbus')
+        with unittest.mock.patch.object(ganesha, 'dbus', None):
+            inst = ganesha.GaneshaNFS('ceph-client', 'mypool')
+            with self.assertRaisesRegex(RuntimeError, 'python3-dbus'):
+                inst.apply_export_changes(remove=[1])
+
+
+class TestGaneshaNFSLibrados(unittest.TestCase):
+
+    def setUp(self):
+        patcher = unittest.mock.patch.object(ganesha, 'rados', FakeRados)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.lock = threading.Lock()
+        self.objects = {
+            'ganesha-export-counter': {
+                'data': b'1000', 'omap': {}, 'version': 1},
+            'ganesha-export-index': {'data': b'', 'omap': {}, 'version': 1},
+        }
+
+    def _client(self):
+        inst = ganesha.GaneshaNFS('ceph-client', 'mypool')
+        inst._ioctx = FakeIoctx(self.objects, self.lock)
+        inst._cluster = unittest.mock.MagicMock()
+        inst._cluster.open_ioctx.side_effect = (
+            lambda pool: FakeIoctx(self.objects, self.lock))
+        return inst
+
+    def _add_exports(self, inst, count):
+        for i in range(count):
+            export = EXAMPLE_EXPORT.replace(
+                'test_ganesha_share', 'share-{}'.format(i)).replace(
+                '1000', str(1000 + i))
+            self.objects['ganesha-export-{}'.format(1000 + i)] = {
+                'data': export.encode('utf-8'), 'omap': {}, 'version': 1}
+            inst._add_share_to_index(1000 + i)
+
+    def _index_urls(self):
+        data = self.objects['ganesha-export-index']['data'].decode('utf-8')
+        return [url for url in data.split('\n') if url]
+
+    def test_next_export_id_concurrent(self):
+        ids = []
+
+        def _allocate():
+            inst = self._client()
+            for _ in range(50):
+                ids.append(inst._get_next_export_id())
+
+        threads = [threading.Thread(target=_allocate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(ids), list(range(1000, 1200)))
+        self.assertEqual(self.objects['ganesha-export-counter']['data'],
+                         b'1200')
+
+    def test_next_export_id_conflict(self):
+        inst = self._client()
+        other = self._client()
+        read = inst._read_versioned
+
+        def _read_then_race(name):
+            rv = read(name)
+            if not other_ids:
+                other_ids.append(other._get_next_export_id())
+            return rv
+
+        other_ids = []
+        with unittest.mock.patch.object(inst, '_read_versioned',
+                                        _read_then_race):
+            self.assertEqual(inst._get_next_export_id(), 1001)
+        self.assertEqual(other_ids, [1000])
+
+    def test_index_add_remove(self):
+        inst = self._client()
+        for export_id in (1000, 1001, 1002, 1001):
+            inst._add_share_to_index(export_id)
+        self.assertEqual(self._index_urls(), [
+            '%url rados://mypool/ganesha-export-1000',
+            '%url rados://mypool/ganesha-export-1001',
+            '%url rados://mypool/ganesha-export-1002'])
+        self.assertEqual(
+            sorted(self.objects['ganesha-export-index']['omap']),
+            ['ganesha-export-1000', 'ganesha-export-1001',
+             'ganesha-export-1002'])
+
+        inst._remove_share_from_index(1001)
+        inst._remove_share_from_index(1005)
+        self.assertEqual(self._index_urls(), [
+            '%url rados://mypool/ganesha-export-1000',
+            '%url rados://mypool/ganesha-export-1002'])
+        self.assertNotIn('ganesha-export-1001',
+                         self.objects['ganesha-export-index']['omap'])
+
+    def test_index_migration(self):
+        self.objects['ganesha-export-index']['data'] = (
+            b'%url rados://mypool/ganesha-export-1000\n'
+            b'%url rados://mypool/ganesha-export-1001')
+        inst = self._client()
+        inst._add_share_to_index(1002)
+        self.assertEqual(
+            sorted(self.objects['ganesha-export-index']['omap']),
+            ['ganesha-export-1000', 'ganesha-export-1001',
+             'ganesha-export-1002'])
+        self.assertEqual(len(self._index_urls()), 3)
+
+    @unittest.mock.patch.object(ganesha, 'import_system_module')
+    def test_no_librados(self, mock_import):
+        mock_import.side_effect = ImportError('No module named rados')
+        with unittest.mock.patch.object(ganesha, 'rados', None):
+            inst = ganesha.GaneshaNFS('ceph-client', 'mypool')
+            with self.assertRaisesRegex(RuntimeError, 'python3-rados'):
+                inst._get_next_export_id()
+            with self.assertRaisesRegex(RuntimeError, 'python3-rados'):
+                inst._add_share_to_index(1000)
+        self.assertEqual(self.objects['ganesha-export-counter']['data'],
+                         b'1000')
+
+    def test_list_shares_cached_by_version(self):
+        inst = self._client()
+        self._add_exports(inst, 20)
+        with unittest.mock.patch.object(FakeIoctx, 'read', autospec=True,
+                                        side_effect=FakeIoctx.read) as read:
+            shares = inst.list_shares()
+            self.assertEqual(sorted(s.name for s in shares),
+                             sorted('share-{}'.format(i) for i in range(20)))
+            self.assertEqual(read.call_count, 20)
+
+            # Unchanged objects are not read again.
+            read.reset_mock()
+            self.assertEqual(len(inst.list_shares()), 20)
+            read.assert_not_called()
+
+            # Callers get their own copies.
+            shares[0].add_client('10.0.0.0/8')
+            self.assertNotIn('10.0.0.0/8',
+                             inst.get_share('share-0').clients_by_mode['rw'])
+
+            self.objects['ganesha-export-1003']['version'] += 1
+            self.assertEqual(len(inst.list_shares()), 20)
+            read.assert_called_once_with(
+                unittest.mock.ANY, 'ganesha-export-1003',
+                length=unittest.mock.ANY)
+
+    def test_get_share_checks_one_object(self):
+        inst = self._client()
+        self._add_exports(inst, 5)
+        inst.list_shares()
+        with unittest.mock.patch.object(FakeIoctx, 'stat', autospec=True,
+                                        side_effect=FakeIoctx.stat) as stat:
+            self.assertEqual(inst.get_share('share-3').export_id, 1003)
+            stat.assert_called_once_with(unittest.mock.ANY,
+                                         'ganesha-export-1003')
+            self.assertIsNone(inst.get_share('missing'))
+
+    def test_get_share_deleted_export(self):
+        inst = self._client()
+        self._add_exports(inst, 2)
+        inst.list_shares()
+        inst._remove_share_from_index(1001)
+        del self.objects['ganesha-export-1001']
+        self.assertIsNone(inst.get_share('share-1'))
+        self.assertEqual(inst.get_share('share-0').export_id, 1000)
+
+
+class TestGaneshaDBus(unittest.TestCase):
+
+    @staticmethod
+    def _export(export_id, clients='0.0.0.0'):
+        export = ganesha.Export.from_export(EXAMPLE_EXPORT)
+        export.export['Export_Id'] = export_id
+        export.clients[0]['Clients'] = clients
+        return export
+
+    def _client(self, export_mgr):
+        inst = ganesha.GaneshaNFS('ceph-client', 'mypool')
+        inst._bus = MockSystemBus(export_mgr)
+        return inst, inst._bus
+
+    def test_apply_export_changes(self):
+        export_mgr = MockExportMgr(exports=[1, 2, 3])
+        inst, bus = self._client(export_mgr)
+        results = inst.apply_export_changes(
+            add=[self._export(i) for i in range(10, 20)],
+            update=[self._export(1, '10.0.0.0/8')],
+            remove=[2, 99])
+
+        self.assertEqual(sorted(export_mgr.exports),
+                         [1, 3] + list(range(10, 20)))
+        self.assertEqual(export_mgr.exports[1]['CLIENT']['Clients'],
+                         '10.0.0.0/8')
+        self.assertEqual(len(results), 13)
+        self.assertEqual(results[10][0], 'AddExport')
+        self.assertEqual(results[1][0], 'UpdateExport')
+        for export_id, (action, seconds, error) in results.items():
+            self.assertGreaterEqual(seconds, 0)
+            if export_id == 99:
+                self.assertIn('no such export', error)
+            else:
+                self.assertIsNone(error)
+        # One connection and one object for the whole batch.
+        self.assertEqual(bus.objects,
+                         [('org.ganesha.nfsd', '/org/ganesha/nfsd/ExportMgr')])
+        self.assertEqual({iface for _, iface in export_mgr.calls},
+                         {'org.ganesha.nfsd.exportmgr'})
+
+    def test_single_changes_share_the_connection(self):
+        export_mgr = MockExportMgr(exports=[1, 5])
+        inst, bus = self._client(export_mgr)
+        inst._apply_export_change(remove=[1])
+        inst._apply_export_change(update=[self._export(5, '10.0.0.1')])
+        self.assertEqual(list(export_mgr.exports), [5])
+        self.assertEqual(export_mgr.exports[5]['CLIENT']['Clients'],
+                         '10.0.0.1')
+        with self.assertRaisesRegex(RuntimeError,
+                                    'RemoveExport of export 1 failed'):
+            inst._apply_export_change(remove=[1])
+        self.assertEqual(len(bus.objects), 1)
+
+    def test_export_file_removed_on_error(self):
+        inst, _ = self._client(MockExportMgr())
+        created = []
+        named_temporary_file = tempfile.NamedTemporaryFile
+
+        def record(*args, **kwargs):
+            created.append(named_temporary_file(*args, **kwargs))
+            return created[-1]
+
+        with unittest.mock.patch.object(
+                ganesha.tempfile, 'NamedTemporaryFile', side_effect=record):
+            with unittest.mock.patch.object(
+                    inst, '_dbus_send', side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    inst.apply_export_changes(add=[self._export(1)])
+        self.assertEqual(len(created), 1)
+        self.assertFalse(os.path.exists(created[0].name))
+
+    @unittest.mock.patch.object(ganesha.subprocess, 'check_output')
+    def test_dbus_send_fallback(self, mock_check_output):
         inst = ganesha.GaneshaNFS('ceph-client', 'mypool')
-        exports = inst.list_shares()
-        mock_rados_get.assert_any_call('ganesha-export-index')
-        mock_rados_get.assert_any_call('test_ganesha_share')
-        for export in exports:
-            self.assertEqual('test_ganesha_share', export.name)
-            self.assertEqual(export.clients_by_mode['r'], [])
-            self.assertEqual(['0.0.0.0'], export.clients_by_mode['rw'])
+        inst._use_dbus = False
+        inst.apply_export_changes(remove=[7])
+        mock_check_output.assert_called_once_with([
+            'dbus-send', '--print-reply', '--system',
+            '--dest=org.ganesha.nfsd', '/org/ganesha/nfsd/ExportMgr',
+            'org.ganesha.nfsd.exportmgr.RemoveExport', 'uint16:7'])
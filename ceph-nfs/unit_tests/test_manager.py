@@ -0,0 +1,68 @@
+import sys
+import unittest
+
+sys.path.append('src')  # noqa
+
+import manager
+
+
+CONF = """
+# A comment, and one after a value.
+NFS_CORE_PARAM {
+    Enable_NLM = false;  # no locking
+    Protocols = 4;
+}
+EXPORT {
+    Export_Id = 0;
+    Path = "/volumes/\\"quoted\\"/path";
+    Pseudo = "/volumes/" "joined";
+    FSAL { Name = Ceph; }
+    CLIENT {
+        Access_Type = rw;
+        Clients = 10.0.0.0/8, 192.168.0.1;
+    }
+    CLIENT {
+        Access_Type = "r";
+        Clients = 0.0.0.0;
+    };
+    CLIENT = { Access_Type = none; Clients = 172.16.0.1 }
+    Attr_Expiration_Time = -1.5
+}
+"""
+
+
+class ParseconfTest(unittest.TestCase):
+
+    def test_parse(self):
+        conf = manager.parseconf(CONF)
+        self.assertEqual(conf['NFS_CORE_PARAM'],
+                         {'Enable_NLM': False, 'Protocols': 4})
+        export = conf['EXPORT']
+        self.assertEqual(export['Export_Id'], 0)
+        self.assertEqual(export['Path'], '/volumes/"quoted"/path')
+        self.assertEqual(export['Pseudo'], '/volumes/joined')
+        self.assertEqual(export['FSAL'], {'Name': 'Ceph'})
+        self.assertEqual(export['CLIENT'], [
+            {'Access_Type': 'rw', 'Clients': '10.0.0.0/8, 192.168.0.1'},
+            {'Access_Type': 'r', 'Clients': '0.0.0.0'},
+            {'Access_Type': 'none', 'Clients': '172.16.0.1'},
+        ])
+        self.assertEqual(export['Attr_Expiration_Time'], -1.5)
+
+    def test_round_trip(self):
+        conf = manager.parseconf(CONF)
+        text = manager.mkconf(conf)
+        self.assertEqual(manager.parseconf(text), conf)
+        self.assertEqual(manager.mkconf(manager.parseconf(text)), text)
+
+    def test_json(self):
+        self.assertEqual(manager.parseconf('{"EXPORT": {"Export_Id": 1}}'),
+                         {'EXPORT': {'Export_Id': 1}})
+
+    def test_errors(self):
+        with self.assertRaises(RuntimeError):
+            manager.parseconf('EXPORT { Path = "/unterminated; }')
+        for conf in ('EXPORT { Path = /x;', 'EXPORT { Path = ; }', '}',
+                     'EXPORT Path;'):
+            with self.assertRaises(ValueError):
+                manager.parseconf(conf)
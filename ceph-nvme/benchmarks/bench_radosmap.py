@@ -0,0 +1,163 @@
+#! /usr/bin/env python3
+#
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure global map contention between gateways on a fake RADOS pool.
+
+Several gateways add hosts to random subsystems at the same time, using
+either the per-subsystem objects of RadosMap or the single JSON object of
+global map version 1. Run from the charm directory:
+
+    python3 benchmarks/bench_radosmap.py --gateways 4 --subsystems 1000
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)
+
+import radosmap  # noqa: E402
+from unit_tests.utils import FakeIoctx, FakeRados  # noqa: E402
+
+radosmap.rados = FakeRados
+
+
+def subsys_entry(i):
+    return {'name': 'rbd://{"pool":"bench","image":"image-%d"}' % i,
+            'units': {'gw-%d' % j: ['10.0.0.%d' % j, str(4420 + i)]
+                      for j in range(3)},
+            'hosts': [{'host': 'any', 'key': False}]}
+
+
+def add_host(host):
+    def _add(elem):
+        elem['hosts'].append({'host': host, 'key': None})
+        return elem
+    return _add
+
+
+class LegacyMap:
+    """The version 1 global map: one object, rewritten on every update."""
+
+    def __init__(self, ioctx):
+        self.ioctx = ioctx
+        self.conflicts = 0
+
+    def _read(self):
+        size = 8192
+        while True:
+            try:
+                data = self.ioctx.read(radosmap.V1_OBJECT, length=size)
+                return json.loads(data.decode('utf8'))
+            except json.decoder.JSONDecodeError:
+                size += 4096
+
+    def update_subsys(self, nqn, fn):
+        while True:
+            gmap = self._read()
+            version = self.ioctx.get_last_version()
+            gmap['subsys'][nqn] = fn(gmap['subsys'][nqn])
+            wx = self.ioctx.create_write_op()
+            wx.assert_version(version)
+            wx.write_full(json.dumps(gmap).encode('utf8'))
+            try:
+                self.ioctx.operate_write_op(wx, radosmap.V1_OBJECT)
+                return
+            except FakeRados.OSError:
+                self.conflicts += 1
+
+
+def populate(objects, count, legacy):
+    ioctx = FakeIoctx(objects)
+    subsys = {'nqn.%d' % i: subsys_entry(i) for i in range(count)}
+    data = json.dumps({'version': 1, 'subsys': subsys}).encode('utf8')
+    objects[radosmap.V1_OBJECT] = {'data': data, 'version': 1, 'omap': {}}
+    if not legacy:
+        rd = radosmap.RadosMap('bench', logging.getLogger('bench'))
+        rd.ioctx = ioctx
+        rd.migrate()
+
+
+def run(args, legacy):
+    objects = {}
+    lock = threading.Lock()
+    populate(objects, args.subsystems, legacy)
+
+    gateways = []
+    for _ in range(args.gateways):
+        ioctx = FakeIoctx(objects, lock, latency=args.latency / 1000)
+        if legacy:
+            gw = LegacyMap(ioctx)
+        else:
+            gw = radosmap.RadosMap('bench', logging.getLogger('bench'))
+            gw.ioctx = ioctx
+            gw.migrated = True
+        gateways.append(gw)
+
+    def _work(gw, seed):
+        rng = random.Random(seed)
+        for i in range(args.updates):
+            nqn = 'nqn.%d' % rng.randrange(args.subsystems)
+            gw.update_subsys(nqn, add_host('host-%d-%d' % (seed, i)))
+
+    threads = [threading.Thread(target=_work, args=(gw, n))
+               for n, gw in enumerate(gateways)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    updates = args.gateways * args.updates
+    return {
+        'elapsed': elapsed,
+        'rate': updates / elapsed,
+        'conflicts': sum(gw.conflicts for gw in gateways),
+        'read': sum(gw.ioctx.bytes_read for gw in gateways),
+        'written': sum(gw.ioctx.bytes_written for gw in gateways),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--gateways', type=int, default=4)
+    parser.add_argument('--subsystems', type=int, default=1000)
+    parser.add_argument('--updates', type=int, default=50,
+                        help='updates per gateway')
+    parser.add_argument('--latency', type=float, default=1.0,
+                        help='milliseconds per RADOS operation')
+    args = parser.parse_args()
+
+    print('{} gateways, {} subsystems, {} updates per gateway'.format(
+        args.gateways, args.subsystems, args.updates))
+    for name, legacy in (('version 1', True), ('version 2', False)):
+        res = run(args, legacy)
+        print('{:<10} {:8.2f}s {:8.1f} updates/s {:6d} conflicts '
+              '{:8.1f} MiB read {:8.1f} MiB written'.format(
+                  name, res['elapsed'], res['rate'], res['conflicts'],
+                  res['read'] / 2 ** 20, res['written'] / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#! /usr/bin/env python3
+#
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure proxy list/find latency against a fake SPDK with many subsystems.
+
+Run from the charm directory:
+
+    python3 benchmarks/bench_rpc.py --subsystems 1000 --iterations 50
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)
+
+import proxy  # noqa: E402
+from unit_tests.utils import MockSPDK  # noqa: E402
+
+
+class NullMap:
+    def __init__(self, *args):
+        pass
+
+    def add_cluster(self, *args):
+        pass
+
+    def get_global_map(self):
+        return {'version': 0, 'subsys': {}}
+
+    def update_map(self, fn):
+        pass
+
+
+def subsystem_cmds(count):
+    for i in range(count):
+        nqn = proxy.NQN_BASE + '00000000-0000-0000-0000-%012d' % i
+        bdev = 'rbd://' + proxy._json_dumps(
+            {'pool': 'bench', 'image': 'image-%d' % i, 'cluster': 'ceph'})
+        yield ('nvmf_create_subsystem', {'nqn': nqn})
+        yield ('nvmf_subsystem_add_listener', {
+            'nqn': nqn, 'listen_address': {
+                'trtype': 'tcp', 'traddr': '10.0.0.1', 'adrfam': 'IPv4',
+                'trsvcid': str(10000 + i)}})
+        yield ('nvmf_subsystem_add_ns', {
+            'nqn': nqn, 'namespace': proxy.Proxy.ns_dict(bdev, nqn)})
+
+
+def start_spdk(sock_path, count):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(sock_path)
+    sock.listen(1)
+
+    def _serve():
+        spdk = MockSPDK(sock, list(subsystem_cmds(count)))
+        while True:
+            try:
+                spdk.loop()
+            except Exception:
+                break
+
+    thread = threading.Thread(target=_serve, daemon=True)
+    thread.start()
+
+
+def timed(fn, iterations):
+    start = time.monotonic()
+    for _ in range(iterations):
+        rv = fn()
+    return (time.monotonic() - start) / iterations, rv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subsystems', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as wdir:
+        sock_path = os.path.join(wdir, 'spdk.sock')
+        config_path = os.path.join(wdir, 'config.json')
+        with open(config_path, 'w') as file:
+            json.dump({'proxy-port': 0, 'pool': 'bench', 'node-id': 'bench',
+                       'discovery-port': 0}, file)
+
+        start_spdk(sock_path, args.subsystems)
+        prx = proxy.Proxy(config_path, sock_path, NullMap)
+        nqn = proxy.NQN_BASE + '00000000-0000-0000-0000-%012d' % (
+            args.subsystems - 1)
+
+        results = [
+            ('list', timed(lambda: prx._post_list({}), args.iterations)),
+            ('find', timed(lambda: prx._post_find({'nqn': nqn}),
+                           args.iterations)),
+        ]
+
+    print('{} subsystems, {} iterations'.format(args.subsystems,
+                                                args.iterations))
+    for name, (latency, rv) in results:
+        size = len(rv) if isinstance(rv, list) else int(bool(rv))
+        print('{:<6} {:>10.3f} ms  ({} results)'.format(
+            name, latency * 1000, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -84,6 +84,8 @@ class CephNVMECharm(ops.CharmBase):
         obs(self.on.reset_target_action, self.on_reset_target_action)
         obs(self.on.pause_action, self.on_pause_action)
         obs(self.on.resume_action, self.on_resume_action)
+        obs(self.on.migrate_global_map_action,
+            self.on_migrate_global_map_action)
         obs(self.client.on.broker_available, self._on_ceph_relation_joined)
         obs(self.client.on.pools_available, self._on_ceph_relation_changed)
         obs(self.admin_access.on.admin_access_request, self.on_admin_access)
@@ -553,6 +555,14 @@ class CephNVMECharm(ops.CharmBase):
     def on_resume_action(self, event):
         self._resume(event)
 
+    def on_migrate_global_map_action(self, event):
+        res = self._msgloop(self.rpc.migrate_map(), addr='127.0.0.1')
+        if 'error' in res:
+            event.fail('failed to migrate global map: %s' % str(res['error']))
+            return
+
+        event.set_results({'migrated': res['migrated']})
+
     def _install_packages(self, packages):
         # Code taken from charmhelpers.
         cmd = ['sudo', 'apt-get', '--assume-yes',
@@ -15,13 +15,17 @@
 # limitations under the License.
 
 import argparse
+import collections
+import concurrent.futures
 import errno
 import json
 import logging
 import os
+import selectors
 import shutil
 import socket
 import sys
+import threading
 import time
 import uuid
 
@@ -33,6 +37,13 @@ import utils
 NQN_BASE = 'nqn.2014-08.org.nvmexpress:uuid:'
 NQN_DISCOVERY = 'nqn.2014-08.org.nvmexpress.discovery'
 
+# Number of requests that may be processed at the same time.
+DEFAULT_WORKERS = 8
+# Serialization key for requests that modify the local cluster state.
+CLUSTER_KEY = 'cluster'
+# Seconds after which the subsystem index is reloaded from SPDK.
+INDEX_REFRESH_INTERVAL = 300
+
 logger = logging.getLogger(__name__)
 
 
@@ -81,6 +92,8 @@ class ProxyCreateEndpoint:
         payload = proxy.rpc.nvmf_subsystem_add_listener(**kwargs)
         self._check_reply(payload, proxy)
         cleanup.append(proxy.rpc.nvmf_subsystem_remove_listener(**kwargs))
+        # Let the post handler know where we're listening.
+        self.msg['listen_address'] = params
 
     def __call__(self, proxy):
         cleanup = []
@@ -197,6 +210,131 @@ class ProxyRemoveHost:
         return rv
 
 
+class RequestScheduler:
+    """Run requests on a thread pool, serializing those sharing a key.
+
+    Requests are identified by a set of keys (the NQNs they touch). A
+    request only starts once no running or earlier queued request holds
+    any of its keys, so requests for the same NQN run in arrival order,
+    while requests for different NQNs run concurrently.
+    """
+
+    def __init__(self, workers):
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='proxy')
+        self.lock = threading.Lock()
+        self.busy = set()
+        self.pending = collections.deque()
+        self.in_flight = 0
+
+    def submit(self, keys, fn, *args):
+        with self.lock:
+            blocked = set(self.busy)
+            for pkeys, _, _ in self.pending:
+                blocked.update(pkeys)
+            if keys & blocked:
+                self.pending.append((keys, fn, args))
+                return
+            self._start(keys, fn, args)
+
+    def _start(self, keys, fn, args):
+        self.busy.update(keys)
+        self.in_flight += 1
+        self.pool.submit(self._run, keys, fn, args)
+
+    def _run(self, keys, fn, args):
+        try:
+            fn(*args)
+        finally:
+            with self.lock:
+                self.busy.difference_update(keys)
+                self.in_flight -= 1
+                blocked = set()
+                waiting = collections.deque()
+                for entry in self.pending:
+                    if entry[0] & (self.busy | blocked):
+                        blocked.update(entry[0])
+                        waiting.append(entry)
+                    else:
+                        self._start(*entry)
+                self.pending = waiting
+
+    def queue_depth(self):
+        """Return the number of requests queued or in progress."""
+        with self.lock:
+            return len(self.pending) + self.in_flight
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class SubsystemIndex:
+    """In-memory index of the SPDK subsystems, keyed by NQN.
+
+    The index is loaded from SPDK on first use and kept up to date by the
+    proxy's own changes. SPDK has no cheap way to tell whether subsystems
+    changed, so the index is reloaded when an NQN the proxy could not
+    track precisely is looked up, and every INDEX_REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(self, fetch, refresh_interval=INDEX_REFRESH_INTERVAL):
+        self.fetch = fetch
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.subsystems = None
+        self.stale = set()
+        self.refreshed = 0
+        self.refreshes = 0
+
+    def _check(self, nqn=None):
+        # Must be called with the lock held.
+        if (self.subsystems is None or
+                (nqn is None and self.stale) or nqn in self.stale or
+                time.monotonic() - self.refreshed > self.refresh_interval):
+            subsystems = self.fetch()
+            if subsystems is None:
+                if self.subsystems is None:
+                    raise ProxyError('failed to list SPDK subsystems')
+                return
+
+            self.subsystems = subsystems
+            self.stale.clear()
+            self.refreshed = time.monotonic()
+            self.refreshes += 1
+
+    def get(self, nqn):
+        """Return the subsystem for an NQN, or None."""
+        with self.lock:
+            self._check(nqn)
+            return self.subsystems.get(nqn)
+
+    def items(self):
+        """Return a list of (NQN, subsystem) pairs."""
+        with self.lock:
+            self._check()
+            return list(self.subsystems.items())
+
+    def add(self, nqn, subsys):
+        with self.lock:
+            if self.subsystems is not None:
+                self.subsystems[nqn] = subsys
+
+    def discard(self, nqn):
+        with self.lock:
+            if self.subsystems is not None:
+                self.subsystems.pop(nqn, None)
+
+    def update(self, nqn, **kwargs):
+        with self.lock:
+            if self.subsystems is not None and nqn in self.subsystems:
+                self.subsystems[nqn].update(kwargs)
+
+    def invalidate(self, *nqns):
+        """Reload the index the next time one of nqns is looked up."""
+        with self.lock:
+            self.stale.update(nqns)
+
+
 class Proxy:
     def __init__(self, config_path, rpc_path, map_cls=radosmap.RadosMap):
         with open(config_path) as file:
@@ -204,6 +342,13 @@ class Proxy:
 
         self.rpc = utils.RPC()
         self.buffer = bytearray(4096 * 10)
+        self.map_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stats = collections.defaultdict(
+            lambda: {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+        self.scheduler = None
+        self.index = SubsystemIndex(self.get_spdk_subsystems)
+        self.workers = config.get('workers', DEFAULT_WORKERS)
         self.node_id = config['node-id']
         self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.receiver.bind(('0.0.0.0', config['proxy-port']))
@@ -252,6 +397,7 @@ class Proxy:
         while True:
             if os.access(rpc_path, os.F_OK) or time.time() > end:
                 self.rpc_sock.connect(rpc_path)
+                self.rpc_client = utils.RPCClient(self.rpc_sock)
                 return
 
             time.sleep(0.1)
@@ -292,11 +438,12 @@ class Proxy:
             self.local_file = open(fname, 'w+b')
             return {'version': radosmap.VERSION, 'clusters': []}
 
-        for elem in obj.get('clusters', ()):
-            self.msgloop(self.rpc.bdev_rbd_register_cluster(
+        self.rpc_client.call_many([
+            self.rpc.bdev_rbd_register_cluster(
                 name=elem['name'], user_id=elem['user'],
                 config_param={'key': elem['key'],
-                              'mon_host': elem['mon_host']}))
+                              'mon_host': elem['mon_host']})
+            for elem in obj.get('clusters', ())])
 
         return obj
 
@@ -399,12 +546,12 @@ class Proxy:
 
     def msgloop(self, msg):
         """Send an RPC to SPDK and receive the response."""
-        self.rpc_sock.sendall(json.dumps(msg).encode('utf8'))
-        nbytes = self.rpc_sock.recv_into(self.buffer)
-        try:
-            return json.loads(self.buffer[:nbytes])
-        except Exception:
-            return None
+        return self.rpc_client.call(msg)
+
+    def update_subsys(self, nqn, fn):
+        """Update an NQN's global map entry, one request at a time."""
+        with self.map_lock:
+            self.gmapper.update_subsys(nqn, fn)
 
     def _get_method_handlers(self, method):
         expand = getattr(self, '_expand_' + method, None)
@@ -423,6 +570,9 @@ class Proxy:
             logger.debug('stopping proxy as requested')
             return True
 
+        self._execute(method, obj, addr)
+
+    def _execute(self, method, obj, addr):
         handler, post = self._get_method_handlers(method)
         if handler is None:
             logger.error('invalid method: %s', method)
@@ -432,13 +582,19 @@ class Proxy:
 
         logger.info('processing request: %s', obj)
         obj = obj.get('params')
-        cmds = list(handler(obj))
-        for cmd in cmds:
-            self._process_cmd(cmd)
+        try:
+            cmds = list(handler(obj))
+            for cmd in cmds:
+                self._process_cmd(cmd)
+
+            resp = {}
+            if post is not None:
+                resp = post(obj) or {}
+        except Exception:
+            # The subsystems may have been left half-modified.
+            self.index.invalidate(*self._request_keys(method, obj))
+            raise
 
-        resp = {}
-        if post is not None:
-            resp = post(obj) or {}
         self.receiver.sendto(_json_dumps(resp).encode('utf8'), addr)
 
     @staticmethod
@@ -448,26 +604,94 @@ class Proxy:
 
         return {"code": -2, "type": str(type(exc)), "message": str(exc)}
 
+    def _send_error(self, exc, addr):
+        err = {"error": self._make_exc_msg(exc)}
+        self.receiver.sendto(json.dumps(err).encode('utf8'), addr)
+
+    @staticmethod
+    def _request_keys(method, params):
+        """Return the set of keys a request must be serialized on."""
+        params = params or {}
+        if 'nqn' in params:
+            return {params['nqn']}
+        elif 'subsystems' in params:
+            return {elem['nqn'] for elem in params['subsystems']}
+        elif method == 'cluster_add':
+            return {CLUSTER_KEY}
+        return set()
+
+    def _run_request(self, method, obj, addr, received):
+        start = time.monotonic()
+        failed = False
+        try:
+            self._execute(method, obj, addr)
+        except Exception as exc:
+            failed = True
+            logger.exception('caught exception: ')
+            self._send_error(exc, addr)
+
+        end = time.monotonic()
+        with self.stats_lock:
+            stats = self.stats[method]
+            stats['count'] += 1
+            stats['errors'] += failed
+            stats['total'] += end - received
+            stats['max'] = max(stats['max'], end - received)
+        logger.debug('%s processed in %.3fs (%.3fs queued)',
+                     method, end - received, start - received)
+
     def serve(self):
-        """Main server loop."""
-        while True:
-            inaddr = None
-            try:
-                nbytes, inaddr = self.receiver.recvfrom_into(self.buffer)
-                logger.info('got a request from address ', inaddr)
-                rv = self.handle_request(self.buffer[:nbytes], inaddr)
-                if rv:
-                    logger.warning('got a request to stop proxy')
-                    return
-            except Exception as exc:
-                logger.exception('caught exception: ')
-                if inaddr is not None:
-                    err = {"error": self._make_exc_msg(exc)}
-                    self.receiver.sendto(json.dumps(err).encode('utf8'),
-                                         inaddr)
+        """Main server loop.
+
+        Requests are read as they arrive and handed to a pool of workers,
+        so that slow SPDK or RADOS operations don't hold up the requests
+        behind them. Requests for the same NQN are run in order.
+        """
+        self.scheduler = RequestScheduler(self.workers)
+        selector = selectors.DefaultSelector()
+        selector.register(self.receiver, selectors.EVENT_READ)
+        try:
+            while True:
+                selector.select()
+                inaddr = None
+                try:
+                    nbytes, inaddr = self.receiver.recvfrom_into(self.buffer)
+                    logger.info('got a request from address %s', inaddr)
+                    obj = json.loads(self.buffer[:nbytes])
+                    method = obj['method'].strip()
+                    if method == 'stop':
+                        logger.warning('got a request to stop proxy')
+                        return
+
+                    keys = self._request_keys(method, obj.get('params'))
+                    self.scheduler.submit(keys, self._run_request, method,
+                                          obj, inaddr, time.monotonic())
+                except Exception as exc:
+                    logger.exception('caught exception: ')
+                    if inaddr is not None:
+                        self._send_error(exc, inaddr)
+        finally:
+            selector.close()
+            self.scheduler.shutdown()
 
     # RPC handlers.
 
+    def _post_stats(self, msg):
+        with self.stats_lock:
+            methods = {
+                method: {'count': elem['count'], 'errors': elem['errors'],
+                         'avg_ms': round(1000 * elem['total'] /
+                                         elem['count'], 3),
+                         'max_ms': round(1000 * elem['max'], 3)}
+                for method, elem in self.stats.items()}
+
+        queue_depth = 0
+        if self.scheduler is not None:
+            # Don't count this request.
+            queue_depth = self.scheduler.queue_depth() - 1
+        return {'queue_depth': queue_depth, 'methods': methods,
+                'index_refreshes': self.index.refreshes}
+
     @staticmethod
     def _parse_bdev_name(name):
         ix = name.find('://')
@@ -520,24 +744,31 @@ class Proxy:
         yield ProxyCreateEndpoint(msg, bdev_name, cluster)
 
     def _post_create(self, msg):
-        subsystems = self.get_spdk_subsystems()
         nqn = msg['nqn']
-        sub = subsystems[nqn]
-        trid = sub['listen_addresses'][0]
-
-        def _update_map(gmap):
-            elem = {'name': msg['bdev_name'], 'units': {},
-                    'hosts': [{'host': 'any', 'key': False}]}
-            sub = gmap['subsys'].setdefault(nqn, elem)
-            sub['units'].update({self.node_id: [trid['traddr'],
-                                                str(trid['trsvcid'])]})
+        trid = msg['listen_address']
+        namespace = self.ns_dict(msg['bdev_name'], nqn)
+        namespace['name'] = msg['bdev_name']
+        self.index.add(nqn, {'subtype': 'NVMe', 'listen_addresses': [trid],
+                             'allow_any_host': False, 'hosts': [],
+                             'namespaces': [namespace]})
+
+        def _update_subsys(elem):
+            if elem is None:
+                elem = {'name': msg['bdev_name'], 'units': {},
+                        'hosts': [{'host': 'any', 'key': False}]}
+            elem['units'].update({self.node_id: [trid['traddr'],
+                                                 str(trid['trsvcid'])]})
+            return elem
 
-        self.gmapper.update_map(_update_map)
+        self.update_subsys(nqn, _update_subsys)
         return {'nqn': nqn, 'addr': trid['traddr'], 'port': trid['trsvcid']}
 
     def _expand_remove(self, msg):
         nqn = msg['nqn']
-        name = self.get_spdk_subsystems()[nqn]['namespaces'][0]['name']
+        subsys = self.index.get(nqn)
+        if subsys is None:
+            raise ProxyError('nqn not found')
+        name = subsys['namespaces'][0]['name']
         payload = self.rpc.nvmf_subsystem_remove_ns(
             nqn=msg['nqn'], nsid=1)
         yield ProxyCommand(payload)
@@ -549,14 +780,16 @@ class Proxy:
         yield ProxyCommand(payload)
 
     def _post_remove(self, msg):
-        def _update_map(gmap):
-            elem = gmap['subsys'].get(msg['nqn'])
-            if elem is None:
+        self.index.discard(msg['nqn'])
+
+        def _update_subsys(elem):
+            if elem is None or self.node_id not in elem['units']:
                 return
 
             elem['units'].pop(self.node_id)
+            return elem
 
-        self.gmapper.update_map(_update_map)
+        self.update_subsys(msg['nqn'], _update_subsys)
 
     def _expand_cluster_add(self, msg):
         for cluster in self.local_state.get('clusters', ()):
@@ -577,10 +810,13 @@ class Proxy:
         self.local_file.write(data)
         self.local_file.truncate(len(data))
 
+    def _post_migrate_map(self, msg):
+        with self.map_lock:
+            return {'migrated': self.gmapper.migrate()}
+
     def _expand_join(self, msg):
         nqn = msg['nqn']
-        subsystems = self.get_spdk_subsystems()
-        if nqn not in subsystems:
+        if self.index.get(nqn) is None:
             return
 
         for elem in msg.get('addresses', ()):
@@ -591,16 +827,15 @@ class Proxy:
             yield ProxyCommand(payload)
 
     def _post_find(self, msg):
-        subsys = self.get_spdk_subsystems().get(msg['nqn'])
+        subsys = self.index.get(msg['nqn'])
         return self._subsystem_to_dict(subsys) if subsys else {}
 
     def _post_list(self, msg):
-        subsystems = self.get_spdk_subsystems()
         return [{'nqn': nqn, **self._subsystem_to_dict(subsys)}
-                for nqn, subsys in subsystems.items()]
+                for nqn, subsys in self.index.items()]
 
     def _post_host_list(self, msg):
-        subsys = self.get_spdk_subsystems().get(msg['nqn'])
+        subsys = self.index.get(msg['nqn'])
         if subsys is None:
             return {'error': 'nqn not found'}
         elif subsys.get('allow_any_host'):
@@ -632,49 +867,61 @@ class Proxy:
             yield ProxyAddHost(payload, msg.get('dhchap_key'))
 
     def _post_host_add(self, msg):
-        def _update_map(gmap):
-            elem = gmap['subsys'].get(msg['nqn'])
+        if msg['host'] == 'any':
+            self.index.update(msg['nqn'], allow_any_host=True)
+        else:
+            # Let SPDK tell us how it describes the host and its key.
+            self.index.invalidate(msg['nqn'])
+
+        def _update_subsys(elem):
             if elem is None:
-                self.logger.warning('host_add: NQN %s not found' % msg['nqn'])
+                logger.warning('host_add: NQN %s not found' % msg['nqn'])
                 return
 
             hosts = elem['hosts']
             host = msg['host']
             if host == 'any':
                 hosts[0]['key'] = True
-                return
+                return elem
 
             for h in hosts:
                 if h['host'] == host:
                     h['key'] = msg.get('dhchap_key')
-                    return
+                    return elem
 
             hosts.append({'host': host, 'key': msg.get('dhchap_key')})
+            return elem
 
-        self.gmapper.update_map(_update_map)
+        self.update_subsys(msg['nqn'], _update_subsys)
 
     def _expand_host_del(self, msg):
         yield ProxyRemoveHost(msg)
 
     def _post_host_del(self, msg):
-        def _update_map(gmap):
-            elem = gmap['subsys'].get(msg['nqn'])
+        if msg['host'] == 'any':
+            self.index.update(msg['nqn'], allow_any_host=False)
+        else:
+            self.index.invalidate(msg['nqn'])
+
+        def _update_subsys(elem):
             if elem is None:
-                self.logger.warning('host_del: NQN %s not found' % msg['nqn'])
+                logger.warning('host_del: NQN %s not found' % msg['nqn'])
                 return
 
             hosts = elem['hosts']
-            h = msg['host']
-            if h == 'any':
+            host = msg['host']
+            if host == 'any':
                 hosts[0]['key'] = False
-                return
+                return elem
 
             for i, h in enumerate(hosts):
-                if h['host'] == h:
+                if h['host'] == host:
                     elem['hosts'] = hosts[:i] + hosts[i + 1:]
-                    return
+                    return elem
+
+            logger.warning('host %s not found' % host)
 
-            self.logger.warning('host %s not found' % h)
+        self.update_subsys(msg['nqn'], _update_subsys)
 
 
 def main():
@@ -15,13 +15,33 @@
 # limitations under the License.
 
 import json
+import random
+import time
 
 try:
     import rados
 except ImportError:
     rados = None
 
-VERSION = 1
+# Version 1 kept every subsystem in the 'global-map' object. Version 2
+# keeps one object per subsystem, listed in the omap of a directory
+# object, and leaves a version marker in 'global-map'.
+#
+# Gateways running version 1 only know the 'global-map' object, so an
+# existing version 1 map is kept, and updated in place, until migrate()
+# is called once every gateway runs version 2 (see the migrate-global-map
+# action). A pool without a map starts out at version 2.
+VERSION = 2
+V1_OBJECT = 'global-map'
+DIRECTORY = 'nvme-subsystems'
+SUBSYS_PREFIX = 'nvme-subsys.'
+# Number of attempts at a compare-and-swap update or a consistent read.
+MAX_ATTEMPTS = 100
+OMAP_PAGE = 1000
+
+
+def _subsys_object(nqn):
+    return SUBSYS_PREFIX + nqn
 
 
 class RadosMap:
@@ -30,6 +50,8 @@ class RadosMap:
         self.logger = logger
         self.cluster = None
         self.ioctx = None
+        self.migrated = False
+        self.conflicts = 0
 
     def add_cluster(self, app_name, key, mon_host):
         if self.ioctx is not None:
@@ -48,47 +70,194 @@ class RadosMap:
         self.cluster = rd
         self.logger.info('connected to cluster')
 
-    def get_global_map(self):
-        size = 8192   # default size
-        num = 0
-        while True:
-            num += 1
-            if num > 100:
-                raise RuntimeError('failed to get global map')
+    def _read_object(self, name):
+        """Read a JSON object, returning it and its version.
+
+        Returns (None, 0) if the object doesn't exist, and an empty dict
+        if it is empty.
+        """
+        for _ in range(MAX_ATTEMPTS):
             try:
-                data = self.ioctx.read('global-map', length=size)
-                return json.loads(data.decode('utf8'))
+                size, _ = self.ioctx.stat(name)
+                data = self.ioctx.read(name, length=size)
+                version = self.ioctx.get_last_version()
+                if not size and not data:
+                    return {}, version
+                return json.loads(data.decode('utf8')), version
             except json.decoder.JSONDecodeError:
-                size += 4096
+                # The object was rewritten between stat and read.
                 continue
             except rados.ObjectNotFound:
-                return {'version': 0, 'subsys': {}}
+                return None, 0
+
+        raise RuntimeError('failed to read %s' % name)
+
+    def _write_object(self, name, obj, version):
+        """Write a JSON object if it's still at version.
+
+        A version of 0 means the object must not exist yet, None that it
+        is written whatever its version.
+        """
+        wx = self.ioctx.create_write_op()
+        try:
+            if version == 0:
+                wx.new(1)
+            elif version is not None:
+                wx.assert_version(version)
+            wx.write_full(json.dumps(obj).encode('utf8'))
+            self.ioctx.operate_write_op(wx, name)
+        finally:
+            wx.release()
+
+    def _list_nqns(self):
+        nqns = []
+        start_after = ''
+        while True:
+            rop = self.ioctx.create_read_op()
+            try:
+                it, _ = self.ioctx.get_omap_vals(rop, start_after, '',
+                                                 OMAP_PAGE)
+                self.ioctx.operate_read_op(rop, DIRECTORY)
+                page = [key for key, _ in it]
+            except rados.ObjectNotFound:
+                return nqns
+            finally:
+                rop.release()
+
+            nqns.extend(page)
+            if len(page) < OMAP_PAGE:
+                return nqns
+            start_after = page[-1]
+
+    def _add_to_directory(self, nqn):
+        wx = self.ioctx.create_write_op()
+        try:
+            self.ioctx.set_omap(wx, (nqn,), (b'',))
+            self.ioctx.operate_write_op(wx, DIRECTORY)
+        finally:
+            wx.release()
+
+    def _legacy_map(self):
+        """Return the version 1 map and its object version.
+
+        Returns (None, 0) once subsystems are kept in their own objects.
+        If there is no map yet, the version 2 marker is created.
+        """
+        if self.migrated:
+            return None, 0
+
+        for _ in range(MAX_ATTEMPTS):
+            gmap, version = self._read_object(V1_OBJECT)
+            if gmap and gmap.get('version', 0) < VERSION:
+                return gmap, version
+            if gmap:
+                self.migrated = True
+                return None, 0
+
+            try:
+                self._write_object(V1_OBJECT, {'version': VERSION}, version)
+                self.migrated = True
+                return None, 0
+            except (rados.ObjectExists, rados.OSError):
+                # Another gateway created a map first; look again.
+                pass
+
+        raise RuntimeError('failed to read global map')
 
-    def update_map(self, fn):
+    def migrate(self):
+        """Move the subsystems out of a version 1 global map.
+
+        Only call this once every gateway runs version 2: gateways still
+        running version 1 would no longer see the subsystems.
+
+        Returns the number of subsystems moved.
+        """
+        if self.ioctx is None:
+            raise RuntimeError('cannot migrate map if not connected to '
+                               'cluster')
+
+        for _ in range(MAX_ATTEMPTS):
+            gmap, version = self._legacy_map()
+            if gmap is None:
+                return 0
+
+            subsys = gmap.get('subsys', {})
+            self.logger.info('migrating %d subsystems to global map '
+                             'version %d', len(subsys), VERSION)
+            for nqn, elem in subsys.items():
+                self._add_to_directory(nqn)
+                # Overwrite the copy of an earlier attempt, the entry may
+                # have been updated since.
+                self._write_object(_subsys_object(nqn), elem, None)
+
+            try:
+                self._write_object(V1_OBJECT, {'version': VERSION},
+                                   version)
+                self.migrated = True
+                return len(subsys)
+            except (rados.ObjectExists, rados.OSError):
+                # Updated in the meantime; go again.
+                pass
+
+        raise RuntimeError('failed to migrate global map')
+
+    def get_global_map(self):
+        gmap, _ = self._legacy_map()
+        if gmap is not None:
+            return {'version': gmap.get('version', 1),
+                    'subsys': gmap.get('subsys', {})}
+
+        subsys = {}
+        for nqn in self._list_nqns():
+            elem, _ = self._read_object(_subsys_object(nqn))
+            if elem is not None:
+                subsys[nqn] = elem
+
+        return {'version': VERSION, 'subsys': subsys}
+
+    def update_subsys(self, nqn, fn):
+        """Update the entry for a single subsystem.
+
+        fn is called with the current entry, or None if there is none, and
+        returns the entry to store, or None to leave it unchanged. It may
+        be called more than once if other gateways update the same entry.
+        """
         if self.ioctx is None:
             raise RuntimeError('cannot update map if not connected to cluster')
 
-        while True:
-            prev = self.get_global_map()
+        name = _subsys_object(nqn)
+        for attempt in range(MAX_ATTEMPTS):
+            gmap, gversion = self._legacy_map()
+            if gmap is not None:
+                elem = gmap.setdefault('subsys', {}).get(nqn)
+            else:
+                elem, version = self._read_object(name)
+            try:
+                elem = fn(elem or None)
+            except Exception as exc:
+                self.logger.exception('exception caught when updating '
+                                      'global map: %s' % str(exc))
+                return
+
+            if elem is None:
+                return
+
             try:
-                wx = self.ioctx.create_write_op()
-                if not prev['version']:
-                    wx.new(1)
-                    prev['version'] = VERSION
-                else:
-                    wx.assert_version(self.ioctx.get_last_version())
-
-                try:
-                    fn(prev)
-                except Exception as exc:
-                    self.logger.exception('exception caught when updating '
-                                          'global map: %s' % str(exc))
+                if gmap is not None:
+                    # Version 1 gateways may still be running.
+                    gmap['subsys'][nqn] = elem
+                    self._write_object(V1_OBJECT, gmap, gversion)
                     return
 
-                wx.write_full(json.dumps(prev).encode('utf8'))
-                self.ioctx.operate_write_op(wx, 'global-map')
+                if not version:
+                    self._add_to_directory(nqn)
+                self._write_object(name, elem, version)
                 return
             except (rados.ObjectExists, rados.OSError):
-                pass
-            finally:
-                wx.release()
+                # Lost the race against another gateway. Back off a bit
+                # so that we don't keep colliding.
+                self.conflicts += 1
+                time.sleep(random.uniform(0, 0.001 * min(2 ** attempt,
+                                                         100)))
+
+        raise RuntimeError('failed to update global map for %s' % nqn)
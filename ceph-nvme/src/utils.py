@@ -14,13 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import json
 import logging
 import os
+import re
 import shutil
 import socket
 import subprocess
 import tempfile
+import threading
 import uuid
 
 
@@ -45,6 +48,154 @@ class RPC:
         return _inner
 
 
+class JSONFramer:
+    """Split a byte stream into complete JSON documents.
+
+    Only the bytes received since the last call are scanned, so a reply
+    that arrives in many pieces is still processed in linear time.
+    """
+    _SPECIAL = re.compile(rb'["\\{}\[\]]')
+    _STRING_SPECIAL = re.compile(rb'["\\]')
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+
+    def feed(self, data):
+        """Add data to the stream and return the documents completed."""
+        self.buf += data
+        frames = []
+        pos = self.pos
+        while True:
+            pattern = self._STRING_SPECIAL if self.in_string else self._SPECIAL
+            match = pattern.search(self.buf, pos)
+            if match is None:
+                break
+
+            char = match.group()
+            pos = match.end()
+            if self.in_string:
+                if char == b'\\':
+                    if pos >= len(self.buf):
+                        # Escaped character not received yet.
+                        pos -= 1
+                        break
+                    pos += 1
+                else:
+                    self.in_string = False
+            elif char == b'"':
+                self.in_string = True
+            elif char in b'{[':
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    frames.append(bytes(self.buf[:pos]))
+                    del self.buf[:pos]
+                    pos = 0
+
+        self.pos = pos
+        return frames
+
+
+class RPCClient:
+    """JSON-RPC client for the SPDK socket.
+
+    Replies are decoded incrementally, so they can be of any size, and
+    matched to their requests by ID, so several requests may be in flight
+    at once, from one or several threads.
+    """
+
+    def __init__(self, sock, bufsize=65536):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.framer = JSONFramer()
+        self.next_id = 1
+        self.send_lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.reading = False
+        # IDs of the requests waiting for a reply, in the order sent.
+        self.pending = collections.deque()
+        self.replies = {}
+
+    def submit(self, msg):
+        """Send a request without waiting for the reply.
+
+        :returns: The ID to pass to ``wait``.
+        """
+        with self.send_lock:
+            id_ = self.next_id
+            self.next_id += 1
+            data = json.dumps(dict(msg, id=id_)).encode('utf8')
+            with self.cond:
+                self.pending.append(id_)
+            self.sock.sendall(data)
+        return id_
+
+    def wait(self, id_):
+        """Wait for the reply to a request sent with ``submit``.
+
+        The reply is None if it could not be decoded.
+        """
+        with self.cond:
+            while id_ not in self.replies:
+                if self.reading:
+                    # Another thread is reading; it will wake us up.
+                    self.cond.wait()
+                    continue
+
+                self.reading = True
+                self.cond.release()
+                try:
+                    frames = self._read()
+                finally:
+                    self.cond.acquire()
+                    self.reading = False
+                    self.cond.notify_all()
+
+                for frame in frames:
+                    self._dispatch(frame)
+
+            return self.replies.pop(id_)
+
+    def call(self, msg):
+        """Send a request and wait for its reply."""
+        return self.wait(self.submit(msg))
+
+    def call_many(self, msgs):
+        """Send several requests at once and return their replies."""
+        return [self.wait(id_) for id_ in [self.submit(m) for m in msgs]]
+
+    def _read(self):
+        while True:
+            data = self.sock.recv(self.bufsize)
+            if not data:
+                raise ConnectionError('SPDK closed the RPC socket')
+            frames = self.framer.feed(data)
+            if frames:
+                return frames
+
+    def _dispatch(self, frame):
+        try:
+            obj = json.loads(frame)
+            id_ = obj.get('id') if isinstance(obj, dict) else None
+        except ValueError:
+            obj, id_ = None, None
+
+        if id_ not in self.pending:
+            # SPDK answers in order, so an unidentified reply
+            # belongs to the oldest request.
+            if not self.pending:
+                logger.warning('discarding unexpected reply: %s', frame)
+                return
+            id_ = self.pending[0]
+
+        self.pending.remove(id_)
+        self.replies[id_] = obj
+
+
 def default_cpuset(cpus):
     """By default, use half of the available cores."""
     rlen = -(len(cpus) // -2)
@@ -1,9 +1,13 @@
+import json
 import logging
+import socket
+import threading
 import unittest
 import unittest.mock as mock
 
 import src.utils as src_utils
 import src.radosmap as radosmap
+from . import utils as test_utils
 
 
 class MockRados:
@@ -21,27 +25,6 @@ class MockRados:
         self.shutdown = mock.MagicMock()
 
 
-class MockIoctx:
-    def __init__(self, result):
-        self.result = result
-
-    def read(self, name, length):
-        if not isinstance(self.result, bytes):
-            raise self.result()
-
-        return self.result
-
-
-class WriteOp:
-    def __init__(self):
-        self.new = mock.MagicMock()
-        self.assert_version = mock.MagicMock()
-        self.write_full = mock.MagicMock()
-
-    def release(self):
-        pass
-
-
 class RadosObjects:
     ObjectNotFound = KeyError
     ObjectExists = ValueError
@@ -67,40 +50,157 @@ class TestRadosMap(unittest.TestCase):
         with self.assertRaises(Exception):
             rd.add_cluster('ceph-nvme', 'some-key', '0.0.0.0')
 
-    def test_global_map(self):
-        rd = radosmap.RadosMap('some-pool', self.logger)
-        rd.ioctx = MockIoctx(b'{"version":%d,"subsys":{}}' % radosmap.VERSION)
-        ret = rd.get_global_map()
-        self.assertNotEqual(ret['version'], 0)
-
-    def test_global_map_nonexistent(self):
-        rd = radosmap.RadosMap('some-pool', self.logger)
-        rd.ioctx = MockIoctx(radosmap.rados.ObjectNotFound)
-        ret = rd.get_global_map()
-        self.assertEqual(ret['version'], 0)
 
-    def test_global_map_fail(self):
-        rd = radosmap.RadosMap('some-pool', self.logger)
-        rd.ioctx = MockIoctx(b'{')
+class TestRadosMapV2(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(radosmap, 'rados', test_utils.FakeRados)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.objects = {}
+        self.rd = self._gateway()
+
+    def _gateway(self):
+        rd = radosmap.RadosMap('some-pool', logging.getLogger(__name__))
+        rd.ioctx = test_utils.FakeIoctx(self.objects)
+        return rd
+
+    def _put(self, name, obj):
+        self.objects[name] = {'data': json.dumps(obj).encode('utf8'),
+                              'version': 1, 'omap': {}}
+
+    def _get(self, name):
+        return json.loads(self.objects[name]['data'])
+
+    def test_global_map_empty(self):
+        self.assertEqual(self.rd.get_global_map(),
+                         {'version': radosmap.VERSION, 'subsys': {}})
+
+    def test_global_map_created_at_v2(self):
+        self.rd.update_subsys('nqn.1', lambda _: {'units': {}})
+        self.assertEqual(self._get(radosmap.V1_OBJECT),
+                         {'version': radosmap.VERSION})
+        self.assertIn('nvme-subsys.nqn.1', self.objects)
+
+    def test_empty_objects(self):
+        self.objects[radosmap.V1_OBJECT] = {'data': b'', 'version': 1,
+                                            'omap': {}}
+        self.objects['nvme-subsys.nqn.1'] = {'data': b'', 'version': 1,
+                                             'omap': {'nqn.1': b''}}
+        self.objects[radosmap.DIRECTORY] = {'data': b'', 'version': 1,
+                                            'omap': {'nqn.1': b''}}
+        self.assertEqual(self.rd.get_global_map(),
+                         {'version': radosmap.VERSION,
+                          'subsys': {'nqn.1': {}}})
+        self.assertEqual(self._get(radosmap.V1_OBJECT),
+                         {'version': radosmap.VERSION})
+
+        calls = []
+
+        def _update(elem):
+            calls.append(elem)
+            return {'units': {}}
+
+        self.rd.update_subsys('nqn.1', _update)
+        self.assertEqual(calls, [None])
+        self.assertEqual(self._get('nvme-subsys.nqn.1'), {'units': {}})
+
+    def test_legacy_v1(self):
+        subsys = {'nqn.%d' % i: {'name': 'rbd://%d' % i, 'units': {},
+                                 'hosts': []}
+                  for i in range(3)}
+        self._put(radosmap.V1_OBJECT, {'version': 1, 'subsys': subsys})
+        self.assertEqual(self.rd.get_global_map()['subsys'], subsys)
+
+        def _add_host(elem):
+            elem['hosts'].append({'host': 'h1', 'key': None})
+            return elem
+
+        # Version 1 gateways keep seeing the whole map.
+        self.rd.update_subsys('nqn.1', _add_host)
+        self.rd.update_subsys('nqn.5', lambda _: {'units': {}, 'hosts': []})
+        gmap = self._get(radosmap.V1_OBJECT)
+        self.assertEqual(gmap['version'], 1)
+        self.assertEqual(gmap['subsys']['nqn.1']['hosts'],
+                         [{'host': 'h1', 'key': None}])
+        self.assertIn('nqn.5', gmap['subsys'])
+        self.assertNotIn(radosmap.DIRECTORY, self.objects)
+
+    def test_migrate_v1(self):
+        subsys = {'nqn.%d' % i: {'name': 'rbd://%d' % i, 'units': {},
+                                 'hosts': [{'host': 'any', 'key': False}]}
+                  for i in range(3)}
+        self._put(radosmap.V1_OBJECT, {'version': 1, 'subsys': subsys})
+        self.assertEqual(self.rd.migrate(), 3)
+        self.assertEqual(self._get(radosmap.V1_OBJECT),
+                         {'version': radosmap.VERSION})
+        self.assertEqual(self._get('nvme-subsys.nqn.1'), subsys['nqn.1'])
+        self.assertEqual(sorted(self.objects[radosmap.DIRECTORY]['omap']),
+                         sorted(subsys))
+        self.assertEqual(self.rd.get_global_map()['subsys'], subsys)
+        # Another gateway sees the migrated map.
+        self.assertEqual(self._gateway().get_global_map()['subsys'], subsys)
+        self.assertEqual(self._gateway().migrate(), 0)
+
+    def test_read_exact_size(self):
+        elem = {'name': 'x' * 100000, 'units': {}, 'hosts': []}
+        self.rd.update_subsys('nqn.1', lambda _: elem)
+        with mock.patch.object(self.rd.ioctx, 'read',
+                               wraps=self.rd.ioctx.read) as read:
+            self.assertEqual(self.rd.get_global_map()['subsys']['nqn.1'],
+                             elem)
+            read.assert_called_once_with(
+                'nvme-subsys.nqn.1',
+                length=len(self.objects['nvme-subsys.nqn.1']['data']))
+
+    def test_update_touches_one_object(self):
+        for i in range(10):
+            self.rd.update_subsys('nqn.%d' % i,
+                                  lambda _: {'units': {}, 'hosts': []})
+        written = self.rd.ioctx.bytes_written
+
+        def _add_host(elem):
+            elem['hosts'].append({'host': 'h1', 'key': None})
+            return elem
+
+        self.rd.update_subsys('nqn.5', _add_host)
+        self.assertEqual(self.rd.ioctx.bytes_written - written,
+                         len(self.objects['nvme-subsys.nqn.5']['data']))
+        self.assertEqual(self._get('nvme-subsys.nqn.5')['hosts'],
+                         [{'host': 'h1', 'key': None}])
+
+        # Returning None leaves the entry alone.
+        self.rd.update_subsys('nqn.5', lambda elem: None)
+        self.rd.update_subsys('nqn.99', lambda elem: None)
+        self.assertNotIn('nvme-subsys.nqn.99', self.objects)
+
+    @mock.patch.object(radosmap.time, 'sleep')
+    def test_update_conflict_retried(self, _sleep):
+        self.rd.update_subsys('nqn.1', lambda _: {'count': 0})
+        other = self._gateway()
+        calls = []
+
+        def _increment(elem):
+            if not calls:
+                # Another gateway gets in first.
+                other.update_subsys('nqn.1', lambda e: {'count': 10})
+            calls.append(elem['count'])
+            return {'count': elem['count'] + 1}
+
+        self.rd.update_subsys('nqn.1', _increment)
+        self.assertEqual(calls, [0, 10])
+        self.assertEqual(self._get('nvme-subsys.nqn.1'), {'count': 11})
+        self.assertEqual(self.rd.conflicts, 1)
+
+    @mock.patch.object(radosmap, 'OMAP_PAGE', 2)
+    def test_directory_paging(self):
+        for i in range(5):
+            self.rd.update_subsys('nqn.%d' % i, lambda _: {})
+        self.assertEqual(len(self.rd.get_global_map()['subsys']), 5)
+
+    def test_update_not_connected(self):
+        rd = radosmap.RadosMap('some-pool', logging.getLogger(__name__))
         with self.assertRaises(RuntimeError):
-            rd.get_global_map()
-
-    def test_update_map_first(self):
-        rd = radosmap.RadosMap('some-pool', self.logger)
-        rd.get_global_map = lambda: {'version': 0, 'subsys': {}}
-        rd.ioctx = mock.MagicMock()
-        rd.ioctx.operate_write_op = mock.MagicMock()
-        wop = WriteOp()
-        rd.ioctx.create_write_op = lambda: wop
-
-        def _update(gmap):
-            gmap['subsys']['nqn.1'] = {}
-
-        rd.update_map(_update)
-        rd.ioctx.operate_write_op.assert_called_with(wop, 'global-map')
-        wop.write_full.assert_called_with(
-            radosmap.json.dumps({'version': radosmap.VERSION,
-                                 'subsys': {'nqn.1': {}}}).encode('utf8'))
+            rd.update_subsys('nqn.1', lambda _: {})
 
 
 class TestUtils(unittest.TestCase):
@@ -141,3 +241,76 @@ class TestUtils(unittest.TestCase):
         xaddr = src_utils.get_external_addr()
         _, fam = src_utils.get_adrfam(xaddr)
         self.assertTrue(fam == 'IPv4' or fam == 'IPv6')
+
+
+class TestRPCClient(unittest.TestCase):
+    def setUp(self):
+        self.client_sock, self.server_sock = socket.socketpair()
+        self.addCleanup(self.client_sock.close)
+        self.addCleanup(self.server_sock.close)
+        self.client = src_utils.RPCClient(self.client_sock, bufsize=64)
+
+    def _requests(self, count):
+        decoder = json.JSONDecoder()
+        data = ''
+        reqs = []
+        while len(reqs) < count:
+            data += self.server_sock.recv(4096).decode('utf8')
+            while data:
+                try:
+                    obj, end = decoder.raw_decode(data)
+                except ValueError:
+                    break
+                reqs.append(obj)
+                data = data[end:]
+        return reqs
+
+    def test_framer(self):
+        framer = src_utils.JSONFramer()
+        doc = json.dumps({'a': 'x\\"}{[', 'b': [1, {'c': '\\'}]})
+        doc = doc.encode('utf8')
+        frames = []
+        for i in range(len(doc)):
+            frames.extend(framer.feed(doc[i:i + 1]))
+        frames.extend(framer.feed(doc + b'\n' + doc[:10]))
+        self.assertEqual(frames, [doc, doc])
+        self.assertEqual(framer.feed(doc[10:]), [b'\n' + doc])
+
+    def test_large_reply(self):
+        subsystems = [{'nqn': 'nqn.%d' % i} for i in range(1000)]
+
+        def _serve():
+            req, = self._requests(1)
+            reply = {'id': req['id'], 'result': subsystems}
+            self.server_sock.sendall(json.dumps(reply).encode('utf8'))
+
+        thread = threading.Thread(target=_serve)
+        thread.start()
+        rv = self.client.call({'method': 'nvmf_get_subsystems'})
+        thread.join()
+        self.assertEqual(rv['result'], subsystems)
+
+    def test_pipelined_out_of_order(self):
+        def _serve():
+            reqs = self._requests(3)
+            for req in reversed(reqs):
+                reply = {'id': req['id'], 'result': req['method']}
+                self.server_sock.sendall(json.dumps(reply).encode('utf8'))
+
+        thread = threading.Thread(target=_serve)
+        thread.start()
+        replies = self.client.call_many(
+            [{'method': 'a'}, {'method': 'b'}, {'method': 'c'}])
+        thread.join()
+        self.assertEqual([r['result'] for r in replies], ['a', 'b', 'c'])
+
+    def test_unidentified_and_invalid_replies(self):
+        def _serve():
+            self._requests(2)
+            self.server_sock.sendall(b'{"result": 1}{"result": nope}')
+
+        thread = threading.Thread(target=_serve)
+        thread.start()
+        replies = self.client.call_many([{'method': 'a'}, {'method': 'b'}])
+        thread.join()
+        self.assertEqual(replies, [{'result': 1}, None])
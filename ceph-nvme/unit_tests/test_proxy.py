@@ -14,6 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import json
 import multiprocessing
 import os
@@ -21,6 +22,7 @@ import socket
 import tempfile
 import time
 import unittest
+import unittest.mock as mock
 
 import src.proxy as proxy
 from . import utils
@@ -30,7 +32,7 @@ class MockGmap:
     BASE = {'version': 0, 'subsys': {}}
 
     def __init__(self, *args):
-        self.gmap = self.BASE.copy()
+        self.gmap = copy.deepcopy(self.BASE)
 
     def add_cluster(self, *args):
         pass
@@ -38,12 +40,13 @@ class MockGmap:
     def get_global_map(self):
         return self.gmap
 
-    def update_map(self, fn):
-        tmp = self.gmap.copy()
-        fn(tmp)
-        self.gmap = tmp
-        if not isinstance(tmp, dict):
-            raise TypeError()
+    def update_subsys(self, nqn, fn):
+        elem = fn(copy.deepcopy(self.gmap['subsys'].get(nqn)))
+        if elem is not None:
+            self.gmap['subsys'][nqn] = elem
+
+    def migrate(self):
+        return 0
 
 
 class TestBase(unittest.TestCase):
@@ -188,6 +191,44 @@ class TestProxy(TestBase):
         rv = self.msgloop(msg)
         self.assertNotIn('error', rv)
 
+        rv = self.msgloop(self.rpc.migrate_map())
+        self.assertEqual(rv, {'migrated': 0})
+
+    def test_concurrent_requests(self):
+        msg = self.rpc.cluster_add(
+            name='ceph', user='client', key='ABC123', mon_host='1.1.1.1')
+        self.assertNotIn('error', self.msgloop(msg))
+
+        # Send all the requests before reading any reply.
+        nqns = ['nqn.%d' % i for i in range(5)]
+        for nqn in nqns:
+            msg = self.rpc.create(
+                nqn=nqn, cluster='ceph', pool_name='mypool',
+                rbd_name=nqn, addr='0.0.0.0')
+            self.local_sock.sendto(json.dumps(msg).encode('utf8'),
+                                   self.proxy_addr)
+            msg = self.rpc.host_add(host='any', nqn=nqn)
+            self.local_sock.sendto(json.dumps(msg).encode('utf8'),
+                                   self.proxy_addr)
+
+        replies = [json.loads(self.local_sock.recv(2048))
+                   for _ in range(2 * len(nqns))]
+        for rv in replies:
+            self.assertNotIn('error', rv)
+        self.assertEqual(sorted(rv['nqn'] for rv in replies if rv),
+                         nqns)
+
+        # Each host_add ran after the create for the same NQN.
+        for nqn in nqns:
+            self.assertEqual('any', self.msgloop(self.rpc.host_list(nqn=nqn)))
+
+        rv = self.msgloop(self.rpc.stats())
+        self.assertEqual(rv['queue_depth'], 0)
+        self.assertEqual(rv['methods']['create']['count'], len(nqns))
+        self.assertEqual(rv['methods']['create']['errors'], 0)
+        self.assertIn('avg_ms', rv['methods']['host_add'])
+        self.assertIn('max_ms', rv['methods']['host_add'])
+
 
 class MockGmapWithContents(MockGmap):
     BASE = {'subsys':
@@ -226,3 +267,55 @@ class TestProxyEmptyLocalFile(TestBase):
         rv = self.msgloop(self.rpc.list())
         self.assertNotIn('error', rv)
         self.assertEqual(len(rv), 0)
+
+
+class TestSubsystemIndex(unittest.TestCase):
+    def setUp(self):
+        self.fetch = mock.MagicMock()
+        self.fetch.side_effect = lambda: {
+            'nqn.1': {'allow_any_host': False, 'hosts': []}}
+        self.index = proxy.SubsystemIndex(self.fetch, refresh_interval=60)
+
+    def test_loaded_once(self):
+        self.assertFalse(self.index.get('nqn.1')['allow_any_host'])
+        self.assertIsNone(self.index.get('nqn.2'))
+        self.assertEqual(len(self.index.items()), 1)
+        self.fetch.assert_called_once_with()
+
+    def test_local_updates(self):
+        self.index.items()
+        self.index.add('nqn.2', {'hosts': []})
+        self.index.update('nqn.1', allow_any_host=True)
+        self.index.discard('nqn.3')
+        self.assertTrue(self.index.get('nqn.1')['allow_any_host'])
+        self.assertEqual(self.index.get('nqn.2'), {'hosts': []})
+        self.index.discard('nqn.2')
+        self.assertIsNone(self.index.get('nqn.2'))
+        self.fetch.assert_called_once_with()
+
+    def test_invalidate(self):
+        self.index.get('nqn.1')
+        self.index.update('nqn.1', allow_any_host=True)
+        self.index.invalidate('nqn.1')
+        # Only looking up a stale NQN reloads the index.
+        self.assertIsNone(self.index.get('nqn.2'))
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertFalse(self.index.get('nqn.1')['allow_any_host'])
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertEqual(self.index.refreshes, 2)
+
+    @mock.patch.object(proxy.time, 'monotonic')
+    def test_periodic_refresh(self, monotonic):
+        monotonic.return_value = 1000
+        self.index.get('nqn.1')
+        monotonic.return_value = 1030
+        self.index.get('nqn.1')
+        self.assertEqual(self.fetch.call_count, 1)
+        monotonic.return_value = 1061
+        self.index.get('nqn.1')
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_fetch_failure(self):
+        self.fetch.side_effect = lambda: None
+        with self.assertRaises(proxy.ProxyError):
+            self.index.get('nqn.1')
@@ -17,6 +17,8 @@
 import json
 import logging
 import select
+import threading
+import time
 
 
 class MockSPDK:
@@ -25,6 +27,7 @@ class MockSPDK:
         sock.close()
         self.sock = new_sock
         self.logger = logging.getLogger('spdk')
+        self.buf = ''
         self._init_vars()
 
         for cmd in pre_cmds:
@@ -167,19 +170,166 @@ class MockSPDK:
             return False
 
         buf = self.sock.recv(2048)
-        obj = json.loads(buf)
+        if not buf:
+            raise EOFError()
+
+        # Requests may be pipelined, so there may be several of them,
+        # or only part of one, in a single read.
+        self.buf += buf.decode('utf8')
+        decoder = json.JSONDecoder()
+        while self.buf:
+            try:
+                obj, end = decoder.raw_decode(self.buf)
+            except ValueError:
+                break
 
+            self.buf = self.buf[end:].lstrip()
+            self._handle(obj)
+
+        return True
+
+    def _handle(self, obj):
         name = obj['method']
         method = getattr(self, name, None)
         if method is None:
-            err = {'error': 'method %s not found' % name}
+            err = {'error': 'method %s not found' % name, 'id': obj.get('id')}
             self.sock.sendall(json.dumps(err).encode('utf8'))
-            return True
+            return
 
         try:
             ret = {'result': method(**obj.get('params', {}))}
         except Exception as exc:
             ret = {'error': str(exc)}
 
+        ret['id'] = obj.get('id')
         self.sock.sendall(json.dumps(ret).encode('utf8'))
-        return True
+
+
+class FakeRados:
+    """Stand-ins for the rados exceptions used by RadosMap."""
+    class OSError(Exception):
+        pass
+
+    class ObjectNotFound(OSError):
+        pass
+
+    class ObjectExists(OSError):
+        pass
+
+
+class FakeWriteOp:
+    def __init__(self):
+        self.exclusive = False
+        self.version = None
+        self.data = None
+        self.omap = {}
+
+    def new(self, flags):
+        self.exclusive = True
+
+    def assert_version(self, version):
+        self.version = version
+
+    def write_full(self, data):
+        self.data = data
+
+    def release(self):
+        pass
+
+
+class FakeReadOp:
+    def __init__(self):
+        self.omap_query = None
+        self.result = []
+
+    def release(self):
+        pass
+
+
+class FakeIoctx:
+    """An in-memory RADOS pool, shared by several gateways.
+
+    Objects carry a version, bumped on each write, so compare-and-swap
+    loops behave as they do against a real cluster. Each gateway should
+    use its own FakeIoctx on a shared `objects` dict, since the last
+    version is tracked per ioctx.
+    """
+
+    def __init__(self, objects=None, lock=None, latency=0):
+        self.objects = {} if objects is None else objects
+        self.lock = threading.Lock() if lock is None else lock
+        self.latency = latency
+        self.last_version = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, name):
+        obj = self.objects.get(name)
+        if obj is None:
+            raise FakeRados.ObjectNotFound(name)
+        return obj
+
+    def stat(self, name):
+        self._delay()
+        with self.lock:
+            return len(self._get(name)['data']), time.time()
+
+    def read(self, name, length=8192, offset=0):
+        self._delay()
+        with self.lock:
+            obj = self._get(name)
+            self.last_version = obj['version']
+            data = obj['data'][offset:offset + length]
+        self.bytes_read += len(data)
+        return data
+
+    def get_last_version(self):
+        return self.last_version
+
+    def create_write_op(self):
+        return FakeWriteOp()
+
+    def create_read_op(self):
+        return FakeReadOp()
+
+    def set_omap(self, op, keys, values):
+        op.omap.update(zip(keys, values))
+
+    def get_omap_vals(self, op, start_after, filter_prefix, max_return):
+        op.omap_query = (start_after, filter_prefix, max_return)
+        return op.result, 0
+
+    def operate_read_op(self, op, name):
+        self._delay()
+        with self.lock:
+            omap = self._get(name)['omap']
+            start_after, prefix, max_return = op.omap_query
+            keys = sorted(k for k in omap
+                          if k > start_after and k.startswith(prefix))
+            op.result.extend((k, omap[k]) for k in keys[:max_return])
+
+    def operate_write_op(self, op, name):
+        self._delay()
+        with self.lock:
+            obj = self.objects.get(name)
+            if op.exclusive and obj is not None:
+                raise FakeRados.ObjectExists(name)
+            elif op.version is not None:
+                if obj is None:
+                    raise FakeRados.ObjectNotFound(name)
+                elif obj['version'] != op.version:
+                    raise FakeRados.OSError('version mismatch')
+
+            if obj is None:
+                obj = self.objects[name] = {'data': b'', 'version': 0,
+                                            'omap': {}}
+            if op.data is not None:
+                obj['data'] = op.data
+                self.bytes_written += len(op.data)
+            obj['omap'].update(op.omap)
+            obj['version'] += 1
+            self.last_version = obj['version']
@@ -4,8 +4,10 @@
 # All Rights Reserved
 # Author: Alex Kavanagh <alex.kavanagh@canonical.com>
 
+import glob
 import os
 import subprocess
+import tempfile
 from pwd import getpwnam
 
 # fasteners only exists in Bionic, so this will fail on xenial and trusty
@@ -18,6 +20,7 @@ SYSTEMD_SYSTEM = '/run/systemd/system'
 LOCKFILE = '/var/lock/check-osds.lock'
 CRON_CHECK_TMPFILE = 'ceph-osd-checks'
 NAGIOS_HOME = '/var/lib/nagios'
+WHOAMI_GLOB = '/var/lib/ceph/osd/ceph-*/whoami'
 
 
 def init_is_systemd():
@@ -39,48 +42,109 @@ def lsb_release():
 
 def get_osd_units():
     """Returns a list of strings, one for each unit that is live"""
-    cmd = '/bin/cat /var/lib/ceph/osd/ceph-*/whoami'
+    units = []
+    for path in sorted(glob.glob(WHOAMI_GLOB)):
+        try:
+            with open(path, 'rt') as f:
+                unit = f.read().strip()
+        except OSError:
+            continue
+        if unit:
+            units.append(unit)
+    return units
+
+
+def get_systemd_states(units):
+    """Ask systemd for the state of all ceph-osd@ units in one call.
+
+    :param units: The OSD ids
+    :type units: List[str]
+    :returns: ActiveState and SubState of each 'ceph-osd@N' unit
+    :rtype: Dict[str, Tuple[str, str]]
+    :raises: subprocess.CalledProcessError
+    """
+    cmd = ['systemctl', 'show', '--no-pager',
+           '--property=Id,ActiveState,SubState']
+    cmd.extend('ceph-osd@{}.service'.format(unit) for unit in units)
+    output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+    states = {}
+    # systemctl prints one block of properties per unit, in the order they
+    # were asked for, separated by blank lines.
+    for block in output.decode('utf-8').strip().split('\n\n'):
+        props = dict(line.split('=', 1)
+                     for line in block.splitlines() if '=' in line)
+        name = props.get('Id', '')
+        if name.endswith('.service'):
+            name = name[:-len('.service')]
+        states[name] = (props.get('ActiveState', 'unknown'),
+                        props.get('SubState', 'unknown'))
+    return states
+
+
+def systemd_status(units):
+    """Lines in the format of check_systemd.py for each unit."""
     try:
-        output = (subprocess
-                  .check_output([cmd], shell=True).decode('utf-8')
-                  .split('\n'))
-        return [u for u in output if u]
-    except subprocess.CalledProcessError:
-        return []
-
-
-def do_status():
-    if init_is_systemd():
-        cmd = "/usr/local/lib/nagios/plugins/check_systemd.py ceph-osd@{}"
-    else:
-        cmd = "/sbin/status ceph-osd id={}"
-
+        states = get_systemd_states(units)
+    except (OSError, subprocess.CalledProcessError) as e:
+        return ["Failed: systemctl show raised: {}\n".format(
+            getattr(e, 'output', b'').decode('utf-8').strip() or e)]
     lines = []
-
-    for unit in get_osd_units():
+    for unit in units:
+        service = 'ceph-osd@{}'.format(unit)
+        active, sub = states.get(service, ('unknown', 'unknown'))
+        if active == 'active':
+            lines.append("OK: {} is running\n".format(service))
+        else:
+            lines.append("Failed: {} is {} ({})\n".format(
+                service, active, sub))
+    return lines
+
+
+def upstart_status(units):
+    lines = []
+    for unit in units:
         try:
             output = (subprocess
-                      .check_output(cmd.format(unit).split(),
+                      .check_output(['/sbin/status', 'ceph-osd',
+                                     'id={}'.format(unit)],
                                     stderr=subprocess.STDOUT)
                       .decode('utf-8'))
         except subprocess.CalledProcessError as e:
             output = ("Failed: check command raised: {}"
                       .format(e.output.decode('utf-8')))
         lines.append(output)
+    return lines
 
-    _tmp_file = os.path.join(NAGIOS_HOME, CRON_CHECK_TMPFILE)
-    with open(_tmp_file, 'wt') as f:
-        f.writelines(lines)
 
+def write_report(lines):
+    """Atomically replace the report read by check_ceph_osd_services.py."""
     # In cis hardened environments check_ceph_osd_services cannot
     # read _tmp_file due to restrained permissions (#LP1879667).
     # Changing the owner of the file to nagios solves this problem.
-    # check_ceph_osd_services.py removes this file, so make
-    # sure that we change permissions on a file that exists.
     nagios_uid = getpwnam('nagios').pw_uid
     nagios_gid = getpwnam('nagios').pw_gid
-    if os.path.isfile(_tmp_file):
+    fd, _tmp_file = tempfile.mkstemp(dir=NAGIOS_HOME,
+                                     prefix='.' + CRON_CHECK_TMPFILE)
+    try:
+        with os.fdopen(fd, 'wt') as f:
+            f.writelines(lines)
         os.chown(_tmp_file, nagios_uid, nagios_gid)
+        os.chmod(_tmp_file, 0o644)
+        os.replace(_tmp_file, os.path.join(NAGIOS_HOME, CRON_CHECK_TMPFILE))
+    except BaseException:
+        os.unlink(_tmp_file)
+        raise
+
+
+def do_status():
+    units = get_osd_units()
+    if not units:
+        lines = []
+    elif init_is_systemd():
+        lines = systemd_status(units)
+    else:
+        lines = upstart_status(units)
+    write_report(lines)
 
 
 def run_main():
@@ -30,6 +30,7 @@ import utils
 
 sys.path.append('lib')
 import charms_ceph.utils as ceph
+from charms_ceph.inventory import BlockDeviceInventory
 from charmhelpers.core import hookenv
 from charmhelpers.core.hookenv import (
     log,
@@ -105,7 +106,6 @@ from charmhelpers.contrib.network.ip import (
 )
 import charmhelpers.contrib.storage.linux.ceph as ch_ceph
 from charmhelpers.contrib.storage.linux.utils import (
-    is_device_mounted,
     is_block_device,
 )
 from charmhelpers.contrib.charmsupport import nrpe
@@ -176,8 +176,10 @@ def check_for_upgrade():
                 old_version, new_version))
 
         emit_cephconf(upgrading=True)
-        ceph.roll_osd_cluster(new_version=new_version,
-                              upgrade_key='osd-upgrade')
+        ceph.roll_osd_cluster(
+            new_version=new_version,
+            upgrade_key='osd-upgrade',
+            concurrency=hookenv.config('osd-upgrade-concurrency') or 1)
         emit_cephconf(upgrading=False)
         notify_mon_of_upgrade(new_version)
     elif (old_version == new_version and
@@ -674,17 +676,19 @@ def prepare_disks_and_activate():
     devices = [dev for dev in devices if dev.startswith('/dev')]
     # filter osd-devices that does not exist on this unit
     devices = [dev for dev in devices if os.path.exists(dev)]
+    # scan all block devices once rather than probing each device
+    inventory = BlockDeviceInventory()
     # filter osd-devices that are already mounted
-    devices = [dev for dev in devices if not is_device_mounted(dev)]
+    devices = [dev for dev in devices if not inventory.is_device_mounted(dev)]
     # filter osd-devices that are active bluestore devices
     devices = [dev for dev in devices
-               if not ceph.is_active_bluestore_device(dev)]
+               if not inventory.is_active_bluestore_device(dev)]
     # filter osd-devices that are used as dmcrypt devices
     devices = [dev for dev in devices
-               if not ceph.is_mapped_luks_device(dev)]
+               if not inventory.is_mapped_luks_device(dev)]
 
     log('Checking for pristine devices: "{}"'.format(devices), level=DEBUG)
-    if not all(ceph.is_pristine_disk(dev) for dev in devices):
+    if not all(inventory.is_pristine_disk(dev) for dev in devices):
         status_set('blocked',
                    'Non-pristine devices detected, consult '
                    '`list-disks`, `zap-disk` and `blacklist-*` actions.')
@@ -694,18 +698,26 @@ def prepare_disks_and_activate():
         log('ceph bootstrapped, rescanning disks')
         emit_cephconf()
         ceph.udevadm_settle()
-        for dev in get_devices():
-            ceph.osdize(dev, config('osd-format'),
-                        osd_journal,
-                        config('ignore-device-errors'),
-                        config('osd-encrypt'),
-                        config('osd-encrypt-keymanager'))
+        devices = get_devices()
+        inventory.scan()
+        results = ceph.osdize_devices(
+            devices, config('osd-format'),
+            osd_journal,
+            config('ignore-device-errors'),
+            config('osd-encrypt'),
+            config('osd-encrypt-keymanager'),
+            concurrency=config('osd-prepare-concurrency') or 1,
+            inventory=inventory)
+        log('Prepared OSD devices: {}'.format(', '.join(
+            '{} {} ({:.1f}s)'.format(dev, outcome, seconds)
+            for dev, (outcome, seconds) in results.items())), level=INFO)
+        for dev in devices:
             # Make it fast!
             if config('autotune'):
                 log('The autotune config is deprecated and planned '
                     'for removal in the next release.', level=WARNING)
                 ceph.tune_dev(dev)
-        ceph.start_osds(get_devices())
+        ceph.start_osds(devices)
 
     # Notify MON cluster as to how many OSD's this unit bootstrapped
     # into the cluster
@@ -907,7 +919,7 @@ def update_nrpe_config():
 
     # BUG#1810749 - the nagios user can't access /var/lib/ceph/.. and that's a
     # GOOD THING, as it keeps ceph secure from Nagios.  However, to check
-    # whether ceph is okay, the check_systemd.py or 'status ceph-osd' still
+    # whether ceph is okay, systemd or 'status ceph-osd' still
     # needs to be called with the contents of ../osd/ceph-*/whoami files.  To
     # get around this conundrum, instead a cron.d job that runs as root will
     # perform the checks every minute, and write to a temporary file the
@@ -1032,13 +1044,15 @@ def assess_status():
         pristine = True
         # Check unmounted disks that should be configured but don't check
         # journals or already processed devices
-        config_devices = (set(get_devices()) & set(ceph.unmounted_disks()))
+        inventory = BlockDeviceInventory()
+        config_devices = (set(get_devices()) &
+                          set(inventory.unmounted_disks()))
         osd_journals = set(get_journal_devices())
         touched_devices = set(kv().get('osd-devices', []))
         for dev in config_devices - osd_journals - touched_devices:
-            if (not ceph.is_active_bluestore_device(dev) and
-                    not ceph.is_pristine_disk(dev) and
-                    not ceph.is_mapped_luks_device(dev)):
+            if (not inventory.is_active_bluestore_device(dev) and
+                    not inventory.is_pristine_disk(dev) and
+                    not inventory.is_mapped_luks_device(dev)):
                 pristine = False
                 break
         if pristine:
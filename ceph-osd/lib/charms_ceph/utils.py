@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import collections
+import concurrent.futures
 import glob
 import itertools
 import json
@@ -1180,6 +1181,8 @@ osd_upgrade_caps = collections.OrderedDict([
              'allow command "config-key put"',
              'allow command "config-key get"',
              'allow command "config-key exists"',
+             'allow command "config-key dump"',
+             'allow command "osd crush rule dump"',
              'allow command "osd out"',
              'allow command "osd in"',
              'allow command "osd rm"',
@@ -1603,81 +1606,259 @@ def osdize_dev(dev, osd_format, osd_journal, ignore_errors=False,
     db = kv()
     osd_devices = db.get('osd-devices', [])
     try:
-        if dev in osd_devices:
-            log('Device {} already processed by charm,'
-                ' skipping'.format(dev))
+        cmd = _osdize_dev_cmd(dev, osd_format, osd_journal, osd_devices,
+                              encrypt, key_manager, osd_id, bluestore_skip)
+        if cmd is None:
             return
+        _run_osdize_cmd(dev, cmd, ignore_errors)
+        # NOTE: Record processing of device only on success to ensure that
+        #       the charm only tries to initialize a device of OSD usage
+        #       once during its lifetime.
+        osd_devices.append(dev)
+    finally:
+        db.set('osd-devices', osd_devices)
+        db.flush()
 
-        if not os.path.exists(dev):
-            log('Path {} does not exist - bailing'.format(dev))
-            return
 
-        if not is_block_device(dev):
-            log('Path {} is not a block device - bailing'.format(dev))
-            return
+def _osdize_dev_cmd(dev, osd_format, osd_journal, osd_devices,
+                    encrypt=False, key_manager=CEPH_KEY_MANAGER,
+                    osd_id=None, bluestore_skip=None, inventory=None):
+    """Check a block device and return the command to turn it into an OSD.
 
-        if is_osd_disk(dev):
-            log('Looks like {} is already an'
-                ' OSD data or journal, skipping.'.format(dev))
-            if is_device_mounted(dev):
-                osd_devices.append(dev)
-            return
+    Any LVM volumes the OSD needs, including those on shared WAL and DB
+    devices, are created here.  Devices found to already be in use by an
+    OSD are appended to osd_devices.
 
-        if is_device_mounted(dev):
-            log('Looks like {} is in use, skipping.'.format(dev))
-            return
+    :param inventory: Answers the device checks from a single scan of the
+                      host rather than probing dev with its own commands.
+    :type inventory: Optional[charms_ceph.inventory.BlockDeviceInventory]
+
+    :returns: The command to run, None if the device is to be skipped.
+    :rtype: Optional[List[str]]
+    :raises subprocess.CalledProcessError: if an LVM operation failed
+    """
+    if dev in osd_devices:
+        log('Device {} already processed by charm,'
+            ' skipping'.format(dev))
+        return None
+
+    if not os.path.exists(dev):
+        log('Path {} does not exist - bailing'.format(dev))
+        return None
 
-        if is_active_bluestore_device(dev):
-            log('{} is in use as an active bluestore block device,'
-                ' skipping.'.format(dev))
+    if not is_block_device(dev):
+        log('Path {} is not a block device - bailing'.format(dev))
+        return None
+
+    if inventory is not None:
+        osd_disk = inventory.is_osd_disk
+        mounted = inventory.is_device_mounted
+        active_bluestore = inventory.is_active_bluestore_device
+        mapped_luks = inventory.is_mapped_luks_device
+    else:
+        osd_disk = is_osd_disk
+        mounted = is_device_mounted
+        active_bluestore = is_active_bluestore_device
+        mapped_luks = is_mapped_luks_device
+
+    if osd_disk(dev):
+        log('Looks like {} is already an'
+            ' OSD data or journal, skipping.'.format(dev))
+        if mounted(dev):
             osd_devices.append(dev)
-            return
+        return None
 
-        if is_mapped_luks_device(dev):
-            log('{} is a mapped LUKS device,'
-                ' skipping.'.format(dev))
-            return
+    if mounted(dev):
+        log('Looks like {} is in use, skipping.'.format(dev))
+        return None
 
-        if cmp_pkgrevno('ceph', '12.2.4') >= 0:
-            cmd = _ceph_volume(dev,
-                               osd_journal,
-                               encrypt,
-                               key_manager,
-                               osd_id,
-                               bluestore_skip)
-        else:
-            cmd = _ceph_disk(dev,
-                             osd_format,
-                             osd_journal,
-                             encrypt)
+    if active_bluestore(dev):
+        log('{} is in use as an active bluestore block device,'
+            ' skipping.'.format(dev))
+        osd_devices.append(dev)
+        return None
 
+    if mapped_luks(dev):
+        log('{} is a mapped LUKS device,'
+            ' skipping.'.format(dev))
+        return None
+
+    if cmp_pkgrevno('ceph', '12.2.4') >= 0:
+        return _ceph_volume(dev,
+                            osd_journal,
+                            encrypt,
+                            key_manager,
+                            osd_id,
+                            bluestore_skip)
+    return _ceph_disk(dev,
+                      osd_format,
+                      osd_journal,
+                      encrypt)
+
+
+def _run_osdize_cmd(dev, cmd, ignore_errors=False):
+    """Run the command returned by _osdize_dev_cmd.
+
+    :returns: Whether the command succeeded.
+    :rtype: bool
+    :raises subprocess.CalledProcessError: if the command failed and
+                                           ignore_errors is False
+    """
+    lsblk_output = None
+    try:
+        status_set('maintenance', 'Initializing device {}'.format(dev))
+        log("osdize cmd: {}".format(cmd))
+        subprocess.check_call(cmd)
+        return True
+    except subprocess.CalledProcessError:
         try:
-            status_set('maintenance', 'Initializing device {}'.format(dev))
-            log("osdize cmd: {}".format(cmd))
-            subprocess.check_call(cmd)
-        except subprocess.CalledProcessError:
-            try:
-                lsblk_output = subprocess.check_output(
-                    ['lsblk', '-P']).decode('UTF-8')
-            except subprocess.CalledProcessError as e:
-                log("Couldn't get lsblk output: {}".format(e), ERROR)
-            if ignore_errors:
-                log('Unable to initialize device: {}'.format(dev), WARNING)
-                if lsblk_output:
-                    log('lsblk output: {}'.format(lsblk_output), DEBUG)
-            else:
-                log('Unable to initialize device: {}'.format(dev), ERROR)
-                if lsblk_output:
-                    log('lsblk output: {}'.format(lsblk_output), WARNING)
-                raise
+            lsblk_output = subprocess.check_output(
+                ['lsblk', '-P']).decode('UTF-8')
+        except subprocess.CalledProcessError as e:
+            log("Couldn't get lsblk output: {}".format(e), ERROR)
+        if ignore_errors:
+            log('Unable to initialize device: {}'.format(dev), WARNING)
+            if lsblk_output:
+                log('lsblk output: {}'.format(lsblk_output), DEBUG)
+        else:
+            log('Unable to initialize device: {}'.format(dev), ERROR)
+            if lsblk_output:
+                log('lsblk output: {}'.format(lsblk_output), WARNING)
+            raise
+    return False
 
-        # NOTE: Record processing of device only on success to ensure that
-        #       the charm only tries to initialize a device of OSD usage
-        #       once during its lifetime.
-        osd_devices.append(dev)
+
+# Outcomes of preparing a device with osdize_devices().
+OSDIZE_CREATED = 'created'
+OSDIZE_SKIPPED = 'skipped'
+OSDIZE_FAILED = 'failed'
+OSDIZE_CANCELLED = 'cancelled'
+
+
+def osdize_devices(devices, osd_format, osd_journal, ignore_errors=False,
+                   encrypt=False, key_manager=CEPH_KEY_MANAGER,
+                   bluestore_skip=None, concurrency=1, inventory=None):
+    """Prepare block devices for use as Ceph OSDs, several at a time.
+
+    Checking each device and creating its LVM volumes, which is where a
+    shared WAL or DB device is picked with find_least_used_utility_device,
+    happens one device after the other in the calling thread.  Only the
+    slow 'ceph-volume lvm create' commands run in a pool of up to
+    concurrency threads.  The 'osd-devices' list in the unit's kv store is
+    likewise only updated from the calling thread, as each device is done.
+
+    If a device fails and ignore_errors is False, devices not yet started
+    are cancelled and the error is raised once the running ones are done.
+
+    :param devices: Paths of the devices to prepare
+    :type devices: List[str]
+    :param concurrency: The maximum number of devices to prepare at once
+    :type concurrency: int
+    :param inventory: A scan of the host's block devices to check the
+                      devices against, see _osdize_dev_cmd.
+    :type inventory: Optional[charms_ceph.inventory.BlockDeviceInventory]
+
+    Other parameters are as for osdize_dev.
+
+    :returns: Outcome and seconds taken for each device, in the order of
+              devices.
+    :rtype: collections.OrderedDict[str, Tuple[str, float]]
+    :raises subprocess.CalledProcessError: if a device failed and
+                                           ignore_errors is False
+    :raises ValueError: if an invalid key_manager is provided
+    """
+    if key_manager not in KEY_MANAGERS:
+        raise ValueError('Unsupported key manager: {}'.format(key_manager))
+
+    results = collections.OrderedDict()
+    db = kv()
+    osd_devices = db.get('osd-devices', [])
+    concurrency = max(1, concurrency)
+
+    def record(dev, outcome, started):
+        results[dev] = (outcome, round(time.monotonic() - started, 3))
+        log('osdize {}: {} in {:.1f}s'.format(dev, outcome, results[dev][1]),
+            level=DEBUG)
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    running = {}
+    error = None
+    try:
+        for dev in devices:
+            if error:
+                break
+            started = time.monotonic()
+            if not dev.startswith('/dev'):
+                osdize(dev, osd_format, osd_journal, ignore_errors, encrypt,
+                       key_manager, bluestore_skip=bluestore_skip)
+                # osdize_dir records the directory in the kv store itself
+                osd_devices = db.get('osd-devices', [])
+                record(dev, OSDIZE_CREATED if dev in osd_devices
+                       else OSDIZE_SKIPPED, started)
+                continue
+            try:
+                cmd = _osdize_dev_cmd(dev, osd_format, osd_journal,
+                                      osd_devices, encrypt, key_manager,
+                                      bluestore_skip=bluestore_skip,
+                                      inventory=inventory)
+            finally:
+                db.set('osd-devices', osd_devices)
+                db.flush()
+            if cmd is None:
+                record(dev, OSDIZE_SKIPPED, started)
+                continue
+            running[pool.submit(_run_osdize_cmd, dev, cmd,
+                                ignore_errors)] = (dev, started)
+            # Only check the next device once a worker is free, so no
+            # volumes are allocated for devices that an earlier failure
+            # would leave unprepared.
+            while len(running) >= concurrency:
+                error = _collect_osdize(running, osd_devices, db,
+                                        record) or error
     finally:
-        db.set('osd-devices', osd_devices)
-        db.flush()
+        while running:
+            error = _collect_osdize(running, osd_devices, db,
+                                    record) or error
+        pool.shutdown(wait=True)
+    if error:
+        for dev in devices:
+            if dev not in results:
+                results[dev] = (OSDIZE_CANCELLED, 0.0)
+        log('osdize cancelled for devices: {}'.format(
+            [dev for dev, (outcome, _) in results.items()
+             if outcome == OSDIZE_CANCELLED]), level=WARNING)
+        raise error
+    return collections.OrderedDict((dev, results[dev]) for dev in devices)
+
+
+def _collect_osdize(running, osd_devices, db, record):
+    """Wait for at least one running osdize command and record the outcome.
+
+    :returns: The first error raised by a finished command, if any.
+    :rtype: Optional[Exception]
+    """
+    done, _ = concurrent.futures.wait(
+        running, return_when=concurrent.futures.FIRST_COMPLETED)
+    error = None
+    for future in done:
+        dev, started = running.pop(future)
+        try:
+            created = future.result()
+        except Exception as e:
+            record(dev, OSDIZE_FAILED, started)
+            error = error or e
+            continue
+        if created:
+            # NOTE: Record processing of device only on success to ensure
+            #       that the charm only tries to initialize a device of OSD
+            #       usage once during its lifetime.
+            osd_devices.append(dev)
+            db.set('osd-devices', osd_devices)
+            db.flush()
+            record(dev, OSDIZE_CREATED, started)
+        else:
+            record(dev, OSDIZE_FAILED, started)
+    return error
 
 
 def _ceph_disk(dev, osd_format, osd_journal, encrypt=False):
@@ -2125,11 +2306,10 @@ def wait_for_all_monitors_to_upgrade(new_version, upgrade_key):
     if mon_map['monmap']['mons']:
         for mon in mon_map['monmap']['mons']:
             monitor_list.append(mon['name'])
+    progress = UpgradeProgress(upgrade_key, 'mon', monitor_list, new_version)
     while not done:
         try:
-            done = all(monitor_key_exists(upgrade_key, "{}_{}_{}_done".format(
-                "mon", mon, new_version
-            )) for mon in monitor_list)
+            done = progress.done()
             current_time = time.time()
             if current_time > (start_time + 10 * 60):
                 raise Exception
@@ -2146,7 +2326,7 @@ def roll_monitor_cluster(new_version, upgrade_key):
     """This is tricky to get right so here's what we're going to do.
 
     There's 2 possible cases: Either I'm first in line or not.
-    If I'm not first in line I'll wait a random time between 5-30 seconds
+    If I'm not first in line I'll wait a random time between 2-10 seconds
     and test to see if the previous monitor is upgraded yet.
 
     :param new_version: str of the version to upgrade to
@@ -2384,25 +2564,35 @@ def wait_on_previous_node(upgrade_key, service, previous_node, version):
     :param version: str. The version we are upgrading to
     :returns: None
     """
-    log("Previous node is: {}".format(previous_node))
-
-    previous_node_started_f = (
-        lambda: monitor_key_exists(
-            upgrade_key,
-            "{}_{}_{}_start".format(service, previous_node, version)))
-    previous_node_finished_f = (
-        lambda: monitor_key_exists(
-            upgrade_key,
-            "{}_{}_{}_done".format(service, previous_node, version)))
-    previous_node_alive_time_f = (
-        lambda: monitor_key_get(
-            upgrade_key,
-            "{}_{}_{}_alive".format(service, previous_node, version)))
-
-    # wait for 30 minutes until the previous node starts.  We don't proceed
+    wait_on_previous_nodes(upgrade_key, service, [previous_node], version)
+
+
+def wait_on_previous_nodes(upgrade_key, service, previous_nodes, version):
+    """A lock that sleeps the current thread while waiting for all nodes of
+    the previous upgrade wave to finish upgrading.
+
+    The keys of all the nodes are read with a single config-key dump per
+    check, so waiting costs the monitors one command however many nodes
+    are waited on, and checks can be more frequent than before.
+
+    :param upgrade_key: str. The cephx key to use
+    :param service: str. The service being upgraded, 'mon' or 'osd'
+    :param previous_nodes: List[str]. The names of the nodes to wait on
+    :param version: str. The version we are upgrading to
+    :returns: None
+    """
+    previous = ', '.join(previous_nodes)
+    if len(previous_nodes) == 1:
+        log("Previous node is: {}".format(previous))
+    else:
+        log("Previous nodes are: {}".format(previous))
+    progress = UpgradeProgress(upgrade_key, service, previous_nodes, version)
+
+    # wait for 30 minutes until the previous nodes start.  We don't proceed
     # unless we get a start condition.
     try:
-        WatchDog.wait_until(previous_node_started_f, timeout=30 * 60)
+        WatchDog.wait_until(progress.started, timeout=30 * 60,
+                            delay_range=UPGRADE_POLL_DELAY)
     except WatchDog.WatchDogTimeoutException:
         log("Waited for previous node to start for 30 minutes. "
             "It didn't start, so may have a serious issue. Continuing with "
@@ -2413,17 +2603,18 @@ def wait_on_previous_node(upgrade_key, service, previous_node, version):
     # keep the time it started from this nodes' perspective.
     previous_node_started_at = time.time()
     log("Detected that previous node {} has started.  Time now: {}"
-        .format(previous_node, previous_node_started_at))
+        .format(previous, previous_node_started_at))
 
-    # Now wait for the node to complete.  The node may optionally be kicking
-    # with the *_alive key, which allows this node to wait longer as it 'knows'
-    # the other node is proceeding.
+    # Now wait for the nodes to complete.  The nodes may optionally be kicking
+    # with the *_alive key, which allows this node to wait longer as it
+    # 'knows' the other nodes are proceeding.
     try:
-        WatchDog.timed_wait(kicked_at_function=previous_node_alive_time_f,
-                            complete_function=previous_node_finished_f,
+        WatchDog.timed_wait(kicked_at_function=progress.kicked_at,
+                            complete_function=progress.done,
                             wait_time=30 * 60,
                             compatibility_wait_time=10 * 60,
-                            max_kick_interval=5 * 60)
+                            max_kick_interval=5 * 60,
+                            delay_range=UPGRADE_POLL_DELAY)
     except WatchDog.WatchDogDeadException:
         # previous node was kicking, but timed out; log this condition and move
         # on.
@@ -2433,7 +2624,7 @@ def wait_on_previous_node(upgrade_key, service, previous_node, version):
             "Waited total of {} mins on node {}. current time: {} > "
             "previous node start time: {}. "
             "Continuing with upgrade of this node."
-            .format(waited, previous_node, now, previous_node_started_at),
+            .format(waited, previous, now, previous_node_started_at),
             level=WARNING)
     except WatchDog.WatchDogTimeoutException:
         # previous node never kicked, or simply took too long; log this
@@ -2444,10 +2635,107 @@ def wait_on_previous_node(upgrade_key, service, previous_node, version):
             "Waited {} mins on node {}. current time: {} > "
             "previous node start time: {}. "
             "Continuing with upgrade of this node."
-            .format(waited, previous_node, now, previous_node_started_at),
+            .format(waited, previous, now, previous_node_started_at),
             level=WARNING)
 
 
+def monitor_key_dump(service, prefix=None):
+    """Return all keys starting with prefix in the monitor cluster.
+
+    One command replaces a monitor_key_get call per key.
+
+    :param service: The Ceph user name to run the command under
+    :type service: str
+    :param prefix: Only return keys starting with this prefix.
+    :type prefix: Optional[str]
+    :rtype: Dict[str, str]
+    :raises: subprocess.CalledProcessError, ValueError
+    """
+    cmd = ['ceph', '--id', service, 'config-key', 'dump']
+    if prefix:
+        cmd.append(prefix)
+    return json.loads(subprocess.check_output(cmd).decode('UTF-8'))
+
+
+# Range of seconds to sleep between checks on the upgrade progress of other
+# nodes.
+UPGRADE_POLL_DELAY = (2, 10)
+
+
+class UpgradeProgress(object):
+    """The upgrade keys published by a set of nodes.
+
+    Each node taking part in a rolling upgrade sets the
+    '<service>_<node>_<version>_start', '_alive' and '_done' keys. Every
+    check reads the keys of all nodes with one config-key dump rather than
+    running monitor_key_exists and monitor_key_get per key and node. If the
+    dump is not permitted, e.g. because the upgrade key predates the
+    'config-key dump' cap, the keys are read one at a time as before.
+    """
+
+    def __init__(self, upgrade_key, service, nodes, version):
+        self.upgrade_key = upgrade_key
+        self.service = service
+        self.nodes = list(nodes)
+        self.version = version
+        self._bulk = True
+        self._keys = None
+
+    def key(self, node, stage):
+        return '{}_{}_{}_{}'.format(self.service, node, self.version, stage)
+
+    def refresh(self):
+        """Read the current keys of all nodes."""
+        if not self._bulk:
+            return
+        try:
+            self._keys = monitor_key_dump(self.upgrade_key,
+                                          '{}_'.format(self.service))
+        except (subprocess.CalledProcessError, ValueError) as e:
+            log("Unable to dump upgrade keys, reading them one at a time: "
+                "{}".format(e), level=WARNING)
+            self._bulk = False
+            self._keys = None
+
+    def _exists(self, node, stage):
+        if self._keys is not None:
+            return self.key(node, stage) in self._keys
+        return monitor_key_exists(self.upgrade_key, self.key(node, stage))
+
+    def _get(self, node, stage):
+        if self._keys is not None:
+            return self._keys.get(self.key(node, stage))
+        return monitor_key_get(self.upgrade_key, self.key(node, stage))
+
+    def started(self):
+        """Whether all nodes have started upgrading."""
+        self.refresh()
+        return all(self._exists(node, 'start') for node in self.nodes)
+
+    def done(self):
+        """Whether all nodes have finished upgrading."""
+        self.refresh()
+        return all(self._exists(node, 'done') for node in self.nodes)
+
+    def kicked_at(self):
+        """Return the time of the oldest kick of the nodes still upgrading.
+
+        Uses the keys read by the last call to done().
+
+        :returns: The time as a string, None if any of the nodes still
+                  upgrading has not kicked.
+        :rtype: Optional[str]
+        """
+        pending = self.nodes
+        if self._keys is not None:
+            pending = [node for node in self.nodes
+                       if not self._exists(node, 'done')]
+        kicks = [self._get(node, 'alive') for node in pending]
+        if not kicks or None in kicks:
+            return None
+        return min(kicks, key=float)
+
+
 class WatchDog(object):
     """Watch a dog; basically a kickable timer with a timeout between two async
     units.
@@ -2512,20 +2800,22 @@ class WatchDog(object):
         self.last_kick_at = now
 
     @staticmethod
-    def wait_until(wait_f, timeout=10 * 60):
+    def wait_until(wait_f, timeout=10 * 60, delay_range=(5, 30)):
         """Wait for timeout seconds until the passed function return True.
 
         :param wait_f: The function to call that will end the wait.
         :type wait_f: Callable[[], Boolean]
         :param timeout: The time to wait in seconds.
         :type timeout: int
+        :param delay_range: The range of seconds to sleep between calls.
+        :type delay_range: Tuple[int, int]
         """
         start_time = time.time()
         while not wait_f():
             now = time.time()
             if now > start_time + timeout:
                 raise WatchDog.WatchDogTimeoutException()
-            wait_time = random.randrange(5, 30)
+            wait_time = random.randrange(*delay_range)
             log('wait_until: waiting for {} seconds'.format(wait_time))
             time.sleep(wait_time)
 
@@ -2534,7 +2824,8 @@ class WatchDog(object):
                    complete_function,
                    wait_time=30 * 60,
                    compatibility_wait_time=10 * 60,
-                   max_kick_interval=5 * 60):
+                   max_kick_interval=5 * 60,
+                   delay_range=(5, 30)):
         """Wait a maximum time with an intermediate 'kick' time.
 
         This function will wait for max_kick_interval seconds unless the
@@ -2581,6 +2872,8 @@ class WatchDog(object):
         :param max_kick_interval: The maximum time allowed between kicks before
             the wait is over, in seconds:
         :type max_kick_interval: int
+        :param delay_range: The range of seconds to sleep between checks.
+        :type delay_range: Tuple[int, int]
         :raises: WatchDog.WatchDogTimeoutException,
                  WatchDog.WatchDogDeadException
         """
@@ -2602,7 +2895,7 @@ class WatchDog(object):
                     raise WatchDog.WatchDogDeadException()
             if (now - start_time > wait_time):
                 raise WatchDog.WatchDogTimeoutException()
-            delay_time = random.randrange(5, 30)
+            delay_time = random.randrange(*delay_range)
             log('waiting for {} seconds'.format(delay_time))
             time.sleep(delay_time)
 
@@ -2625,27 +2918,93 @@ def get_upgrade_position(osd_sorted_list, match_name):
                      .format(match_name))
 
 
+# CRUSH bucket types from the narrowest to the widest.
+CRUSH_BUCKET_TYPES = ('osd', 'host', 'chassis', 'rack', 'row', 'pdu', 'pod',
+                      'room', 'datacenter', 'zone', 'region')
+
+
+def get_crush_failure_domain(service):
+    """Return the narrowest failure domain used by any CRUSH rule.
+
+    The failure domain of a rule is the bucket type of its last choose or
+    chooseleaf step.  Rules using a custom bucket type count as 'host'.
+
+    :param service: The Ceph user name to run the command under.
+    :type service: str
+    :returns: A CRUSH bucket type, e.g. 'host' or 'rack'.
+    :rtype: str
+    :raises: subprocess.CalledProcessError, ValueError
+    """
+    out = subprocess.check_output(
+        ['ceph', '--id', service, 'osd', 'crush', 'rule', 'dump',
+         '--format=json']).decode('UTF-8')
+    domains = set()
+    for rule in json.loads(out):
+        types = [step['type'] for step in rule.get('steps', [])
+                 if step.get('op', '').startswith('choose') and
+                 'type' in step]
+        if types:
+            domains.add(types[-1] if types[-1] in CRUSH_BUCKET_TYPES
+                        else 'host')
+    for bucket_type in CRUSH_BUCKET_TYPES:
+        if bucket_type in domains:
+            return bucket_type
+    return 'host'
+
+
+def get_upgrade_waves(osd_sorted_list, failure_domain='host', concurrency=1):
+    """Split the OSD hosts into waves that upgrade at the same time.
+
+    All hosts of a wave are in the same failure domain bucket, so a wave
+    only takes down the replicas CRUSH placed in that bucket.  With a
+    failure domain of 'host' or narrower every host is a wave of its own.
+
+    :param osd_sorted_list: OSD hosts sorted by name
+    :type osd_sorted_list: List[CrushLocation]
+    :param failure_domain: The CRUSH failure domain of the cluster
+    :type failure_domain: str
+    :param concurrency: The maximum number of hosts per wave
+    :type concurrency: int
+    :returns: The host names of each wave, in upgrade order
+    :rtype: List[List[str]]
+    """
+    if concurrency <= 1 or failure_domain in ('osd', 'host'):
+        return [[host.name] for host in osd_sorted_list]
+    buckets = collections.OrderedDict()
+    for host in osd_sorted_list:
+        bucket = getattr(host, failure_domain, None)
+        # Hosts outside any bucket of that type get a wave of their own.
+        key = ('bucket', bucket) if bucket else ('host', host.name)
+        buckets.setdefault(key, []).append(host.name)
+    waves = []
+    for key in sorted(buckets):
+        hosts = buckets[key]
+        for i in range(0, len(hosts), concurrency):
+            waves.append(hosts[i:i + concurrency])
+    return waves
+
+
 # Edge cases:
 # 1. Previous node dies on upgrade, can we retry?
 # 2. This assumes that the OSD failure domain is not set to OSD.
 #    It rolls an entire server at a time.
-def roll_osd_cluster(new_version, upgrade_key):
+def roll_osd_cluster(new_version, upgrade_key, concurrency=1):
     """This is tricky to get right so here's what we're going to do.
 
     There's 2 possible cases: Either I'm first in line or not.
-    If I'm not first in line I'll wait a random time between 5-30 seconds
-    and test to see if the previous OSD is upgraded yet.
+    If I'm not first in line I'll wait a random time between 2-10 seconds
+    and test to see if the previous OSDs are upgraded yet.
 
-    TODO: If you're not in the same failure domain it's safe to upgrade
-     1. Examine all pools and adopt the most strict failure domain policy
-        Example: Pool 1: Failure domain = rack
-        Pool 2: Failure domain = host
-        Pool 3: Failure domain = row
-
-        outcome: Failure domain = host
+    With a concurrency above 1, hosts sharing a bucket of the narrowest
+    failure domain used by any CRUSH rule, e.g. the same rack, upgrade
+    together in waves of up to concurrency hosts.  Losing a single bucket
+    is what CRUSH placement already tolerates, so a wave never takes down
+    more than one replica of a placement group.  Buckets are still rolled
+    one after the other.
 
     :param new_version: str of the version to upgrade to
     :param upgrade_key: the cephx key name to use when upgrading
+    :param concurrency: int. The maximum number of hosts to upgrade at once
     """
     log('roll_osd_cluster called with {}'.format(new_version))
     my_name = socket.gethostname()
@@ -2656,6 +3015,19 @@ def roll_osd_cluster(new_version, upgrade_key):
 
     try:
         position = get_upgrade_position(osd_sorted_list, my_name)
+        waves = [[host.name] for host in osd_sorted_list]
+        if concurrency > 1:
+            try:
+                failure_domain = get_crush_failure_domain(upgrade_key)
+            except (subprocess.CalledProcessError, ValueError) as e:
+                log("Unable to determine the CRUSH failure domain, upgrading "
+                    "one host at a time: {}".format(e), level=WARNING)
+                failure_domain = 'host'
+            waves = get_upgrade_waves(osd_sorted_list, failure_domain,
+                                      concurrency)
+            position = [my_name in wave for wave in waves].index(True)
+            log("upgrade waves ({} failure domain): {}".format(
+                failure_domain, waves))
         log("upgrade position: {}".format(position))
         if position == 0:
             # I'm first!  Roll
@@ -2665,14 +3037,15 @@ def roll_osd_cluster(new_version, upgrade_key):
                           my_name=my_name,
                           version=new_version)
         else:
-            # Check if the previous node has finished
+            # Check if the previous wave has finished
+            previous_nodes = waves[position - 1]
             status_set('waiting',
                        'Waiting on {} to finish upgrading'.format(
-                           osd_sorted_list[position - 1].name))
-            wait_on_previous_node(
+                           ', '.join(previous_nodes)))
+            wait_on_previous_nodes(
                 upgrade_key=upgrade_key,
                 service='osd',
-                previous_node=osd_sorted_list[position - 1].name,
+                previous_nodes=previous_nodes,
                 version=new_version)
             lock_and_roll(upgrade_key=upgrade_key,
                           service='osd',
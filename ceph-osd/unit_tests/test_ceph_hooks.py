@@ -815,6 +815,54 @@ class CephHooksTestCase(unittest.TestCase):
             config['bdev-enable-discard'] = value
             self.assertEqual(ceph_hooks.get_bdev_enable_discard(), expected)
 
+    @patch.object(ceph_hooks, 'relation_ids', lambda *args: [])
+    @patch.object(ceph_hooks, 'emit_cephconf', lambda: None)
+    @patch.object(ceph_hooks, 'is_osd_bootstrap_ready', lambda: True)
+    @patch.object(ceph_hooks.os.path, 'exists', lambda path: True)
+    @patch.object(ceph_hooks, 'use_vaultlocker', lambda: False)
+    @patch.object(ceph_hooks, 'get_journal_devices', lambda: set())
+    @patch.object(ceph_hooks, 'get_devices')
+    @patch.object(ceph_hooks, 'BlockDeviceInventory')
+    @patch.object(ceph_hooks, 'kv')
+    @patch.object(ceph_hooks, 'ceph')
+    @patch.object(ceph_hooks, 'log')
+    @patch.object(ceph_hooks, 'config')
+    def test_prepare_disks_and_activate(self, mock_config, mock_log,
+                                        mock_ceph, mock_kv, mock_inventory,
+                                        mock_get_devices):
+        config = copy.deepcopy(CHARM_CONFIG)
+        config.update({'ignore-device-errors': False,
+                       'osd-encrypt': False,
+                       'osd-encrypt-keymanager': 'ceph',
+                       'osd-prepare-concurrency': 4,
+                       'autotune': False})
+        mock_config.side_effect = lambda key: config[key]
+        mock_get_devices.return_value = ['/dev/vdb', '/dev/vdc']
+        mock_kv.return_value.get.return_value = []
+        inventory = mock_inventory.return_value
+        inventory.is_device_mounted.return_value = False
+        inventory.is_active_bluestore_device.return_value = False
+        inventory.is_mapped_luks_device.return_value = False
+        inventory.is_pristine_disk.return_value = True
+        mock_ceph.osdize_devices.return_value = OrderedDict([
+            ('/dev/vdb', ('created', 61.2)),
+            ('/dev/vdc', ('skipped', 0.1))])
+        ceph_hooks.prepare_disks_and_activate()
+        mock_inventory.assert_called_once_with()
+        inventory.is_pristine_disk.assert_has_calls(
+            [call('/dev/vdb'), call('/dev/vdc')])
+        mock_ceph.is_pristine_disk.assert_not_called()
+        # The devices are checked against the same inventory, rescanned
+        # once udev settled.
+        inventory.scan.assert_called_once_with()
+        mock_ceph.osdize_devices.assert_called_once_with(
+            ['/dev/vdb', '/dev/vdc'], 'ext4', set(), False, False, 'ceph',
+            concurrency=4, inventory=inventory)
+        mock_log.assert_any_call(
+            'Prepared OSD devices: /dev/vdb created (61.2s), '
+            '/dev/vdc skipped (0.1s)', level=ceph_hooks.INFO)
+        mock_ceph.start_osds.assert_called_once_with(['/dev/vdb', '/dev/vdc'])
+
     @patch.object(ceph_hooks, "get_total_ram")
     @patch.object(ceph_hooks, "kv")
     @patch.object(ceph_hooks, "log")
@@ -0,0 +1,81 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from unittest.mock import ANY, MagicMock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'files', 'nagios'))
+import collect_ceph_osd_services as collect  # noqa: E402
+
+SYSTEMCTL_SHOW = b"""ActiveState=active
+SubState=running
+Id=ceph-osd@0.service
+
+ActiveState=failed
+SubState=failed
+Id=ceph-osd@1.service
+"""
+
+
+class CollectCephOsdServicesTestCase(unittest.TestCase):
+
+    def test_get_osd_units(self):
+        with tempfile.TemporaryDirectory() as wdir:
+            for osd in ('3', '12', None):
+                path = os.path.join(wdir, 'ceph-{}'.format(osd))
+                os.mkdir(path)
+                if osd:
+                    with open(os.path.join(path, 'whoami'), 'w') as f:
+                        f.write(osd + '\n')
+            with patch.object(collect, 'WHOAMI_GLOB',
+                              os.path.join(wdir, 'ceph-*', 'whoami')):
+                self.assertEqual(collect.get_osd_units(), ['12', '3'])
+
+    @patch.object(collect.subprocess, 'check_output')
+    def test_systemd_status(self, check_output):
+        check_output.return_value = SYSTEMCTL_SHOW
+        lines = collect.systemd_status(['0', '1', '2'])
+        check_output.assert_called_once_with(
+            ['systemctl', 'show', '--no-pager',
+             '--property=Id,ActiveState,SubState',
+             'ceph-osd@0.service', 'ceph-osd@1.service',
+             'ceph-osd@2.service'], stderr=subprocess.STDOUT)
+        self.assertEqual(lines, [
+            'OK: ceph-osd@0 is running\n',
+            'Failed: ceph-osd@1 is failed (failed)\n',
+            'Failed: ceph-osd@2 is unknown (unknown)\n'])
+
+        check_output.side_effect = subprocess.CalledProcessError(
+            1, 'systemctl', output=b'Failed to connect to bus')
+        self.assertEqual(
+            collect.systemd_status(['0']),
+            ['Failed: systemctl show raised: Failed to connect to bus\n'])
+
+    @patch.object(collect, 'getpwnam')
+    @patch.object(collect.os, 'chown')
+    def test_write_report(self, chown, getpwnam):
+        getpwnam.return_value = MagicMock(pw_uid=1, pw_gid=2)
+        with tempfile.TemporaryDirectory() as wdir:
+            with patch.object(collect, 'NAGIOS_HOME', wdir):
+                collect.write_report(['OK: ceph-osd@0 is running\n'])
+            self.assertEqual(os.listdir(wdir), [collect.CRON_CHECK_TMPFILE])
+            with open(os.path.join(wdir, collect.CRON_CHECK_TMPFILE)) as f:
+                self.assertEqual(f.read(), 'OK: ceph-osd@0 is running\n')
+        chown.assert_called_once_with(ANY, 1, 2)
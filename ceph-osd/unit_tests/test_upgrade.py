@@ -35,7 +35,8 @@ class UpgradeRollingTestCase(CharmTestCase):
         check_for_upgrade()
 
         roll_osd_cluster.assert_called_with(new_version='hammer',
-                                            upgrade_key='osd-upgrade')
+                                            upgrade_key='osd-upgrade',
+                                            concurrency=1)
         emit_cephconf.assert_has_calls([call(upgrading=True),
                                         call(upgrading=False)])
         exists.assert_called_with(
@@ -60,11 +61,14 @@ class UpgradeRollingTestCase(CharmTestCase):
         exists.return_value = True
         version_pre_and_post = 'jewel'
         version.side_effect = [version_pre_and_post, version_pre_and_post]
+        self.test_config.set('osd-upgrade-concurrency', 3)
+        hookenv.config.side_effect = self.test_config
 
         check_for_upgrade()
 
         roll_osd_cluster.assert_called_with(new_version='jewel',
-                                            upgrade_key='osd-upgrade')
+                                            upgrade_key='osd-upgrade',
+                                            concurrency=3)
         emit_cephconf.assert_has_calls([call(upgrading=True),
                                         call(upgrading=False)])
         exists.assert_called_with(
@@ -14,6 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
 import os
 import subprocess
 import sys
@@ -30,6 +31,7 @@ from charmhelpers.core.hookenv import (
     leader_set,
     action_set,
     action_get,
+    function_log,
     log,
     ERROR,
     DEBUG,
@@ -50,6 +52,10 @@ from charmhelpers.core.host import (
 )
 
 DEFAULT_SYNC_POLICY_ID = 'default'
+# Number of buckets whose sync policy is changed at the same time.
+BUCKET_SYNC_WORKERS = 8
+# Report progress every this many buckets.
+BUCKET_SYNC_PROGRESS_INTERVAL = 100
 
 
 def pause(args):
@@ -281,6 +287,69 @@ def is_multisite_sync_policy_action_allowed():
     return True
 
 
+def _apply_to_buckets(buckets, apply, done_message):
+    """Call apply for each of the given buckets that exists in the zone.
+
+    Up to BUCKET_SYNC_WORKERS buckets are handled at the same time and
+    progress is reported every BUCKET_SYNC_PROGRESS_INTERVAL buckets. The
+    action result lists what happened to each bucket in the given order.
+
+    :param buckets: List of bucket names.
+    :type buckets: list
+    :param apply: Called with the name of each existing bucket.
+    :type apply: Callable[[str], None]
+    :param done_message: Message for a bucket once apply succeeded, with a
+        placeholder for the bucket name.
+    :type done_message: str
+    :raises subprocess.CalledProcessError: The first failure, once every
+        bucket has been handled.
+    """
+    zone = config('zone')
+    zonegroup = config('zonegroup')
+    existing_buckets = set(
+        multisite.list_buckets(zonegroup=zonegroup, zone=zone) or [])
+    messages = {}
+    pending = []
+    for bucket in dict.fromkeys(buckets):
+        if bucket in existing_buckets:
+            pending.append(bucket)
+        else:
+            messages[bucket] = (
+                'Bucket "{}" does not exist in the zonegroup "{}" and '
+                'zone "{}"'.format(bucket, zonegroup, zone))
+
+    errors = []
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=BUCKET_SYNC_WORKERS) as executor:
+        futures = {executor.submit(apply, bucket): bucket
+                   for bucket in pending}
+        for count, future in enumerate(
+                concurrent.futures.as_completed(futures), 1):
+            bucket = futures[future]
+            try:
+                future.result()
+                messages[bucket] = done_message.format(bucket)
+            except subprocess.CalledProcessError as cpe:
+                errors.append(cpe)
+                messages[bucket] = ('Failed to update "{}" bucket sync '
+                                    'policy: {}'.format(bucket, cpe))
+            if (count % BUCKET_SYNC_PROGRESS_INTERVAL == 0 or
+                    count == len(pending)):
+                function_log('Processed {} of {} buckets'.format(
+                    count, len(pending)))
+
+    ordered = [messages[bucket] for bucket in dict.fromkeys(buckets)]
+    for message in ordered:
+        log(message)
+    action_set(
+        values={
+            'message': '\n'.join(ordered)
+        }
+    )
+    if errors:
+        raise errors[0]
+
+
 def update_buckets_sync_policy(buckets, sync_policy_state):
     """Update the sync policy state for all the given buckets.
 
@@ -292,72 +361,46 @@ def update_buckets_sync_policy(buckets, sync_policy_state):
     The sync policy state is set by creating a bucket-level sync group with
     the given state, followed by a sync group pipe that match all the source
     and destination buckets. If the bucket already has a sync group, it is
-    updated with the new state.
+    updated with the new state. Several buckets are updated concurrently.
 
     :param buckets: List of bucket names.
     :type buckets: list
     :param sync_policy_state: The sync policy state to set for the buckets.
     :type sync_policy_state: str
     """
-    zone = config('zone')
-    zonegroup = config('zonegroup')
-    existing_buckets = multisite.list_buckets(zonegroup=zonegroup, zone=zone)
-    messages = []
-    for bucket in buckets:
-        if bucket in existing_buckets:
-            multisite.create_sync_group(
-                bucket=bucket,
-                group_id=DEFAULT_SYNC_POLICY_ID,
-                status=sync_policy_state)
-            multisite.create_sync_group_pipe(
-                bucket=bucket,
-                group_id=DEFAULT_SYNC_POLICY_ID,
-                pipe_id=DEFAULT_SYNC_POLICY_ID,
-                source_zones=['*'],
-                dest_zones=['*'])
-            message = 'Updated "{}" bucket sync policy to "{}"'.format(
-                bucket, sync_policy_state)
-        else:
-            message = ('Bucket "{}" does not exist in the zonegroup "{}" and '
-                       'zone "{}"'.format(bucket, zonegroup, zone))
-        log(message)
-        messages.append(message)
-    action_set(
-        values={
-            'message': '\n'.join(messages)
-        }
-    )
+    def _update(bucket):
+        multisite.create_sync_group(
+            bucket=bucket,
+            group_id=DEFAULT_SYNC_POLICY_ID,
+            status=sync_policy_state)
+        multisite.create_sync_group_pipe(
+            bucket=bucket,
+            group_id=DEFAULT_SYNC_POLICY_ID,
+            pipe_id=DEFAULT_SYNC_POLICY_ID,
+            source_zones=['*'],
+            dest_zones=['*'])
+
+    _apply_to_buckets(
+        buckets, _update,
+        'Updated "{{}}" bucket sync policy to "{}"'.format(sync_policy_state))
 
 
 def reset_buckets_sync_policy(buckets):
     """Reset the sync policy state for all the given buckets.
 
     For every bucket in the given list, this method resets the sync policy
-    state. This is done by removing the bucket-level sync group.
+    state. This is done by removing the bucket-level sync group. Several
+    buckets are reset concurrently.
 
     :param buckets: List of bucket names.
     :type buckets: list
     """
-    zone = config('zone')
-    zonegroup = config('zonegroup')
-    existing_buckets = multisite.list_buckets(zonegroup=zonegroup, zone=zone)
-    messages = []
-    for bucket in buckets:
-        if bucket in existing_buckets:
-            multisite.remove_sync_group(
-                bucket=bucket,
-                group_id=DEFAULT_SYNC_POLICY_ID)
-            message = 'Reset "{}" bucket sync policy'.format(bucket)
-        else:
-            message = ('Bucket "{}" does not exist in the zonegroup "{}" and '
-                       'zone "{}"'.format(bucket, zonegroup, zone))
-        log(message)
-        messages.append(message)
-    action_set(
-        values={
-            'message': '\n'.join(messages)
-        }
-    )
+    def _reset(bucket):
+        multisite.remove_sync_group(
+            bucket=bucket,
+            group_id=DEFAULT_SYNC_POLICY_ID)
+
+    _apply_to_buckets(buckets, _reset, 'Reset "{}" bucket sync policy')
 
 
 def enable_buckets_sync(args):
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import json
 import functools
 import subprocess
@@ -50,6 +51,70 @@ class UnknownSyncFlowType(Exception):
     pass
 
 
+class MultisiteSnapshot(object):
+    """Multisite configuration as read from radosgw-admin during one hook.
+
+    The read helpers in this module answer from the current snapshot, so
+    each distinct query forks radosgw-admin at most once. Helpers that
+    change the configuration drop the snapshot and the next read starts
+    a new one.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self.queries = 0
+
+    def lookup(self, key, fetch, *args, **kwargs):
+        """Return the cached result for key, calling fetch on a miss.
+
+        Results are copied out so callers cannot change the snapshot.
+        """
+        if key not in self._results:
+            self._results[key] = fetch(*args, **kwargs)
+            self.queries += 1
+        return copy.deepcopy(self._results[key])
+
+
+_snapshot = None
+
+
+def snapshot():
+    """The MultisiteSnapshot of the running hook, created on first use.
+
+    :rtype: MultisiteSnapshot
+    """
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = MultisiteSnapshot()
+    return _snapshot
+
+
+def invalidate_snapshot():
+    """Drop the current snapshot so the next read queries radosgw-admin."""
+    global _snapshot
+    _snapshot = None
+
+
+def _read(func):
+    """Answer calls to func from the snapshot, keyed on its arguments."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+        return snapshot().lookup(key, func, *args, **kwargs)
+    return wrapper
+
+
+def _mutation(func):
+    """Drop the snapshot once func has changed the configuration."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            invalidate_snapshot()
+    return wrapper
+
+
 @decorators.retry_on_exception(num_retries=10, base_delay=5,
                                exc_type=subprocess.CalledProcessError)
 def _check_output(cmd):
@@ -80,6 +145,7 @@ def _key_name():
         return 'radosgw.gateway'
 
 
+@_read
 def _list(key):
     """
     Internal implementation for list_* functions
@@ -150,6 +216,8 @@ def list_zones(retry_on_empty=False):
     _zones = _list('zone')
     if retry_on_empty and not _zones:
         hookenv.log("No zones found", level=hookenv.DEBUG)
+        # Query again on the next attempt.
+        invalidate_snapshot()
         raise ValueError("No zones found")
     return _zones
 
@@ -159,6 +227,7 @@ list_zonegroups = functools.partial(_list, 'zonegroup')
 list_users = functools.partial(_list, 'user')
 
 
+@_read
 def list_buckets(zone, zonegroup):
     """List Buckets served under the provided zone and zonegroup pair.
 
@@ -185,6 +254,41 @@ def list_buckets(zone, zonegroup):
         return None
 
 
+@_read
+def zone_has_buckets(zone, zonegroup):
+    """Check for a bucket in the zone without listing all of them.
+
+    The bucket metadata listing is asked for a single entry; depending on
+    the Ceph release it comes back as a list or as a dict of keys with a
+    continuation marker.
+
+    :param zone: Parent zone.
+    :type zone: str
+    :param zonegroup: Parent zonegroup.
+    :type zonegroup: str
+    :returns: Whether the zone has a bucket, None if the query failed.
+    :rtype: Optional[bool]
+    """
+    cmd = [
+        RGW_ADMIN, '--id={}'.format(_key_name()),
+        'metadata', 'list', 'bucket', '--max-entries=1',
+        '--rgw-zone={}'.format(zone),
+        '--rgw-zonegroup={}'.format(zonegroup),
+    ]
+    try:
+        result = json.loads(_check_output(cmd))
+        if isinstance(result, dict):
+            result = result['keys']
+        return len(result) > 0
+    except subprocess.CalledProcessError:
+        hookenv.log("Bucket queried for incorrect zone({})-zonegroup({}) "
+                    "pair".format(zone, zonegroup), level=hookenv.ERROR)
+        return None
+    except TypeError:
+        return None
+
+
+@_mutation
 def create_realm(name, default=False):
     """
     Create a new RADOS Gateway Realm.
@@ -209,6 +313,7 @@ def create_realm(name, default=False):
         return None
 
 
+@_mutation
 def set_default_realm(name):
     """
     Set the default RADOS Gateway Realm
@@ -224,6 +329,7 @@ def set_default_realm(name):
     _check_call(cmd)
 
 
+@_mutation
 def create_zonegroup(name, endpoints, default=False, master=False, realm=None):
     """
     Create a new RADOS Gateway zone Group
@@ -259,6 +365,7 @@ def create_zonegroup(name, endpoints, default=False, master=False, realm=None):
         return None
 
 
+@_mutation
 def modify_zonegroup(name, endpoints=None, default=False,
                      master=False, realm=None):
     """Modify an existing RADOS Gateway zonegroup
@@ -298,6 +405,7 @@ def modify_zonegroup(name, endpoints=None, default=False,
         return None
 
 
+@_mutation
 def create_zone(name, endpoints, default=False, master=False, zonegroup=None,
                 access_key=None, secret=None, readonly=False):
     """
@@ -344,6 +452,7 @@ def create_zone(name, endpoints, default=False, master=False, zonegroup=None,
         return None
 
 
+@_mutation
 def modify_zone(name, endpoints=None, default=False, master=False,
                 access_key=None, secret=None, readonly=False,
                 realm=None, zonegroup=None):
@@ -395,6 +504,7 @@ def modify_zone(name, endpoints=None, default=False, master=False,
         return None
 
 
+@_read
 def get_zone_info(name, zonegroup=None):
     """Fetch detailed info for the provided zone
 
@@ -417,6 +527,7 @@ def get_zone_info(name, zonegroup=None):
         return None
 
 
+@_mutation
 def remove_zone_from_zonegroup(zone, zonegroup):
     """Remove RADOS Gateway zone from provided parent zonegroup
 
@@ -445,6 +556,7 @@ def remove_zone_from_zonegroup(zone, zonegroup):
             .format(zone, zonegroup, result)) from exc
 
 
+@_mutation
 def add_zone_to_zonegroup(zone, zonegroup):
     """Add RADOS Gateway zone to provided zonegroup
 
@@ -470,6 +582,7 @@ def add_zone_to_zonegroup(zone, zonegroup):
             .format(zone, zonegroup, result)) from exc
 
 
+@_mutation
 def update_period(fatal=True, zonegroup=None, zone=None, realm=None):
     """Update RADOS Gateway configuration period
 
@@ -498,6 +611,7 @@ def update_period(fatal=True, zonegroup=None, zone=None, realm=None):
         _call(cmd)
 
 
+@_mutation
 def tidy_defaults():
     """
     Purge any default zonegroup and zone definitions
@@ -532,6 +646,7 @@ def tidy_defaults():
         update_period()
 
 
+@_read
 def get_user_creds(username):
     cmd = [
         RGW_ADMIN, '--id={}'.format(_key_name()),
@@ -543,6 +658,7 @@ def get_user_creds(username):
             result['keys'][0]['secret_key'])
 
 
+@_mutation
 def suspend_user(username):
     """
     Suspend a RADOS Gateway user
@@ -566,6 +682,7 @@ def suspend_user(username):
         level=hookenv.DEBUG)
 
 
+@_mutation
 def create_user(username, system_user=False):
     """
     Create a RADOS Gateway user
@@ -605,6 +722,7 @@ def create_system_user(username):
     return create_user(username, system_user=True)
 
 
+@_mutation
 def pull_realm(url, access_key, secret):
     """
     Pull in a RADOS Gateway Realm from a master RGW instance
@@ -631,6 +749,7 @@ def pull_realm(url, access_key, secret):
         return None
 
 
+@_mutation
 def pull_period(url, access_key, secret):
     """
     Pull in a RADOS Gateway period from a master RGW instance
@@ -657,6 +776,7 @@ def pull_period(url, access_key, secret):
         return None
 
 
+@_mutation
 def rename_zone(name, new_name, zonegroup):
     """Rename an existing RADOS Gateway zone
 
@@ -680,6 +800,7 @@ def rename_zone(name, new_name, zonegroup):
     return 0 if result == 0 else None
 
 
+@_mutation
 def rename_zonegroup(name, new_name):
     """Rename an existing RADOS Gateway zonegroup
 
@@ -702,6 +823,7 @@ def rename_zonegroup(name, new_name):
     return 0 if result == 0 else None
 
 
+@_read
 def get_zonegroup_info(zonegroup):
     """Fetch detailed info for the provided zonegroup
 
@@ -894,9 +1016,9 @@ def check_zone_has_buckets(zone, zonegroup):
     :type zonegroup: str
     :rtype: Boolean
     """
-    buckets = list_buckets(zone, zonegroup)
-    if buckets is not None:
-        return (len(buckets) > 0)
+    has_buckets = zone_has_buckets(zone, zonegroup)
+    if has_buckets is not None:
+        return has_buckets
     hookenv.log(
         "Failed to query buckets for zone {} zonegroup {}"
         .format(zone, zonegroup),
@@ -937,6 +1059,7 @@ def check_cluster_has_buckets():
     return False
 
 
+@_read
 def list_sync_groups(bucket=None):
     """List sync policy groups.
 
@@ -985,22 +1108,17 @@ def get_sync_group(group_id, bucket=None):
         policy is returned.
     :type bucket: str
 
-    :return: Sync policy group configuration.
+    :return: Sync policy group configuration, or None if there is no such
+        group.
     :rtype: dict
     """
-    cmd = [
-        RGW_ADMIN, '--id={}'.format(_key_name()),
-        'sync', 'group', 'get',
-        '--group-id={}'.format(group_id),
-    ]
-    if bucket:
-        cmd.append('--bucket={}'.format(bucket))
-    try:
-        return json.loads(_check_output(cmd))
-    except TypeError:
-        return None
+    for group in list_sync_groups(bucket=bucket):
+        if group['key'] == group_id:
+            return group['val']
+    return None
 
 
+@_mutation
 def create_sync_group(group_id, status, bucket=None):
     """Create a sync policy group.
 
@@ -1036,6 +1154,7 @@ def create_sync_group(group_id, status, bucket=None):
         return None
 
 
+@_mutation
 def remove_sync_group(group_id, bucket=None):
     """Remove a sync group with the given group ID and optional bucket.
 
@@ -1113,6 +1232,7 @@ def is_sync_group_update_needed(group_id, flow_id, pipe_id, source_zone,
     return False
 
 
+@_mutation
 def create_sync_group_flow(group_id, flow_id, flow_type, source_zone,
                            dest_zone):
     """Create a new sync group data flow with the given parameters.
@@ -1154,6 +1274,7 @@ def create_sync_group_flow(group_id, flow_id, flow_type, source_zone,
         return None
 
 
+@_mutation
 def remove_sync_group_flow(group_id, flow_id, flow_type, source_zone=None,
                            dest_zone=None):
     """Remove a sync group data flow.
@@ -1190,6 +1311,7 @@ def remove_sync_group_flow(group_id, flow_id, flow_type, source_zone=None,
         return None
 
 
+@_mutation
 def create_sync_group_pipe(group_id, pipe_id, source_zones, dest_zones,
                            source_bucket='*', dest_bucket='*', bucket=None):
     """Create a sync group pipe between source and destination zones.
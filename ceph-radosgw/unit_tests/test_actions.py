@@ -86,6 +86,7 @@ class MultisiteActionsTestCase(CharmTestCase):
         'action_set',
         'multisite',
         'config',
+        'function_log',
         'is_leader',
         'leader_set',
         'service_name',
@@ -329,3 +330,47 @@ class MultisiteActionsTestCase(CharmTestCase):
             values={
                 'message': '\n'.join(expected_messages),
             })
+
+    def test_enable_buckets_sync_failure(self):
+        self.multisite.is_multisite_configured.return_value = True
+        self.multisite.get_zonegroup_info.return_value = {
+            'master_zone': 'test-zone-id',
+        }
+        self.multisite.get_zone_info.return_value = {
+            'id': 'test-zone-id',
+        }
+        self.is_leader.return_value = True
+        buckets = ['testbucket{}'.format(i) for i in range(250)]
+        self.action_get.return_value = ','.join(buckets)
+        self.test_config.set('zone', 'testzone')
+        self.test_config.set('zonegroup', 'testzonegroup')
+        self.test_config.set('realm', 'testrealm')
+        self.multisite.list_buckets.return_value = buckets
+
+        def _create_sync_group(bucket, group_id, status):
+            if bucket == 'testbucket7':
+                raise actions.subprocess.CalledProcessError(
+                    1, 'radosgw-admin', output='boom')
+        self.multisite.create_sync_group.side_effect = _create_sync_group
+
+        actions.enable_buckets_sync([])
+
+        # The failed bucket does not stop the others.
+        self.assertEqual(self.multisite.create_sync_group.call_count, 250)
+        self.assertEqual(self.multisite.create_sync_group_pipe.call_count,
+                         249)
+        messages = self.action_set.call_args[1]['values']['message']
+        messages = messages.split('\n')
+        self.assertEqual(len(messages), 250)
+        self.assertTrue(messages[7].startswith(
+            'Failed to update "testbucket7" bucket sync policy'))
+        self.assertEqual(messages[8], 'Updated "testbucket8" bucket sync '
+                         'policy to "{}"'.format(
+                             self.multisite.SYNC_POLICY_ENABLED))
+        self.function_log.assert_has_calls([
+            mock.call('Processed 100 of 250 buckets'),
+            mock.call('Processed 200 of 250 buckets'),
+            mock.call('Processed 250 of 250 buckets'),
+        ])
+        self.action_fail.assert_called_once_with(
+            'Failed to enable sync for the given buckets : boom')
@@ -53,6 +53,7 @@ class TestMultisiteHelpers(CharmTestCase):
         super(TestMultisiteHelpers, self).setUp(multisite, self.TO_PATCH)
         self.socket.gethostname.return_value = 'testhost'
         self.utils.request_per_unit_key.return_value = True
+        multisite.invalidate_snapshot()
 
     def _testdata(self, funcname):
         return os.path.join(os.path.dirname(__file__),
@@ -473,17 +474,26 @@ class TestMultisiteHelpers(CharmTestCase):
 
     @mock.patch.object(multisite, 'list_zonegroups')
     @mock.patch.object(multisite, 'get_local_zone')
-    @mock.patch.object(multisite, 'list_buckets')
-    def test_check_zone_has_buckets(self, mock_list_zonegroups,
-                                    mock_get_local_zone,
-                                    mock_list_buckets):
+    def test_check_zone_has_buckets(self, mock_get_local_zone,
+                                    mock_list_zonegroups):
         mock_list_zonegroups.return_value = ['test_zonegroup']
         mock_get_local_zone.return_value = 'test_zone', 'test_zonegroup'
-        mock_list_buckets.return_value = ['test_bucket_1', 'test_bucket_2']
+        self.subprocess.check_output.return_value = json.dumps(
+            {'keys': ['test_bucket_1'], 'truncated': True,
+             'marker': 'test_bucket_1'}).encode()
         self.assertEqual(
             multisite.check_cluster_has_buckets(),
             True
         )
+        self.subprocess.check_output.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'metadata', 'list', 'bucket', '--max-entries=1',
+            '--rgw-zone=test_zone', '--rgw-zonegroup=test_zonegroup',
+        ])
+
+    def test_zone_has_buckets_list_output(self):
+        self.subprocess.check_output.return_value = b'[]'
+        self.assertFalse(multisite.zone_has_buckets('zone', 'zonegroup'))
 
     def test_get_zone_info(self):
         multisite.get_zone_info('test_zone', 'test_zonegroup')
@@ -526,16 +536,48 @@ class TestMultisiteHelpers(CharmTestCase):
             ])
 
     def test_get_sync_group(self):
-        with open(self._testdata(whoami()), 'rb') as f:
+        with open(self._testdata('test_list_sync_groups'), 'rb') as f:
             self.subprocess.check_output.return_value = f.read()
             result = multisite.get_sync_group('default')
             self.assertEqual(result['id'], 'default')
-            self.subprocess.check_output.assert_called_with([
+            self.assertIsNone(multisite.get_sync_group('missing'))
+            self.subprocess.check_output.assert_called_once_with([
                 'radosgw-admin', '--id=rgw.testhost',
                 'sync', 'group', 'get',
-                '--group-id=default',
             ])
 
+    def test_snapshot(self):
+        with open(self._testdata('test_list_zones'), 'rb') as f:
+            self.subprocess.check_output.return_value = f.read()
+        for _ in range(3):
+            self.assertIn('brundall-east', multisite.list_zones())
+        self.assertEqual(multisite.snapshot().queries, 1)
+        self.subprocess.check_output.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost', 'zone', 'list'])
+
+        # Callers get copies of the cached results.
+        multisite.list_zones().append('local-change')
+        self.assertNotIn('local-change', multisite.list_zones())
+
+        multisite.modify_zone('brundall-east', default=True)
+        multisite.list_zones()
+        self.assertEqual(self.subprocess.check_output.call_count, 3)
+
+    @mock.patch.object(multisite, 'list_zonegroups')
+    def test_check_cluster_has_buckets_snapshot(self, mock_list_zonegroups):
+        mock_list_zonegroups.return_value = ['zg1', 'zg2']
+        outputs = {
+            'zone': {'zones': ['zone1']},
+            'zonegroup': {'name': 'zg1', 'zones': [{'name': 'zone1'}]},
+            'metadata': {'keys': [], 'truncated': False},
+        }
+        self.subprocess.check_output.side_effect = (
+            lambda cmd: json.dumps(outputs[cmd[2]]).encode())
+        self.assertFalse(multisite.check_cluster_has_buckets())
+        self.assertFalse(multisite.check_cluster_has_buckets())
+        # zone list once, zonegroup get for each and one bucket probe.
+        self.assertEqual(self.subprocess.check_output.call_count, 4)
+
     def test_create_sync_group(self):
         test_group_json = json.dumps({"id": "default"}).encode()
         self.subprocess.check_output.return_value = test_group_json
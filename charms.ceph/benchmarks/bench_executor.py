@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the CLI and librados paths of CephCommandExecutor.
+
+Run on a unit with access to a Ceph cluster and an admin keyring, e.g.:
+
+    sudo python3 benchmarks/bench_executor.py --iterations 50
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from charms_ceph.executor import CephCommandExecutor  # noqa: E402
+
+OPERATIONS = [
+    ('pool_exists', lambda ex: ex.pool_exists('.mgr')),
+    ('get_osds', lambda ex: ex.get_osds()),
+    ('osd_tree', lambda ex: ex.osd_tree()),
+    ('config_key_exists', lambda ex: ex.config_key_exists('bench-missing')),
+]
+
+
+def run(executor, iterations):
+    results = {}
+    for name, op in OPERATIONS:
+        start = time.monotonic()
+        for _ in range(iterations):
+            op(executor)
+        results[name] = (time.monotonic() - start) / iterations
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--service', default='admin')
+    parser.add_argument('--conffile', default='/etc/ceph/ceph.conf')
+    args = parser.parse_args()
+
+    cli = CephCommandExecutor(service=args.service, conffile=args.conffile,
+                              use_librados=False)
+    lib = CephCommandExecutor(service=args.service, conffile=args.conffile)
+    if not lib.connect():
+        sys.exit('librados is not available, nothing to compare')
+
+    try:
+        cli_results = run(cli, args.iterations)
+        lib_results = run(lib, args.iterations)
+    finally:
+        lib.shutdown()
+
+    print('{:<20} {:>12} {:>12} {:>9}'.format(
+        'operation', 'cli (ms)', 'rados (ms)', 'speedup'))
+    for name, _ in OPERATIONS:
+        c, r = cli_results[name] * 1000, lib_results[name] * 1000
+        print('{:<20} {:>12.2f} {:>12.2f} {:>8.1f}x'.format(
+            name, c, r, c / r if r else float('inf')))
+
+
+if __name__ == '__main__':
+    main()
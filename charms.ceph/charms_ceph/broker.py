@@ -13,35 +13,57 @@
 # limitations under the License.
 
 import collections
+import contextlib
 import json
 import os
+import time
 
 from subprocess import check_call, check_output, CalledProcessError
 from tempfile import NamedTemporaryFile
 
 from charms_ceph.utils import (
+    enabled_manager_modules,
     get_cephfs,
-    get_osd_weight
+    get_osd_weight,
+    get_pool_ls_detail,
+    key_registry,
+)
+from charms_ceph.cache import (
+    invalidate_hook_cache,
+    POOLS,
 )
 from charms_ceph.crush_utils import Crushmap
+from charms_ceph.pg_planner import (
+    DEFAULT_PGS_PER_OSD_TARGET,
+    ExistingPool,
+    PoolSpec,
+    plan_pgs,
+)
+from charms_ceph.executor import (
+    get_osds,
+    monitor_key_get,
+    monitor_key_set,
+    pool_exists,
+    pool_set,
+)
 
 from charmhelpers.core.hookenv import (
+    config,
     log,
     DEBUG,
     INFO,
+    WARNING,
     ERROR,
 )
+import charmhelpers.contrib.storage.linux.ceph as ch_ceph
 from charmhelpers.contrib.storage.linux.ceph import (
     create_erasure_profile,
     delete_pool,
     erasure_profile_exists,
-    get_osds,
-    monitor_key_get,
-    monitor_key_set,
-    pool_exists,
-    pool_set,
+    get_erasure_profile,
     remove_pool_snapshot,
     rename_pool,
+    set_pool_quota,
     snapshot_pool,
     validator,
     ErasurePool,
@@ -87,6 +109,20 @@ POOL_KEYS = {
     "crush_rule": [str],
 }
 
+# Pool properties a create-pool op may change on an existing pool, see
+# BasePool.set_compression in charmhelpers.
+COMPRESSION_KEYS = (
+    'compression-algorithm',
+    'compression-mode',
+    'compression-required-ratio',
+    'compression-min-blob-size',
+    'compression-min-blob-size-hdd',
+    'compression-min-blob-size-ssd',
+    'compression-max-blob-size',
+    'compression-max-blob-size-hdd',
+    'compression-max-blob-size-ssd',
+)
+
 CEPH_BUCKET_TYPES = [
     'osd',
     'host',
@@ -113,6 +149,316 @@ def decode_req_encode_rsp(f):
     return decode_inner
 
 
+class ClusterSnapshot(object):
+    """Cluster state shared by all ops of a broker request.
+
+    State is read lazily and at most once: the pool table comes from a single
+    ``osd pool ls detail``, OSD lists, erasure profile lookups, enabled
+    manager modules and config-keys are memoized. Ops record the mutations
+    they make so later ops in the same request see them without asking the
+    cluster again.
+
+    While a snapshot is registered with ``process_requests_v1`` key
+    permission updates are deferred and applied once per client by
+    ``flush``, rather than once for every pool added to a group.
+
+    ``pg_plan`` holds the PG counts of the pools the request creates, sized
+    together by ``charms_ceph.pg_planner`` before the first op runs.
+
+    CRUSH placements are queued on ``crushmap`` and applied together by
+    ``save_crushmap`` before the next op that is not a placement, or once
+    all ops ran, so moving many OSDs creates one osdmap epoch rather than
+    one per OSD. ``crush_epochs`` counts the epochs created.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self._pools = None
+        self._osds = {}
+        self._erasure_profiles = {}
+        self._erasure_profile_params = {}
+        self._config_keys = {}
+        self._mgr_modules = None
+        self._pending_permissions = collections.OrderedDict()
+        self.pg_plan = None
+        self._crushmap = None
+        self.crush_epochs = 0
+
+    @property
+    def pools(self):
+        if self._pools is None:
+            self._pools = {
+                pool['pool_name']: pool
+                for pool in get_pool_ls_detail(client=self.service)}
+        return self._pools
+
+    def pool_exists(self, name):
+        return name in self.pools
+
+    def pool(self, name):
+        """Return the details of a pool, None if it is unknown."""
+        return self.pools.get(name)
+
+    def pool_created(self, name):
+        """Record a pool created while processing the request."""
+        self.pools.setdefault(name, {'pool_name': name})
+
+    def pool_removed(self, name, new_name=None):
+        """Record a pool deleted or renamed while processing the request."""
+        if self._pools is not None and name in self._pools:
+            pool = self._pools.pop(name)
+            if new_name:
+                pool['pool_name'] = new_name
+                self._pools[new_name] = pool
+
+    def get_osds(self, device_class=None):
+        if device_class not in self._osds:
+            self._osds[device_class] = get_osds(self.service, device_class)
+        return self._osds[device_class]
+
+    def erasure_profile_exists(self, name):
+        if name not in self._erasure_profiles:
+            self._erasure_profiles[name] = erasure_profile_exists(
+                service=self.service, name=name)
+        return self._erasure_profiles[name]
+
+    def erasure_profile_created(self, name):
+        self._erasure_profiles[name] = True
+
+    def erasure_profile(self, name):
+        """Return the parameters of an erasure profile, None if unknown."""
+        if name not in self._erasure_profile_params:
+            self._erasure_profile_params[name] = get_erasure_profile(
+                service=self.service, name=name)
+        return self._erasure_profile_params[name]
+
+    def enabled_manager_modules(self):
+        if self._mgr_modules is None:
+            self._mgr_modules = enabled_manager_modules()
+        return self._mgr_modules
+
+    def planned_pgs(self, name):
+        """Return the planned pg_num of a new pool, None if not planned."""
+        if self.pg_plan is None:
+            return None
+        return self.pg_plan.get(name)
+
+    def config_key_get(self, key):
+        if key not in self._config_keys:
+            self._config_keys[key] = monitor_key_get(service=self.service,
+                                                     key=key)
+        return self._config_keys[key]
+
+    def config_key_set(self, key, value):
+        """Set a config-key unless it is known to hold value already.
+
+        :returns: Whether the key was written.
+        :rtype: bool
+        """
+        if key in self._config_keys and self._config_keys[key] == value:
+            log("config-key {} unchanged, not updating".format(key),
+                level=DEBUG)
+            return False
+        monitor_key_set(service=self.service, key=key, value=value)
+        self._config_keys[key] = value
+        return True
+
+    @property
+    def crushmap(self):
+        if self._crushmap is None:
+            self._crushmap = Crushmap()
+        return self._crushmap
+
+    def save_crushmap(self):
+        """Apply the queued CRUSH placements.
+
+        :returns: The number of osdmap epochs created.
+        :rtype: int
+        """
+        if self._crushmap is None:
+            return 0
+        crushmap, self._crushmap = self._crushmap, None
+        epochs = crushmap.save()
+        self.crush_epochs += epochs
+        return epochs
+
+    def defer_permissions_update(self, service, namespace=None):
+        self._pending_permissions[(service, namespace)] = True
+
+    def flush(self):
+        """Apply the deferred key permission updates."""
+        pending, self._pending_permissions = (
+            self._pending_permissions, collections.OrderedDict())
+        for service, namespace in pending:
+            _apply_service_permissions(service, namespace=namespace)
+
+
+_snapshot = None
+
+
+def get_snapshot():
+    """Return the snapshot of the broker request being processed, if any.
+
+    :rtype: Optional[ClusterSnapshot]
+    """
+    return _snapshot
+
+
+def _snapshot_for(service):
+    """Return the current snapshot or a fresh one for a single op."""
+    if _snapshot is not None and _snapshot.service == service:
+        return _snapshot
+    return ClusterSnapshot(service)
+
+
+def _pool_spec(op, snapshot, profile_ops, crushmap):
+    """Describe the pool a create-pool op creates, None if it can't be sized.
+
+    A replicated pool is on the device class its crush-profile rule takes,
+    as looked up in crushmap if that could be read.
+
+    :rtype: Optional[PoolSpec]
+    """
+    if op.get('pool-type') == 'erasure':
+        name = op.get('erasure-profile') or 'default-canonical'
+        if name in profile_ops:
+            profile = profile_ops[name]
+            device_class = profile.get('device-class')
+        else:
+            profile = snapshot.erasure_profile(name)
+            if not profile:
+                return None
+            device_class = profile.get('crush-device-class')
+        if 'k' not in profile or 'm' not in profile:
+            return None
+        return PoolSpec(name=op['name'],
+                        size=int(profile['k']) + int(profile['m']),
+                        weight=op.get('weight'),
+                        device_class=device_class or None)
+    if not op.get('replicas'):
+        return None
+    rule = op.get('crush-profile')
+    return PoolSpec(name=op['name'], size=int(op['replicas']),
+                    weight=op.get('weight'), pg_num=op.get('pg_num'),
+                    device_class=crushmap.rule_device_class(rule)
+                    if crushmap and rule else None)
+
+
+def _plan_pgs(reqs, snapshot):
+    """Size every pool the create-pool ops of a request will create.
+
+    OSDs are counted once per device class and the pools are sized
+    together, see ``charms_ceph.pg_planner``.
+
+    :returns: The plan, None if the request creates no pools.
+    :rtype: Optional[PGPlan]
+    """
+    profile_ops = {op.get('name'): op for op in reqs
+                   if op.get('op') == 'create-erasure-profile'}
+    pool_ops = collections.OrderedDict()
+    for op in reqs:
+        name = op.get('name')
+        if (op.get('op') == 'create-pool' and name and
+                name not in pool_ops and not snapshot.pool_exists(name)):
+            pool_ops[name] = op
+    if not pool_ops:
+        return None
+
+    # Pools count against the OSDs of their rule's device class.
+    try:
+        crushmap = snapshot.crushmap
+    except (CalledProcessError, OSError, ValueError) as e:
+        log("Unable to read CRUSH rules, counting pools against all OSDs: "
+            "{}".format(e), level=WARNING)
+        crushmap = None
+    specs = collections.OrderedDict()
+    for name, op in pool_ops.items():
+        spec = _pool_spec(op, snapshot, profile_ops, crushmap)
+        if spec is not None:
+            specs[name] = spec
+    if not specs:
+        return None
+
+    try:
+        osd_counts = {
+            device_class: len(snapshot.get_osds(device_class))
+            for device_class in set(spec.device_class
+                                    for spec in specs.values())}
+        pgs_per_osd = int(config('pgs-per-osd') or DEFAULT_PGS_PER_OSD_TARGET)
+        expected_osd_count = int(config('expected-osd-count') or 0)
+    except (CalledProcessError, OSError, ValueError) as e:
+        log("Unable to plan placement groups, sizing pools one by one: {}"
+            .format(e), level=WARNING)
+        return None
+    existing = [
+        ExistingPool(name=pool['pool_name'], size=pool.get('size'),
+                     pg_num=pool.get('pg_num'),
+                     target_size_ratio=pool.get('options', {}).get(
+                         'target_size_ratio'),
+                     device_class=crushmap.rule_device_class(
+                         pool.get('crush_rule')) if crushmap else None)
+        for pool in snapshot.pools.values()]
+    plan = plan_pgs(specs.values(), osd_counts, existing,
+                    pgs_per_osd=pgs_per_osd,
+                    expected_osd_count=expected_osd_count)
+    log("Planned placement groups: {}".format(plan.to_dict()), level=DEBUG)
+    for device_class in plan.oversubscribed():
+        log("Pools would place {:.0f} PGs on each OSD of {}, more than "
+            "Ceph allows by default; consider lowering pgs-per-osd or the "
+            "pool weights".format(
+                plan.projected_pgs_per_osd[device_class],
+                "class {}".format(device_class) if device_class
+                else "the cluster"), level=WARNING)
+    return plan
+
+
+def _apply_pg_plan(pool, pool_name, snapshot):
+    """Give a pool about to be created its planned PG count."""
+    planned = snapshot.planned_pgs(pool_name)
+    if planned is not None:
+        # BasePool.get_pgs would ask the cluster for its OSDs once more.
+        pool.get_pgs = lambda *args, **kwargs: planned
+
+
+@contextlib.contextmanager
+def _pool_lookups_from(snapshot):
+    """Answer the cluster lookups of ``BasePool.create`` from snapshot.
+
+    ``BasePool.create`` runs ``rados lspools`` and ``BasePool._post_create``
+    ``ceph mgr module ls`` for every new pool, through module level
+    charmhelpers functions the pool objects offer no way to override.
+    """
+    saved = ch_ceph.pool_exists, ch_ceph.enabled_manager_modules
+    ch_ceph.pool_exists = lambda service, name: snapshot.pool_exists(name)
+    ch_ceph.enabled_manager_modules = snapshot.enabled_manager_modules
+    try:
+        yield
+    finally:
+        ch_ceph.pool_exists, ch_ceph.enabled_manager_modules = saved
+
+
+def _create_pool(pool, pool_name, snapshot):
+    """Create a pool the snapshot does not know of."""
+    _apply_pg_plan(pool, pool_name, snapshot)
+    with _pool_lookups_from(snapshot):
+        pool.create()
+    snapshot.pool_created(pool_name)
+
+
+def _config_key_get(key):
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.config_key_get(key)
+    return monitor_key_get(service='admin', key=key)
+
+
+def _config_key_set(key, value):
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.config_key_set(key, value)
+    return monitor_key_set(service='admin', key=key, value=value)
+
+
 @decode_req_encode_rsp
 def process_requests(reqs):
     """Process Ceph broker request(s).
@@ -195,6 +541,7 @@ def handle_create_erasure_profile(request, service):
                            crush_locality=crush_locality,
                            device_class=device_class,
                            erasure_plugin_technique=erasure_technique)
+    _snapshot_for(service).erasure_profile_created(name)
 
     return {'exit-code': 0}
 
@@ -247,10 +594,23 @@ def handle_set_key_permissions(request, service):
         check_call(call)
     except CalledProcessError as e:
         log("Error updating key capabilities: {}".format(e), level=ERROR)
+    key_registry().forget('client.{}'.format(client))
 
 
 def update_service_permissions(service, service_obj=None, namespace=None):
-    """Update the key permissions for the named client in Ceph"""
+    """Update the key permissions for the named client in Ceph.
+
+    While a broker request is processed the update is deferred to the end of
+    the request, see ``ClusterSnapshot.flush``.
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        snapshot.defer_permissions_update(service, namespace)
+        return
+    _apply_service_permissions(service, service_obj, namespace)
+
+
+def _apply_service_permissions(service, service_obj=None, namespace=None):
     if not service_obj:
         service_obj = get_service_groups(service=service, namespace=namespace)
     permissions = pool_permission_list_for_service(service_obj)
@@ -259,6 +619,7 @@ def update_service_permissions(service, service_obj=None, namespace=None):
         check_call(call)
     except CalledProcessError as e:
         log("Error updating key capabilities: {}".format(e))
+    key_registry().forget('client.{}'.format(service))
 
 
 def add_pool_to_group(pool, group, namespace=None):
@@ -316,8 +677,7 @@ def get_service_groups(service, namespace=None):
         }
     }
     """
-    service_json = monitor_key_get(service='admin',
-                                   key="cephx.services.{}".format(service))
+    service_json = _config_key_get("cephx.services.{}".format(service))
     try:
         service = json.loads(service_json)
     except (TypeError, ValueError):
@@ -364,7 +724,7 @@ def get_group(group_name):
     }
     """
     group_key = get_group_key(group_name=group_name)
-    group_json = monitor_key_get(service='admin', key=group_key)
+    group_json = _config_key_get(group_key)
     try:
         group = json.loads(group_json)
     except (TypeError, ValueError):
@@ -380,17 +740,14 @@ def get_group(group_name):
 def save_service(service_name, service):
     """Persist a service in the monitor cluster"""
     service['groups'] = {}
-    return monitor_key_set(service='admin',
-                           key="cephx.services.{}".format(service_name),
-                           value=json.dumps(service, sort_keys=True))
+    return _config_key_set("cephx.services.{}".format(service_name),
+                           json.dumps(service, sort_keys=True))
 
 
 def save_group(group, group_name):
     """Persist a group in the monitor cluster"""
     group_key = get_group_key(group_name=group_name)
-    return monitor_key_set(service='admin',
-                           key=group_key,
-                           value=json.dumps(group, sort_keys=True))
+    return _config_key_set(group_key, json.dumps(group, sort_keys=True))
 
 
 def get_group_key(group_name):
@@ -408,6 +765,7 @@ def handle_erasure_pool(request, service):
     pool_name = request.get('name')
     erasure_profile = request.get('erasure-profile')
     group_name = request.get('group')
+    snapshot = _snapshot_for(service)
 
     if erasure_profile is None:
         erasure_profile = "default-canonical"
@@ -420,7 +778,7 @@ def handle_erasure_pool(request, service):
                           namespace=group_namespace)
 
     # TODO: Default to 3/2 erasure coding. I believe this requires min 5 osds
-    if not erasure_profile_exists(service=service, name=erasure_profile):
+    if not snapshot.erasure_profile_exists(erasure_profile):
         # TODO: Fail and tell them to create the profile or default
         msg = ("erasure-profile {} does not exist.  Please create it with: "
                "create-erasure-profile".format(erasure_profile))
@@ -436,13 +794,14 @@ def handle_erasure_pool(request, service):
         return {'exit-code': 1, 'stderr': msg}
 
     # Ok make the erasure pool
-    if not pool_exists(service=service, name=pool_name):
+    if not snapshot.pool_exists(pool_name):
         log("Creating pool '{}' (erasure_profile={})"
             .format(pool.name, erasure_profile), level=INFO)
-        pool.create()
-
-    # Set/update properties that are allowed to change after pool creation.
-    pool.update()
+        _create_pool(pool, pool_name, snapshot)
+    else:
+        # Set/update properties that are allowed to change after pool
+        # creation.
+        _update_pool(pool, request, snapshot)
 
 
 def handle_replicated_pool(request, service):
@@ -460,9 +819,10 @@ def handle_replicated_pool(request, service):
     # remove.
     pg_num = request.get('pg_num')
     replicas = request.get('replicas')
+    snapshot = _snapshot_for(service)
     if pg_num:
         # Cap pg_num to max allowed just in case.
-        osds = get_osds(service)
+        osds = snapshot.get_osds()
         if osds:
             pg_num = min(pg_num, (len(osds) * 100 // replicas))
             request.update({'pg_num': pg_num})
@@ -482,16 +842,52 @@ def handle_replicated_pool(request, service):
         log(msg, level=ERROR)
         return {'exit-code': 1, 'stderr': msg}
 
-    if not pool_exists(service=service, name=pool_name):
+    if not snapshot.pool_exists(pool_name):
         log("Creating pool '{}' (replicas={})".format(pool.name, replicas),
             level=INFO)
-        pool.create()
+        _create_pool(pool, pool_name, snapshot)
     else:
         log("Pool '{}' already exists - skipping create".format(pool.name),
             level=DEBUG)
+        # Set/update properties that are allowed to change after pool
+        # creation.
+        _update_pool(pool, request, snapshot)
 
-    # Set/update properties that are allowed to change after pool creation.
-    pool.update()
+
+def _update_pool(pool, request, snapshot):
+    """Update the properties of an existing pool that differ from a request.
+
+    This is the equivalent of ``BasePool.update`` but compares the requested
+    quota and compression settings with the pool details in the snapshot, so
+    re-processing an unchanged request does not issue any ``osd pool set``.
+    Pools created by ``BasePool.create`` have already been updated.
+
+    :param pool: The pool object built from the request.
+    :type pool: BasePool
+    :param request: dict of request operations and params.
+    :param snapshot: Snapshot the pool was found in.
+    :type snapshot: ClusterSnapshot
+    """
+    pool.validate()
+    pool_name = request.get('name')
+    current = snapshot.pool(pool_name) or {}
+
+    max_bytes = request.get('max-bytes')
+    max_objects = request.get('max-objects')
+    if ((max_bytes and int(max_bytes) != current.get('quota_max_bytes')) or
+            (max_objects and
+             int(max_objects) != current.get('quota_max_objects'))):
+        set_pool_quota(service=snapshot.service, pool_name=pool_name,
+                       max_bytes=max_bytes, max_objects=max_objects)
+
+    options = current.setdefault('options', {})
+    for key in COMPRESSION_KEYS:
+        value = request.get(key)
+        option = key.replace('-', '_')
+        if value and str(options.get(option)) != str(value):
+            pool_set(service=snapshot.service, pool_name=pool_name,
+                     key=option, value=value)
+            options[option] = value
 
 
 def handle_create_cache_tier(request, service):
@@ -682,22 +1078,16 @@ def handle_put_osd_in_bucket(request, service):
         msg = "Missing OSD ID or Bucket"
         log(msg, level=ERROR)
         return {'exit-code': 1, 'stderr': msg}
-    crushmap = Crushmap()
+    snapshot = _snapshot_for(service)
     try:
-        crushmap.ensure_bucket_is_present(target_bucket)
-        check_output(
-            [
-                'ceph',
-                '--id', service,
-                'osd',
-                'crush',
-                'set',
-                str(osd_id),
-                str(get_osd_weight(osd_id)),
-                "root={}".format(target_bucket)
-            ]
-        )
-
+        crushmap = snapshot.crushmap
+        if not crushmap.has_bucket(target_bucket):
+            crushmap.add_bucket(target_bucket)
+            crushmap.add_rule(target_bucket, target_bucket)
+        crushmap.set_osd(osd_id, get_osd_weight(osd_id),
+                         {'root': target_bucket})
+        if snapshot is not _snapshot:
+            snapshot.save_crushmap()
     except Exception as exc:
         msg = "Failed to move OSD " \
               "{} into Bucket {} :: {}".format(osd_id, target_bucket, exc)
@@ -904,17 +1294,78 @@ def process_requests_v1(reqs):
     Takes a list of requests (dicts) and processes each one. If an error is
     found, processing stops and the client is notified in the response.
 
+    Cluster state is read into a ``ClusterSnapshot`` shared by all ops, so
+    each op only issues the mutations it actually needs. The time taken by
+    each op and the number of CRUSH map epochs created are logged. They are
+    not part of the response, which has to be the same each time a request
+    is processed so reprocessing it does not change the relation data.
+
     Returns a response dict containing the exit code (non-zero if any
     operation failed along with an explanation).
     """
-    ret = None
+    global _snapshot
     log("Processing {} ceph broker requests".format(len(reqs)), level=INFO)
+    _snapshot = ClusterSnapshot(service='admin')
+    try:
+        _snapshot.pg_plan = _plan_pgs(reqs, _snapshot)
+        ret, timings = _process_ops_v1(reqs)
+        # Placements of ops that did run are applied even if a later op
+        # failed, as permission updates are.
+        try:
+            _snapshot.save_crushmap()
+        except Exception as exc:
+            msg = "Failed to apply CRUSH placements :: {}".format(exc)
+            log(msg, level=ERROR)
+            if not (isinstance(ret, dict) and ret.get('exit-code')):
+                ret = {'exit-code': 1, 'stderr': msg}
+        crush_epochs = _snapshot.crush_epochs
+    finally:
+        # Permission updates of ops that did run must not be lost when a
+        # later op fails.
+        try:
+            _snapshot.flush()
+        finally:
+            _snapshot = None
+            # Ops create and change pools through the charmhelpers pool
+            # classes, which know nothing about the hook cache.
+            invalidate_hook_cache(POOLS)
+
+    if isinstance(ret, dict) and 'exit-code' in ret:
+        rsp = ret
+    else:
+        rsp = {'exit-code': 0}
+    log("Processed {} ops in {:.3f}s creating {} CRUSH epochs: {}".format(
+        len(timings), sum(t['seconds'] for t in timings), crush_epochs,
+        json.dumps(timings)), level=INFO)
+    return rsp
+
+
+def _process_ops_v1(reqs):
+    """Run the ops of a v1 request.
+
+    :returns: The result of the last op, or the error for an unknown op
+              or for queued CRUSH placements that could not be applied,
+              and the timing of each op run.
+    :rtype: Tuple[Optional[dict], List[dict]]
+    """
+    ret = None
+    timings = []
     for req in reqs:
         op = req.get('op')
         log("Processing op='{}'".format(op), level=DEBUG)
+        start = time.monotonic()
         # Use admin client since we do not have other client key locations
         # setup to use them for these operations.
         svc = 'admin'
+        if op != "move-osd-to-bucket":
+            # The op may use the buckets and rules of queued placements,
+            # e.g. create-pool with the new bucket as its crush-profile.
+            try:
+                _snapshot_for(svc).save_crushmap()
+            except Exception as exc:
+                msg = "Failed to apply CRUSH placements :: {}".format(exc)
+                log(msg, level=ERROR)
+                return {'exit-code': 1, 'stderr': msg}, timings
         if op == "create-pool":
             pool_type = req.get('pool-type')  # "replicated" | "erasure"
 
@@ -934,11 +1385,13 @@ def process_requests_v1(reqs):
         elif op == "delete-pool":
             pool = req.get('name')
             ret = delete_pool(service=svc, name=pool)
+            _snapshot_for(svc).pool_removed(pool)
         elif op == "rename-pool":
             old_name = req.get('name')
             new_name = req.get('new-name')
             ret = rename_pool(service=svc, old_name=old_name,
                               new_name=new_name)
+            _snapshot_for(svc).pool_removed(old_name, new_name=new_name)
         elif op == "snapshot-pool":
             pool = req.get('name')
             snapshot_name = req.get('snapshot-name')
@@ -972,9 +1425,14 @@ def process_requests_v1(reqs):
         else:
             msg = "Unknown operation '{}'".format(op)
             log(msg, level=ERROR)
-            return {'exit-code': 1, 'stderr': msg}
+            return {'exit-code': 1, 'stderr': msg}, timings
 
-    if isinstance(ret, dict) and 'exit-code' in ret:
-        return ret
+        timing = {'op': op,
+                  'seconds': round(time.monotonic() - start, 3)}
+        if req.get('name'):
+            timing['name'] = req['name']
+        log("Processed op='{}' in {:.3f}s".format(op, timing['seconds']),
+            level=DEBUG)
+        timings.append(timing)
 
-    return {'exit-code': 0}
+    return ret, timings
@@ -0,0 +1,126 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Hook scoped memoization of read-only Ceph queries.
+
+Functions decorated with ``hook_cached`` remember their result, keyed by
+function and arguments, until the hook exits. Each cached function names
+the parts of the cluster state its result depends on ('mon_status',
+'osd_tree', 'pools', ...); code that changes that state calls
+``invalidate_hook_cache`` with the same tags.
+
+Like ``charms_ceph.executor`` the cache is opt-in: until a charm calls
+``enable_hook_cache`` the decorated functions behave exactly as before.
+Hit and miss counters are logged when the hook exits.
+"""
+
+import collections
+import copy
+import functools
+
+from charmhelpers.core import hookenv
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+)
+
+# Tags for the parts of the cluster and host state cached queries depend on.
+MON_STATUS = 'mon_status'
+OSD_TREE = 'osd_tree'
+POOLS = 'pools'
+MGR_MODULES = 'mgr_modules'
+INSTALLED_PACKAGES = 'packages'
+
+HITS = 'hits'
+MISSES = 'misses'
+INVALIDATIONS = 'invalidations'
+
+_enabled = False
+# (function, args, kwargs) -> (tags, value)
+_entries = {}
+# Function name -> Counter of HITS, MISSES and INVALIDATIONS
+_stats = collections.defaultdict(collections.Counter)
+
+
+def enable_hook_cache():
+    """Cache decorated queries for the rest of the hook."""
+    global _enabled
+    if not _enabled:
+        _enabled = True
+        hookenv.atexit(disable_hook_cache)
+
+
+def disable_hook_cache():
+    """Log the cache statistics, then drop and disable the cache."""
+    global _enabled
+    if _stats:
+        log("Hook cache: {} hits, {} misses; {}".format(
+            sum(c[HITS] for c in _stats.values()),
+            sum(c[MISSES] for c in _stats.values()),
+            ', '.join('{} {}/{}'.format(name, c[HITS], c[MISSES])
+                      for name, c in sorted(_stats.items()))),
+            level=DEBUG)
+    _enabled = False
+    _entries.clear()
+    _stats.clear()
+
+
+def hook_cache_enabled():
+    return _enabled
+
+
+def hook_cache_stats():
+    """Return the hit, miss and invalidation counts per function.
+
+    :rtype: Dict[str, Dict[str, int]]
+    """
+    return {name: dict(c) for name, c in _stats.items()}
+
+
+def invalidate_hook_cache(*tags):
+    """Drop cached results depending on any of tags, all if none given."""
+    for key, (entry_tags, _) in list(_entries.items()):
+        if not tags or entry_tags.intersection(tags):
+            del _entries[key]
+            _stats[key[0].__name__][INVALIDATIONS] += 1
+
+
+def hook_cached(*tags):
+    """Memoize a read-only query for the duration of the hook.
+
+    Calls with unhashable arguments and calls that raise are not cached.
+    Callers get a copy of the cached value so they may modify it.
+
+    :param tags: The parts of the cluster state the result depends on.
+    :type tags: str
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return f(*args, **kwargs)
+            key = (f, args, tuple(sorted(kwargs.items())))
+            try:
+                entry = _entries.get(key)
+            except TypeError:
+                return f(*args, **kwargs)
+            if entry is not None:
+                _stats[f.__name__][HITS] += 1
+                return copy.deepcopy(entry[1])
+            _stats[f.__name__][MISSES] += 1
+            value = f(*args, **kwargs)
+            _entries[key] = (frozenset(tags), value)
+            return copy.deepcopy(value)
+        return wrapper
+    return decorator
@@ -12,121 +12,400 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import json
+import os
 import re
+import tempfile
 
-from subprocess import check_output, CalledProcessError
+from subprocess import check_call, check_output, CalledProcessError, STDOUT
 
 from charmhelpers.core.hookenv import (
     log,
+    DEBUG,
     ERROR,
+    WARNING,
 )
 
-CRUSH_BUCKET = """root {name} {{
-    id {id}    # do not change unnecessarily
-    # weight 0.000
-    alg straw2
-    hash 0  # rjenkins1
-}}
-
-rule {name} {{
-    ruleset 0
-    type replicated
-    min_size 1
-    max_size 10
-    step take {name}
-    step chooseleaf firstn 0 type host
-    step emit
-}}"""
-
-# This regular expression looks for a string like:
-# root NAME {
-# id NUMBER
-# so that we can extract NAME and ID from the crushmap
-CRUSHMAP_BUCKETS_RE = re.compile(r"root\s+(.+)\s+\{\s*id\s+(-?\d+)")
-
-# This regular expression looks for ID strings in the crushmap like:
-# id NUMBER
-# so that we can extract the IDs from a crushmap
-CRUSHMAP_ID_RE = re.compile(r"id\s+(-?\d+)")
+from charms_ceph.cache import (
+    invalidate_hook_cache,
+    OSD_TREE,
+)
+
+# A pending change to the CRUSH map: the ceph command that applies it on its
+# own, and either the crushtool arguments that apply it to a local copy of
+# the map or an edit of the decompiled map for changes with no command.
+CrushChange = collections.namedtuple(
+    'CrushChange', ['kind', 'name', 'command', 'crushtool', 'edit'])
+CrushChange.__new__.__defaults__ = (None,)
+
+
+def _location_args(location):
+    return ['{}={}'.format(t, n) for t, n in location]
+
+
+def _crushtool_location_args(location):
+    args = []
+    for t, n in location:
+        args.extend(['--loc', t, n])
+    return args
 
 
 class Crushmap(object):
-    """An object oriented approach to Ceph crushmap management."""
+    """A model of the CRUSH map, loaded from ``osd crush dump``.
+
+    Changes are recorded against the model and only reach the cluster on
+    ``save``.  Changes the map already satisfies are dropped, and a single
+    change is applied with its ``osd crush`` command.  Several changes are
+    applied to one copy of the map with crushtool and pushed back with a
+    single ``osd setcrushmap``, so they cost one osdmap epoch instead of one
+    each.
+    """
+
+    # Changes beyond this many are combined into one map push.
+    COMMAND_LIMIT = 1
 
     def __init__(self):
-        self._crushmap = self.load_crushmap()
-        roots = re.findall(CRUSHMAP_BUCKETS_RE, self._crushmap)
+        dump = self.load_crushmap() or {}
+        self._type_ids = {t['name']: t['type_id']
+                          for t in dump.get('types', [])}
+        self._ids_by_name = {}
+        self._names = {}
+        self._types = {}
+        self._parents = {}
+        self._weights = {}
+        for device in dump.get('devices', []):
+            self._ids_by_name[device['name']] = device['id']
+            self._names[device['id']] = device['name']
+            self._types[device['id']] = 'osd'
         buckets = []
-        ids = list(map(
-            lambda x: int(x),
-            re.findall(CRUSHMAP_ID_RE, self._crushmap)))
-        ids = sorted(ids)
-        if roots != []:
-            for root in roots:
-                buckets.append(CRUSHBucket(root[0], root[1], True))
-
+        for bucket in dump.get('buckets', []):
+            self._ids_by_name[bucket['name']] = bucket['id']
+            self._names[bucket['id']] = bucket['name']
+            self._types[bucket['id']] = bucket['type_name']
+            for item in bucket.get('items', []):
+                self._parents[item['id']] = bucket['id']
+                # Weights are 16.16 fixed point in the dump.
+                self._weights[item['id']] = item.get('weight', 0) / 0x10000
+            if bucket['type_name'] == 'root':
+                buckets.append(CRUSHBucket(bucket['name'], bucket['id'],
+                                           True))
+        self._rules = {rule['rule_name']: rule
+                       for rule in dump.get('rules', [])}
         self._buckets = buckets
-        if ids != []:
-            self._ids = ids
-        else:
-            self._ids = [0]
+        ids = sorted(i for i in self._names if i < 0)
+        self._ids = ids or [0]
+        # The placement the cluster has, to drop moves that are undone.
+        self._loaded = (dict(self._parents), dict(self._weights))
+        self._pending = []
 
     def load_crushmap(self):
         try:
-            crush = str(check_output(['ceph', 'osd', 'getcrushmap'])
-                        .decode('UTF-8'))
-            return str(check_output(['crushtool', '-d', '-'],
-                                    stdin=crush.stdout)
-                       .decode('UTF-8'))
+            return json.loads(check_output(
+                ['ceph', 'osd', 'crush', 'dump', '--format', 'json'])
+                .decode('UTF-8'))
         except CalledProcessError as e:
-            log("Error occurred while loading and decompiling CRUSH map:"
+            log("Error occurred while loading CRUSH map: "
                 "{}".format(e), ERROR)
             raise
 
     def ensure_bucket_is_present(self, bucket_name):
         if bucket_name not in [bucket.name for bucket in self.buckets()]:
             self.add_bucket(bucket_name)
+            self.add_rule(bucket_name, bucket_name)
             self.save()
 
     def buckets(self):
-        """Return a list of buckets that are in the Crushmap."""
+        """Return a list of the root buckets that are in the Crushmap."""
         return self._buckets
 
-    def add_bucket(self, bucket_name):
+    def has_bucket(self, bucket_name):
+        item_id = self._ids_by_name.get(bucket_name)
+        return item_id is not None and item_id < 0
+
+    def location(self, name):
+        """Return the ancestors of a bucket or device.
+
+        :param name: Name of the bucket or device, e.g. 'osd.3'.
+        :type name: str
+        :returns: Bucket type -> bucket name, None if name is not in the map.
+        :rtype: Optional[Dict[str, str]]
+        """
+        item_id = self._ids_by_name.get(name)
+        if item_id is None:
+            return None
+        ancestors = {}
+        parent = self._parents.get(item_id)
+        while parent is not None:
+            ancestors[self._types[parent]] = self._names[parent]
+            parent = self._parents.get(parent)
+        return ancestors
+
+    def is_located(self, name, location):
+        """Whether name already sits below all the buckets of location."""
+        ancestors = self.location(name)
+        return (ancestors is not None and
+                all(ancestors.get(t) == n for t, n in location.items()))
+
+    def _sorted_location(self, location):
+        # Innermost bucket first, as the osd crush commands print them.
+        return sorted(location.items(),
+                      key=lambda tn: self._type_ids.get(tn[0], 0))
+
+    def _set_parent(self, item_id, location):
+        location = self._sorted_location(location)
+        self._parents.pop(item_id, None)
+        for _, name in location:
+            parent = self._ids_by_name.get(name)
+            if parent is not None and parent < 0:
+                self._parents[item_id] = parent
+                return
+
+    def _unchanged(self, item_id):
+        parents, weights = self._loaded
+        return (item_id in parents and
+                parents[item_id] == self._parents.get(item_id) and
+                abs(weights[item_id] - self._weights[item_id]) < 1e-4)
+
+    def _queue(self, change, replace=False, item_id=None):
+        if replace:
+            self._pending = [c for c in self._pending
+                             if (c.kind, c.name) != (change.kind,
+                                                     change.name)]
+        if item_id is not None and self._unchanged(item_id):
+            # Moved back to where the cluster has it.
+            return
+        self._pending.append(change)
+
+    def add_bucket(self, bucket_name, bucket_type='root', location=None):
         """Add a named bucket to Ceph"""
+        if self.has_bucket(bucket_name):
+            return
+        location = location or {}
         new_id = min(self._ids) - 1
         self._ids.append(new_id)
-        self._buckets.append(CRUSHBucket(bucket_name, new_id))
+        self._ids_by_name[bucket_name] = new_id
+        self._names[new_id] = bucket_name
+        self._types[new_id] = bucket_type
+        self._set_parent(new_id, location)
+        if bucket_type == 'root':
+            self._buckets.append(CRUSHBucket(bucket_name, new_id))
+        location = self._sorted_location(location)
+        self._queue(CrushChange(
+            'add-bucket', bucket_name,
+            ['ceph', 'osd', 'crush', 'add-bucket', bucket_name,
+             bucket_type] + _location_args(location),
+            ['--add-bucket', bucket_name, bucket_type] +
+            _crushtool_location_args(location)))
+
+    def move_bucket(self, bucket_name, location):
+        """Move a bucket below the buckets of location.
+
+        :param bucket_name: The bucket to move.
+        :type bucket_name: str
+        :param location: Bucket type -> bucket name, e.g. {'root': 'default'}
+        :type location: Dict[str, str]
+        :raises: ValueError if the bucket does not exist.
+        """
+        if not self.has_bucket(bucket_name):
+            raise ValueError("No such CRUSH bucket: {}".format(bucket_name))
+        if self.is_located(bucket_name, location):
+            return
+        self._set_parent(self._ids_by_name[bucket_name], location)
+        location = self._sorted_location(location)
+        # Only the last move of a bucket matters.
+        self._queue(CrushChange(
+            'move', bucket_name,
+            ['ceph', 'osd', 'crush', 'move', bucket_name] +
+            _location_args(location),
+            ['--move', bucket_name] + _crushtool_location_args(location)),
+            replace=True, item_id=self._ids_by_name[bucket_name])
+
+    def add_rule(self, rule_name, root, failure_domain='host'):
+        """Add a replicated rule placing data across failure_domain."""
+        if rule_name in self._rules:
+            return
+        self._rules[rule_name] = {
+            'rule_name': rule_name,
+            'steps': [{'op': 'take', 'item_name': root},
+                      {'op': 'chooseleaf_firstn', 'num': 0,
+                       'type': failure_domain},
+                      {'op': 'emit'}]}
+        self._queue(CrushChange(
+            'rule', rule_name,
+            ['ceph', 'osd', 'crush', 'rule', 'create-replicated',
+             rule_name, root, failure_domain],
+            ['--create-replicated-rule', rule_name, root, failure_domain]))
+
+    def rule_device_class(self, rule):
+        """Return the device class a rule places data on.
+
+        A rule restricted to a class takes a shadow bucket, e.g.
+        'default~ssd'.
+
+        :param rule: The id or name of the rule.
+        :type rule: Union[int, str]
+        :returns: The class, None if the rule places data on any OSD or is
+                  not known.
+        :rtype: Optional[str]
+        """
+        found = self._rules.get(rule)
+        if found is None:
+            found = next((r for r in self._rules.values()
+                          if r.get('rule_id') == rule), {})
+        classes = {step.get('item_name', '').partition('~')[2] or None
+                   for step in found.get('steps', [])
+                   if step.get('op') == 'take'}
+        return classes.pop() if len(classes) == 1 else None
+
+    def rules_choosing(self, bucket_type):
+        """Return the names of the rules that choose across bucket_type."""
+        return sorted(name for name, rule in self._rules.items()
+                      if any(step.get('op', '').startswith('choose') and
+                             step.get('type') == bucket_type
+                             for step in rule.get('steps', [])))
+
+    def set_failure_domain(self, old_type, new_type):
+        """Make the rules that choose leaves across old_type use new_type.
+
+        Only 'step chooseleaf firstn 0' steps are changed, which is what
+        replicated rules use; erasure coded rules are left alone.
+
+        There is no command for this, so the change is always applied as
+        an edit of the decompiled map.
+        """
+        steps = [step for rule in self._rules.values()
+                 for step in rule.get('steps', [])
+                 if step.get('op') == 'chooseleaf_firstn' and
+                 step.get('num') == 0 and step.get('type') == old_type]
+        if not steps:
+            return
+        old_step = 'step chooseleaf firstn 0 type {}'.format(old_type)
+        new_step = 'step chooseleaf firstn 0 type {}'.format(new_type)
+        for step in steps:
+            step['type'] = new_type
+        self._queue(CrushChange(
+            'failure-domain', old_type, None, None,
+            lambda text: text.replace(old_step, new_step)), replace=True)
+
+    def weight(self, name):
+        """Return the CRUSH weight of an item, None if it has no parent."""
+        item_id = self._ids_by_name.get(name)
+        if item_id not in self._parents:
+            return None
+        return self._weights.get(item_id)
+
+    def set_osd(self, osd, weight, location):
+        """Place an OSD with weight below the buckets of location.
+
+        :param osd: The OSD, as 'osd.N' or N.
+        :type osd: Union[str, int]
+        :param weight: The CRUSH weight of the OSD.
+        :type weight: float
+        :param location: Bucket type -> bucket name, e.g. {'root': 'fast'}
+        :type location: Dict[str, str]
+        """
+        name = str(osd)
+        if not name.startswith('osd.'):
+            name = 'osd.{}'.format(name)
+        osd_id = int(name[len('osd.'):])
+        current = self.weight(name)
+        if (self.is_located(name, location) and current is not None and
+                abs(current - float(weight)) < 1e-4):
+            return
+        self._ids_by_name[name] = osd_id
+        self._names[osd_id] = name
+        self._types[osd_id] = 'osd'
+        self._weights[osd_id] = float(weight)
+        self._set_parent(osd_id, location)
+        location = self._sorted_location(location)
+        # Only the last placement of an OSD matters.
+        self._queue(CrushChange(
+            'set', name,
+            ['ceph', 'osd', 'crush', 'set', str(osd), str(weight)] +
+            _location_args(location),
+            ['--update-item', str(osd_id), str(weight), name] +
+            _crushtool_location_args(location)),
+            replace=True, item_id=osd_id)
+
+    def pending(self):
+        """Return the ceph commands save would run one by one."""
+        return [change.command for change in self._pending
+                if change.command]
 
     def save(self):
-        """Persist Crushmap to Ceph"""
+        """Persist the pending changes to Ceph.
+
+        :returns: The number of CRUSH map changes made, each of which
+                  creates a new osdmap epoch.
+        :rtype: int
+        """
+        changes, self._pending = self._pending, []
+        if not changes:
+            return 0
+        invalidate_hook_cache(OSD_TREE)
+        edits = any(change.command is None for change in changes)
+        if edits:
+            # Edits have no command to fall back to.
+            return 1 if self.push_crushmap(changes) else 0
+        if len(changes) > self.COMMAND_LIMIT:
+            try:
+                return 1 if self.push_crushmap(changes) else 0
+            except (CalledProcessError, OSError) as e:
+                log("Unable to push combined CRUSH map, applying changes "
+                    "one by one: {}".format(e), WARNING)
         try:
-            crushmap = self.build_crushmap()
-            compiled = str(check_output(['crushtool', '-c', '/dev/stdin', '-o',
-                                         '/dev/stdout'], stdin=crushmap)
-                           .decode('UTF-8'))
-            ceph_output = str(check_output(['ceph', 'osd', 'setcrushmap', '-i',
-                                            '/dev/stdin'], stdin=compiled)
-                              .decode('UTF-8'))
-            return ceph_output
+            for change in changes:
+                check_call(change.command)
         except CalledProcessError as e:
             log("save error: {}".format(e))
             raise
+        return len(changes)
 
-    def build_crushmap(self):
-        """Modifies the current CRUSH map to include the new buckets"""
-        tmp_crushmap = self._crushmap
-        for bucket in self._buckets:
-            if not bucket.default:
-                tmp_crushmap = "{}\n\n{}".format(
-                    tmp_crushmap,
-                    Crushmap.bucket_string(bucket.name, bucket.id))
+    def push_crushmap(self, changes):
+        """Apply changes to a copy of the map and set it in one step.
 
-        return tmp_crushmap
+        The map is only set if nobody changed it since it was fetched, and
+        after crushtool checked that it still maps placement groups. Edits
+        that leave the decompiled map as it is are dropped.
 
-    @staticmethod
-    def bucket_string(name, id):
-        return CRUSH_BUCKET.format(name=name, id=id)
+        :returns: Whether the map was set.
+        :rtype: bool
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            current = os.path.join(tmpdir, 'crushmap.0')
+            out = check_output(['ceph', 'osd', 'getcrushmap', '-o', current],
+                               stderr=STDOUT).decode('UTF-8')
+            applied = 0
+            for n, change in enumerate(changes, 1):
+                edited = os.path.join(tmpdir, 'crushmap.{}'.format(n))
+                if change.edit:
+                    text = check_output(
+                        ['crushtool', '-d', current]).decode('UTF-8')
+                    new_text = change.edit(text)
+                    if new_text == text:
+                        log("CRUSH map unchanged by {} {}".format(
+                            change.kind, change.name), DEBUG)
+                        continue
+                    check_output(['crushtool', '-c', '/dev/stdin', '-o',
+                                  edited], input=new_text.encode('UTF-8'))
+                else:
+                    check_call(['crushtool', '-i', current, '-o', edited] +
+                               change.crushtool)
+                current = edited
+                applied += 1
+            if not applied:
+                return False
+            check_output(['crushtool', '-i', current, '--test',
+                          '--num-rep', '3', '--show-statistics'])
+            cmd = ['ceph', 'osd', 'setcrushmap', '-i', current]
+            # getcrushmap prints the version of the map it returned.
+            version = re.search(r'(\d+)\s*$', out)
+            if version:
+                cmd.append(version.group(1))
+            log("Pushing {} CRUSH map changes".format(applied), DEBUG)
+            check_call(cmd)
+            return True
 
 
 class CRUSHBucket(object):
@@ -0,0 +1,423 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Persistent librados backed execution of Ceph commands.
+
+Most helpers in this library (and in charmhelpers) fork a ``ceph`` or
+``rados`` process per query, paying for interpreter start up and a cephx
+handshake every time. A ``CephCommandExecutor`` keeps a single
+``rados.Rados`` connection open and sends the same commands through
+``mon_command``, ``mgr_command`` and ``osd_command`` instead.
+
+The executor is opt-in: a charm calls ``enable()`` early in a hook and the
+module level helpers below, which mirror the charmhelpers signatures, route
+through it for the rest of the hook. When ``python3-rados`` is not
+installed, or the connection cannot be established, every call falls back
+to the equivalent CLI invocation.
+"""
+
+import collections
+import errno
+import json
+import subprocess
+
+from charmhelpers.core import hookenv
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    WARNING,
+)
+from charmhelpers.contrib.storage.linux import ceph as ch_ceph
+
+from charms_ceph.cache import (
+    invalidate_hook_cache,
+    POOLS,
+)
+
+try:
+    import rados
+except ImportError:
+    rados = None
+
+DEFAULT_CONFFILE = '/etc/ceph/ceph.conf'
+DEFAULT_TIMEOUT = 30
+
+LIBRADOS = 'librados'
+CLI = 'cli'
+
+
+class CephCommandExecutor(object):
+    """Run Ceph commands over a persistent librados connection."""
+
+    def __init__(self, service='admin', conffile=DEFAULT_CONFFILE,
+                 timeout=DEFAULT_TIMEOUT, use_librados=True):
+        """Initialise a new executor.
+
+        No connection is made until the first command is run.
+
+        :param service: The Ceph user name to run commands under.
+        :type service: str
+        :param conffile: Path to the Ceph configuration file.
+        :type conffile: str
+        :param timeout: Timeout in seconds for connecting and for each
+                        command sent over librados.
+        :type timeout: int
+        :param use_librados: Set to False to always use the CLI.
+        :type use_librados: bool
+        """
+        self.service = service
+        self.conffile = conffile
+        self.timeout = timeout
+        self.calls = collections.Counter()
+        self._cluster = None
+        self._use_librados = use_librados and rados is not None
+
+    @property
+    def connected(self):
+        return self._cluster is not None
+
+    def connect(self):
+        """Connect to the cluster if librados is in use.
+
+        A failure to connect is logged and permanently switches this
+        executor over to the CLI.
+
+        :returns: Whether commands will be sent over librados.
+        :rtype: bool
+        """
+        if self._cluster is not None:
+            return True
+        if not self._use_librados:
+            return False
+        try:
+            cluster = rados.Rados(conffile=self.conffile,
+                                  rados_id=self.service)
+            cluster.connect(timeout=self.timeout)
+        except (rados.Error, OSError) as e:
+            log("Unable to connect to Ceph with librados, falling back to "
+                "the CLI: {}".format(e), level=WARNING)
+            self._use_librados = False
+            return False
+        log("Connected to Ceph with librados as client.{}"
+            .format(self.service), level=DEBUG)
+        self._cluster = cluster
+        return True
+
+    def shutdown(self):
+        """Close the librados connection, if any."""
+        if self._cluster is not None:
+            try:
+                self._cluster.shutdown()
+            finally:
+                self._cluster = None
+        if self.calls:
+            log("Ceph command executor for client.{}: {}".format(
+                self.service, dict(self.calls)), level=DEBUG)
+
+    def _check_output(self, cmd):
+        self.calls[CLI] += 1
+        return subprocess.check_output(cmd).decode('UTF-8')
+
+    def _run(self, send, cmd, cli, fmt, inbuf):
+        command = dict(cmd)
+        if fmt:
+            command['format'] = fmt
+        self.calls[LIBRADOS] += 1
+        ret, outbuf, outs = send(json.dumps(command), inbuf)
+        if ret != 0:
+            raise subprocess.CalledProcessError(
+                abs(ret), ['ceph'] + cli, output=outs)
+        return outbuf.decode('UTF-8')
+
+    def _cli(self, cli, fmt):
+        cmd = ['ceph', '--id', self.service] + cli
+        if fmt:
+            cmd.append('--format={}'.format(fmt))
+        return self._check_output(cmd)
+
+    def mon_command(self, cmd, cli, fmt='json', inbuf=b''):
+        """Run a monitor command.
+
+        :param cmd: Command as understood by the monitor, i.e. a 'prefix'
+                    key plus the command arguments.
+        :type cmd: Dict[str, Any]
+        :param cli: The equivalent ``ceph`` CLI arguments, used when
+                    librados is not available.
+        :type cli: List[str]
+        :param fmt: Output format to request, None for plain output.
+        :type fmt: Optional[str]
+        :param inbuf: Input buffer for the command.
+        :type inbuf: bytes
+        :returns: Command output.
+        :rtype: str
+        :raises: subprocess.CalledProcessError
+        """
+        if self.connect():
+            return self._run(
+                lambda c, i: self._cluster.mon_command(
+                    c, i, timeout=self.timeout),
+                cmd, cli, fmt, inbuf)
+        return self._cli(cli, fmt)
+
+    def mgr_command(self, cmd, cli, fmt='json', inbuf=b''):
+        """Run a manager command.
+
+        Parameters and return value are the same as for ``mon_command``.
+        """
+        if self.connect():
+            return self._run(
+                lambda c, i: self._cluster.mgr_command(
+                    c, i, timeout=self.timeout),
+                cmd, cli, fmt, inbuf)
+        return self._cli(cli, fmt)
+
+    def osd_command(self, osd_id, cmd, cli, fmt='json', inbuf=b''):
+        """Run a command against a single OSD daemon.
+
+        :param osd_id: The id of the OSD to send the command to.
+        :type osd_id: int
+
+        Other parameters and return value are the same as for
+        ``mon_command``; ``cli`` is passed to ``ceph tell osd.<osd_id>``.
+        """
+        if self.connect():
+            return self._run(
+                lambda c, i: self._cluster.osd_command(
+                    int(osd_id), c, i, timeout=self.timeout),
+                cmd, cli, fmt, inbuf)
+        return self._cli(['tell', 'osd.{}'.format(osd_id)] + cli, fmt)
+
+    def list_pools(self):
+        """Return the names of all pools.
+
+        :rtype: List[str]
+        :raises: subprocess.CalledProcessError
+        """
+        if self.connect():
+            self.calls[LIBRADOS] += 1
+            return self._cluster.list_pools()
+        return self._check_output(
+            ['rados', '--id', self.service, 'lspools']).split()
+
+    def pool_exists(self, name):
+        """Check whether a pool exists.
+
+        :rtype: bool
+        """
+        if self.connect():
+            self.calls[LIBRADOS] += 1
+            return self._cluster.pool_exists(name)
+        try:
+            return name in self.list_pools()
+        except subprocess.CalledProcessError:
+            return False
+
+    def get_osds(self, device_class=None):
+        """Return the ids of all OSDs, optionally filtered by device class.
+
+        :rtype: List[int]
+        """
+        if device_class:
+            out = self.mon_command(
+                {'prefix': 'osd crush class ls-osd', 'class': device_class},
+                ['osd', 'crush', 'class', 'ls-osd', device_class])
+        else:
+            out = self.mon_command({'prefix': 'osd ls'}, ['osd', 'ls'])
+        return json.loads(out)
+
+    def osd_tree(self):
+        """Return the OSD tree.
+
+        :rtype: Dict[str, Any]
+        """
+        return json.loads(self.mon_command({'prefix': 'osd tree'},
+                                           ['osd', 'tree']))
+
+    def pool_set(self, pool_name, key, value):
+        """Set a pool property; value is coerced to a lowercase str."""
+        value = str(value).lower()
+        self.mon_command(
+            {'prefix': 'osd pool set', 'pool': pool_name, 'var': key,
+             'val': value},
+            ['osd', 'pool', 'set', pool_name, key, value], fmt=None)
+
+    def config_key_get(self, key):
+        """Return the value of a config-key, None if it does not exist."""
+        try:
+            return self.mon_command({'prefix': 'config-key get', 'key': key},
+                                    ['config-key', 'get', key], fmt=None)
+        except subprocess.CalledProcessError as e:
+            log("Monitor config-key get failed with message: {}"
+                .format(e.output))
+            return None
+
+    def config_key_set(self, key, value):
+        """Set the value of a config-key, value is coerced to a str."""
+        self.mon_command(
+            {'prefix': 'config-key put', 'key': key, 'val': str(value)},
+            ['config-key', 'put', key, str(value)], fmt=None)
+
+    def config_key_dump(self, prefix=None):
+        """Return all config-keys starting with prefix and their values.
+
+        :param prefix: Only return keys starting with this prefix.
+        :type prefix: Optional[str]
+        :rtype: Dict[str, str]
+        :raises: subprocess.CalledProcessError
+        """
+        cmd = {'prefix': 'config-key dump'}
+        cli = ['config-key', 'dump']
+        if prefix:
+            cmd['key'] = prefix
+            cli.append(prefix)
+        return json.loads(self.mon_command(cmd, cli))
+
+    def config_key_exists(self, key):
+        """Check whether a config-key exists.
+
+        :rtype: bool
+        :raises: subprocess.CalledProcessError on errors other than ENOENT.
+        """
+        try:
+            self.mon_command({'prefix': 'config-key exists', 'key': key},
+                             ['config-key', 'exists', key], fmt=None)
+            return True
+        except subprocess.CalledProcessError as e:
+            if e.returncode == errno.ENOENT:
+                return False
+            raise
+
+    def enabled_manager_modules(self):
+        """Return the list of enabled manager modules.
+
+        'mgr module ls' is served by the monitors, which know the module
+        state even while no manager is active.
+
+        :rtype: List[str]
+        """
+        out = self.mon_command({'prefix': 'mgr module ls'},
+                               ['mgr', 'module', 'ls'])
+        return json.loads(out)['enabled_modules']
+
+
+_executor = None
+
+
+def enable(service='admin', conffile=DEFAULT_CONFFILE,
+           timeout=DEFAULT_TIMEOUT):
+    """Route Ceph commands for the rest of the hook through an executor.
+
+    The connection is closed when the hook exits.
+
+    :param service: The Ceph user name to run commands under.
+    :type service: str
+    :returns: The registered executor.
+    :rtype: CephCommandExecutor
+    """
+    global _executor
+    if _executor is not None and _executor.service == service:
+        return _executor
+    disable()
+    _executor = CephCommandExecutor(service=service, conffile=conffile,
+                                    timeout=timeout)
+    hookenv.atexit(disable)
+    return _executor
+
+
+def disable():
+    """Close and unregister the current executor, if any."""
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+
+def get_executor(service=None):
+    """Return the registered executor.
+
+    :param service: If given, only return the executor when it runs as this
+                    Ceph user, as commands for other users must not be sent
+                    with its credentials.
+    :type service: Optional[str]
+    :rtype: Optional[CephCommandExecutor]
+    """
+    if _executor is not None and service in (None, _executor.service):
+        return _executor
+    return None
+
+
+# The helpers below are drop-in replacements for the charmhelpers functions
+# of the same name.
+
+
+def pool_exists(service, name):
+    """Check to see if a RADOS pool already exists."""
+    executor = get_executor(service)
+    if executor:
+        return executor.pool_exists(name)
+    return ch_ceph.pool_exists(service, name)
+
+
+def get_osds(service, device_class=None):
+    """Return a list of all OSDs, optionally filtered by device class."""
+    executor = get_executor(service)
+    if executor:
+        return executor.get_osds(device_class)
+    return ch_ceph.get_osds(service, device_class)
+
+
+def pool_set(service, pool_name, key, value):
+    """Sets a value for a RADOS pool in ceph."""
+    invalidate_hook_cache(POOLS)
+    executor = get_executor(service)
+    if executor:
+        return executor.pool_set(pool_name, key, value)
+    return ch_ceph.pool_set(service, pool_name, key, value)
+
+
+def monitor_key_get(service, key):
+    """Get the value of an existing key in the monitor cluster."""
+    executor = get_executor(service)
+    if executor:
+        return executor.config_key_get(str(key))
+    return ch_ceph.monitor_key_get(service, key)
+
+
+def monitor_key_set(service, key, value):
+    """Set a key value pair on the monitor cluster."""
+    executor = get_executor(service)
+    if executor:
+        return executor.config_key_set(str(key), value)
+    return ch_ceph.monitor_key_set(service, key, value)
+
+
+def monitor_key_exists(service, key):
+    """Search for existence of key in the monitor cluster."""
+    executor = get_executor(service)
+    if executor:
+        return executor.config_key_exists(str(key))
+    return ch_ceph.monitor_key_exists(service, key)
+
+
+def monitor_key_dump(service, prefix=None):
+    """Return all keys starting with prefix in the monitor cluster.
+
+    One command replaces a monitor_key_get call per key.
+
+    :rtype: Dict[str, str]
+    :raises: subprocess.CalledProcessError
+    """
+    executor = (get_executor(service) or
+                CephCommandExecutor(service=service, use_librados=False))
+    return executor.config_key_dump(prefix)
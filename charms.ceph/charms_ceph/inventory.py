@@ -0,0 +1,202 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A snapshot of the block devices on this host.
+
+The device predicates in ``charms_ceph.utils`` each run their own commands
+(lsblk, pvdisplay, lvs, cryptsetup, partx, sgdisk) for every device they
+are asked about.  ``BlockDeviceInventory`` runs ``lsblk --json``,
+``pvs`` and ``lvs`` once, reads /proc/mounts, /sys/class/block and the OSD
+block symlinks, and answers the same questions from that snapshot.
+
+If the scan fails, e.g. because lsblk predates JSON output, every
+predicate falls back to its ``charms_ceph.utils`` counterpart.
+"""
+
+import collections
+import glob
+import json
+import os
+import subprocess
+import time
+
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    WARNING,
+)
+from charmhelpers.core.unitdata import kv
+
+from charms_ceph import utils
+
+LSBLK_COLUMNS = 'NAME,TYPE,FSTYPE,MOUNTPOINT,PARTTYPE'
+OSD_BLOCK_GLOB = '/var/lib/ceph/osd/ceph-*/block'
+
+# Partition type GUIDs in the case lsblk reports them.
+CEPH_PARTITION_TYPES = frozenset(
+    ptype.lower() for ptype in utils.CEPH_PARTITIONS)
+
+
+def _lvm_report(cmd, kind):
+    out = subprocess.check_output(
+        cmd + ['--reportformat', 'json']).decode('UTF-8')
+    return [entry for report in json.loads(out)['report']
+            for entry in report.get(kind, [])]
+
+
+class BlockDeviceInventory(object):
+    """Answer block device questions from a single scan of the host."""
+
+    def __init__(self):
+        self.devices = {}
+        self.scan_seconds = None
+        self._children = collections.defaultdict(list)
+        self._mounted = set()
+        self._pv_vgs = {}
+        self._vg_lvs = collections.defaultdict(list)
+        self._osd_block_targets = []
+        self._pristine = {}
+        self._scanned = False
+        self.scan()
+
+    def scan(self):
+        """(Re)read the state of all block devices.
+
+        :returns: Whether the scan succeeded.
+        :rtype: bool
+        """
+        start = time.monotonic()
+        self.devices.clear()
+        self._children.clear()
+        self._pv_vgs.clear()
+        self._vg_lvs.clear()
+        self._pristine.clear()
+        try:
+            out = subprocess.check_output(
+                ['lsblk', '--json', '--paths', '-o', LSBLK_COLUMNS]
+            ).decode('UTF-8')
+            self._add_devices(json.loads(out)['blockdevices'])
+            for pv in _lvm_report(['pvs', '-o', 'pv_name,vg_name'], 'pv'):
+                self._pv_vgs[os.path.realpath(pv['pv_name'])] = pv['vg_name']
+            for lv in _lvm_report(['lvs', '-o', 'lv_name,vg_name'], 'lv'):
+                self._vg_lvs[lv['vg_name']].append(lv['lv_name'])
+            self._mounted = self._read_mounts()
+        except (subprocess.CalledProcessError, OSError, KeyError,
+                ValueError) as e:
+            log('Unable to scan block devices, probing them one by one: {}'
+                .format(e), level=WARNING)
+            self._scanned = False
+        else:
+            self._scanned = True
+        self._osd_block_targets = [
+            os.readlink(path) for path in glob.glob(OSD_BLOCK_GLOB)
+            if os.path.islink(path)]
+        self.scan_seconds = time.monotonic() - start
+        log('Block device inventory: {} devices scanned in {:.3f}s'
+            .format(len(self.devices), self.scan_seconds), level=DEBUG)
+        return self._scanned
+
+    def _add_devices(self, devices, parent=None):
+        for device in devices:
+            name = device['name']
+            device['holders'] = self._read_holders(name)
+            self.devices[name] = device
+            if parent:
+                self._children[parent].append(name)
+            self._add_devices(device.get('children', []), parent=name)
+
+    @staticmethod
+    def _read_holders(name):
+        path = '/sys/class/block/{}/holders'.format(os.path.basename(name))
+        try:
+            return os.listdir(path)
+        except OSError:
+            return []
+
+    @staticmethod
+    def _read_mounts():
+        with open('/proc/mounts') as mounts:
+            return {os.path.realpath(line.split()[0])
+                    for line in mounts if line.startswith('/dev/')}
+
+    def _lookup(self, dev):
+        return self.devices.get(os.path.realpath(dev))
+
+    def _tree(self, name):
+        yield name
+        for child in self._children.get(name, []):
+            yield from self._tree(child)
+
+    def unmounted_disks(self):
+        """List of unmounted disks, as ``charms_ceph.utils.unmounted_disks``.
+        """
+        if not self._scanned:
+            return utils.unmounted_disks()
+        disks = [name for name, device in sorted(self.devices.items())
+                 if device.get('type') == 'disk' and
+                 not any(block_type in name
+                         for block_type in ('dm-', 'loop', 'ram', 'nbd'))]
+        log("Found disks: {}".format(disks))
+        return [disk for disk in disks if not self.is_device_mounted(disk)]
+
+    def is_device_mounted(self, dev):
+        """Whether dev or any of its partitions or holders is mounted."""
+        device = self._lookup(dev)
+        if not self._scanned or device is None:
+            return utils.is_device_mounted(dev)
+        return any(name in self._mounted or
+                   self.devices[name].get('mountpoint')
+                   for name in self._tree(device['name']))
+
+    def is_active_bluestore_device(self, dev):
+        """Whether dev is the block device of an active bluestore OSD."""
+        if not self._scanned:
+            return utils.is_active_bluestore_device(dev)
+        vg_name = self._pv_vgs.get(os.path.realpath(dev))
+        if vg_name is None:
+            return False
+        return any(target.endswith(lv_name)
+                   for lv_name in self._vg_lvs.get(vg_name, [])
+                   for target in self._osd_block_targets)
+
+    def is_mapped_luks_device(self, dev):
+        """Whether dev has a LUKS header and is held by a mapped device."""
+        device = self._lookup(dev)
+        if not self._scanned or device is None:
+            return utils.is_mapped_luks_device(dev)
+        return (device.get('fstype') == 'crypto_LUKS' and
+                bool(device['holders']))
+
+    def is_osd_disk(self, dev):
+        """Whether dev was processed by the charm or has Ceph partitions."""
+        device = self._lookup(dev)
+        if not self._scanned or device is None:
+            return utils.is_osd_disk(dev)
+        if dev in kv().get('osd-devices', []):
+            log('Device {} already processed by charm,'
+                ' skipping'.format(dev))
+            return True
+        return any((self.devices[name].get('parttype') or '').lower()
+                   in CEPH_PARTITION_TYPES
+                   for name in self._children.get(device['name'], []))
+
+    def is_pristine_disk(self, dev):
+        """Whether the first 2048 bytes of dev are zero.
+
+        This reads the device rather than running a command, so it is only
+        remembered for the lifetime of the snapshot.
+        """
+        if dev not in self._pristine:
+            self._pristine[dev] = utils.is_pristine_disk(dev)
+        return self._pristine[dev]
@@ -0,0 +1,110 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Filtering, paging and field projection for action results.
+
+Actions that list pools, OSDs or entities can return more than a Juju action
+result holds on large clusters.  ``select`` keeps the items whose name
+matches a glob, returns one page of them and only the requested fields, so
+the action can hand back a bounded result together with the offset of the
+next page.
+"""
+
+import collections
+import fnmatch
+import json
+
+# One page of items, the number of items that matched the filter and the
+# offset of the next page, None on the last page.
+Page = collections.namedtuple('Page', ['items', 'total', 'next_offset'])
+
+
+def parse_fields(fields):
+    """Split a comma separated list of field names.
+
+    :param fields: e.g. 'pool_name,size,stats.stored'
+    :type fields: Optional[str]
+    :returns: The field names, None for all fields.
+    :rtype: Optional[List[str]]
+    """
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def project(item, fields):
+    """Keep only fields of item; a dotted field selects a nested key."""
+    if not fields or not isinstance(item, dict):
+        return item
+    result = {}
+    for field in fields:
+        value, target, found = item, result, True
+        parts = field.split('.')
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                found = False
+                break
+            value = value[part]
+        if not found:
+            continue
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return result
+
+
+def select(items, offset=0, limit=0, pattern=None, key=None, fields=None):
+    """Filter, page and project items.
+
+    :param items: The items to choose from, in output order.
+    :type items: Iterable[Any]
+    :param offset: Number of matching items to skip.
+    :type offset: int
+    :param limit: Maximum number of items to return, 0 for all.
+    :type limit: int
+    :param pattern: Glob the name of an item has to match.
+    :type pattern: Optional[str]
+    :param key: Return the name of an item, the item itself by default.
+    :type key: Optional[Callable[[Any], str]]
+    :param fields: Fields to keep, see ``project``.
+    :type fields: Optional[List[str]]
+    :rtype: Page
+    :raises: ValueError if offset or limit is negative.
+    """
+    offset, limit = int(offset or 0), int(limit or 0)
+    if offset < 0 or limit < 0:
+        raise ValueError("offset and limit must not be negative")
+    key = key or str
+    matching = [item for item in items
+                if not pattern or fnmatch.fnmatchcase(str(key(item)),
+                                                      pattern)]
+    end = offset + limit if limit else len(matching)
+    next_offset = end if end < len(matching) else None
+    return Page([project(item, fields) for item in matching[offset:end]],
+                len(matching), next_offset)
+
+
+def dumps(obj, pretty=False):
+    """Encode obj as JSON without the whitespace json.dumps adds."""
+    if pretty:
+        return json.dumps(obj, indent=2)
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def results(page, message):
+    """Return the action results for a page rendered as message."""
+    rv = {'message': message, 'total': page.total}
+    if page.next_offset is not None:
+        rv['next-offset'] = page.next_offset
+    return rv
@@ -0,0 +1,148 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Placement group sizing for all the pools of a broker request.
+
+``BasePool.get_pgs`` in charmhelpers sizes every pool on its own and asks
+the cluster for its OSDs each time.  ``plan_pgs`` sizes all the pools a
+request creates in one pass from OSD counts read once per device class.
+The weights of the new pools, together with the ``target_size_ratio`` of
+the pools that already exist, are scaled down when they add up to more
+than 100%, so the pools of one request never claim more than the whole
+cluster.  The plan also projects the resulting PGs per OSD, so
+oversubscription is reported before any pool is created.
+
+The rounding follows ``BasePool.get_pgs``: the PG count of a pool is
+``pgs-per-osd * osds * weight / size``, at least ``DEFAULT_MINIMUM_PGS``,
+rounded to the nearest power of two unless that is more than 25% below.
+"""
+
+import collections
+import math
+
+DEFAULT_PGS_PER_OSD_TARGET = 100
+DEFAULT_POOL_WEIGHT = 10.0
+DEFAULT_MINIMUM_PGS = 2
+LEGACY_PG_COUNT = 200
+# The default of mon_max_pg_per_osd, above which pool creation fails.
+MAX_PGS_PER_OSD = 250
+
+# A pool to be created. size is the number of replicas or k+m, weight the
+# expected percentage of the data, pg_num an explicitly requested count.
+PoolSpec = collections.namedtuple(
+    'PoolSpec', ['name', 'size', 'weight', 'pg_num', 'device_class'])
+PoolSpec.__new__.__defaults__ = (None, None, None)
+
+# A pool that already exists, from ``osd pool ls detail``.
+ExistingPool = collections.namedtuple(
+    'ExistingPool', ['name', 'size', 'pg_num', 'target_size_ratio',
+                     'device_class'])
+ExistingPool.__new__.__defaults__ = (None, None)
+
+
+def round_pgs(num_pg):
+    """Round a PG count to a power of two as BasePool.get_pgs does."""
+    num_pg = max(num_pg, DEFAULT_MINIMUM_PGS)
+    nearest = 2 ** math.floor(math.log(num_pg, 2))
+    if (num_pg - nearest) > (num_pg * 0.25):
+        return int(nearest * 2)
+    return int(nearest)
+
+
+class PGPlan(object):
+    """The PG count of each new pool and the projected PGs per OSD."""
+
+    def __init__(self):
+        # Pool name -> pg_num
+        self.pg_nums = collections.OrderedDict()
+        # Device class (None for all OSDs) -> projected PGs per OSD
+        self.projected_pgs_per_osd = {}
+        # Device class -> scale applied to the weights of the new pools
+        self.weight_scale = {}
+
+    def get(self, name):
+        return self.pg_nums.get(name)
+
+    def oversubscribed(self, limit=MAX_PGS_PER_OSD):
+        """Device classes whose projected PGs per OSD exceed limit."""
+        return sorted((dc for dc, pgs in self.projected_pgs_per_osd.items()
+                       if pgs > limit), key=str)
+
+    def to_dict(self):
+        return {
+            'pools': dict(self.pg_nums),
+            'projected-pgs-per-osd': {
+                dc or 'all': round(pgs, 1)
+                for dc, pgs in self.projected_pgs_per_osd.items()},
+        }
+
+
+def plan_pgs(pools, osd_counts, existing=(),
+             pgs_per_osd=DEFAULT_PGS_PER_OSD_TARGET, expected_osd_count=0):
+    """Size all the pools of a request together.
+
+    :param pools: The pools to create.
+    :type pools: Iterable[PoolSpec]
+    :param osd_counts: Number of OSDs per device class, None for all OSDs.
+    :type osd_counts: Dict[Optional[str], int]
+    :param existing: The pools that already exist.
+    :type existing: Iterable[ExistingPool]
+    :param pgs_per_osd: Target number of PGs per OSD.
+    :type pgs_per_osd: int
+    :param expected_osd_count: Lower bound for the number of OSDs when no
+                               device class is given.
+    :type expected_osd_count: int
+    :rtype: PGPlan
+    """
+    plan = PGPlan()
+    pools_by_class = collections.defaultdict(list)
+    for pool in pools:
+        pools_by_class[pool.device_class].append(pool)
+    existing_by_class = collections.defaultdict(list)
+    for pool in existing:
+        existing_by_class[pool.device_class].append(pool)
+
+    for device_class in set(pools_by_class) | set(existing_by_class):
+        new = pools_by_class[device_class]
+        old = existing_by_class[device_class]
+        osd_count = osd_counts.get(device_class) or 0
+        if device_class is None:
+            osd_count = max(expected_osd_count, osd_count)
+
+        weights = [pool.weight or DEFAULT_POOL_WEIGHT for pool in new]
+        total = sum(weights) + sum(
+            100.0 * (pool.target_size_ratio or 0) for pool in old)
+        scale = 100.0 / total if total > 100.0 else 1.0
+        plan.weight_scale[device_class] = scale
+
+        for pool, weight in zip(new, weights):
+            if not osd_count:
+                # Nothing to size against, as BasePool.get_pgs.
+                pg_num = pool.pg_num or LEGACY_PG_COUNT
+            else:
+                max_pgs = round_pgs(pgs_per_osd * osd_count // pool.size)
+                if pool.pg_num:
+                    pg_num = min(pool.pg_num, max_pgs)
+                else:
+                    pg_num = round_pgs(
+                        pgs_per_osd * osd_count * weight * scale / 100.0 //
+                        pool.size)
+            plan.pg_nums[pool.name] = pg_num
+
+        if osd_count:
+            placed = sum(plan.pg_nums[pool.name] * pool.size for pool in new)
+            placed += sum((pool.pg_num or 0) * (pool.size or 0)
+                          for pool in old)
+            plan.projected_pgs_per_osd[device_class] = placed / osd_count
+    return plan
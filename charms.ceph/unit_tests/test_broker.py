@@ -16,9 +16,11 @@ import json
 import unittest
 import textwrap
 
-from unittest.mock import patch, ANY
+from unittest.mock import patch, ANY, MagicMock
 
+import charmhelpers.contrib.storage.linux.ceph as ch_ceph
 import charms_ceph.broker
+import charms_ceph.utils
 
 from unittest.mock import call
 
@@ -332,13 +334,13 @@ class CephBrokerTestCase(unittest.TestCase):
 
     @patch.object(charms_ceph.broker, 'get_osds')
     @patch.object(charms_ceph.broker, 'ReplicatedPool')
-    @patch.object(charms_ceph.broker, 'pool_exists')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
     @patch.object(charms_ceph.broker, 'log')
     def test_process_requests_create_pool_w_pg_num(self, mock_log,
-                                                   mock_pool_exists,
+                                                   mock_pool_ls_detail,
                                                    mock_replicated_pool,
                                                    mock_get_osds):
-        mock_pool_exists.return_value = False
+        mock_pool_ls_detail.return_value = []
         mock_get_osds.return_value = [0, 1, 2]
         op = {
             'op': 'create-pool',
@@ -350,17 +352,160 @@ class CephBrokerTestCase(unittest.TestCase):
                            'ops': [op]})
         rc = charms_ceph.broker.process_requests(reqs)
         mock_replicated_pool.assert_called_with(service='admin', op=op)
-        mock_pool_exists.assert_called_with(service='admin', name='foo')
+        mock_pool_ls_detail.assert_called_once_with(client='admin')
         self.assertEqual(json.loads(rc), {'exit-code': 0})
 
+    @patch('charms_ceph.crush_utils.Crushmap.load_crushmap')
+    @patch.object(charms_ceph.broker, 'config')
+    @patch.object(charms_ceph.broker, 'get_osds')
     @patch.object(charms_ceph.broker, 'ReplicatedPool')
-    @patch.object(charms_ceph.broker, 'pool_exists')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
+    @patch.object(charms_ceph.broker, 'log')
+    def test_process_requests_create_pools_planned(self, mock_log,
+                                                   mock_pool_ls_detail,
+                                                   mock_replicated_pool,
+                                                   mock_get_osds,
+                                                   mock_config,
+                                                   mock_load_crushmap):
+        mock_pool_ls_detail.return_value = [
+            {'pool_name': 'existing', 'size': 3, 'pg_num': 32,
+             'crush_rule': 0, 'options': {'target_size_ratio': 0.4}}]
+        mock_load_crushmap.return_value = {'rules': [
+            {'rule_id': 0, 'rule_name': 'replicated_rule',
+             'steps': [{'op': 'take', 'item_name': 'default'}]}]}
+        mock_get_osds.return_value = list(range(30))
+        mock_config.side_effect = {'pgs-per-osd': 100}.get
+        pools = [MagicMock(), MagicMock(), MagicMock()]
+        mock_replicated_pool.side_effect = pools
+        ops = [{'op': 'create-pool', 'name': name, 'replicas': 3,
+                'weight': 40} for name in ('a', 'b', 'existing')]
+        reqs = json.dumps({'api-version': 1, 'ops': ops})
+        rc = charms_ceph.broker.process_requests(reqs)
+        self.assertEqual(json.loads(rc)['exit-code'], 0)
+        mock_get_osds.assert_called_once_with('admin', None)
+        # a and b share the 60% left by the existing pool.
+        self.assertEqual([pool.get_pgs(3, 40) for pool in pools[:2]],
+                         [256, 256])
+        pools[0].create.assert_called_once_with()
+        pools[2].create.assert_not_called()
+
+    @patch('charms_ceph.crush_utils.Crushmap.load_crushmap')
+    @patch.object(charms_ceph.broker, 'config')
+    @patch.object(charms_ceph.broker, 'get_osds')
+    @patch.object(charms_ceph.broker, 'ReplicatedPool')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
+    @patch.object(charms_ceph.broker, 'log')
+    def test_process_requests_create_pools_planned_by_class(
+            self, mock_log, mock_pool_ls_detail, mock_replicated_pool,
+            mock_get_osds, mock_config, mock_load_crushmap):
+        mock_pool_ls_detail.return_value = [
+            {'pool_name': 'existing', 'size': 3, 'pg_num': 32,
+             'crush_rule': 1, 'options': {'target_size_ratio': 0.4}}]
+        mock_load_crushmap.return_value = {'rules': [
+            {'rule_id': 1, 'rule_name': 'fast',
+             'steps': [{'op': 'take', 'item_name': 'default~ssd'}]}]}
+        mock_get_osds.return_value = list(range(30))
+        mock_config.side_effect = {'pgs-per-osd': 100}.get
+        pools = [MagicMock(), MagicMock()]
+        mock_replicated_pool.side_effect = pools
+        ops = [{'op': 'create-pool', 'name': name, 'replicas': 3,
+                'weight': 40} for name in ('a', 'b')]
+        reqs = json.dumps({'api-version': 1, 'ops': ops})
+        rc = charms_ceph.broker.process_requests(reqs)
+        self.assertEqual(json.loads(rc)['exit-code'], 0)
+        # The existing pool is on the ssd class, so a and b are not scaled
+        # down to share the OSDs of all classes with it.
+        self.assertEqual([pool.get_pgs(3, 40) for pool in pools],
+                         [512, 512])
+        mock_load_crushmap.assert_called_once_with()
+
+    @patch('charms_ceph.crush_utils.Crushmap.load_crushmap')
+    @patch.object(charms_ceph.broker, 'config')
+    @patch.object(charms_ceph.broker, 'get_osds')
+    @patch.object(charms_ceph.broker, 'ReplicatedPool')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
+    @patch.object(charms_ceph.broker, 'log')
+    def test_process_requests_create_pools_planned_on_class_rule(
+            self, mock_log, mock_pool_ls_detail, mock_replicated_pool,
+            mock_get_osds, mock_config, mock_load_crushmap):
+        mock_pool_ls_detail.return_value = [
+            {'pool_name': 'existing', 'size': 3, 'pg_num': 32,
+             'crush_rule': 1, 'options': {'target_size_ratio': 0.4}}]
+        mock_load_crushmap.return_value = {'rules': [
+            {'rule_id': 1, 'rule_name': 'fast',
+             'steps': [{'op': 'take', 'item_name': 'default~ssd'}]}]}
+        mock_get_osds.return_value = list(range(30))
+        mock_config.side_effect = {'pgs-per-osd': 100}.get
+        pools = [MagicMock(), MagicMock()]
+        mock_replicated_pool.side_effect = pools
+        ops = [{'op': 'create-pool', 'name': name, 'replicas': 3,
+                'weight': 40, 'crush-profile': 'fast'} for name in ('a', 'b')]
+        reqs = json.dumps({'api-version': 1, 'ops': ops})
+        rc = charms_ceph.broker.process_requests(reqs)
+        self.assertEqual(json.loads(rc)['exit-code'], 0)
+        mock_get_osds.assert_called_once_with('admin', 'ssd')
+        # a and b share the ssd OSDs with the existing pool.
+        self.assertEqual([pool.get_pgs(3, 40) for pool in pools],
+                         [256, 256])
+        mock_load_crushmap.assert_called_once_with()
+
+    @patch.object(charms_ceph.utils, '_cmp_pkgrevno_with_dpkg_fallback')
+    @patch.object(charms_ceph.utils.subprocess, 'check_output')
+    @patch.object(ch_ceph, 'enabled_manager_modules')
+    @patch.object(ch_ceph, 'pool_exists')
+    @patch.object(charms_ceph.broker, 'config')
+    @patch.object(charms_ceph.broker, 'get_osds')
+    @patch.object(charms_ceph.broker, 'ReplicatedPool')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
+    @patch.object(charms_ceph.broker, 'log')
+    def test_process_requests_create_pools_commands(
+            self, mock_log, mock_pool_ls_detail, mock_replicated_pool,
+            mock_get_osds, mock_config, mock_ch_pool_exists,
+            mock_ch_enabled_manager_modules, mock_check_output,
+            mock_cmp_pkgrevno):
+        class Pool(object):
+            # Makes the lookups of charmhelpers' BasePool.create.
+            def __init__(self, service, op):
+                self.service, self.name = service, op['name']
+                self.autoscale = None
+
+            def create(self):
+                if not ch_ceph.pool_exists(self.service, self.name):
+                    self.autoscale = (
+                        'pg_autoscaler' in ch_ceph.enabled_manager_modules())
+
+        mock_pool_ls_detail.return_value = []
+        mock_get_osds.return_value = list(range(30))
+        mock_config.side_effect = {'pgs-per-osd': 100}.get
+        mock_cmp_pkgrevno.return_value = 1
+        mock_check_output.return_value = (
+            b'{"enabled_modules": ["pg_autoscaler"]}')
+        pools = []
+        mock_replicated_pool.side_effect = (
+            lambda service, op: pools.append(Pool(service, op)) or pools[-1])
+        ops = [{'op': 'create-pool', 'name': 'rgw.{}'.format(i),
+                'replicas': 3, 'weight': 5} for i in range(4)]
+        reqs = json.dumps({'api-version': 1, 'ops': ops})
+        rc = charms_ceph.broker.process_requests(reqs)
+        self.assertEqual(json.loads(rc), {'exit-code': 0})
+        self.assertEqual([pool.autoscale for pool in pools],
+                         [True, True, True, True])
+        # Neither 'rados lspools' nor 'ceph mgr module ls' runs per pool.
+        mock_ch_pool_exists.assert_not_called()
+        mock_ch_enabled_manager_modules.assert_not_called()
+        mock_check_output.assert_called_once_with(
+            ['ceph', 'mgr', 'module', 'ls', '--format=json'])
+        self.assertIs(ch_ceph.pool_exists, mock_ch_pool_exists)
+
+    @patch.object(charms_ceph.broker, 'ReplicatedPool')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
     @patch.object(charms_ceph.broker, 'log')
     @patch.object(charms_ceph.broker, 'add_pool_to_group')
     def test_process_requests_create_pool_w_group(self, add_pool_to_group,
-                                                  mock_log, mock_pool_exists,
+                                                  mock_log,
+                                                  mock_pool_ls_detail,
                                                   mock_replicated_pool):
-        mock_pool_exists.return_value = False
+        mock_pool_ls_detail.return_value = []
         op = {
             'op': 'create-pool',
             'name': 'foo',
@@ -373,17 +518,17 @@ class CephBrokerTestCase(unittest.TestCase):
         add_pool_to_group.assert_called_with(group='image',
                                              pool='foo',
                                              namespace=None)
-        mock_pool_exists.assert_called_with(service='admin', name='foo')
+        mock_pool_ls_detail.assert_called_once_with(client='admin')
         mock_replicated_pool.assert_called_with(service='admin', op=op)
         self.assertEqual(json.loads(rc), {'exit-code': 0})
 
     @patch.object(charms_ceph.broker, 'ReplicatedPool')
-    @patch.object(charms_ceph.broker, 'pool_exists')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
     @patch.object(charms_ceph.broker, 'log')
     def test_process_requests_create_pool_exists(self, mock_log,
-                                                 mock_pool_exists,
+                                                 mock_pool_ls_detail,
                                                  mock_replicated_pool):
-        mock_pool_exists.return_value = True
+        mock_pool_ls_detail.return_value = [{'pool_name': 'foo'}]
 
         op = {
             'op': 'create-pool',
@@ -393,18 +538,17 @@ class CephBrokerTestCase(unittest.TestCase):
         reqs = json.dumps({'api-version': 1,
                            'ops': [op]})
         rc = charms_ceph.broker.process_requests(reqs)
-        mock_pool_exists.assert_called_with(service='admin',
-                                            name='foo')
+        mock_pool_ls_detail.assert_called_once_with(client='admin')
         self.assertFalse(mock_replicated_pool.create.called)
         self.assertEqual(json.loads(rc), {'exit-code': 0})
 
     @patch.object(charms_ceph.broker, 'ReplicatedPool')
-    @patch.object(charms_ceph.broker, 'pool_exists')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
     @patch.object(charms_ceph.broker, 'log')
     def test_process_requests_create_pool_rid(self, mock_log,
-                                              mock_pool_exists,
+                                              mock_pool_ls_detail,
                                               mock_replicated_pool):
-        mock_pool_exists.return_value = False
+        mock_pool_ls_detail.return_value = []
         op = {
             'op': 'create-pool',
             'name': 'foo',
@@ -415,19 +559,19 @@ class CephBrokerTestCase(unittest.TestCase):
                            'ops': [op]})
         rc = charms_ceph.broker.process_requests(reqs)
         mock_replicated_pool.assert_called_with(service='admin', op=op)
-        mock_pool_exists.assert_called_with(service='admin', name='foo')
+        mock_pool_ls_detail.assert_called_once_with(client='admin')
         self.assertEqual(json.loads(rc)['exit-code'], 0)
         self.assertEqual(json.loads(rc)['request-id'], '1ef5aede')
 
     @patch.object(charms_ceph.broker, 'erasure_profile_exists')
     @patch.object(charms_ceph.broker, 'ErasurePool')
-    @patch.object(charms_ceph.broker, 'pool_exists')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
     @patch.object(charms_ceph.broker, 'log')
     def test_process_requests_create_erasure_pool(self, mock_log,
-                                                  mock_pool_exists,
+                                                  mock_pool_ls_detail,
                                                   mock_erasure_pool,
                                                   mock_profile_exists):
-        mock_pool_exists.return_value = False
+        mock_pool_ls_detail.return_value = []
         op = {
             'op': 'create-pool',
             'pool-type': 'erasure',
@@ -439,7 +583,7 @@ class CephBrokerTestCase(unittest.TestCase):
         rc = charms_ceph.broker.process_requests(reqs)
         mock_profile_exists.assert_called_with(service='admin', name='default')
         mock_erasure_pool.assert_called_with(service='admin', op=op)
-        mock_pool_exists.assert_called_with(service='admin', name='foo')
+        mock_pool_ls_detail.assert_called_once_with(client='admin')
         self.assertEqual(json.loads(rc), {'exit-code': 0})
 
     @patch.object(charms_ceph.broker, 'pool_exists')
@@ -537,19 +681,22 @@ class CephBrokerTestCase(unittest.TestCase):
         self.assertEqual(json.loads(rc)['exit-code'], 0)
         self.assertEqual(json.loads(rc)['request-id'], '1ef5aede')
 
-    @patch.object(charms_ceph.broker, 'check_output')
+    @patch('charms_ceph.crush_utils.invalidate_hook_cache')
+    @patch('charms_ceph.crush_utils.check_call')
     @patch.object(charms_ceph.broker, 'get_osd_weight')
     @patch.object(charms_ceph.broker, 'log')
     @patch('charms_ceph.crush_utils.Crushmap.load_crushmap')
-    @patch('charms_ceph.crush_utils.Crushmap.ensure_bucket_is_present')
     def test_process_requests_move_osd(self,
-                                       mock_ensure_bucket_is_present,
                                        mock_load_crushmap,
                                        mock_log,
                                        mock_get_osd_weight,
-                                       mock_check_output):
-        mock_load_crushmap.return_value = ""
-        mock_ensure_bucket_is_present.return_value = None
+                                       mock_check_call,
+                                       mock_invalidate_hook_cache):
+        mock_load_crushmap.return_value = {
+            'devices': [{'id': 0, 'name': 'osd.0'}],
+            'buckets': [{'id': -1, 'name': 'test', 'type_name': 'root',
+                         'items': []}],
+            'rules': [{'rule_name': 'test'}]}
         mock_get_osd_weight.return_value = 1
         reqs = json.dumps({'api-version': 1,
                            'request-id': '1ef5aede',
@@ -561,10 +708,98 @@ class CephBrokerTestCase(unittest.TestCase):
         rc = charms_ceph.broker.process_requests(reqs)
         self.assertEqual(json.loads(rc)['exit-code'], 0)
         self.assertEqual(json.loads(rc)['request-id'], '1ef5aede')
-        mock_check_output.assert_called_with(["ceph",
-                                              '--id', 'admin',
-                                              "osd", "crush", "set",
-                                              "osd.0", "1", "root=test"])
+        self.assertNotIn('crush-epochs', json.loads(rc))
+        self.assertTrue(any('creating 1 CRUSH epochs' in c[0][0]
+                            for c in mock_log.call_args_list))
+        mock_check_call.assert_called_once_with(["ceph",
+                                                 "osd", "crush", "set",
+                                                 "osd.0", "1", "root=test"])
+
+    @patch('charms_ceph.crush_utils.invalidate_hook_cache')
+    @patch('charms_ceph.crush_utils.Crushmap.push_crushmap')
+    @patch.object(charms_ceph.broker, 'get_osd_weight')
+    @patch.object(charms_ceph.broker, 'log')
+    @patch('charms_ceph.crush_utils.Crushmap.load_crushmap')
+    def test_process_requests_move_osds_batched(self,
+                                                mock_load_crushmap,
+                                                mock_log,
+                                                mock_get_osd_weight,
+                                                mock_push_crushmap,
+                                                mock_invalidate_hook_cache):
+        mock_load_crushmap.return_value = {
+            'devices': [{'id': 0, 'name': 'osd.0'},
+                        {'id': 1, 'name': 'osd.1'}],
+            'buckets': [{'id': -1, 'name': 'default', 'type_name': 'root',
+                         'items': [{'id': 0, 'weight': 0x10000}]}]}
+        mock_get_osd_weight.return_value = 1.0
+        ops = [{'op': 'move-osd-to-bucket', 'osd': 'osd.{}'.format(i),
+                'bucket': 'fast'} for i in range(2)]
+        ops.append({'op': 'move-osd-to-bucket', 'osd': 'osd.0',
+                    'bucket': 'default'})
+        reqs = json.dumps({'api-version': 1,
+                           'request-id': '1ef5aede',
+                           'ops': ops})
+        rc = charms_ceph.broker.process_requests(reqs)
+        self.assertEqual(json.loads(rc)['exit-code'], 0)
+        self.assertTrue(any('creating 1 CRUSH epochs' in c[0][0]
+                            for c in mock_log.call_args_list))
+        changes = mock_push_crushmap.call_args[0][0]
+        self.assertEqual(
+            [c.crushtool for c in changes],
+            [['--add-bucket', 'fast', 'root'],
+             ['--create-replicated-rule', 'fast', 'fast', 'host'],
+             ['--update-item', '1', '1.0', 'osd.1', '--loc', 'root',
+              'fast']])
+
+    @patch('charms_ceph.crush_utils.invalidate_hook_cache')
+    @patch('charms_ceph.crush_utils.Crushmap.push_crushmap')
+    @patch.object(charms_ceph.broker, 'get_osds')
+    @patch.object(charms_ceph.broker, 'ReplicatedPool')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
+    @patch.object(charms_ceph.broker, 'get_osd_weight')
+    @patch.object(charms_ceph.broker, 'log')
+    @patch('charms_ceph.crush_utils.Crushmap.load_crushmap')
+    def test_process_requests_placements_before_pool(
+            self, mock_load_crushmap, mock_log, mock_get_osd_weight,
+            mock_pool_ls_detail, mock_replicated_pool, mock_get_osds,
+            mock_push_crushmap, mock_invalidate_hook_cache):
+        mock_load_crushmap.return_value = {
+            'devices': [{'id': 0, 'name': 'osd.0'},
+                        {'id': 1, 'name': 'osd.1'}],
+            'buckets': [{'id': -1, 'name': 'default', 'type_name': 'root',
+                         'items': [{'id': 0, 'weight': 0x10000},
+                                   {'id': 1, 'weight': 0x10000}]}]}
+        mock_get_osd_weight.return_value = 1.0
+        mock_pool_ls_detail.return_value = []
+        mock_get_osds.return_value = [0, 1]
+        # The pool using the new bucket's rule is only created once the
+        # bucket exists.
+        mock_replicated_pool.side_effect = (
+            lambda **kwargs: self.assertEqual(
+                mock_push_crushmap.call_count, 1) or MagicMock())
+        ops = [{'op': 'move-osd-to-bucket', 'osd': 'osd.{}'.format(i),
+                'bucket': 'fast'} for i in range(2)]
+        ops.append({'op': 'create-pool', 'name': 'foo', 'replicas': 2,
+                    'pg_num': 32, 'crush-profile': 'fast'})
+        ops.append({'op': 'move-osd-to-bucket', 'osd': 'osd.0',
+                    'bucket': 'slow'})
+        reqs = json.dumps({'api-version': 1, 'ops': ops})
+        rc = charms_ceph.broker.process_requests(reqs)
+        self.assertEqual(json.loads(rc), {'exit-code': 0})
+        mock_replicated_pool.assert_called_once_with(service='admin',
+                                                     op=ops[2])
+        self.assertEqual(
+            [[c.crushtool[:2] for c in call[0][0]]
+             for call in mock_push_crushmap.call_args_list],
+            [[['--add-bucket', 'fast'],
+              ['--create-replicated-rule', 'fast'],
+              ['--update-item', '0'],
+              ['--update-item', '1']],
+             [['--add-bucket', 'slow'],
+              ['--create-replicated-rule', 'slow'],
+              ['--update-item', '0']]])
+        self.assertTrue(any('creating 2 CRUSH epochs' in c[0][0]
+                            for c in mock_log.call_args_list))
 
     @patch.object(charms_ceph.broker, 'log')
     def test_process_requests_invalid_api_rid(self, mock_log):
@@ -957,3 +1192,98 @@ class CephBrokerTestCase(unittest.TestCase):
         self.assertEqual(rc['exit-code'], 0)
         self.assertEqual(rc['request-id'], 'aabbccdd')
         self.assertEqual(rc['key'], 'other-client-key')
+
+    @patch.object(charms_ceph.broker, 'check_call')
+    @patch.object(charms_ceph.broker, 'monitor_key_set')
+    @patch.object(charms_ceph.broker, 'monitor_key_get')
+    @patch.object(charms_ceph.broker, 'ReplicatedPool')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
+    @patch.object(charms_ceph.broker, 'log')
+    def test_process_requests_batch_create_pools(self, mock_log,
+                                                 mock_pool_ls_detail,
+                                                 mock_replicated_pool,
+                                                 mock_monitor_key_get,
+                                                 mock_monitor_key_set,
+                                                 mock_check_call):
+        mock_pool_ls_detail.return_value = [{'pool_name': 'rgw.root'}]
+        mkey = {
+            'cephx.groups.objects': ('{"pools": ["rgw.root"], '
+                                     '"services": ["rgw"]}'),
+            'cephx.services.rgw': '{"group_names": {"rwx": ["objects"]}}'}
+        mock_monitor_key_get.side_effect = lambda service, key: mkey[key]
+        ops = [{'op': 'create-pool', 'name': name, 'replicas': 3,
+                'group': 'objects'}
+               for name in ('rgw.root', 'rgw.control', 'rgw.log')]
+        reqs = json.dumps({'api-version': 1, 'ops': ops})
+        rc = json.loads(charms_ceph.broker.process_requests(reqs))
+        self.assertEqual(rc['exit-code'], 0)
+        # Op timings are logged, the response is the same on every run.
+        self.assertEqual(rc, {'exit-code': 0})
+        summary, = [c[0][0] for c in mock_log.call_args_list
+                    if c[0][0].startswith('Processed 3 ops')]
+        self.assertEqual(
+            [t['name'] for t in json.loads(summary.split(': ', 1)[1])],
+            ['rgw.root', 'rgw.control', 'rgw.log'])
+        mock_pool_ls_detail.assert_called_once_with(client='admin')
+        self.assertEqual(mock_replicated_pool.return_value.create.call_count,
+                         2)
+        # The group is read once, written once per new pool and the key
+        # permissions are only updated at the end of the request.
+        self.assertEqual(mock_monitor_key_get.call_count, 2)
+        self.assertEqual(mock_monitor_key_set.call_count, 2)
+        mock_check_call.assert_called_once_with([
+            'ceph', 'auth', 'caps', 'client.rgw',
+            'mon', ('allow r, allow command "osd blacklist"'
+                    ', allow command "osd blocklist"'),
+            'osd', ('allow rwx pool=rgw.root, allow rwx pool=rgw.control, '
+                    'allow rwx pool=rgw.log')])
+        self.assertIsNone(charms_ceph.broker.get_snapshot())
+
+    @patch.object(charms_ceph.broker, 'set_pool_quota')
+    @patch.object(charms_ceph.broker, 'pool_set')
+    @patch.object(charms_ceph.broker, 'ReplicatedPool')
+    @patch.object(charms_ceph.broker, 'get_pool_ls_detail')
+    @patch.object(charms_ceph.broker, 'log')
+    def test_process_requests_update_existing_pool(self, mock_log,
+                                                   mock_pool_ls_detail,
+                                                   mock_replicated_pool,
+                                                   mock_pool_set,
+                                                   mock_set_pool_quota):
+        mock_pool_ls_detail.return_value = [{
+            'pool_name': 'foo',
+            'quota_max_bytes': 1024,
+            'quota_max_objects': 0,
+            'options': {'compression_mode': 'aggressive'}}]
+        op = {'op': 'create-pool', 'name': 'foo', 'replicas': 3,
+              'max-bytes': 1024, 'compression-mode': 'aggressive'}
+        reqs = json.dumps({'api-version': 1, 'ops': [op]})
+        charms_ceph.broker.process_requests(reqs)
+        mock_replicated_pool.return_value.validate.assert_called_once_with()
+        mock_replicated_pool.return_value.create.assert_not_called()
+        mock_replicated_pool.return_value.update.assert_not_called()
+        mock_pool_set.assert_not_called()
+        mock_set_pool_quota.assert_not_called()
+
+        op.update({'max-objects': 10, 'compression-algorithm': 'zstd'})
+        reqs = json.dumps({'api-version': 1, 'ops': [op]})
+        charms_ceph.broker.process_requests(reqs)
+        mock_set_pool_quota.assert_called_once_with(
+            service='admin', pool_name='foo', max_bytes=1024, max_objects=10)
+        mock_pool_set.assert_called_once_with(
+            service='admin', pool_name='foo', key='compression_algorithm',
+            value='zstd')
+
+    @patch.object(charms_ceph.broker, 'monitor_key_set')
+    @patch.object(charms_ceph.broker, 'monitor_key_get')
+    def test_snapshot_config_key_set_unchanged(self, mock_monitor_key_get,
+                                               mock_monitor_key_set):
+        mock_monitor_key_get.return_value = 'bar'
+        snapshot = charms_ceph.broker.ClusterSnapshot('admin')
+        self.assertEqual(snapshot.config_key_get('foo'), 'bar')
+        self.assertEqual(snapshot.config_key_get('foo'), 'bar')
+        self.assertFalse(snapshot.config_key_set('foo', 'bar'))
+        self.assertTrue(snapshot.config_key_set('foo', 'baz'))
+        mock_monitor_key_get.assert_called_once_with(service='admin',
+                                                     key='foo')
+        mock_monitor_key_set.assert_called_once_with(service='admin',
+                                                     key='foo', value='baz')
@@ -0,0 +1,119 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+import charms_ceph.cache as cache
+import charms_ceph.executor as executor
+import charms_ceph.utils as utils
+
+
+class HookCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(cache.disable_hook_cache)
+        self.query = MagicMock(return_value=['rbd'])
+        self.query.__name__ = 'query'
+        self.cached_query = cache.hook_cached(cache.POOLS)(self.query)
+
+    def test_disabled_passes_through(self):
+        self.cached_query('admin')
+        self.cached_query('admin')
+        self.assertEqual(self.query.call_count, 2)
+        self.assertEqual(cache.hook_cache_stats(), {})
+
+    def test_hits_and_misses(self):
+        cache.enable_hook_cache()
+        self.assertEqual(self.cached_query('admin'), ['rbd'])
+        self.assertEqual(self.cached_query('admin'), ['rbd'])
+        self.cached_query(client='glance')
+        self.assertEqual(self.query.call_count, 2)
+        self.assertEqual(cache.hook_cache_stats(),
+                         {'query': {'hits': 1, 'misses': 2}})
+
+    def test_returns_copies(self):
+        cache.enable_hook_cache()
+        self.cached_query('admin').append('glance')
+        self.assertEqual(self.cached_query('admin'), ['rbd'])
+
+    def test_unhashable_args_not_cached(self):
+        cache.enable_hook_cache()
+        self.cached_query({'osd': ['allow r']})
+        self.cached_query({'osd': ['allow r']})
+        self.assertEqual(self.query.call_count, 2)
+
+    def test_exceptions_not_cached(self):
+        cache.enable_hook_cache()
+        self.query.side_effect = [ValueError, ['rbd']]
+        with self.assertRaises(ValueError):
+            self.cached_query('admin')
+        self.assertEqual(self.cached_query('admin'), ['rbd'])
+
+    def test_invalidate_by_tag(self):
+        cache.enable_hook_cache()
+        self.cached_query('admin')
+        cache.invalidate_hook_cache(cache.OSD_TREE)
+        self.cached_query('admin')
+        self.assertEqual(self.query.call_count, 1)
+        cache.invalidate_hook_cache(cache.POOLS)
+        self.cached_query('admin')
+        self.assertEqual(self.query.call_count, 2)
+        self.assertEqual(cache.hook_cache_stats()['query']['invalidations'],
+                         1)
+
+    @patch.object(executor, 'ch_ceph')
+    def test_pool_set_invalidates(self, _ch_ceph):
+        cache.enable_hook_cache()
+        self.cached_query('admin')
+        executor.pool_set('admin', 'rbd', 'size', 3)
+        self.cached_query('admin')
+        self.assertEqual(self.query.call_count, 2)
+
+    @patch.object(cache, 'log')
+    @patch.object(cache.hookenv, 'atexit')
+    def test_stats_logged_at_exit(self, _atexit, _log):
+        cache.enable_hook_cache()
+        cache.enable_hook_cache()
+        _atexit.assert_called_once_with(cache.disable_hook_cache)
+        self.cached_query('admin')
+        self.cached_query('admin')
+        cache.disable_hook_cache()
+        _log.assert_called_once_with(
+            'Hook cache: 1 hits, 1 misses; query 1/1', level=cache.DEBUG)
+        self.assertFalse(cache.hook_cache_enabled())
+        self.assertEqual(cache.hook_cache_stats(), {})
+
+
+class MonStatusCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(cache.disable_hook_cache)
+
+    @patch.object(utils, 'ceph_user', lambda: 'ceph')
+    @patch.object(utils.os.path, 'exists', lambda path: True)
+    @patch.object(utils.subprocess, 'check_output')
+    def test_is_leader_and_is_quorum_share_mon_status(self, _check_output):
+        _check_output.return_value = b'{"state": "leader"}'
+        cache.enable_hook_cache()
+        self.assertTrue(utils.is_quorum())
+        self.assertTrue(utils.is_leader())
+        self.assertTrue(utils.is_leader())
+        _check_output.assert_called_once()
+        _check_output.return_value = b'{"state": "peon"}'
+        utils.invalidate_hook_cache(utils.MON_STATUS)
+        self.assertFalse(utils.is_leader())
+        self.assertTrue(utils.is_quorum())
+        self.assertEqual(_check_output.call_count, 2)
@@ -12,269 +12,56 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+
 import unittest
 
 import charms_ceph.crush_utils
 
-from unittest.mock import patch
-
-
-CRUSHMAP1 = """# begin crush map
-tunable choose_local_tries 0
-tunable choose_local_fallback_tries 0
-tunable choose_total_tries 50
-tunable chooseleaf_descend_once 1
-tunable chooseleaf_vary_r 1
-tunable straw_calc_version 1
-
-# devices
-device 0 osd.0
-device 1 osd.1
-device 2 osd.2
-
-# types
-type 0 osd
-type 1 host
-type 2 chassis
-type 3 rack
-type 4 row
-type 5 pdu
-type 6 pod
-type 7 room
-type 8 datacenter
-type 9 region
-type 10 root
-
-# buckets
-host ip-172-31-33-152 {
-    id -2        # do not change unnecessarily
-    # weight 0.003
-    alg straw
-    hash 0    # rjenkins1
-    item osd.0 weight 0.003
-}
-host ip-172-31-54-117 {
-    id -3        # do not change unnecessarily
-    # weight 0.003
-    alg straw
-    hash 0    # rjenkins1
-    item osd.1 weight 0.003
-}
-host ip-172-31-30-0 {
-    id -4        # do not change unnecessarily
-    # weight 0.003
-    alg straw
-    hash 0    # rjenkins1
-    item osd.2 weight 0.003
-}
-root default {
-    id -1        # do not change unnecessarily
-    # weight 0.009
-    alg straw2
-    hash 0    # rjenkins1
-    item ip-172-31-33-152 weight 0.003
-    item ip-172-31-54-117 weight 0.003
-    item ip-172-31-30-0 weight 0.003
-}
-
-# rules
-rule replicated_ruleset {
-    ruleset 0
-    type replicated
-    min_size 1
-    max_size 10
-    step take default
-    step chooseleaf firstn 0 type host
-    step emit
-}
-
-# end crush map"""
-
-CRUSHMAP2 = """# begin crush map
-tunable choose_local_tries 0
-tunable choose_local_fallback_tries 0
-tunable choose_total_tries 50
-tunable chooseleaf_descend_once 1
-tunable chooseleaf_vary_r 1
-tunable straw_calc_version 1
-
-# devices
-device 0 osd.0
-device 1 osd.1
-device 2 osd.2
-
-# types
-type 0 osd
-type 1 host
-type 2 chassis
-type 3 rack
-type 4 row
-type 5 pdu
-type 6 pod
-type 7 room
-type 8 datacenter
-type 9 region
-type 10 root
-
-# buckets
-host ip-172-31-33-152 {
-    id -2        # do not change unnecessarily
-    # weight 0.003
-    alg straw2
-    hash 0    # rjenkins1
-    item osd.0 weight 0.003
-}
-host ip-172-31-54-117 {
-    id -3        # do not change unnecessarily
-    # weight 0.003
-    alg straw2
-    hash 0    # rjenkins1
-    item osd.1 weight 0.003
-}
-host ip-172-31-30-0 {
-    id -4        # do not change unnecessarily
-    # weight 0.003
-    alg straw2
-    hash 0    # rjenkins1
-    item osd.2 weight 0.003
-}
-root default {
-    id -1        # do not change unnecessarily
-    # weight 0.009
-    alg straw2
-    hash 0    # rjenkins1
-    item ip-172-31-33-152 weight 0.003
-    item ip-172-31-54-117 weight 0.003
-    item ip-172-31-30-0 weight 0.003
-}
-
-# rules
-rule replicated_ruleset {
-    ruleset 0
-    type replicated
-    min_size 1
-    max_size 10
-    step take default
-    step chooseleaf firstn 0 type host
-    step emit
-}
-
-# end crush map"""
-
-CRUSHMAP3 = """# begin crush map
-tunable choose_local_tries 0
-tunable choose_local_fallback_tries 0
-tunable choose_total_tries 50
-tunable chooseleaf_descend_once 1
-tunable chooseleaf_vary_r 1
-tunable straw_calc_version 1
-
-# devices
-device 0 osd.0
-device 1 osd.1
-device 2 osd.2
-
-# types
-type 0 osd
-type 1 host
-type 2 chassis
-type 3 rack
-type 4 row
-type 5 pdu
-type 6 pod
-type 7 room
-type 8 datacenter
-type 9 region
-type 10 root
-
-# buckets
-host ip-172-31-33-152 {
-    id -2        # do not change unnecessarily
-    # weight 0.003
-    alg straw2
-    hash 0    # rjenkins1
-    item osd.0 weight 0.003
-}
-host ip-172-31-54-117 {
-    id -3        # do not change unnecessarily
-    # weight 0.003
-    alg straw2
-    hash 0    # rjenkins1
-    item osd.1 weight 0.003
-}
-host ip-172-31-30-0 {
-    id -4        # do not change unnecessarily
-    # weight 0.003
-    alg straw2
-    hash 0    # rjenkins1
-    item osd.2 weight 0.003
-}
-root default {
-    id -1        # do not change unnecessarily
-    # weight 0.009
-    alg straw2
-    hash 0    # rjenkins1
-    item ip-172-31-33-152 weight 0.003
-    item ip-172-31-54-117 weight 0.003
-    item ip-172-31-30-0 weight 0.003
-}
-
-# rules
-rule replicated_ruleset {
-    ruleset 0
-    type replicated
-    min_size 1
-    max_size 10
-    step take default
-    step chooseleaf firstn 0 type host
-    step emit
+from subprocess import CalledProcessError
+from unittest.mock import call, patch
+
+
+CRUSH_DUMP = {
+    "devices": [
+        {"id": 0, "name": "osd.0", "class": "hdd"},
+        {"id": 1, "name": "osd.1", "class": "hdd"},
+    ],
+    "types": [
+        {"type_id": 0, "name": "osd"},
+        {"type_id": 1, "name": "host"},
+        {"type_id": 3, "name": "rack"},
+        {"type_id": 10, "name": "root"},
+    ],
+    "buckets": [
+        {"id": -1, "name": "default", "type_name": "root",
+         "items": [{"id": -2, "weight": 196, "pos": 0},
+                   {"id": -3, "weight": 0, "pos": 1}]},
+        {"id": -2, "name": "ip-172-31-33-152", "type_name": "host",
+         "items": [{"id": 0, "weight": 196, "pos": 0}]},
+        {"id": -3, "name": "ip-172-31-54-117", "type_name": "host",
+         "items": []},
+        {"id": -4, "name": "rack1", "type_name": "rack", "items": []},
+    ],
+    "rules": [
+        {"rule_id": 0, "rule_name": "replicated_rule"},
+    ],
 }
 
-# end crush map
-
-root test {
-    id -5    # do not change unnecessarily
-    # weight 0.000
-    alg straw2
-    hash 0  # rjenkins1
-}
-
-rule test {
-    ruleset 0
-    type replicated
-    min_size 1
-    max_size 10
-    step take test
-    step chooseleaf firstn 0 type host
-    step emit
-}"""
-
-
-CRUSHMAP4 = """root fast {
-    id -21    # do not change unnecessarily
-    # weight 0.000
-    alg straw2
-    hash 0  # rjenkins1
-}
-
-rule fast {
-    ruleset 0
-    type replicated
-    min_size 1
-    max_size 10
-    step take fast
-    step chooseleaf firstn 0 type host
-    step emit
-}"""
-
 
 class CephCrushmapTests(unittest.TestCase):
     def setUp(self):
         super(CephCrushmapTests, self).setUp()
+        patcher = patch.object(charms_ceph.crush_utils, 'check_call')
+        self.check_call = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(charms_ceph.crush_utils,
+                               'invalidate_hook_cache')
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
     def test_crushmap_buckets(self, load_crushmap):
-        load_crushmap.return_value = ""
+        load_crushmap.return_value = {}
         crushmap = charms_ceph.crush_utils.Crushmap()
         crushmap.add_bucket("test")
         self.assertEqual(
@@ -283,22 +70,204 @@ class CephCrushmapTests(unittest.TestCase):
 
     @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
     def test_parsed_crushmap(self, load_crushmap):
-        load_crushmap.return_value = CRUSHMAP1
+        load_crushmap.return_value = CRUSH_DUMP
         crushmap = charms_ceph.crush_utils.Crushmap()
         self.assertEqual(
             [charms_ceph.crush_utils.CRUSHBucket("default", -1, True)],
             crushmap.buckets())
         self.assertEqual([-4, -3, -2, -1], crushmap._ids)
+        self.assertEqual({'host': 'ip-172-31-33-152', 'root': 'default'},
+                         crushmap.location('osd.0'))
+        self.assertEqual({}, crushmap.location('osd.1'))
+        self.assertIsNone(crushmap.location('osd.2'))
 
     @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
-    def test_build_crushmap(self, load_crushmap):
-        load_crushmap.return_value = CRUSHMAP2
-        expected = CRUSHMAP3
+    def test_ensure_bucket_is_present(self, load_crushmap):
+        load_crushmap.return_value = CRUSH_DUMP
         crushmap = charms_ceph.crush_utils.Crushmap()
-        crushmap.add_bucket("test")
-        self.assertEqual(expected, crushmap.build_crushmap())
+        crushmap.ensure_bucket_is_present('default')
+        self.check_call.assert_not_called()
+        with patch.object(crushmap, 'push_crushmap') as push_crushmap:
+            crushmap.ensure_bucket_is_present('fast')
+            changes = push_crushmap.call_args[0][0]
+        self.assertEqual(
+            [c.crushtool for c in changes],
+            [['--add-bucket', 'fast', 'root'],
+             ['--create-replicated-rule', 'fast', 'fast', 'host']])
+        self.assertEqual(crushmap.buckets()[-1],
+                         charms_ceph.crush_utils.CRUSHBucket('fast', -5))
+        self.assertEqual(crushmap.pending(), [])
+
+    @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
+    def test_pending_changes(self, load_crushmap):
+        load_crushmap.return_value = CRUSH_DUMP
+        crushmap = charms_ceph.crush_utils.Crushmap()
+        crushmap.add_bucket('ip-172-31-33-152', 'host')
+        crushmap.move_bucket('ip-172-31-33-152', {'root': 'default'})
+        crushmap.add_bucket('rack2', 'rack', {'root': 'default'})
+        crushmap.move_bucket('ip-172-31-54-117', {'root': 'default',
+                                                  'rack': 'rack1'})
+        crushmap.move_bucket('ip-172-31-54-117', {'root': 'default',
+                                                  'rack': 'rack2'})
+        self.assertEqual(crushmap.pending(), [
+            ['ceph', 'osd', 'crush', 'add-bucket', 'rack2', 'rack',
+             'root=default'],
+            ['ceph', 'osd', 'crush', 'move', 'ip-172-31-54-117',
+             'rack=rack2', 'root=default'],
+        ])
+        self.assertEqual({'rack': 'rack2', 'root': 'default'},
+                         crushmap.location('ip-172-31-54-117'))
+        self.assertRaises(ValueError, crushmap.move_bucket, 'missing',
+                          {'root': 'default'})
+
+    @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
+    def test_save_single_change(self, load_crushmap):
+        load_crushmap.return_value = CRUSH_DUMP
+        crushmap = charms_ceph.crush_utils.Crushmap()
+        self.assertEqual(crushmap.save(), 0)
+        crushmap.move_bucket('ip-172-31-54-117', {'rack': 'rack1'})
+        self.assertEqual(crushmap.save(), 1)
+        self.check_call.assert_called_once_with(
+            ['ceph', 'osd', 'crush', 'move', 'ip-172-31-54-117',
+             'rack=rack1'])
+
+    @patch.object(charms_ceph.crush_utils, 'check_output')
+    @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
+    def test_save_combined(self, load_crushmap, check_output):
+        load_crushmap.return_value = CRUSH_DUMP
+        check_output.return_value = b'14\n'
+        crushmap = charms_ceph.crush_utils.Crushmap()
+        crushmap.add_bucket('rack2', 'rack', {'root': 'default'})
+        crushmap.move_bucket('ip-172-31-54-117', {'rack': 'rack2'})
+        with patch.object(charms_ceph.crush_utils.tempfile,
+                          'TemporaryDirectory') as tmpdir:
+            tmpdir.return_value.__enter__.return_value = '/tmp/x'
+            self.assertEqual(crushmap.save(), 1)
+        self.check_call.assert_has_calls([
+            call(['crushtool', '-i', '/tmp/x/crushmap.0',
+                  '-o', '/tmp/x/crushmap.1',
+                  '--add-bucket', 'rack2', 'rack', '--loc', 'root',
+                  'default']),
+            call(['crushtool', '-i', '/tmp/x/crushmap.1',
+                  '-o', '/tmp/x/crushmap.2',
+                  '--move', 'ip-172-31-54-117', '--loc', 'rack', 'rack2']),
+            call(['ceph', 'osd', 'setcrushmap', '-i', '/tmp/x/crushmap.2',
+                  '14']),
+        ])
+
+    @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
+    def test_save_combined_falls_back(self, load_crushmap):
+        load_crushmap.return_value = CRUSH_DUMP
+        crushmap = charms_ceph.crush_utils.Crushmap()
+        crushmap.add_bucket('rack2', 'rack', {'root': 'default'})
+        crushmap.move_bucket('ip-172-31-54-117', {'rack': 'rack2'})
+        with patch.object(crushmap, 'push_crushmap') as push_crushmap:
+            push_crushmap.side_effect = CalledProcessError(1, 'setcrushmap')
+            self.assertEqual(crushmap.save(), 2)
+        self.assertEqual(self.check_call.call_count, 2)
+
+    @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
+    def test_set_osd(self, load_crushmap):
+        load_crushmap.return_value = CRUSH_DUMP
+        crushmap = charms_ceph.crush_utils.Crushmap()
+        self.assertEqual(crushmap.weight('osd.0'), 196 / 0x10000)
+        crushmap.set_osd('osd.0', 196 / 0x10000,
+                         {'host': 'ip-172-31-33-152'})
+        crushmap.set_osd(1, 0.5, {'host': 'ip-172-31-33-152'})
+        crushmap.set_osd('osd.0', 0.5, {'host': 'ip-172-31-54-117'})
+        crushmap.set_osd('osd.0', 196 / 0x10000,
+                         {'host': 'ip-172-31-33-152'})
+        self.assertEqual(crushmap.pending(), [
+            ['ceph', 'osd', 'crush', 'set', '1', '0.5',
+             'host=ip-172-31-33-152'],
+        ])
+        self.assertEqual({'host': 'ip-172-31-33-152', 'root': 'default'},
+                         crushmap.location('osd.1'))
 
-    def test_crushmap_string(self):
-        result = charms_ceph.crush_utils.Crushmap.bucket_string("fast", -21)
-        expected = CRUSHMAP4
-        self.assertEqual(expected, result)
+    @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
+    def test_rule_device_class(self, load_crushmap):
+        load_crushmap.return_value = dict(CRUSH_DUMP, rules=[
+            {'rule_id': 0, 'rule_name': 'replicated_rule',
+             'steps': [{'op': 'take', 'item': -1, 'item_name': 'default'},
+                       {'op': 'emit'}]},
+            {'rule_id': 1, 'rule_name': 'fast',
+             'steps': [{'op': 'take', 'item': -5,
+                        'item_name': 'default~ssd'},
+                       {'op': 'emit'}]}])
+        crushmap = charms_ceph.crush_utils.Crushmap()
+        self.assertEqual(crushmap.rule_device_class(1), 'ssd')
+        self.assertEqual(crushmap.rule_device_class('fast'), 'ssd')
+        self.assertIsNone(crushmap.rule_device_class(0))
+        self.assertIsNone(crushmap.rule_device_class(7))
+
+    @patch.object(charms_ceph.crush_utils, 'check_output')
+    @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
+    def test_set_failure_domain(self, load_crushmap, check_output):
+        dump = dict(CRUSH_DUMP, rules=[
+            {'rule_id': 0, 'rule_name': 'replicated_rule',
+             'steps': [{'op': 'take', 'item': -1},
+                       {'op': 'chooseleaf_firstn', 'num': 0,
+                        'type': 'host'},
+                       {'op': 'emit'}]},
+            {'rule_id': 1, 'rule_name': 'ec',
+             'steps': [{'op': 'take', 'item': -1},
+                       {'op': 'chooseleaf_indep', 'num': 0,
+                        'type': 'host'},
+                       {'op': 'emit'}]}])
+        load_crushmap.return_value = dump
+        check_output.side_effect = [
+            b'14',
+            (b'step chooseleaf firstn 0 type host\n'
+             b'step chooseleaf indep 0 type host\n'),
+            b'', b'']
+        crushmap = charms_ceph.crush_utils.Crushmap()
+        self.assertEqual(crushmap.rules_choosing('host'),
+                         ['ec', 'replicated_rule'])
+        crushmap.set_failure_domain('host', 'rack')
+        crushmap.set_failure_domain('host', 'rack')
+        # Erasure coded rules are left alone, as the edit leaves them.
+        self.assertEqual(crushmap.rules_choosing('rack'),
+                         ['replicated_rule'])
+        self.assertEqual(crushmap.rules_choosing('host'), ['ec'])
+        with patch.object(charms_ceph.crush_utils.tempfile,
+                          'TemporaryDirectory') as tmpdir:
+            tmpdir.return_value.__enter__.return_value = '/tmp/x'
+            self.assertEqual(crushmap.save(), 1)
+        check_output.assert_any_call(
+            ['crushtool', '-c', '/dev/stdin', '-o', '/tmp/x/crushmap.1'],
+            input=(b'step chooseleaf firstn 0 type rack\n'
+                   b'step chooseleaf indep 0 type host\n'))
+        self.check_call.assert_called_once_with(
+            ['ceph', 'osd', 'setcrushmap', '-i', '/tmp/x/crushmap.1', '14'])
+
+    @patch.object(charms_ceph.crush_utils, 'check_output')
+    @patch.object(charms_ceph.crush_utils.Crushmap, 'load_crushmap')
+    def test_set_failure_domain_unchanged(self, load_crushmap, check_output):
+        load_crushmap.return_value = dict(CRUSH_DUMP, rules=[
+            {'rule_id': 0, 'rule_name': 'replicated_rule',
+             'steps': [{'op': 'take', 'item': -1},
+                       {'op': 'chooseleaf_firstn', 'num': 0,
+                        'type': 'rack'},
+                       {'op': 'emit'}]},
+            {'rule_id': 1, 'rule_name': 'ec',
+             'steps': [{'op': 'take', 'item': -1},
+                       {'op': 'chooseleaf_indep', 'num': 0,
+                        'type': 'host'},
+                       {'op': 'emit'}]}])
+        crushmap = charms_ceph.crush_utils.Crushmap()
+        crushmap.set_failure_domain('host', 'rack')
+        self.assertEqual(crushmap.save(), 0)
+        check_output.assert_not_called()
+
+        # An edit the map turns out to have already is not pushed.
+        load_crushmap.return_value['rules'][0]['steps'][1]['type'] = 'host'
+        check_output.side_effect = [
+            b'15', b'step chooseleaf firstn 0 type rack\n']
+        crushmap = charms_ceph.crush_utils.Crushmap()
+        crushmap.set_failure_domain('host', 'rack')
+        with patch.object(charms_ceph.crush_utils.tempfile,
+                          'TemporaryDirectory') as tmpdir:
+            tmpdir.return_value.__enter__.return_value = '/tmp/x'
+            self.assertEqual(crushmap.save(), 0)
+        self.assertEqual(check_output.call_count, 2)
+        self.check_call.assert_not_called()
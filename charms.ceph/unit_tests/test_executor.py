@@ -0,0 +1,171 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import subprocess
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+import charms_ceph.executor as executor
+import charms_ceph.utils as utils
+
+
+class FakeRadosError(Exception):
+    pass
+
+
+def fake_rados_module():
+    mod = MagicMock()
+    mod.Error = FakeRadosError
+    return mod
+
+
+class CephCommandExecutorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rados = fake_rados_module()
+        self.cluster = self.rados.Rados.return_value
+        patcher = patch.object(executor, 'rados', self.rados)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(executor.subprocess, 'check_output')
+    def test_cli_fallback_without_librados(self, _check_output):
+        _check_output.return_value = b'[0, 1, 2]'
+        with patch.object(executor, 'rados', None):
+            ex = executor.CephCommandExecutor(service='admin')
+            self.assertEqual(ex.get_osds(), [0, 1, 2])
+        _check_output.assert_called_once_with(
+            ['ceph', '--id', 'admin', 'osd', 'ls', '--format=json'])
+        self.assertEqual(ex.calls, {'cli': 1})
+
+    def test_mon_command_over_librados(self):
+        self.cluster.mon_command.return_value = (0, b'[3, 4]', '')
+        ex = executor.CephCommandExecutor(service='admin')
+        self.assertEqual(ex.get_osds(device_class='ssd'), [3, 4])
+        self.rados.Rados.assert_called_once_with(
+            conffile='/etc/ceph/ceph.conf', rados_id='admin')
+        cmd, inbuf = self.cluster.mon_command.call_args[0]
+        self.assertEqual(json.loads(cmd), {'prefix': 'osd crush class ls-osd',
+                                           'class': 'ssd',
+                                           'format': 'json'})
+        self.assertEqual(ex.calls, {'librados': 1})
+
+    def test_connection_is_reused(self):
+        self.cluster.mon_command.return_value = (0, b'', '')
+        self.cluster.pool_exists.return_value = True
+        ex = executor.CephCommandExecutor(service='admin')
+        ex.pool_set('rbd', 'size', 3)
+        self.assertTrue(ex.pool_exists('rbd'))
+        ex.config_key_set('foo', 'bar')
+        self.cluster.connect.assert_called_once_with(timeout=30)
+        self.assertEqual(ex.calls, {'librados': 3})
+        ex.shutdown()
+        self.cluster.shutdown.assert_called_once_with()
+        self.assertFalse(ex.connected)
+
+    def test_mon_command_error(self):
+        self.cluster.mon_command.return_value = (-13, b'', 'access denied')
+        ex = executor.CephCommandExecutor(service='admin')
+        with self.assertRaises(subprocess.CalledProcessError) as ctx:
+            ex.pool_set('rbd', 'size', 3)
+        self.assertEqual(ctx.exception.returncode, 13)
+        self.assertEqual(ctx.exception.output, 'access denied')
+
+    def test_config_key_exists(self):
+        ex = executor.CephCommandExecutor(service='admin')
+        self.cluster.mon_command.return_value = (0, b'', '')
+        self.assertTrue(ex.config_key_exists('foo'))
+        self.cluster.mon_command.return_value = (-2, b'', 'not found')
+        self.assertFalse(ex.config_key_exists('foo'))
+        self.cluster.mon_command.return_value = (-13, b'', 'denied')
+        with self.assertRaises(subprocess.CalledProcessError):
+            ex.config_key_exists('foo')
+
+    def test_enabled_manager_modules(self):
+        self.cluster.mon_command.return_value = (
+            0, b'{"enabled_modules": ["dashboard", "prometheus"]}', '')
+        ex = executor.CephCommandExecutor(service='admin')
+        self.assertEqual(ex.enabled_manager_modules(),
+                         ['dashboard', 'prometheus'])
+        cmd, inbuf = self.cluster.mon_command.call_args[0]
+        self.assertEqual(json.loads(cmd), {'prefix': 'mgr module ls',
+                                           'format': 'json'})
+        self.cluster.mgr_command.assert_not_called()
+
+    def test_config_key_get_missing(self):
+        self.cluster.mon_command.return_value = (-2, b'', 'not found')
+        ex = executor.CephCommandExecutor(service='admin')
+        self.assertIsNone(ex.config_key_get('foo'))
+
+    @patch.object(executor.subprocess, 'check_output')
+    def test_monitor_key_dump_without_executor(self, _check_output):
+        _check_output.return_value = b'{"osd_a_squid_done": "1"}'
+        self.assertEqual(executor.monitor_key_dump('osd-upgrade', 'osd_'),
+                         {'osd_a_squid_done': '1'})
+        _check_output.assert_called_once_with(
+            ['ceph', '--id', 'osd-upgrade', 'config-key', 'dump', 'osd_',
+             '--format=json'])
+
+    @patch.object(executor.subprocess, 'check_output')
+    def test_connect_failure_falls_back_to_cli(self, _check_output):
+        self.cluster.connect.side_effect = FakeRadosError('no mons')
+        _check_output.return_value = b'rbd\nglance\n'
+        ex = executor.CephCommandExecutor(service='admin')
+        self.assertEqual(ex.list_pools(), ['rbd', 'glance'])
+        self.assertTrue(ex.pool_exists('glance'))
+        self.cluster.connect.assert_called_once_with(timeout=30)
+        _check_output.assert_called_with(['rados', '--id', 'admin',
+                                          'lspools'])
+
+
+class ExecutorRegistrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(executor.disable)
+
+    def test_get_executor_matches_service(self):
+        self.assertIsNone(executor.get_executor())
+        ex = executor.enable('admin')
+        self.assertIs(executor.enable('admin'), ex)
+        self.assertIs(executor.get_executor(), ex)
+        self.assertIs(executor.get_executor('admin'), ex)
+        self.assertIsNone(executor.get_executor('glance'))
+        executor.disable()
+        self.assertIsNone(executor.get_executor())
+
+    @patch.object(executor, 'ch_ceph')
+    def test_helpers_delegate_to_charmhelpers(self, _ch_ceph):
+        executor.pool_exists('admin', 'rbd')
+        _ch_ceph.pool_exists.assert_called_once_with('admin', 'rbd')
+        executor.monitor_key_get('admin', 'foo')
+        _ch_ceph.monitor_key_get.assert_called_once_with('admin', 'foo')
+
+    @patch.object(executor, 'ch_ceph')
+    def test_helpers_use_executor(self, _ch_ceph):
+        ex = executor.enable('admin')
+        ex.pool_exists = MagicMock(return_value=True)
+        self.assertTrue(executor.pool_exists('admin', 'rbd'))
+        ex.pool_exists.assert_called_once_with('rbd')
+        _ch_ceph.pool_exists.assert_not_called()
+        executor.pool_exists('glance', 'rbd')
+        _ch_ceph.pool_exists.assert_called_once_with('glance', 'rbd')
+
+    @patch.object(utils.subprocess, 'check_output')
+    def test_utils_list_pools(self, _check_output):
+        ex = executor.enable('admin')
+        ex.list_pools = MagicMock(return_value=['rbd'])
+        self.assertEqual(utils.list_pools(), ['rbd'])
+        _check_output.assert_not_called()
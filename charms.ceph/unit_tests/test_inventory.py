@@ -0,0 +1,107 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import subprocess
+import unittest
+
+from unittest.mock import mock_open, patch
+
+import charms_ceph.inventory as inventory
+
+LSBLK = {'blockdevices': [
+    {'name': '/dev/sda', 'type': 'disk', 'fstype': None,
+     'mountpoint': None, 'parttype': None, 'children': [
+         {'name': '/dev/sda1', 'type': 'part', 'fstype': 'ext4',
+          'mountpoint': '/', 'parttype': None}]},
+    {'name': '/dev/sdb', 'type': 'disk', 'fstype': 'LVM2_member',
+     'mountpoint': None, 'parttype': None, 'children': [
+         {'name': '/dev/mapper/ceph--vg-osd--block', 'type': 'lvm',
+          'fstype': None, 'mountpoint': None, 'parttype': None}]},
+    {'name': '/dev/sdc', 'type': 'disk', 'fstype': 'crypto_LUKS',
+     'mountpoint': None, 'parttype': None},
+    {'name': '/dev/sdd', 'type': 'disk', 'fstype': None,
+     'mountpoint': None, 'parttype': None, 'children': [
+         {'name': '/dev/sdd1', 'type': 'part', 'fstype': 'xfs',
+          'mountpoint': None,
+          'parttype': '4FBD7E29-9D25-41B8-AFD0-062C0CEFF05D'}]},
+    {'name': '/dev/loop0', 'type': 'loop', 'fstype': None,
+     'mountpoint': None, 'parttype': None},
+]}
+PVS = {'report': [{'pv': [{'pv_name': '/dev/sdb', 'vg_name': 'ceph-vg'}]}]}
+LVS = {'report': [{'lv': [{'lv_name': 'osd-block', 'vg_name': 'ceph-vg'}]}]}
+
+
+def fake_check_output(cmd):
+    return json.dumps({'lsblk': LSBLK, 'pvs': PVS, 'lvs': LVS}[cmd[0]]
+                      ).encode('UTF-8')
+
+
+@patch.object(inventory.os.path, 'realpath', lambda path: path)
+@patch.object(inventory, 'kv', lambda: {})
+@patch.object(inventory, 'log', lambda *args, **kwargs: None)
+@patch.object(inventory, 'open', mock_open(read_data='/dev/sda1 / ext4 rw\n'),
+              create=True)
+@patch.object(inventory.os, 'readlink',
+              lambda path: '/dev/ceph-vg/osd-block')
+@patch.object(inventory.os.path, 'islink', lambda path: True)
+@patch.object(inventory.glob, 'glob',
+              lambda pattern: ['/var/lib/ceph/osd/ceph-0/block'])
+@patch.object(inventory.os, 'listdir',
+              lambda path: ['dm-1'] if '/sdc/' in path else [])
+@patch.object(inventory, 'utils')
+class BlockDeviceInventoryTestCase(unittest.TestCase):
+
+    @patch.object(inventory.subprocess, 'check_output')
+    def test_predicates(self, _check_output, _utils):
+        _check_output.side_effect = fake_check_output
+        inv = inventory.BlockDeviceInventory()
+        self.assertEqual(_check_output.call_count, 3)
+        self.assertEqual(len(inv.devices), 8)
+
+        self.assertTrue(inv.is_device_mounted('/dev/sda'))
+        self.assertFalse(inv.is_device_mounted('/dev/sdb'))
+        self.assertTrue(inv.is_active_bluestore_device('/dev/sdb'))
+        self.assertFalse(inv.is_active_bluestore_device('/dev/sdc'))
+        self.assertTrue(inv.is_mapped_luks_device('/dev/sdc'))
+        self.assertFalse(inv.is_mapped_luks_device('/dev/sdb'))
+        self.assertTrue(inv.is_osd_disk('/dev/sdd'))
+        self.assertFalse(inv.is_osd_disk('/dev/sdb'))
+        self.assertEqual(inv.unmounted_disks(),
+                         ['/dev/sdb', '/dev/sdc', '/dev/sdd'])
+        self.assertEqual(_check_output.call_count, 3)
+        _utils.is_device_mounted.assert_not_called()
+        _utils.is_osd_disk.assert_not_called()
+
+        inv.is_pristine_disk('/dev/sdc')
+        inv.is_pristine_disk('/dev/sdc')
+        _utils.is_pristine_disk.assert_called_once_with('/dev/sdc')
+
+    @patch.object(inventory.subprocess, 'check_output')
+    def test_unknown_device_falls_back(self, _check_output, _utils):
+        _check_output.side_effect = fake_check_output
+        inv = inventory.BlockDeviceInventory()
+        inv.is_device_mounted('/dev/vdz')
+        _utils.is_device_mounted.assert_called_once_with('/dev/vdz')
+
+    @patch.object(inventory.subprocess, 'check_output')
+    def test_scan_failure_falls_back(self, _check_output, _utils):
+        _check_output.side_effect = subprocess.CalledProcessError(1, 'lsblk')
+        inv = inventory.BlockDeviceInventory()
+        for name in ('is_device_mounted', 'is_active_bluestore_device',
+                     'is_mapped_luks_device', 'is_osd_disk'):
+            getattr(inv, name)('/dev/sdb')
+            getattr(_utils, name).assert_called_once_with('/dev/sdb')
+        inv.unmounted_disks()
+        _utils.unmounted_disks.assert_called_once_with()
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import subprocess
 import sys
 import time
 import unittest
@@ -391,8 +392,11 @@ class UpgradeRollingTestCase(unittest.TestCase):
     @patch.object(charms_ceph.utils, 'time')
     @patch.object(charms_ceph.utils, 'monitor_key_get')
     @patch.object(charms_ceph.utils, 'monitor_key_exists')
-    def test_wait_on_previous_node(self, monitor_key_exists, monitor_key_get,
-                                   mock_time, log):
+    @patch.object(charms_ceph.utils, 'monitor_key_dump')
+    def test_wait_on_previous_node(self, monitor_key_dump, monitor_key_exists,
+                                   monitor_key_get, mock_time, log):
+        # Keys predating the 'config-key dump' cap fall back to single reads
+        monitor_key_dump.side_effect = subprocess.CalledProcessError(13, [])
         tval = [previous_node_start_time]
 
         def fake_time():
@@ -428,3 +432,38 @@ class UpgradeRollingTestCase(unittest.TestCase):
         )
 
         self.assertGreaterEqual(tval[0], previous_node_start_time + 600)
+
+    @patch.object(charms_ceph.utils, 'log')
+    @patch.object(charms_ceph.utils, 'time')
+    @patch.object(charms_ceph.utils, 'monitor_key_get')
+    @patch.object(charms_ceph.utils, 'monitor_key_exists')
+    @patch.object(charms_ceph.utils, 'monitor_key_dump')
+    def test_wait_on_previous_nodes_bulk(self, monitor_key_dump,
+                                         monitor_key_exists, monitor_key_get,
+                                         mock_time, log):
+        mock_time.time.return_value = 1000.0
+        started = {'osd_a_squid_start': '990', 'osd_b_squid_start': '995'}
+        monitor_key_dump.side_effect = [
+            {'osd_a_squid_start': '990'},
+            started,
+            dict(started, osd_a_squid_alive='998', osd_b_squid_alive='999'),
+            dict(started, osd_a_squid_done='1000', osd_b_squid_alive='999'),
+            dict(started, osd_a_squid_done='1000', osd_b_squid_done='1001'),
+        ]
+        charms_ceph.utils.wait_on_previous_nodes(
+            upgrade_key='osd-upgrade', service='osd',
+            previous_nodes=['a', 'b'], version='squid')
+        self.assertEqual(monitor_key_dump.call_count, 5)
+        monitor_key_dump.assert_called_with('osd-upgrade', 'osd_')
+        monitor_key_exists.assert_not_called()
+        monitor_key_get.assert_not_called()
+        self.assertEqual(mock_time.sleep.call_count, 3)
+
+    def test_upgrade_progress_kicked_at(self):
+        progress = charms_ceph.utils.UpgradeProgress(
+            'osd-upgrade', 'osd', ['a', 'b'], 'squid')
+        progress._keys = {'osd_a_squid_alive': '10',
+                          'osd_b_squid_alive': '5', 'osd_b_squid_done': '6'}
+        self.assertEqual(progress.kicked_at(), '10')
+        progress._keys = {'osd_a_squid_alive': '10'}
+        self.assertIsNone(progress.kicked_at())
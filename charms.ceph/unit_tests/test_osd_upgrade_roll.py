@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import os
 import sys
 import time
@@ -360,15 +361,15 @@ class UpgradeRollingTestCase(unittest.TestCase):
     @patch.object(charms_ceph.utils, 'status_set')
     @patch.object(charms_ceph.utils, 'lock_and_roll')
     @patch.object(charms_ceph.utils, 'get_upgrade_position')
-    @patch.object(charms_ceph.utils, 'wait_on_previous_node')
+    @patch.object(charms_ceph.utils, 'wait_on_previous_nodes')
     def test_roll_osd_cluster_second(self,
-                                     wait_on_previous_node,
+                                     wait_on_previous_nodes,
                                      get_upgrade_position,
                                      lock_and_roll,
                                      status_set,
                                      socket,
                                      get_osd_tree):
-        wait_on_previous_node.return_value = None
+        wait_on_previous_nodes.return_value = None
         socket.gethostname.return_value = "ip-192-168-1-3"
         get_osd_tree.return_value = [
             charms_ceph.utils.CrushLocation(
@@ -397,11 +398,106 @@ class UpgradeRollingTestCase(unittest.TestCase):
         status_set.assert_called_with(
             'waiting',
             'Waiting on ip-192-168-1-2 to finish upgrading')
+        wait_on_previous_nodes.assert_called_once_with(
+            upgrade_key='osd-upgrade',
+            service='osd',
+            previous_nodes=['ip-192-168-1-2'],
+            version='0.94.1')
         lock_and_roll.assert_called_with(my_name='ip-192-168-1-3',
                                          service='osd',
                                          upgrade_key='osd-upgrade',
                                          version='0.94.1')
 
+    def _crush_locations(self, racks):
+        return [
+            charms_ceph.utils.CrushLocation(
+                name=name, identifier=name, host=name, rack=rack,
+                root='default')
+            for name, rack in sorted(racks.items())]
+
+    def test_get_upgrade_waves(self):
+        hosts = self._crush_locations({
+            'host-a1': 'rack-a', 'host-a2': 'rack-a', 'host-a3': 'rack-a',
+            'host-b1': 'rack-b', 'host-c1': ''})
+        self.assertEqual(
+            charms_ceph.utils.get_upgrade_waves(hosts, 'rack', 2),
+            [['host-a1', 'host-a2'], ['host-a3'], ['host-b1'], ['host-c1']])
+        self.assertEqual(
+            charms_ceph.utils.get_upgrade_waves(hosts, 'host', 2),
+            [[host.name] for host in hosts])
+        self.assertEqual(
+            charms_ceph.utils.get_upgrade_waves(hosts, 'rack', 1),
+            [[host.name] for host in hosts])
+
+    @patch.object(charms_ceph.utils, 'get_executor', lambda service: None)
+    @patch('subprocess.check_output')
+    def test_get_crush_failure_domain(self, check_output):
+        rules = [
+            {'rule_name': 'replicated_rule',
+             'steps': [{'op': 'take', 'item_name': 'default'},
+                       {'op': 'chooseleaf_firstn', 'num': 0,
+                        'type': 'rack'},
+                       {'op': 'emit'}]},
+            {'rule_name': 'ec',
+             'steps': [{'op': 'take', 'item_name': 'default'},
+                       {'op': 'choose_indep', 'num': 3, 'type': 'row'},
+                       {'op': 'chooseleaf_indep', 'num': 2,
+                        'type': 'chassis'},
+                       {'op': 'emit'}]},
+        ]
+        check_output.return_value = json.dumps(rules).encode()
+        self.assertEqual(
+            charms_ceph.utils.get_crush_failure_domain('osd-upgrade'),
+            'chassis')
+        check_output.assert_called_once_with(
+            ['ceph', '--id', 'osd-upgrade', 'osd', 'crush', 'rule', 'dump',
+             '--format=json'])
+        rules[1]['steps'][2]['type'] = 'custom'
+        check_output.return_value = json.dumps(rules).encode()
+        self.assertEqual(
+            charms_ceph.utils.get_crush_failure_domain('osd-upgrade'),
+            'host')
+
+    @patch.object(charms_ceph.utils, 'get_crush_failure_domain')
+    @patch.object(charms_ceph.utils, 'get_osd_tree')
+    @patch.object(charms_ceph.utils, 'socket')
+    @patch.object(charms_ceph.utils, 'status_set')
+    @patch.object(charms_ceph.utils, 'lock_and_roll')
+    @patch.object(charms_ceph.utils, 'wait_on_previous_nodes')
+    def test_roll_osd_cluster_concurrent(self,
+                                         wait_on_previous_nodes,
+                                         lock_and_roll,
+                                         status_set,
+                                         socket,
+                                         get_osd_tree,
+                                         get_crush_failure_domain):
+        get_osd_tree.return_value = self._crush_locations({
+            'host-a1': 'rack-a', 'host-a2': 'rack-a',
+            'host-b1': 'rack-b', 'host-b2': 'rack-b'})
+        get_crush_failure_domain.return_value = 'rack'
+
+        socket.gethostname.return_value = 'host-a2'
+        charms_ceph.utils.roll_osd_cluster(new_version='squid',
+                                           upgrade_key='osd-upgrade',
+                                           concurrency=2)
+        wait_on_previous_nodes.assert_not_called()
+        lock_and_roll.assert_called_once_with(my_name='host-a2',
+                                              service='osd',
+                                              upgrade_key='osd-upgrade',
+                                              version='squid')
+
+        socket.gethostname.return_value = 'host-b1'
+        charms_ceph.utils.roll_osd_cluster(new_version='squid',
+                                           upgrade_key='osd-upgrade',
+                                           concurrency=2)
+        status_set.assert_called_with(
+            'waiting', 'Waiting on host-a1, host-a2 to finish upgrading')
+        wait_on_previous_nodes.assert_called_once_with(
+            upgrade_key='osd-upgrade',
+            service='osd',
+            previous_nodes=['host-a1', 'host-a2'],
+            version='squid')
+
     @patch('os.path.exists')
     @patch('os.listdir')
     @patch('os.path.isdir')
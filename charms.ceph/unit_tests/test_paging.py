@@ -0,0 +1,63 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from charms_ceph import paging
+
+
+POOLS = [
+    {'pool': 1, 'pool_name': 'rbd', 'size': 3, 'options': {'a': 1, 'b': 2}},
+    {'pool': 2, 'pool_name': 'glance', 'size': 3, 'options': {}},
+    {'pool': 3, 'pool_name': 'cinder-ceph', 'size': 2},
+]
+
+
+class PagingTestCase(unittest.TestCase):
+
+    def test_parse_fields(self):
+        self.assertIsNone(paging.parse_fields(None))
+        self.assertIsNone(paging.parse_fields(''))
+        self.assertEqual(paging.parse_fields('pool_name, options.a,'),
+                         ['pool_name', 'options.a'])
+
+    def test_project(self):
+        self.assertEqual(
+            paging.project(POOLS[0], ['pool_name', 'options.a', 'missing',
+                                      'size.x']),
+            {'pool_name': 'rbd', 'options': {'a': 1}})
+        self.assertEqual(paging.project('client.admin', ['name']),
+                         'client.admin')
+
+    def test_select(self):
+        page = paging.select(POOLS)
+        self.assertEqual(page, paging.Page(POOLS, 3, None))
+        page = paging.select(POOLS, offset=1, limit=1,
+                             key=lambda p: p['pool_name'],
+                             fields=['pool'])
+        self.assertEqual(page, paging.Page([{'pool': 2}], 3, 2))
+        page = paging.select(POOLS, pattern='*e*',
+                             key=lambda p: p['pool_name'], fields=['pool'])
+        self.assertEqual(page, paging.Page([{'pool': 2}, {'pool': 3}], 2,
+                                           None))
+        page = paging.select(['a', 'b'], offset=5)
+        self.assertEqual(page, paging.Page([], 2, None))
+        self.assertRaises(ValueError, paging.select, POOLS, limit=-1)
+
+    def test_results(self):
+        self.assertEqual(paging.results(paging.Page([1], 3, 1), '[1]'),
+                         {'message': '[1]', 'total': 3, 'next-offset': 1})
+        self.assertEqual(paging.results(paging.Page([], 0, None), ''),
+                         {'message': '', 'total': 0})
+        self.assertEqual(paging.dumps({'a': [1, 2]}), '{"a":[1,2]}')
@@ -0,0 +1,75 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from charms_ceph.pg_planner import (
+    ExistingPool,
+    PoolSpec,
+    LEGACY_PG_COUNT,
+    plan_pgs,
+    round_pgs,
+)
+
+
+class PGPlannerTestCase(unittest.TestCase):
+
+    def test_round_pgs(self):
+        self.assertEqual(round_pgs(0), 2)
+        self.assertEqual(round_pgs(100), 128)
+        self.assertEqual(round_pgs(333), 256)
+        self.assertEqual(round_pgs(400), 512)
+
+    def test_single_pool_matches_get_pgs(self):
+        plan = plan_pgs([PoolSpec('rbd', 3, 10.0)], {None: 30})
+        self.assertEqual(plan.get('rbd'), 128)
+        self.assertEqual(plan.projected_pgs_per_osd, {None: 128 * 3 / 30})
+        self.assertEqual(plan.oversubscribed(), [])
+
+    def test_weights_scaled_to_cluster(self):
+        pools = [PoolSpec(name, 3, 40.0) for name in ('a', 'b', 'c')]
+        plan = plan_pgs(pools, {None: 30})
+        self.assertEqual(plan.pg_nums, {'a': 256, 'b': 256, 'c': 256})
+        self.assertAlmostEqual(plan.weight_scale[None], 100 / 120)
+
+        # Existing pools claim their target_size_ratio first.
+        plan = plan_pgs(
+            pools[:1], {None: 30},
+            existing=[ExistingPool('d', 3, 512, target_size_ratio=0.8)])
+        self.assertAlmostEqual(plan.weight_scale[None], 100 / 120)
+        self.assertEqual(plan.projected_pgs_per_osd[None],
+                         (256 * 3 + 512 * 3) / 30)
+
+    def test_pg_num_and_device_class(self):
+        plan = plan_pgs(
+            [PoolSpec('big', 3, pg_num=4096),
+             PoolSpec('small', 3, pg_num=16),
+             PoolSpec('ec', 6, 50.0, device_class='ssd')],
+            {None: 30, 'ssd': 6}, expected_osd_count=60)
+        self.assertEqual(plan.pg_nums, {'big': 2048, 'small': 16, 'ec': 64})
+        self.assertEqual(plan.projected_pgs_per_osd['ssd'], 64)
+
+    def test_oversubscribed(self):
+        plan = plan_pgs([PoolSpec('a', 3, 100.0)], {None: 3},
+                        existing=[ExistingPool('b', 3, 256)],
+                        pgs_per_osd=200)
+        self.assertEqual(plan.oversubscribed(), [None])
+        self.assertEqual(plan.to_dict(), {
+            'pools': {'a': 256},
+            'projected-pgs-per-osd': {'all': 512.0}})
+
+    def test_no_osds(self):
+        plan = plan_pgs([PoolSpec('a', 3), PoolSpec('b', 3, pg_num=8)], {})
+        self.assertEqual(plan.pg_nums, {'a': LEGACY_PG_COUNT, 'b': 8})
+        self.assertEqual(plan.projected_pgs_per_osd, {})
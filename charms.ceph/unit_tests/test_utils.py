@@ -13,7 +13,10 @@
 # limitations under the License.
 
 import collections
+import json
 import subprocess
+import threading
+import time
 import unittest
 
 from unittest.mock import (
@@ -27,6 +30,16 @@ import charms_ceph.utils as utils
 
 from subprocess import CalledProcessError
 
+AUTH_LS = json.dumps({'auth_dump': [
+    {'entity': 'client.admin', 'key': 'adminkey',
+     'caps': {'mds': 'allow *', 'mgr': 'allow *', 'mon': 'allow *',
+              'osd': 'allow *'}},
+    {'entity': 'client.glance', 'key': 'glancekey',
+     'caps': {'mon': 'allow r', 'osd': 'allow rwx pool=glance'}},
+    {'entity': 'client.osd-upgrade', 'key': 'upgradekey',
+     'caps': {'mon': '; '.join(utils.osd_upgrade_caps['mon'])}},
+]}).encode('UTF-8')
+
 
 class TestDevice():
     """Test class to mock out pyudev Device"""
@@ -216,6 +229,41 @@ class CephTestCase(unittest.TestCase):
         db.get.assert_called_with('osd-devices', [])
         db.set.assert_called_with('osd-devices', ['/dev/sdb'])
 
+    @patch.object(utils.os.path, 'exists', lambda path: True)
+    @patch.object(utils, 'is_block_device', lambda dev: True)
+    @patch.object(utils, 'cmp_pkgrevno', lambda pkg, rev: 1)
+    @patch.object(utils, '_ceph_volume')
+    @patch.object(utils, 'is_mapped_luks_device')
+    @patch.object(utils, 'is_active_bluestore_device')
+    @patch.object(utils, 'is_device_mounted')
+    @patch.object(utils, 'is_osd_disk')
+    def test_osdize_dev_cmd_with_inventory(self, _is_osd, _mounted,
+                                           _bluestore, _luks, _ceph_volume):
+        """The device checks are answered by the inventory"""
+        inventory = MagicMock()
+        inventory.is_osd_disk.return_value = False
+        inventory.is_device_mounted.return_value = False
+        inventory.is_active_bluestore_device.return_value = False
+        inventory.is_mapped_luks_device.return_value = False
+        osd_devices = []
+        self.assertEqual(
+            utils._osdize_dev_cmd('/dev/sdb', 'xfs', None, osd_devices,
+                                  inventory=inventory),
+            _ceph_volume.return_value)
+        for check in (inventory.is_osd_disk, inventory.is_device_mounted,
+                      inventory.is_active_bluestore_device,
+                      inventory.is_mapped_luks_device):
+            check.assert_called_once_with('/dev/sdb')
+        for check in (_is_osd, _mounted, _bluestore, _luks):
+            check.assert_not_called()
+
+        inventory.is_active_bluestore_device.return_value = True
+        self.assertIsNone(
+            utils._osdize_dev_cmd('/dev/sdb', 'xfs', None, osd_devices,
+                                  inventory=inventory))
+        self.assertEqual(osd_devices, ['/dev/sdb'])
+        _bluestore.assert_not_called()
+
     @patch.object(utils, 'kv')
     @patch.object(utils.subprocess, 'check_call')
     @patch.object(utils, '_ceph_volume')
@@ -551,14 +599,14 @@ class CephTestCase(unittest.TestCase):
     @patch.object(utils, "ceph_user", lambda: "ceph")
     @patch.object(utils.socket, "gethostname", lambda: "osd001")
     def test_get_named_key_with_pool(self, mock_check_output):
-        mock_check_output.side_effect = [CalledProcessError(0, 0, 0), b""]
-        utils.ceph_auth_get.cache_clear()
+        mock_check_output.side_effect = [AUTH_LS, b"key=rgwkey"]
+        utils.reset_key_registry()
         utils.get_named_key(name="rgw001", pool_list=["rbd", "block"])
         mock_check_output.assert_has_calls([
             call(['sudo', '-u', 'ceph', 'ceph', '--name',
                   'mon.', '--keyring',
                   '/var/lib/ceph/mon/ceph-osd001/keyring',
-                  'auth', 'get', 'client.rgw001']),
+                  'auth', 'ls', '--format', 'json']),
             call(['sudo', '-u', 'ceph', 'ceph', '--name',
                   'mon.', '--keyring',
                   '/var/lib/ceph/mon/ceph-osd001/keyring',
@@ -566,18 +614,21 @@ class CephTestCase(unittest.TestCase):
                   'mon', ('allow r; allow command "osd blacklist"'
                           '; allow command "osd blocklist"'),
                   'osd', 'allow rwx pool=rbd pool=block'])])
+        # The default caps are not modified by the pool list.
+        self.assertEqual(utils._default_caps['osd'], ['allow rwx'])
 
     @patch.object(utils.subprocess, 'check_output')
     @patch.object(utils, 'ceph_user', lambda: "ceph")
     @patch.object(utils.socket, "gethostname", lambda: "osd001")
     def test_get_named_key(self, mock_check_output):
-        mock_check_output.side_effect = [CalledProcessError(0, 0, 0), b""]
-        utils.get_named_key(name="rgw001")
+        mock_check_output.side_effect = [AUTH_LS, b"key=rgwkey"]
+        utils.reset_key_registry()
+        self.assertEqual(utils.get_named_key(name="rgw001"), "key=rgwkey")
         mock_check_output.assert_has_calls([
             call(['sudo', '-u', 'ceph', 'ceph', '--name',
                   'mon.', '--keyring',
                   '/var/lib/ceph/mon/ceph-osd001/keyring',
-                  'auth', 'get', 'client.rgw001']),
+                  'auth', 'ls', '--format', 'json']),
             call(['sudo', '-u', 'ceph', 'ceph', '--name',
                   'mon.', '--keyring',
                   '/var/lib/ceph/mon/ceph-osd001/keyring',
@@ -586,17 +637,57 @@ class CephTestCase(unittest.TestCase):
                           '; allow command "osd blocklist"'),
                   'osd', 'allow rwx'])])
         mock_check_output.reset_mock()
-        mock_check_output.side_effect = [b'key=test']
-        utils.get_named_key(name="rgw001")
-        mock_check_output.assert_called_once_with([
+        self.assertEqual(utils.get_named_key(name="rgw001"), "key=rgwkey")
+        self.assertEqual(utils.get_named_key(name="glance"), "glancekey")
+        mock_check_output.assert_not_called()
+
+    @patch.object(utils.subprocess, 'check_output')
+    @patch.object(utils, 'ceph_user', lambda: "ceph")
+    @patch.object(utils.socket, "gethostname", lambda: "osd001")
+    def test_get_named_key_auth_ls_fails(self, mock_check_output):
+        mock_check_output.side_effect = [
+            CalledProcessError(1, 'ceph'),
+            json.dumps([{'entity': 'client.glance', 'key': 'glancekey',
+                         'caps': {}}]).encode('UTF-8')]
+        utils.reset_key_registry()
+        self.assertEqual(utils.get_named_key(name="glance"), "glancekey")
+        mock_check_output.assert_called_with([
             'sudo', '-u', 'ceph', 'ceph', '--name',
             'mon.', '--keyring',
             '/var/lib/ceph/mon/ceph-osd001/keyring',
-            'auth', 'get', 'client.rgw001'])
+            'auth', 'get', 'client.glance', '--format', 'json'])
         mock_check_output.reset_mock()
-        utils.get_named_key(name="rgw001")
+        utils.get_named_key(name="glance")
         mock_check_output.assert_not_called()
 
+    @patch.object(utils.subprocess, 'check_call')
+    @patch.object(utils.subprocess, 'check_output')
+    @patch.object(utils, 'is_leader', lambda: True)
+    @patch.object(utils, 'ceph_user', lambda: "ceph")
+    @patch.object(utils.socket, "gethostname", lambda: "osd001")
+    def test_get_named_key_internal_caps(self, mock_check_output,
+                                         mock_check_call):
+        mock_check_output.return_value = AUTH_LS
+        utils.reset_key_registry()
+        utils.get_named_key('osd-upgrade', utils.osd_upgrade_caps)
+        mock_check_call.assert_not_called()
+
+        caps = {'mon': ['allow r'], 'osd': ['allow rwx']}
+        utils.get_named_key('admin', caps)
+        utils.get_named_key('admin', caps)
+        mock_check_call.assert_called_once_with([
+            'sudo', '-u', 'ceph', 'ceph', 'auth', 'caps', 'client.admin',
+            'mon', 'allow r', 'osd', 'allow rwx'])
+        self.assertEqual(mock_check_output.call_count, 1)
+
+        mock_check_output.return_value = json.dumps([{
+            'entity': 'client.admin', 'key': 'adminkey',
+            'caps': {'mon': 'allow *'}}]).encode('UTF-8')
+        utils.key_registry().forget('client.admin')
+        utils.get_named_key('admin', caps)
+        self.assertEqual(mock_check_output.call_count, 2)
+        self.assertEqual(mock_check_call.call_count, 2)
+
     def test_parse_key_with_caps_existing_key(self):
         expected = "AQCm7aVYQFXXFhAAj0WIeqcag88DKOvY4UKR/g=="
         with_caps = "[client.osd-upgrade]\n" \
@@ -1279,6 +1370,100 @@ class CephTestCase(unittest.TestCase):
         self.assertEqual(utils.get_cephfs('admin'), [])
 
 
+class FakeKV(object):
+
+    def __init__(self):
+        self.data = {}
+        self.writers = set()
+
+    def get(self, key, default=None):
+        return list(self.data.get(key, default))
+
+    def set(self, key, value):
+        self.writers.add(threading.get_ident())
+        self.data[key] = list(value)
+
+    def flush(self):
+        pass
+
+
+class CephOsdizeDevicesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeKV()
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        for name, attr in (('kv', lambda: self.db),
+                           ('_osdize_dev_cmd', self.fake_cmd),
+                           ('status_set', MagicMock()),
+                           ('log', MagicMock())):
+            patcher = patch.object(utils, name, attr)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.check_call = patch.object(utils.subprocess, 'check_call',
+                                       side_effect=self.fake_check_call)
+        self.check_call.start()
+        self.addCleanup(self.check_call.stop)
+        self.failing = set()
+        self.inventories = set()
+
+    def fake_cmd(self, dev, osd_format, osd_journal, osd_devices, *args,
+                 **kwargs):
+        self.inventories.add(kwargs.get('inventory'))
+        if dev == '/dev/sdz':
+            osd_devices.append(dev)
+            return None
+        return ['ceph-volume', 'lvm', 'create', '--data', dev]
+
+    def fake_check_call(self, cmd):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        if cmd[-1] in self.failing:
+            raise CalledProcessError(1, cmd)
+
+    def test_concurrent(self):
+        devices = ['/dev/sdb', '/dev/sdc', '/dev/sdz', '/dev/sdd',
+                   '/dev/sde']
+        results = utils.osdize_devices(devices, 'xfs', None, concurrency=2)
+        self.assertEqual(list(results), devices)
+        self.assertEqual(
+            {dev: outcome for dev, (outcome, _) in results.items()},
+            {'/dev/sdb': 'created', '/dev/sdc': 'created',
+             '/dev/sdz': 'skipped', '/dev/sdd': 'created',
+             '/dev/sde': 'created'})
+        self.assertEqual(self.max_active, 2)
+        self.assertEqual(sorted(self.db.data['osd-devices']), sorted(devices))
+        self.assertEqual(self.db.writers, {threading.get_ident()})
+
+    def test_failure_cancels_remaining(self):
+        self.failing.add('/dev/sdc')
+        with self.assertRaises(CalledProcessError):
+            utils.osdize_devices(['/dev/sdb', '/dev/sdc', '/dev/sdd'],
+                                 'xfs', None, concurrency=1)
+        self.assertEqual(self.db.data['osd-devices'], ['/dev/sdb'])
+        self.assertEqual(utils.subprocess.check_call.call_count, 2)
+
+    def test_failure_ignored(self):
+        self.failing.add('/dev/sdc')
+        results = utils.osdize_devices(['/dev/sdb', '/dev/sdc', '/dev/sdd'],
+                                       'xfs', None, ignore_errors=True,
+                                       concurrency=3)
+        self.assertEqual(results['/dev/sdc'][0], 'failed')
+        self.assertEqual(sorted(self.db.data['osd-devices']),
+                         ['/dev/sdb', '/dev/sdd'])
+
+    def test_inventory_passed_to_checks(self):
+        inventory = MagicMock()
+        utils.osdize_devices(['/dev/sdb', '/dev/sdc'], 'xfs', None,
+                             concurrency=2, inventory=inventory)
+        self.assertEqual(self.inventories, {inventory})
+
+
 class CephApplyOSDSettingsTestCase(unittest.TestCase):
 
     def setUp(self):